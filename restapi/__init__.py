@@ -17,13 +17,26 @@ try:
 except:
     pass
 
+# asyncio client (python 3.6+)
+try:
+    from . import async_restapi
+    from .async_restapi import *
+except (ImportError, SyntaxError):
+    async_restapi = None
+
 
 __all__ = ['MapServiceLayer',  'ImageService', 'Geocoder', 'FeatureService', 'FeatureLayer', 'has_arcpy', '__opensource__',
            'exportFeatureSet', 'exportReplica', 'exportFeaturesWithAttachments', 'Geometry', 'GeometryCollection',
            'GeocodeService', 'GPService', 'GPTask', 'do_post', 'MapService', 'ArcServer', 'Cursor', 'FeatureSet',
-           'generate_token', 'mil_to_date', 'date_to_mil', 'guessWKID', 'validate_name', 'exportGeometryCollection',
-           'GeometryService', 'GeometryCollection', 'getFeatureExtent', 'JsonReplica', 'SQLiteReplica', 'force_open_source'] + \
+           'generate_token', 'mil_to_date', 'mil_to_isoformat', 'date_to_mil', 'guessWKID', 'validate_name', 'exportGeometryCollection',
+           'GeometryService', 'GeometryCollection', 'getFeatureExtent', 'JsonReplica', 'SQLiteReplica', 'force_open_source',
+           'configure_sessions', 'SESSION_MANAGER', 'ColumnarFeatureSet', 'has_numpy',
+           'ParquetWriter', 'write_parquet', 'has_pyarrow', 'run_pipeline', 'PipelineStats',
+           'GeoPackageWriter', 'FlatGeobufWriter', 'NDJSONWriter', 'CSVWriter',
+           'PackedCoordinates', 'Transformer'] + \
            [d for d in dir(_strings) if not d.startswith('__')]
+if async_restapi is not None:
+    __all__ += async_restapi.__all__
 
 # package info
 __author__ = 'Caleb Mackey'
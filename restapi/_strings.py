@@ -18,6 +18,7 @@ LONG_FIELD = 'esriFieldTypeInteger'
 GUID_FIELD = 'esriFieldTypeGUID'
 RASTER_FIELD = 'esriFieldTypeRaster'
 BLOB_FIELD = 'esriFieldTypeBlob'
+BIG_INTEGER_FIELD = 'esriFieldTypeBigInteger'
 SQL_TYPE = 'sqlType'
 SQL_TYPE_OTHER = 'sqlTypeOther'
 
@@ -75,6 +76,16 @@ RETURN_M = 'returnM'
 RETURN_TRUE_CURVES = 'returnTrueCurves'
 RETURN_IDS_ONLY = 'returnIdsOnly'
 RESULT_RECORD_COUNT = 'resultRecordCount' # added at 10.3
+RESULT_OFFSET = 'resultOffset' # added at 10.3
+RETURN_COUNT_ONLY = 'returnCountOnly'
+RETURN_EXTENT_ONLY = 'returnExtentOnly'
+ORDER_BY_FIELDS = 'orderByFields'
+COUNT = 'count'
+EXCEEDED_TRANSFER_LIMIT = 'exceededTransferLimit'
+ADVANCED_QUERY_CAPABILITIES = 'advancedQueryCapabilities'
+SUPPORTS_PAGINATION = 'supportsPagination'
+PAGINATION_OFFSET = 'offset' # restapi pagination strategies, not in ArcGIS REST API
+PAGINATION_OID = 'oid'
 RETURN_ATTACHMENTS = 'returnAttachments'
 HAS_ATTACHMENTS = 'hasAttachments'
 ATTACHMENT_IDS = 'attachmentIds'
@@ -255,6 +266,17 @@ PJSON = 'pjson'
 JSON = 'json'
 GEOJSON_FORMAT = 'geoJSON'
 ESRI_JSON_FORMAT = 'esriJSON'
+PBF = 'pbf'
+PBF_CONTENT_TYPE = 'application/x-protobuf'
+SUPPORTED_QUERY_FORMATS = 'supportedQueryFormats'
+JSON_STREAM_CHUNK_SIZE = 64 * 1024
+LOG_MESSAGES = 'logMessages'
+PARQUET_EXTENSION = '.parquet'
+GPKG_EXTENSION = '.gpkg'
+FGB_EXTENSION = '.fgb'
+NDJSON_EXTENSIONS = ('.geojsonl', '.geojsons', '.ndjson', '.jsonl')
+CSV_EXTENSION = '.csv'
+SHP_FLOAT_DECIMALS = 11
 COORDINATES = 'coordinates'
 CRS = 'crs'
 LAYER_URL = 'layerURL'
@@ -268,6 +290,7 @@ OID_FIELD_NAME = 'objectIdFieldName'
 GLOBALID_FIELD_NAME = 'globalIdFieldName'
 CODED_VALUES = 'codedValues'
 CODED = 'CODED'
+CODED_VALUE_DOMAIN = 'codedValue'
 CODE = 'code'
 RANGE = 'range'
 RANGE_UPPER = 'RANGE'
@@ -278,6 +301,10 @@ CURVE_RINGS = 'curveRings'
 CURVE_PATHS = 'curvePaths'
 X = 'x'
 Y = 'y'
+Z = 'z'
+M = 'm'
+HAS_Z = 'hasZ'
+HAS_M = 'hasM'
 COPY_RUNTIME_GDB_TO_FILE_GDB = 'CopyRuntimeGdbToFileGdb'
 DEFAULT_VALUE = 'defaultValue'
 SQL_GLOBAL_ID_EXP = 'NEWID() WITH VALUES'
@@ -375,6 +402,14 @@ G_DICT = {ESRI_POLYGON: 'Polygon',
           ESRI_MULTIPOINT: 'Multipoint',
           ESRI_ENVELOPE:'Envelope'}
 
+# esri geometry types of GeoJSON geometry types
+GEOJSON_GEOMETRY_TYPES = {'Point': ESRI_POINT,
+                          'MultiPoint': ESRI_MULTIPOINT,
+                          'LineString': ESRI_POLYLINE,
+                          'MultiLineString': ESRI_POLYLINE,
+                          'Polygon': ESRI_POLYGON,
+                          'MultiPolygon': ESRI_POLYGON}
+
 GEOM_DICT = {RINGS: ESRI_POLYGON,
              PATHS: ESRI_POLYLINE,
              POINTS: ESRI_MULTIPOINT,
@@ -405,6 +440,13 @@ PORTAL_SERVICES_PATTERN = 'http*://*/sharing/servers/*/rest/services/*'
 VERSION = '1.1'
 PACKAGE_NAME = 'restapi'
 USER_AGENT = '{} (Python)'.format(PACKAGE_NAME)
+
+# operations that change nothing on the server, their POST requests are
+# retried on 502/503/504 responses like GET requests
+READ_ONLY_OPERATIONS = ('query', 'queryRelatedRecords', 'queryAttachments', 'identify', 'find',
+                        'export', 'exportImage', 'generateRenderer', 'getSamples', 'computeHistograms',
+                        'buffer', 'project', 'intersect', 'union', 'simplify', 'areasAndLengths',
+                        'lengths', 'distance', 'findAddressCandidates', 'reverseGeocode', 'suggest')
 PROTOCOL = ''
 
 # WKID json files
@@ -8,11 +8,10 @@ import datetime
 import json
 from collections import namedtuple
 from ..rest_utils import Token, mil_to_date, date_to_mil, RequestError, IdentityManager, JsonGetter, \
-    generate_token, ID_MANAGER, do_post, SpatialReferenceMixin, parse_url, get_portal_base
+    generate_token, ID_MANAGER, SESSION_MANAGER, do_post, stream_post, lazy_munchify, SpatialReferenceMixin, parse_url, get_portal_base
 from ..decorator import decorator
 import munch
 from .._strings import *
-import requests
 from .. import enums
 
 import six
@@ -124,10 +123,10 @@ class AdminRESTEndpoint(JsonGetter):
         if self.url.endswith('/sharing'):
             resource_url = self.url + '/rest/portals/self'
 
-        self.raw_response = requests.post(resource_url, params, verify=False)
+        self.raw_response = SESSION_MANAGER.post(resource_url, params)
         self.elapsed = self.raw_response.elapsed
         self.response = self.raw_response.json()
-        self.json = munch.munchify(self.response)
+        self.json = lazy_munchify(self.response)
 
     def check_for_token(self, url, usr=None, pw=None, token=None):
         if not self.token:
@@ -1320,7 +1319,7 @@ class Service(BaseDirectory, EditableResource):
                   'token': self.token.token if isinstance(self.token, Token) else self.token,
                   'f': 'json'}
 
-        return requests.post(query_url, params, files=files, verify=False).json()
+        return SESSION_MANAGER.post(query_url, params, files=files).json()
 
     @passthrough
     def uploadItemInfo(self, folder, file):
@@ -1871,6 +1870,42 @@ class ArcServerAdmin(AdminRESTEndpoint):
 
         return self.request(query_url, params)
 
+    def _log_params(self, startTime='', endTime='', sinceLastStarted=False, level='WARNING', filter=None, pageSize=1000):
+        """Returns the parameters for a log query, see queryLogs()."""
+        if isinstance(startTime, datetime.datetime):
+            startTime = date_to_mil(startTime)
+
+        #if not endTime:
+        #    # default to 1 week ago
+        #    endTime = date_to_mil(datetime.datetime.now() - datetime.timedelta(days=7))
+
+        elif isinstance(endTime, datetime.datetime):
+            endTime = date_to_mil(endTime)
+
+        if filter is None or not isinstance(filter, dict):
+            filter = {"server": "*",
+                      "services": "*",
+                      "machines":"*" }
+
+        return {'startTime': startTime,
+                'endTime': endTime,
+                'sinceLastStarted': sinceLastStarted,
+                'level': level,
+                'filter': json.dumps(filter) if isinstance(filter, dict) else filter,
+                'pageSize': pageSize
+                }
+
+    def iterLogs(self, startTime='', endTime='', sinceLastStarted=False, level='WARNING', filter=None, pageSize=1000):
+        """Generator that streams the log messages of a log query as they are
+                read from the response, so large pages of logs are never held
+                in memory at once.  See queryLogs() for arguments.
+        """
+        query_url = self._logsURL + '/query'
+        params = self._log_params(startTime, endTime, sinceLastStarted, level, filter, pageSize)
+        params[F] = JSON
+        for log in stream_post(query_url, params, LOG_MESSAGES, token=self.token):
+            yield log
+
     def queryLogs(self, startTime='', endTime='', sinceLastStarted=False, level='WARNING', filter=None, pageSize=1000):
         """Queries all log reports accross an entire site.
         
@@ -1904,29 +1939,8 @@ class ArcServerAdmin(AdminRESTEndpoint):
                 "services": "*", "server": ["Rest"]
         """
 
-        if isinstance(startTime, datetime.datetime):
-            startTime = date_to_mil(startTime)
-
-        #if not endTime:
-        #    # default to 1 week ago
-        #    endTime = date_to_mil(datetime.datetime.now() - datetime.timedelta(days=7))
-
-        elif isinstance(endTime, datetime.datetime):
-            endTime = date_to_mil(endTime)
-
-        if filter is None or not isinstance(filter, dict):
-            filter = {"server": "*",
-                      "services": "*",
-                      "machines":"*" }
-
         query_url = self._logsURL + '/query'
-        params = {'startTime': startTime,
-                  'endTime': endTime,
-                  'sinceLastStarted': sinceLastStarted,
-                  'level': level,
-                  'filter': json.dumps(filter) if isinstance(filter, dict) else filter,
-                  'pageSize': pageSize
-                  }
+        params = self._log_params(startTime, endTime, sinceLastStarted, level, filter, pageSize)
 
         r = self.request(query_url, params)
 
@@ -3126,7 +3140,7 @@ class Portal(AdminRESTEndpoint):
 
     def getServers(self):
         servers_url = get_portal_base(self.url).split('/sharing')[0] + '/portaladmin/federation/servers'
-        serversResp = requests.get(servers_url, {TOKEN: self.token.token, F: JSON}, verify=False).json()
+        serversResp = SESSION_MANAGER.get(servers_url, {TOKEN: self.token.token, F: JSON}).json()
         return [ArcServerAdmin(s.get('adminUrl') + '/admin/services', token=self.token) for s in serversResp.get('servers', [])]
 
     def __repr__(self):
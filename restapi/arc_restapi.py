@@ -356,7 +356,7 @@ class GeometryCollection(BaseGeometryCollection):
             elif not self.geometries:
                 raise ValueError('Inputs are not valid ESRI JSON Geometries!!!')
 
-            self.json = munch.munchify(self.json)
+            self.json = lazy_munchify(self.json)
 
     @property
     def spatialReference(self):
@@ -0,0 +1,449 @@
+"""asyncio flavour of the REST endpoints.  These classes share the parameter
+validation and response formatting of their blocking counterparts, but every
+network call is a coroutine so many layers can be queried concurrently from a
+single event loop:
+
+    async def main():
+        lyr = await restapi.AsyncFeatureLayer.create(url)
+        fs = await lyr.query(where="STATE = 'IA'", exceed_limit=True, max_workers=8)
+        async for chunk in lyr.query_in_chunks(max_workers=4):
+            print(chunk.count)
+
+Requests are sent with aiohttp when it is installed.  Otherwise each request
+is handed to the shared pooled session (see SessionManager) in the event loop's
+default executor, so the event loop is never blocked either way.
+"""
+from __future__ import print_function
+import asyncio
+import datetime
+import functools
+import json
+import time
+import weakref
+from .rest_utils import *
+from .common_types import ArcServer, MapServiceLayer, FeatureLayer, getFeatureExtent
+
+import six
+
+try:
+    import aiohttp
+    has_aiohttp = True
+except ImportError:
+    has_aiohttp = False
+
+# errors that make a chunk request fail, the chunk is split and retried when the sizer allows it
+CHUNK_ERRORS = (RuntimeError, NameError, asyncio.TimeoutError, requests.exceptions.RequestException)
+if has_aiohttp:
+    CHUNK_ERRORS += (aiohttp.ClientError,)
+
+__all__ = ['AsyncRESTEndpoint', 'AsyncArcServer', 'AsyncMapServiceLayer', 'AsyncFeatureLayer',
+           'AsyncSessionManager', 'ASYNC_SESSION_MANAGER', 'async_do_post', 'has_aiohttp']
+
+class AsyncResponse(object):
+    """Fully read response with the parts of the requests.Response interface
+            used throughout restapi.
+    """
+    def __init__(self, url, status_code, headers, content, elapsed, encoding=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.elapsed = elapsed
+        self.encoding = encoding or 'utf-8'
+
+    @property
+    def text(self):
+        """Response body as text."""
+        return self.content.decode(self.encoding, 'replace')
+
+    def json(self):
+        """Returns the response body as JSON."""
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        """Raises a RuntimeError for http error codes."""
+        if self.status_code >= 400:
+            raise RuntimeError('{} Error for url: {}'.format(self.status_code, self.url))
+
+    def __repr__(self):
+        return '<AsyncResponse [{}]>'.format(self.status_code)
+
+class AsyncSessionManager(object):
+    """Keeps one aiohttp.ClientSession per event loop.  Pool size, timeout and
+            ssl verification are taken from the shared SESSION_MANAGER, so
+            restapi.configure_sessions() applies to both clients.
+    """
+
+    def __init__(self):
+        self._sessions = weakref.WeakKeyDictionary()
+
+    def _timeout(self):
+        """Converts the requests style timeout to an aiohttp.ClientTimeout."""
+        timeout = SESSION_MANAGER.timeout
+        if timeout is None:
+            return aiohttp.ClientTimeout(total=None)
+        if isinstance(timeout, (list, tuple)):
+            connect, read = timeout
+        else:
+            connect = read = timeout
+        return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+
+    def get_session(self):
+        """Returns the session for the running event loop."""
+        loop = asyncio.get_event_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=SESSION_MANAGER.pool_maxsize,
+                                             ssl=None if SESSION_MANAGER.verify else False)
+            session = aiohttp.ClientSession(connector=connector,
+                                            timeout=self._timeout(),
+                                            cookie_jar=aiohttp.DummyCookieJar(),
+                                            headers={'User-Agent': USER_AGENT})
+            self._sessions[loop] = session
+        return session
+
+    @staticmethod
+    def _encode(params):
+        """Encodes parameters the same way requests does, None values are dropped."""
+        return {k: v if isinstance(v, six.string_types) else str(v)
+                for k,v in six.iteritems(params or {}) if v is not None}
+
+    async def request(self, method, url, params=None, cookies=None, headers=None, **kwargs):
+        """Makes a request and reads the whole response.
+
+        Args:
+            method: HTTP method (GET|POST).
+            url: Full url to resource.
+            params: Optional parameters, sent in the body for POST requests and
+                in the query string for GET requests.
+            cookies: Optional cookies for this request.
+            headers: Optional headers for this request.
+            kwargs: Optional keyword arguments for the blocking session, only
+                used when aiohttp is not installed.
+        """
+        if not has_aiohttp:
+            loop = asyncio.get_event_loop()
+            call = functools.partial(SESSION_MANAGER.request, method, url, params,
+                                     cookies=cookies, headers=headers, **kwargs)
+            return await loop.run_in_executor(None, call)
+
+        start = time.time()
+        encoded = self._encode(params)
+        if method.upper() == 'POST':
+            kw = {'data': encoded}
+        else:
+            kw = {'params': encoded}
+        async with self.get_session().request(method.upper(), url, cookies=cookies, headers=headers, **kw) as r:
+            content = await r.read()
+            return AsyncResponse(str(r.url), r.status, r.headers, content,
+                                 datetime.timedelta(seconds=time.time() - start), r.charset)
+
+    async def get(self, url, params=None, **kwargs):
+        """Makes a GET request."""
+        return await self.request('GET', url, params, **kwargs)
+
+    async def post(self, url, params=None, **kwargs):
+        """Makes a POST request."""
+        return await self.request('POST', url, params, **kwargs)
+
+    async def close(self):
+        """Closes the session for the running event loop."""
+        session = self._sessions.pop(asyncio.get_event_loop(), None)
+        if session is not None:
+            await session.close()
+
+# initialize async Session Manager
+ASYNC_SESSION_MANAGER = AsyncSessionManager()
+
+async def async_do_post(service, params={F: JSON}, ret_json=True, token='', cookies=None, proxy=None, referer=None, **kwargs):
+    """Coroutine version of do_post(), see do_post() for arguments."""
+    service, params, cookies, proxy = prepare_post(service, params, token, cookies, proxy, **kwargs)
+    if proxy:
+        loop = asyncio.get_event_loop()
+        r = await loop.run_in_executor(None, do_proxy_request, proxy, service, params, referer)
+        ID_MANAGER.proxies[service.split('/rest')[0].lower() + '/rest/services'] = proxy
+    else:
+        r = await ASYNC_SESSION_MANAGER.post(service, params, cookies=cookies)
+    return handle_response(service, r, ret_json)
+
+class AsyncRESTEndpoint(RESTEndpoint):
+    """Base class for asyncio endpoints.  Instances must be created with the
+            create() coroutine:
+
+        lyr = await AsyncMapServiceLayer.create(url, token=token)
+    """
+
+    def __init__(self, *args, **kwargs):
+        raise TypeError('use "await {}.create(url)" to create this object'.format(self.__class__.__name__))
+
+    @classmethod
+    async def create(cls, url, usr='', pw='', token='', proxy=None, referer=None, **kwargs):
+        """Creates the endpoint and fetches its JSON definition.
+
+        Args:
+            url: Service url.
+        Below args only required if security is enabled:
+            usr: Username credentials for ArcGIS Server.
+            pw: Password credentials for ArcGIS Server.
+            token: Token to handle security (alternative to usr and pw).
+            proxy: Option to use proxy page to handle security, need to provide
+                full path to proxy url.
+            referer: Option to add Referer Header if required by proxy.
+        """
+        self = cls.__new__(cls)
+        prepare = functools.partial(self._prepare_endpoint, url, usr, pw, token, proxy, referer, **kwargs)
+        if usr and pw:
+            # generating a token is a blocking request
+            params = await asyncio.get_event_loop().run_in_executor(None, prepare)
+        else:
+            params = prepare()
+        self._load_response(await async_do_post(self.url, params, ret_json=False, token=self.token,
+                                                cookies=self._cookie, proxy=self._proxy, referer=self._referer))
+        return self
+
+    async def request(self, *args, **kwargs):
+        """Wrapper for request to automatically pass in credentials."""
+        self._add_credentials(kwargs)
+        if 'ret_json' not in kwargs:
+            kwargs['ret_json'] = True
+        return await async_do_post(*args, **kwargs)
+
+    async def refresh(self):
+        """Refreshes the endpoint."""
+        params = self._prepare_endpoint(self.url, token=self.token)
+        self._load_response(await async_do_post(self.url, params, ret_json=False, token=self.token,
+                                                cookies=self._cookie, proxy=self._proxy, referer=self._referer))
+
+class AsyncArcServer(AsyncRESTEndpoint, ArcServer):
+    """asyncio version of ArcServer."""
+
+    @classmethod
+    async def create(cls, url, usr='', pw='', token='', proxy=None, referer=None):
+        self = await super(AsyncArcServer, cls).create(url, usr, pw, token, proxy, referer)
+        self.service_cache = []
+        return self
+
+    async def iter_services(self, token='', filterer=True):
+        """Asynchronous generator for all service urls."""
+        self.service_cache = []
+        for s in self.services:
+            full_service_url = '/'.join([self.url, s[NAME], s[TYPE]])
+            self.service_cache.append(full_service_url)
+            yield full_service_url
+
+        # fetch all folders at once
+        folders = [self.request('/'.join([self.url, s])) for s in self.folders]
+        for resp in await asyncio.gather(*folders):
+            for serv in resp[SERVICES]:
+                full_service_url =  '/'.join([self.url, serv[NAME], serv[TYPE]])
+                self.service_cache.append(full_service_url)
+                yield full_service_url
+
+    async def list_services(self, filterer=True):
+        """Returns a list of all services."""
+        return [s async for s in self.iter_services(filterer=filterer)]
+
+    async def get_service_url(self, wildcard='*', _list=False):
+        """Coroutine version of ArcServer.get_service_url()."""
+        if not self.service_cache:
+            await self.list_services()
+        return super(AsyncArcServer, self).get_service_url(wildcard, _list)
+
+class AsyncMapServiceLayer(AsyncRESTEndpoint, MapServiceLayer):
+    """asyncio version of MapServiceLayer."""
+
+    async def iter_queries(self, where='1=1', add_params={}, max_recs=None, chunk_size=None, **kwargs):
+        """Asynchronous generator for the where clauses that query all records,
+                see MapServiceLayer.iter_queries().
+        """
+        if isinstance(add_params, dict):
+            add_params[RETURN_IDS_ONLY] = TRUE
+
+        # get oids
+        resp = await self.query(where=where, add_params=add_params)
+
+        # set returnIdsOnly to False
+        add_params[RETURN_IDS_ONLY] = FALSE
+
+        for where2 in self._iter_oid_wheres(resp, max_recs, chunk_size):
+            yield where2
+
+    async def _iter_chunks(self, where, params, max_recs=None, sizer=None, pagination=None):
+        """Asynchronous generator for each chunk of a query, see
+                MapServiceLayer._iter_chunks().
+        """
+        if self._get_pagination(pagination) == PAGINATION_OFFSET:
+            count_params = dict(params)
+            count_params.update({RETURN_COUNT_ONLY: TRUE, RETURN_GEOMETRY: FALSE, F: JSON})
+            count = (await self.request(self.url + '/query', count_params)).get(COUNT) or 0
+            for page in self._iter_offset_chunks(count, params, max_recs, sizer):
+                yield page
+        else:
+            ids_params = dict(params)
+            ids_params.update({RETURN_IDS_ONLY: TRUE, RETURN_GEOMETRY: FALSE, F: JSON})
+            resp = await self.request(self.url + '/query', ids_params)
+            for chunk in self._iter_oid_chunks(resp, where, max_recs, sizer):
+                yield chunk
+
+    async def _fetch_chunk(self, query_url, params, sizer, chunk, retries=None):
+        """Fetches a chunk and any records left out of a truncated response,
+                see MapServiceLayer._fetch_chunk().
+        """
+        chunk_params = dict(params)
+        chunk_params.update(chunk.params)
+        try:
+            raw = await self.request(query_url, chunk_params, ret_json=False)
+            resp = handle_response(query_url, raw, as_munch=False)
+        except CHUNK_ERRORS as e:
+            sizer.record_error(chunk.size, e)
+            retries = sizer.max_retries if retries is None else retries
+            parts = chunk.split()
+            if retries < 1 or not parts:
+                raise
+            resp = await self._fetch_chunk(query_url, params, sizer, parts[0], retries - 1)
+            for part in parts[1:]:
+                resp[FEATURES] += (await self._fetch_chunk(query_url, params, sizer, part, retries - 1))[FEATURES]
+            return resp
+
+        sizer.record(chunk.size, len(resp.get(FEATURES) or []), raw.elapsed.total_seconds(), len(raw.content))
+        remainder = chunk.remainder(resp, self.OIDFieldName)
+        for extra in remainder:
+            resp[FEATURES] += (await self._fetch_chunk(query_url, params, sizer, extra))[FEATURES]
+        if remainder:
+            resp.pop(EXCEEDED_TRANSFER_LIMIT, None)
+        return resp
+
+    async def _iter_chunk_responses(self, query_url, where, params, records=None, max_workers=None, pagination=None, chunk_size=None, window=None):
+        """Fetches every chunk and yields the raw responses in chunk order,
+                with at most max_workers requests (or window if given) in flight.
+        """
+        window = max(window or max_workers or 1, 1)
+        sizer = self._get_chunk_sizer(chunk_size)
+
+        def fetch_chunk(chunk):
+            return asyncio.ensure_future(self._fetch_chunk(query_url, params, sizer, chunk))
+
+        pending = []
+        try:
+            async for chunk in self._iter_chunks(where, params, records, sizer, pagination):
+                pending.append(fetch_chunk(chunk))
+                if len(pending) >= window:
+                    yield await pending.pop(0)
+            while pending:
+                yield await pending.pop(0)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def query(self, where='1=1', fields='*', add_params={}, records=None, exceed_limit=False, f=JSON, max_workers=None, pagination=None, chunk_size=None, **kwargs):
+        """Queries layer and gets response as JSON, see MapServiceLayer.query().
+                kmz output is not supported.
+
+        Args:
+            max_workers: Optional number of concurrent requests to use when
+                exceed_limit is True. Default is None to fetch one chunk at a time.
+            pagination: Optional pagination strategy (offset|oid), see MapServiceLayer.query().
+            chunk_size: Optional number of records per request or an
+                AdaptiveChunkSizer, see MapServiceLayer.query().
+        """
+        if f == 'kmz':
+            raise NotImplementedError('kmz output is not supported by the asyncio client')
+        query_url = self.url + '/query'
+        params = self._validate_params(where, fields, add_params, f, **kwargs)
+
+        server_response = {}
+        if exceed_limit:
+            i = 0
+            async for resp in self._iter_chunk_responses(query_url, where, params, records, max_workers, pagination, chunk_size):
+                if i < 1:
+                    server_response = resp
+                else:
+                    server_response[FEATURES] += resp[FEATURES]
+                i += 1
+        else:
+            if isinstance(records, int) and str(self.currentVersion) >= '10.3':
+                params[RESULT_RECORD_COUNT] = records
+            server_response = await self.request(query_url, params)
+
+        return self._format_server_response(server_response, records)
+
+    async def query_in_chunks(self, where='1=1', fields='*', add_params={}, records=None, max_workers=None, pagination=None, chunk_size=None, **kwargs):
+        """Asynchronous generator that queries a layer in chunks, see
+                MapServiceLayer.query_in_chunks().  Chunks are yielded in order.
+        """
+        query_url = self.url + '/query'
+        params = self._validate_params(where, fields, add_params, **kwargs)
+        async for resp in self._iter_chunk_responses(query_url, where, params, records, max_workers, pagination, chunk_size):
+            yield self._format_server_response(resp)
+
+    async def iter_features(self, where='1=1', fields='*', add_params={}, records=None, max_workers=None, prefetch=2, pagination=None, chunk_size=None, f=JSON, **kwargs):
+        """Asynchronous generator that yields every feature of a query as a 
+                Feature, see MapServiceLayer.iter_features().
+        """
+        query_url = self.url + '/query'
+        params = self._validate_params(where, fields, add_params, f, **kwargs)
+        window = max(prefetch or 0, max_workers or 0) or None
+        async for resp in self._iter_chunk_responses(query_url, where, params, records, max_workers, pagination, chunk_size, window):
+            features = resp.get(FEATURES) or []
+            del resp
+
+            # pop from the end so each feature is released once consumed
+            features.reverse()
+            while features:
+                yield Feature(features.pop())
+
+    async def getOIDs(self, where='1=1', max_recs=None, **kwargs):
+        """Returns a list of OIDs from feature layer, see MapServiceLayer.getOIDs()."""
+        p = {RETURN_IDS_ONLY:TRUE,
+             RETURN_GEOMETRY: FALSE,
+             OUT_FIELDS: ''}
+
+        # add kwargs if specified
+        for k,v in six.iteritems(kwargs):
+            if k not in p.keys():
+                p[k] = v
+
+        resp = await self.query(where=where, add_params=p)
+        return sorted(resp[OBJECT_IDS])[:max_recs]
+
+    async def _query_cached(self, params, use_cache=True):
+        """Makes a query request, the response is cached for cache_ttl seconds."""
+        key = json.dumps(params, sort_keys=True, default=str)
+        cached = self._cache_get(key) if use_cache else None
+        if cached is not None:
+            return cached
+        return self._cache_put(key, await self.request(self.url + '/query', dict(params)))
+
+    async def getCount(self, where='1=1', use_cache=True, **kwargs):
+        """Returns count of features, see MapServiceLayer.getCount()."""
+        resp = await self._query_cached(self._count_params(where, **kwargs), use_cache)
+        if COUNT in resp:
+            return resp[COUNT]
+        return len(await self.getOIDs(where, **kwargs))
+
+    async def getExtent(self, where='1=1', outSR=None, use_cache=True, **kwargs):
+        """Returns the extent of features, see MapServiceLayer.getExtent()."""
+        resp = await self._query_cached(self._extent_params(where, outSR, **kwargs), use_cache)
+        if resp.get(EXTENT):
+            return self._format_extent(resp[EXTENT])
+        if outSR:
+            kwargs[OUT_SR] = outSR
+        fs = await self.query(where, self.OIDFieldName or '*', exceed_limit=True, f=JSON, **kwargs)
+        return getFeatureExtent(fs)
+
+class AsyncFeatureLayer(AsyncMapServiceLayer, FeatureLayer):
+    """asyncio version of FeatureLayer."""
+
+    @classmethod
+    async def create(cls, url, usr='', pw='', token='', proxy=None, referer=None):
+        self = await super(AsyncFeatureLayer, cls).create(url, usr, pw, token, proxy, referer)
+
+        # store list of EditResult() objects to track changes
+        self.editResults = []
+        return self
+
+    async def applyEdits(self, adds=None, updates=None, deletes=None, attachments=None, gdbVersion=None, rollbackOnFailure=TRUE, useGlobalIds=False, **kwargs):
+        """Applies edits on a feature service layer, see FeatureLayer.applyEdits()."""
+        edits_url = self.url + '/applyEdits'
+        params = self._edit_params(adds, updates, deletes, gdbVersion, rollbackOnFailure, useGlobalIds, **kwargs)
+        return self._edit_handler(await self.request(edits_url, params))
@@ -0,0 +1,528 @@
+"""Columnar storage for query results.
+
+A ColumnarFeatureSet stores each attribute of a feature set as a typed numpy
+array based on the field types, and the geometries as flat coordinate buffers
+with offset arrays.  Filtering, selecting and aggregating query results are
+then vectorized operations instead of loops over feature dicts:
+
+    cfs = layer.query(where='POP > 0').to_columns(layer.fields)
+    big = cfs.filter(cfs['POP'] > 10000)
+    totals = big.aggregate('POP', 'sum', by='COUNTY')
+
+Requires numpy.
+"""
+from __future__ import print_function
+from collections import OrderedDict
+from ._strings import *
+from .rest_utils import FeatureSet, Feature, lazy_munchify
+from .reproject import get_transformer
+
+import six
+
+try:
+    import numpy as np
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+__all__ = ['ColumnarFeatureSet', 'has_numpy']
+
+# numpy dtypes of the esri field types, other types are stored as objects
+FIELD_DTYPES = {
+    OID: 'int64',
+    SHORT_FIELD: 'int16',
+    LONG_FIELD: 'int32',
+    BIG_INTEGER_FIELD: 'int64',
+    FLOAT_FIELD: 'float32',
+    DOUBLE_FIELD: 'float64',
+    DATE_FIELD: 'datetime64[ms]'
+}
+
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max')
+
+def _coded_values(field):
+    """Returns the codes of a coded value domain field, or None."""
+    domain = field.get(DOMAIN) or {}
+    if domain.get(TYPE) == CODED_VALUE_DOMAIN and domain.get(CODED_VALUES):
+        return [cv.get(CODE) for cv in domain[CODED_VALUES]]
+    return None
+
+def _take_ragged(offsets, idx):
+    """Selects items of a ragged array.
+
+    Args:
+        offsets: Offsets of the ragged array, item i spans offsets[i]:offsets[i + 1].
+        idx: Indices of the items to take.
+
+    Returns:
+        A tuple of the offsets of the selected items and the indices of their
+            elements in the original array.
+    """
+    starts = offsets[idx]
+    counts = offsets[idx + 1] - starts
+    new_offsets = np.zeros(len(idx) + 1, dtype='int64')
+    np.cumsum(counts, out=new_offsets[1:])
+    elements = np.repeat(starts - new_offsets[:-1], counts) + np.arange(new_offsets[-1], dtype='int64')
+    return new_offsets, elements
+
+class ColumnarFeatureSet(object):
+    """Feature set stored as one typed array per field.
+
+    Attributes:
+        fields: The fields of the feature set.
+        columns: OrderedDict of field name to numpy array.  Coded value domain
+            fields hold int32 indices into categories, -1 for null.
+        nulls: Dict of field name to a boolean array that is True where the
+            value is null, for integer, date and text columns with nulls.
+        categories: Dict of field name to an object array of the codes of a
+            coded value domain field, the last item is None for nulls.
+        coords: float64 array of shape (vertices, 2 + hasZ + hasM).
+        part_offsets: int64 array, the vertices of part i are
+            coords[part_offsets[i]:part_offsets[i + 1]].
+        geometry_offsets: int64 array, the parts of feature i are
+            geometry_offsets[i]:geometry_offsets[i + 1], a feature without
+            parts has a null geometry.
+        geometryType: The esri geometry type.
+        spatialReference: The spatial reference JSON.
+        hasZ: True if the coordinates have z values.
+        hasM: True if the coordinates have m values.
+    """
+
+    def __init__(self, fields, columns, nulls=None, categories=None, coords=None, part_offsets=None,
+                 geometry_offsets=None, geometryType=None, spatialReference=None, hasZ=False, hasM=False):
+        """Creates a columnar feature set from arrays, see from_features() to
+                create one from features.
+
+        Raises:
+            ImportError: 'numpy is required for ColumnarFeatureSet'
+        """
+        if not has_numpy:
+            raise ImportError('numpy is required for ColumnarFeatureSet')
+        self.fields = [lazy_munchify(f) for f in fields]
+        self.columns = OrderedDict(columns)
+        self.nulls = nulls or {}
+        self.categories = categories or {}
+        self.geometryType = geometryType
+        self.spatialReference = spatialReference
+        self.hasZ = hasZ
+        self.hasM = hasM
+        if geometry_offsets is None:
+            count = len(next(six.itervalues(self.columns))) if self.columns else 0
+            geometry_offsets = np.zeros(count + 1, dtype='int64')
+            part_offsets = np.zeros(1, dtype='int64')
+            coords = np.zeros((0, 2 + hasZ + hasM))
+        self.coords = coords
+        self.part_offsets = part_offsets
+        self.geometry_offsets = geometry_offsets
+
+    @classmethod
+    def from_features(cls, features, fields, geometryType=None, spatialReference=None, hasZ=False, hasM=False):
+        """Creates a columnar feature set from esri JSON features.
+
+        Args:
+            features: Iterable of features as JSON or Feature objects.
+            fields: The fields to store, the field types decide the column
+                types and coded value domains are stored as categories.
+            geometryType: Optional esri geometry type, found from the first
+                geometry by default.
+            spatialReference: Optional spatial reference JSON.
+            hasZ: Optional boolean, True if the geometries have z values.
+                Defaults to False.
+            hasM: Optional boolean, True if the geometries have m values.
+                Defaults to False.
+
+        Returns:
+            A ColumnarFeatureSet.
+        """
+        if not has_numpy:
+            raise ImportError('numpy is required for ColumnarFeatureSet')
+        fields = [f for f in fields if f and f.get(TYPE) != SHAPE]
+        names = [f.get(NAME) for f in fields]
+        values = [[] for f in fields]
+        appenders = list(zip(names, [v.append for v in values]))
+        coords, part_lengths, geometry_parts = [], [], []
+        dims = 2 + bool(hasZ) + bool(hasM)
+
+        for ft in features:
+            if isinstance(ft, Feature):
+                ft = ft.json
+            attributes = dict.get(ft, ATTRIBUTES) or {}
+            for name, append in appenders:
+                append(attributes.get(name))
+
+            geometry = dict.get(ft, GEOMETRY)
+            if not geometry:
+                geometry_parts.append(0)
+            elif X in geometry:
+                if geometryType is None:
+                    geometryType = ESRI_POINT
+                pt = [geometry.get(X), geometry.get(Y)]
+                if hasZ:
+                    pt.append(geometry.get(Z))
+                if hasM:
+                    pt.append(geometry.get(M))
+                coords.append(pt)
+                part_lengths.append(1)
+                geometry_parts.append(1)
+            else:
+                for key in (RINGS, PATHS, POINTS):
+                    parts = dict.get(geometry, key)
+                    if parts is not None:
+                        break
+                else:
+                    # envelopes and curves are not stored
+                    geometry_parts.append(0)
+                    continue
+                if geometryType is None:
+                    geometryType = JSON_DICT.get(key)
+                if key == POINTS:
+                    parts = [parts]
+                for part in parts:
+                    coords.extend(part)
+                    part_lengths.append(len(part))
+                geometry_parts.append(len(parts))
+
+        columns, nulls, categories = OrderedDict(), {}, {}
+        for field, name, vals in zip(fields, names, values):
+            columns[name], mask, codes = cls._column(field, vals)
+            if mask is not None:
+                nulls[name] = mask
+            if codes is not None:
+                categories[name] = codes
+
+        return cls(fields, columns, nulls, categories, cls._coordinates(coords, dims),
+                   cls._offsets(part_lengths), cls._offsets(geometry_parts),
+                   geometryType, spatialReference, bool(hasZ), bool(hasM))
+
+    @classmethod
+    def from_feature_set(cls, feature_set, fields=None):
+        """Creates a columnar feature set from a FeatureSet.
+
+        Args:
+            feature_set: A FeatureSet or feature set JSON.
+            fields: Optional list of fields with more details than the fields of
+                the feature set, usually the fields of the layer, which have
+                the coded value domains.  Defaults to None.
+
+        Returns:
+            A ColumnarFeatureSet.
+        """
+        if not isinstance(feature_set, FeatureSet):
+            feature_set = FeatureSet(feature_set)
+        lookup = {f.get(NAME): f for f in fields or []}
+        fs_fields = [lookup.get(f.name, f) for f in feature_set.fields if f]
+        features = dict.get(feature_set.json, FEATURES) or []
+        if isinstance(features, list):
+            features = list.__iter__(features)
+        return cls.from_features(features, fs_fields, feature_set.json.get(GEOMETRY_TYPE),
+                                 feature_set.json.get(SPATIAL_REFERENCE), feature_set.json.get(HAS_Z, False),
+                                 feature_set.json.get(HAS_M, False))
+
+    @staticmethod
+    def _column(field, values):
+        """Returns the array, null mask and categories for the values of a field."""
+        codes = _coded_values(field)
+        if codes is not None:
+            lookup = {code: i for i, code in enumerate(codes)}
+            indices = []
+            for v in values:
+                if v is None:
+                    indices.append(-1)
+                else:
+                    indices.append(lookup.setdefault(v, len(lookup)))
+            categories = np.empty(len(lookup) + 1, dtype=object)
+            categories[:-1] = sorted(lookup, key=lookup.get)
+            return np.array(indices, dtype='int32'), None, categories
+
+        obj = np.empty(len(values), dtype=object)
+        obj[:] = values
+        mask = obj == None
+        dtype = FIELD_DTYPES.get(field.get(TYPE))
+        if dtype is None:
+            return obj, mask if mask.any() else None, None
+        if dtype.startswith('int'):
+            if mask.any():
+                obj[mask] = 0
+                return obj.astype(dtype), mask, None
+            return obj.astype(dtype), None, None
+        if dtype.startswith('float'):
+            obj[mask] = np.nan
+        # None is NaT for dates and NaN for floats, no separate mask is needed
+        return obj.astype(dtype), None, None
+
+    @staticmethod
+    def _coordinates(coords, dims):
+        """Returns the coordinates as a float64 array with dims columns."""
+        if not coords:
+            return np.zeros((0, dims))
+        try:
+            arr = np.array(coords, dtype='float64')
+            if arr.ndim == 2 and arr.shape[1] == dims:
+                return arr
+        except (ValueError, TypeError):
+            pass
+        # vertices with missing or extra z and m values
+        arr = np.full((len(coords), dims), np.nan)
+        for i, pt in enumerate(coords):
+            pt = [np.nan if v is None else v for v in pt[:dims]]
+            arr[i, :len(pt)] = pt
+        return arr
+
+    @staticmethod
+    def _offsets(lengths):
+        offsets = np.zeros(len(lengths) + 1, dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        return offsets
+
+    @property
+    def count(self):
+        """Returns the number of features."""
+        return len(self)
+
+    @property
+    def fieldLookup(self):
+        """Convenience property for field lookups."""
+        return {f.name: f for f in self.fields}
+
+    def list_fields(self):
+        """Returns a list of field names."""
+        return list(self.columns)
+
+    def __len__(self):
+        return len(self.geometry_offsets) - 1
+
+    def __getitem__(self, name):
+        """Returns the values of a field as an array, see values()."""
+        return self.values(name)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __iter__(self):
+        return self.iter_features()
+
+    def __repr__(self):
+        return '<{} (count: {})>'.format(self.__class__.__name__, self.count)
+
+    def values(self, name):
+        """Returns the values of a field as an array, the codes of coded value
+                domain fields instead of their category indices.
+
+        Arg:
+            name: The field name.
+        """
+        column = self.columns[name]
+        if name in self.categories:
+            # -1 is the last category, which is None
+            return self.categories[name][column]
+        return column
+
+    def labels(self, name):
+        """Returns the domain names of the values of a coded value domain field.
+
+        Arg:
+            name: The field name.
+        """
+        domain = self.fieldLookup[name].get(DOMAIN) or {}
+        names = {cv.get(CODE): cv.get(NAME) for cv in domain.get(CODED_VALUES) or []}
+        labels = np.array([names.get(code, code) for code in self.categories[name]], dtype=object)
+        return labels[self.columns[name]]
+
+    def isnull(self, name):
+        """Returns a boolean array that is True where the value of a field is null.
+
+        Arg:
+            name: The field name.
+        """
+        column = self.columns[name]
+        if name in self.categories:
+            return column == -1
+        if name in self.nulls:
+            return self.nulls[name]
+        if column.dtype.kind == 'f':
+            return np.isnan(column)
+        if column.dtype.kind == 'M':
+            return np.isnat(column)
+        return np.zeros(len(column), dtype=bool)
+
+    @property
+    def has_geometry(self):
+        """Returns a boolean array that is True for features with a geometry."""
+        return np.diff(self.geometry_offsets) > 0
+
+    def filter(self, mask):
+        """Returns a new ColumnarFeatureSet with the selected features.
+
+        Arg:
+            mask: Boolean array with a value for each feature, or an array of
+                feature indices.
+        """
+        idx = np.asarray(mask)
+        if idx.dtype == bool:
+            idx = np.flatnonzero(idx)
+        idx = idx.astype('int64')
+        columns = OrderedDict((name, column[idx]) for name, column in six.iteritems(self.columns))
+        nulls = {}
+        for name, mask in six.iteritems(self.nulls):
+            mask = mask[idx]
+            if mask.any():
+                nulls[name] = mask
+        geometry_offsets, parts = _take_ragged(self.geometry_offsets, idx)
+        part_offsets, vertices = _take_ragged(self.part_offsets, parts)
+        return self.__class__(self.fields, columns, nulls, self.categories, self.coords[vertices], part_offsets,
+                              geometry_offsets, self.geometryType, self.spatialReference, self.hasZ, self.hasM)
+
+    def select(self, fields, geometry=True):
+        """Returns a new ColumnarFeatureSet with a subset of the fields, the
+                arrays are shared with this one.
+
+        Args:
+            fields: List of field names.
+            geometry: Optional boolean, False to drop the geometries.
+                Defaults to True.
+        """
+        if isinstance(fields, six.string_types):
+            fields = [f.strip() for f in fields.split(',')]
+        lookup = self.fieldLookup
+        keep = lambda d: {k: v for k, v in six.iteritems(d) if k in fields}
+        args = [self.coords, self.part_offsets, self.geometry_offsets] if geometry else [None, None, None]
+        return self.__class__([lookup[f] for f in fields], [(f, self.columns[f]) for f in fields],
+                              keep(self.nulls), keep(self.categories), *args, geometryType=self.geometryType,
+                              spatialReference=self.spatialReference, hasZ=self.hasZ, hasM=self.hasM)
+
+    def project(self, outSR):
+        """Returns a new ColumnarFeatureSet with the coordinate array projected 
+                to another spatial reference on the client, see restapi.reproject.
+                The other arrays are shared with this one.
+
+        Arg:
+            outSR: The output well known id or spatial reference dict.
+
+        Raises:
+            NotImplementedError: The transformation is not supported locally.
+        """
+        transformer = get_transformer(self.spatialReference, outSR)
+        return self.__class__(self.fields, self.columns, self.nulls, self.categories, transformer.transform_coords(self.coords),
+                              self.part_offsets, self.geometry_offsets, self.geometryType,
+                              transformer.spatialReference, self.hasZ, self.hasM)
+
+    def _groups(self, by):
+        """Returns the group keys and the group index of each feature."""
+        column = self.columns[by]
+        if by in self.categories:
+            codes, inverse = np.unique(column, return_inverse=True)
+            return self.categories[by][codes].tolist(), inverse
+        null = self.isnull(by)
+        if column.dtype != object and not null.any():
+            keys, inverse = np.unique(column, return_inverse=True)
+            return keys.tolist(), inverse
+        lookup = {}
+        inverse = np.fromiter((lookup.setdefault(k, len(lookup)) for k in self._pylist(by)), dtype='int64', count=len(self))
+        return sorted(lookup, key=lookup.get), inverse
+
+    def aggregate(self, field, func='sum', by=None):
+        """Aggregates the values of a field, null values are ignored.
+
+        Args:
+            field: The field name.
+            func: Optional aggregate function, one of count, sum, mean, min or
+                max.  Defaults to 'sum'.
+            by: Optional field name to group by.  Defaults to None.
+
+        Returns:
+            The aggregated value, or a dict of group key to aggregated value
+                when grouped.  Empty groups have a value of None.
+
+        Raises:
+            ValueError: 'Invalid aggregate function "{}", must be one of {}'
+        """
+        if func not in AGGREGATES:
+            raise ValueError('Invalid aggregate function "{}", must be one of {}'.format(func, AGGREGATES))
+        valid = ~self.isnull(field)
+        values = self.values(field)[valid]
+        if by is None:
+            if func == 'count':
+                return int(valid.sum())
+            if not len(values):
+                return None
+            return getattr(np, func)(values).item()
+
+        keys, inverse = self._groups(by)
+        inverse = inverse.reshape(-1)[valid]
+        n = len(keys)
+        counts = np.bincount(inverse, minlength=n)
+        if func == 'count':
+            result = counts.tolist()
+        elif func in ('sum', 'mean'):
+            result = np.bincount(inverse, weights=values, minlength=n)
+            if func == 'mean':
+                result = result / np.where(counts, counts, 1)
+            result = result.tolist()
+        else:
+            # the first or last value of each group once sorted by group and value
+            order = np.lexsort((values, inverse))
+            ends = np.cumsum(counts)
+            pick = ends - counts if func == 'min' else ends - 1
+            result = values[order[np.minimum(pick, len(order) - 1)]].tolist() if len(order) else [None] * n
+        if func != 'count':
+            result = [r if c else None for r, c in zip(result, counts)]
+        return dict(zip(keys, result))
+
+    def _pylist(self, name):
+        """Returns the values of a field as a list of python values in esri
+                JSON form, with None for nulls and milliseconds for dates."""
+        column = self.values(name)
+        if column.dtype.kind == 'M':
+            column = column.astype('int64')
+        values = column.tolist()
+        for i in np.flatnonzero(self.isnull(name)).tolist():
+            values[i] = None
+        return values
+
+    def iter_geometries(self):
+        """Generator for the esri JSON geometry of each feature, None for null
+                geometries."""
+        coords = self.coords.tolist()
+        part_offsets = self.part_offsets.tolist()
+        geometry_offsets = self.geometry_offsets.tolist()
+        dims = self.coords.shape[1]
+        for start, end in zip(geometry_offsets[:-1], geometry_offsets[1:]):
+            if start == end:
+                yield None
+                continue
+            parts = [coords[part_offsets[i]:part_offsets[i + 1]] for i in six.moves.range(start, end)]
+            if self.geometryType == ESRI_POINT:
+                pt = parts[0][0]
+                geometry = {X: pt[0], Y: pt[1]}
+                if self.hasZ:
+                    geometry[Z] = pt[2]
+                if self.hasM:
+                    geometry[M] = pt[dims - 1]
+                yield geometry
+            elif self.geometryType == ESRI_MULTIPOINT:
+                yield {POINTS: [pt for part in parts for pt in part]}
+            else:
+                yield {JSON_CODE.get(self.geometryType, RINGS): parts}
+
+    def iter_features(self):
+        """Generator for the features as esri JSON."""
+        names = list(self.columns)
+        columns = [self._pylist(name) for name in names]
+        for values, geometry in zip(zip(*columns) if columns else [()] * len(self), self.iter_geometries()):
+            feature = {ATTRIBUTES: dict(zip(names, values))}
+            if geometry is not None:
+                feature[GEOMETRY] = geometry
+            yield feature
+
+    def to_feature_set(self):
+        """Returns the features as a FeatureSet."""
+        fs = {FIELDS: [dict(f) for f in self.fields], FEATURES: list(self.iter_features())}
+        if self.geometryType:
+            fs[GEOMETRY_TYPE] = self.geometryType
+        if self.spatialReference:
+            fs[SPATIAL_REFERENCE] = self.spatialReference
+        if self.hasZ:
+            fs[HAS_Z] = True
+        if self.hasM:
+            fs[HAS_M] = True
+        return FeatureSet(fs)
@@ -5,12 +5,23 @@ import sqlite3
 import base64
 import shutil
 import contextlib
+import functools
+import itertools
+import operator
 from .rest_utils import *
 from .decorator import decorator
 import sys
 import warnings
-from munch import munchify
 from . import projections
+from .columnar import ColumnarFeatureSet, has_numpy
+from .parquet import ParquetWriter, write_parquet, arrow_schema, record_batch, has_pyarrow
+from .pipeline import run_pipeline, PipelineStats
+from .geopackage import GeoPackageWriter, split_geopackage_path, _geopackage_rows
+from .flatgeobuf import FlatGeobufWriter, _flatgeobuf_features
+from .textformats import NDJSONWriter, CSVWriter, split_compression, _ndjson_lines, _csv_rows
+from .coordinates import PackedCoordinates
+from . import geometry_engine
+from .reproject import Transformer, get_transformer, get_wkid
 
 import six
 from six.moves import urllib, zip_longest
@@ -102,6 +113,16 @@ def geometry_passthrough(func, *args, **kwargs):
         return gc
     return f
 
+def _project_response(fetch_chunk, outSR, *args):
+    """Fetches a chunk and projects the geometries of the raw response on the
+            client, see MapServiceLayer._iter_chunk_responses()."""
+    resp = fetch_chunk(*args)
+    transformer = get_transformer(resp.get(SPATIAL_REFERENCE), outSR)
+    if not transformer.identity:
+        transformer.transform_features(resp.get(FEATURES) or [])
+    resp[SPATIAL_REFERENCE] = transformer.spatialReference
+    return resp
+
 def getFeatureExtent(in_features):
     """Gets the extent for a FeatureSet() or GeometryCollection(), must be convertible
     to a GeometryCollection().
@@ -116,9 +137,17 @@ def getFeatureExtent(in_features):
     if not isinstance(in_features, GeometryCollection):
         in_features = GeometryCollection(in_features)
 
-    extents = [g.envelopeAsJSON() for g in iter(in_features)]
-    full_extent = {SPATIAL_REFERENCE: extents[0].get(SPATIAL_REFERENCE)}
-    for attr, op in {XMIN: min, YMIN: min, XMAX: max, YMAX: max}.iteritems():
+    geometries = list(in_features)
+    full_extent = {SPATIAL_REFERENCE: geometries[0].json.get(SPATIAL_REFERENCE)}
+    if all(hasattr(g, 'bbox') for g in geometries):
+        # combine the cached numeric envelopes, empty geometries are skipped
+        bboxes = [g.bbox for g in geometries if g.bbox]
+        for i, (attr, op) in enumerate([(XMIN, min), (YMIN, min), (XMAX, max), (YMAX, max)]):
+            full_extent[attr] = op(b[i] for b in bboxes) if bboxes else None
+        return munch.munchify(full_extent)
+
+    extents = [g.envelopeAsJSON() for g in geometries]
+    for attr, op in six.iteritems({XMIN: min, YMIN: min, XMAX: max, YMAX: max}):
         full_extent[attr] = op([e.get(attr) for e in extents])
     return munch.munchify(full_extent)
 
@@ -248,43 +277,78 @@ def exportFeatureSet_arcpy(feature_set, out_fc, include_domains=False, qualified
         return original
 
 
-def exportFeatureSet_os(feature_set, out_fc, outSR=None, **kwargs):
-        """Exports features (JSON result) to shapefile or feature class.
+def _shapefile_rows(field_map, date_fields, feature_set):
+    """Returns the (geometry, record) of each feature for a shapefile."""
+    rows = []
+    for feat in raw_features(feature_set):
+        attributes = dict.get(feat, ATTRIBUTES) or dict.get(feat, PROPERTIES) or {}
+        rows.append((dict.get(feat, GEOMETRY), [datetime_to_datestring(attributes.get(field)) if field in date_fields else attributes.get(field) for field, _ in field_map]))
+    return rows
+
+def _row_stages(prepare):
+    """Returns the stages of MapServiceLayer._export_chunks() for a writer 
+            with row_args and write_rows(), prepare is called with the row 
+            arguments of the writer and a chunk."""
+    return lambda writer: (functools.partial(prepare, *writer.row_args), writer.write_rows)
+
+def _is_transient_error(e):
+    """Returns True if a failed chunk request may succeed when it is split and 
+            sent again, i.e. timeouts, connection errors, 5xx responses and esri 
+            errors with a 5xx code or about a response that is too large."""
+    if isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(e, requests.exceptions.HTTPError):
+        return e.response is not None and e.response.status_code >= 500
+    if not isinstance(e, RuntimeError) or not e.args or not isinstance(e.args[0], six.string_types):
+        return False
+
+    # RequestError raises the esri error response as json
+    try:
+        err = json.loads(e.args[0]).get('error') or {}
+        code = int(err.get('code') or 0)
+    except (ValueError, TypeError, AttributeError):
+        return False
+    messages = [err.get('message')] + list(err.get('details') or [])
+    return code >= 500 or any('too large' in six.text_type(m).lower() for m in messages if m)
+
+def _record_batch(fields, feature_set):
+    """Returns a feature set as an Arrow record batch."""
+    # the layer fields have the coded value domains and exact types
+    return record_batch(ColumnarFeatureSet.from_feature_set(feature_set, fields))
+
+class ShapefileStreamWriter(object):
+    """Writes feature sets to a shapefile as they arrive.  The shapefile is
+            opened once, every feature set is appended to it and the headers
+            are written when it is closed, so only the feature set being
+            written is held in memory.
+
+    Attributes:
+        path: Path of the shapefile.
+        outSR: Spatial reference written to the .prj file.
+        field_map: List of (field name, shapefile field name) tuples.
+        count: Number of features written.
+    """
+
+    def __init__(self, out_fc, fields, geometryType, outSR=None):
+        """Creates the shapefile.
 
         Args:
-            out_fc: Output feature class or shapefile.
-            feature_set: JSON response (feature set) obtained from a query.
-            outSR: Optional output spatial reference.  If none set, will default
-                to SR of result_query feature set. Defaults to None.
-        
-        Returns:
-            Feature class.
+            out_fc: Output shapefile.
+            fields: The fields of the feature sets that will be written.
+            geometryType: The esri geometry type.
+            outSR: Optional spatial reference for the .prj file. Defaults to None.
         """
         from . import shp_helper
-        out_fc = validate_name(out_fc)
-        # validate features input (should be list or dict, preferably list)
-        if not isinstance(feature_set, (FeatureSet, GeoJSONFeatureSet)):
-            feature_set = FeatureSet(feature_set)
-
-        # make new shapefile
-        fields = feature_set.fields
-        this_sr = feature_set.getSR()
-        date_fields = [f.name for f in fields if f.type == DATE_FIELD]
-        if not outSR:
-            outSR = this_sr
-        else:
-            if this_sr:
-                if outSR != this_sr:
-                    # do not change without reprojecting...
-                    outSR = this_sr
-
-        g_type = getattr(feature_set, GEOMETRY_TYPE)
+        self.path = validate_name(out_fc)
+        self.outSR = outSR
+        self.count = 0
+        self.date_fields = set(f.name for f in fields if f and f.type == DATE_FIELD)
+        self._writer = shp_helper.ShpWriter(self.path, G_DICT[geometryType].upper())
 
         # add all fields
-        w = shp_helper.ShpWriter(out_fc, G_DICT[g_type].upper())
-        field_map = []
+        self.field_map = []
         for fld in fields:
-            if fld.type not in [OID, SHAPE] + list(SKIP_FIELDS.keys()):
+            if fld and fld.type not in [OID, SHAPE] + list(SKIP_FIELDS.keys()):
                 if not any(['shape_' in fld.name.lower(),
                             'shape.' in fld.name.lower(),
                             '(shape)' in fld.name.lower(),
@@ -294,23 +358,129 @@ def exportFeatureSet_os(feature_set, out_fc, outSR=None, **kwargs):
                     field_name = fld.name.split('.')[-1][:10]
                     field_type = SHP_FTYPES[fld.type]
                     field_length = str(fld.length) if hasattr(fld, 'length') else "50"
-                    w.add_field(field_name, field_type, field_length)
-                    field_map.append((fld.name, field_name))
+                    # keep the fractional part of float fields
+                    decimal = SHP_FLOAT_DECIMALS if field_type == 'F' else 0
+                    self._writer.add_field(field_name, field_type, field_length, decimal)
+                    self.field_map.append((fld.name, field_name))
+
+    @classmethod
+    def from_feature_set(cls, feature_set, out_fc, outSR=None):
+        """Creates a writer for the fields and geometry type of a feature set.
+
+        Args:
+            feature_set: A FeatureSet or GeoJSONFeatureSet.
+            out_fc: Output shapefile.
+            outSR: Optional spatial reference for the .prj file, the spatial 
+                reference of the feature set is used by default.
+        """
+        # the features are not reprojected, the .prj must match them
+        return cls(out_fc, feature_set.fields, getattr(feature_set, GEOMETRY_TYPE), feature_set.getSR() or outSR)
+
+    def _add_shape(self, geometry):
+        w = self._writer.w
+        if not geometry:
+            w.null()
+        elif TYPE in geometry:
+            # geojson
+            w.shape(shapefile.Shape._from_geojson(geometry))
+        elif X in geometry:
+            w.point(geometry[X], geometry[Y])
+        elif POINTS in geometry:
+            w.multipoint(geometry[POINTS])
+        elif PATHS in geometry:
+            w.line(geometry[PATHS])
+        elif RINGS in geometry:
+            # esri rings run clockwise like shapefile rings
+            w.poly(geometry[RINGS])
+        else:
+            w.null()
 
-        # search cursor to write rows
-        s_fields = [fl for fl in fields if fl.name in [f[0] for f in field_map]]
-        for feat in feature_set:
-            # print(feat)
-            row = [datetime_to_datestring(feat.get(field)) if field in date_fields else feat.get(field) for field in [f[0] for f in field_map]]
-            w.add_row(feat.getGeometry().asShape(), *row)
+    def prepare(self, feature_set):
+        """Returns the (geometry, record) of each feature, the part of write()
+                that does not touch the shapefile so it can run in another
+                thread or process.
 
-        w.save()
-        print('Created: "{0}"'.format(out_fc))
+        Arg:
+            feature_set: A FeatureSet, GeoJSONFeatureSet or list of features.
+        """
+        return _shapefile_rows(*self.row_args + (feature_set,))
 
-        # write projection file
-        project(out_fc, outSR)
+    @property
+    def row_args(self):
+        """The arguments of the row conversion before the feature set."""
+        return self.field_map, self.date_fields
+
+    def write_rows(self, rows):
+        """Appends the rows returned by prepare().
+
+        Arg:
+            rows: List of (geometry, record) tuples.
+        """
+        record = self._writer.w.record
+        for geometry, row in rows:
+            self._add_shape(geometry)
+            record(*row)
+            self.count += 1
+
+    def write(self, feature_set):
+        """Appends the features of a feature set.
+
+        Arg:
+            feature_set: A FeatureSet, GeoJSONFeatureSet or list of features.
+        """
+        self.write_rows(self.prepare(feature_set))
+
+    def close(self):
+        """Writes the headers and the .prj file."""
+        if self._writer is not None:
+            self._writer.save()
+            self._writer = None
+            print('Created: "{0}"'.format(self.path))
+
+            # write projection file
+            project(self.path, self.outSR)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+def exportFeatureSet_os(feature_set, out_fc, outSR=None, **kwargs):
+    """Exports features (JSON result) to shapefile or feature class.  A path
+            ending with ".gpkg", or a table inside one such as 
+            "data.gpkg/parcels", is written to a GeoPackage and a path ending
+            with ".fgb" to FlatGeobuf.
+
+    Args:
+        out_fc: Output feature class, shapefile, GeoPackage table or FlatGeobuf file.
+        feature_set: JSON response (feature set) obtained from a query.
+        outSR: Optional output spatial reference.  If none set, will default
+            to SR of result_query feature set. Defaults to None.
+        index_node_size: Optional keyword argument, the node size of the 
+            FlatGeobuf spatial index, 0 writes no index. Defaults to 16.
+    
+    Returns:
+        Feature class.
+    """
+    # validate features input (should be list or dict, preferably list)
+    if not isinstance(feature_set, (FeatureSet, GeoJSONFeatureSet)):
+        feature_set = FeatureSet(feature_set)
+
+    if out_fc.lower().endswith(FGB_EXTENSION):
+        with FlatGeobufWriter.from_feature_set(feature_set, out_fc, outSR, kwargs.get('index_node_size', 16)) as writer:
+            writer.write(feature_set)
+        return out_fc
+
+    if split_geopackage_path(out_fc)[0].lower().endswith(GPKG_EXTENSION):
+        with GeoPackageWriter.from_feature_set(feature_set, out_fc, outSR) as writer:
+            writer.write(feature_set)
         return out_fc
 
+    with ShapefileStreamWriter.from_feature_set(feature_set, out_fc, outSR) as writer:
+        writer.write(feature_set)
+    return writer.path
+
 if has_arcpy:
     exportFeatureSet = exportFeatureSet_arcpy
 
@@ -353,38 +523,184 @@ def featureIterator(obj):
 
 FeatureSet.__iter__ = featureIterator
 
-class Cursor(FeatureSet):
-    """Class to handle Cursor object."""
-    json = {}
-    fieldOrder = []
-    field_names = []
+def _date_value(row, value):
+    return mil_to_date(value) if value else value
 
-    class BaseRow(object):
-        """Class to handle Row object.
-        
-        Attributes:
-            feature: A feature JSON object.
-            spatialReference: A spatial reference.
+def _long_value(row, value):
+    return int(value) if value else value
+
+def _shape_value(row, value):
+    # the Geometry is only created when the shape is in the field order
+    geometry = row.geometry
+    return geometry.asShape() if geometry else None
+
+class CursorRow(object):
+    """Compact row of a Cursor.  Values are stored positionally in the order of
+            the cursor's schema and the geometry is kept as its raw coordinate
+            array, so no Feature or Munch is created per row.
+
+    Attributes:
+        cursor: The Cursor the row belongs to.
+        attributes: Tuple of values in the order of cursor.schema.
+        coordinates: An (x, y) tuple for points, the raw rings, paths or points
+            list for other geometries, the geometry JSON if it has other
+            properties, or None.
+    """
+    __slots__ = ('cursor', 'attributes', 'coordinates')
+
+    def __init__(self, cursor, attributes, coordinates=None):
+        """Row object for Cursor.
+
+        Args:
+            cursor: The Cursor the row belongs to.
+            attributes: Tuple of values in the order of cursor.schema.
+            coordinates: Optional coordinates, see pack_geometry(). Defaults to None.
         """
-        def __init__(self, feature, spatialReference):
-            """Row object for Cursor.
-            
-            Args:
-                feature: Features JSON object.
-                spatialReference: A spatial reference.
-            """
+        self.cursor = cursor
+        self.attributes = attributes
+        self.coordinates = coordinates
 
-            self.feature = Feature(feature) if not isinstance(feature, Feature) else feature
-            self.spatialReference = spatialReference
+    @classmethod
+    def from_feature(cls, cursor, feature):
+        """Creates a row from a feature.
 
-        def get(self, field):
-            """Gets/returns an attribute by field name.
+        Args:
+            cursor: The Cursor the row belongs to.
+            feature: Feature as JSON or a Feature.
+        """
+        if isinstance(feature, Feature):
+            feature = feature.json
+        # read the raw values, there is no need to wrap them for attribute access
+        attributes = dict.get(feature, ATTRIBUTES) or dict.get(feature, PROPERTIES) or {}
+        return cls(cursor, tuple(map(attributes.get, cursor.schema)), cls.pack_geometry(cursor, dict.get(feature, GEOMETRY)))
 
-            Arg:
-                field: Name of field for which to get the value.
-            """
+    @staticmethod
+    def pack_geometry(cursor, geometry):
+        """Returns the compact coordinates of a geometry.
+
+        Args:
+            cursor: The Cursor, its geometry type decides the packing.
+            geometry: Geometry JSON.
+        """
+        if not geometry:
+            return None
+        if len(geometry) == 2 and X in geometry and Y in geometry:
+            return (geometry[X], geometry[Y])
+        if len(geometry) == 1 and cursor._geometry_key in geometry:
+            return dict.get(geometry, cursor._geometry_key)
+        return geometry
 
-            return self.feature.attributes.get(field)
+    @property
+    def geometry_json(self):
+        """Returns the raw geometry JSON."""
+        coordinates = self.coordinates
+        if coordinates is None or isinstance(coordinates, dict):
+            return coordinates
+        if isinstance(coordinates, tuple):
+            return {X: coordinates[0], Y: coordinates[1]}
+        return {self.cursor._geometry_key: coordinates}
+
+    @property
+    def spatialReference(self):
+        """Returns the spatial reference of the cursor."""
+        return self.cursor.spatialReference
+
+    @property
+    def feature(self):
+        """Returns the row as a Feature."""
+        return Feature(self.asJSON())
+
+    def get(self, field):
+        """Gets/returns an attribute by field name.
+
+        Arg:
+            field: Name of field for which to get the value.
+        """
+        i = self.cursor._schema_index.get(field)
+        return None if i is None else self.attributes[i]
+
+    @property
+    def geometry(self):
+        """Returns a restapi Geometry() object."""
+        coordinates = self.coordinates
+        if coordinates is None:
+            return None
+        # geometry_json only needs a copy when the raw geometry is stored
+        gd = dict(coordinates) if isinstance(coordinates, dict) else self.geometry_json
+        if SPATIAL_REFERENCE not in gd:
+            gd[SPATIAL_REFERENCE] = self.cursor._row_spatial_reference
+        return Geometry(gd)
+
+    @property
+    def oid(self):
+        """Returns the OID for row."""
+        if self.cursor.OIDFieldName:
+            return self.get(self.cursor.OIDFieldName)
+        return None
+
+    @property
+    def values(self):
+        """Returns values as tuple."""
+        return self.cursor._decode(self)
+
+    def asJSON(self):
+        """Returns the row as feature JSON."""
+        ft = {ATTRIBUTES: dict(zip(self.cursor.schema, self.attributes))}
+        if self.coordinates is not None:
+            ft[GEOMETRY] = self.geometry_json
+        return ft
+
+    def __getitem__(self, i):
+        """Allows for getting a field value by index.
+
+        Arg:
+            i: Index to get value from.
+        """
+        return self.values[i]
+
+    def __repr__(self):
+        return '<CursorRow: {}>'.format(self.attributes)
+
+class CursorFeatures(object):
+    """Read only sequence of the features of a compact Cursor, each feature is
+            only formed as JSON when it is accessed.
+    """
+    __slots__ = ('_rows',)
+
+    def __init__(self, rows):
+        self._rows = rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [lazy_munchify(row.asJSON()) for row in self._rows[i]]
+        return lazy_munchify(self._rows[i].asJSON())
+
+    def __iter__(self):
+        for row in self._rows:
+            yield lazy_munchify(row.asJSON())
+
+    @property
+    def json(self):
+        """Returns the features as a list for serialization."""
+        return [row.asJSON() for row in self._rows]
+
+class Cursor(FeatureSet):
+    """Class to handle Cursor object.
+
+    Attributes:
+        compact: Class attribute, if True the features are converted to 
+            CursorRow objects when the cursor is created and the feature JSON
+            is released.
+        schema: Names of all fields, the order of the values in each row.
+    """
+    json = {}
+    fieldOrder = []
+    field_names = []
+    compact = True
+    BaseRow = CursorRow
 
     def __init__(self, feature_set, fieldOrder=[]):
         """Cursor object for a feature set.
@@ -402,61 +718,27 @@ class Cursor(FeatureSet):
         super(Cursor, self).__init__(feature_set)
         self.fieldOrder = self.__validateOrderBy(fieldOrder)
 
-        cursor = self
-        class Row(cursor.BaseRow):
-            """Class to handle Row object."""
-
-            @property
-            def geometry(self):
-                """Returns a restapi Geometry() object."""
-                if GEOMETRY in self.feature.json:
-                    gd = {k: v for k,v in six.iteritems(self.feature.geometry)}
-                    if SPATIAL_REFERENCE not in gd:
-                        gd[SPATIAL_REFERENCE] = cursor.spatialReference
-                    return Geometry(gd)
-                return None
-
-            @property
-            def oid(self):
-                """Returns the OID for row."""
-                if cursor.OIDFieldName:
-                    return self.get(cursor.OIDFieldName)
-                return None
-
-            @property
-            def values(self):
-                """Returns values as tuple."""
-                # fix date format in milliseconds to datetime.datetime()
-                vals = []
-                for field in cursor.field_names:
-                    if field in cursor.date_fields and self.get(field):
-                        vals.append(mil_to_date(self.get(field)))
-                    elif field in cursor.long_fields and self.get(field):
-                        vals.append(int(self.get(field)))
-                    else:
-                        if field == OID_TOKEN:
-                            vals.append(self.oid)
-                        elif field == SHAPE_TOKEN:
-                            if self.geometry:
-                                vals.append(self.geometry.asShape())
-                            else:
-                                vals.append(None) #null Geometry
-                        else:
-                            vals.append(self.get(field))
-
-                return tuple(vals)
+        features = raw_features(self.json)
+        first = next(features, None)
 
-            def __getitem__(self, i):
-                """Allows for getting a field value by index.
-                
-                Arg:
-                    i: Index to get value from.
-                """
+        # the schema is every field, plus any attribute missing from the fields
+        self.schema = [f.name for f in self.fields if f]
+        if first is not None:
+            attributes = dict.get(first, ATTRIBUTES) or dict.get(first, PROPERTIES) or {}
+            self.schema += [k for k in attributes if k not in self.schema]
+        self._schema_index = {name: i for i, name in enumerate(self.schema)}
+        self._geometry_key = {ESRI_POLYGON: RINGS, ESRI_POLYLINE: PATHS, ESRI_MULTIPOINT: POINTS}.get(self.json.get(GEOMETRY_TYPE))
 
-                return self.values[i]
+        self._row_spatial_reference = self.json.get(SPATIAL_REFERENCE) or self.spatialReference
+        self._decode = self._compile_decoder()
 
-        # expose Row object
-        self.__Row = Row
+        self._rows = None
+        if self.compact:
+            self._rows = [] if first is None else [CursorRow.from_feature(self, first)]
+            self._rows.extend(CursorRow.from_feature(self, ft) for ft in features)
+            header = {k: v for k, v in six.iteritems(dict(self.json)) if k != FEATURES}
+            header[FEATURES] = CursorFeatures(self._rows)
+            self.json = lazy_munchify(header)
 
     @property
     def date_fields(self):
@@ -486,18 +768,63 @@ class Cursor(FeatureSet):
                 names.append(f)
         return names
 
+    def _compile_decoder(self):
+        """Compiles the function that returns the values of a row in the
+                field order, the value positions and converters are resolved
+                once for the schema instead of for every field of every row.
+
+        Returns:
+            A function that takes a CursorRow and returns its values as tuple.
+        """
+        index = self._schema_index
+        date_fields = set(self.date_fields)
+        long_fields = set(self.long_fields)
+        positions, converters = [], []
+        for i, (token, field) in enumerate(zip(self.fieldOrder, self.field_names)):
+            if token == SHAPE_TOKEN:
+                positions.append(None)
+                converters.append((i, _shape_value))
+                continue
+            positions.append(index.get(field))
+            if field in date_fields:
+                # fix date format in milliseconds to datetime.datetime()
+                converters.append((i, _date_value))
+            elif field in long_fields:
+                converters.append((i, _long_value))
+
+        if None not in positions and len(positions) > 1:
+            get = operator.itemgetter(*positions)
+        else:
+            get = lambda attributes: tuple([None if p is None else attributes[p] for p in positions])
+
+        if not converters:
+            return lambda row: get(row.attributes)
+
+        def decode(row):
+            vals = list(get(row.attributes))
+            for i, convert in converters:
+                vals[i] = convert(row, vals[i])
+            return tuple(vals)
+        return decode
+
     def get_rows(self):
         """Returns row objects."""
-        for feature in self.features:
-            yield self._createRow(feature, self.spatialReference)
+        if self._rows is not None:
+            for row in self._rows:
+                yield row
+        else:
+            for feature in self.features:
+                yield self._createRow(feature, self.spatialReference)
 
     def rows(self):
         """Returns Cursor.rows() as generator."""
-        for feature in self.features:
-            yield self._createRow(feature, self.spatialReference).values
+        for row in self.get_rows():
+            yield row.values
 
     def getRow(self, index):
         """Returns row object at index."""
+        if self._rows is not None:
+            return self._rows[index]
         return self._createRow(self.features[index], self.spatialReference)
 
     def _toJson(self, row):
@@ -531,9 +858,9 @@ class Cursor(FeatureSet):
         """Returns Cursor.rows()."""
         return self.rows()
 
-    def _createRow(self, feature, spatialReference):
-        """Creates a row based off of the feature and spatial reference."""
-        return self.__Row(feature, spatialReference)
+    def _createRow(self, feature, spatialReference=None):
+        """Creates a row based off of the feature."""
+        return CursorRow.from_feature(self, feature)
 
     def __validateOrderBy(self, fields):
         """Fixes "fieldOrder" input fields, accepts esri field tokens too ("SHAPE@", "OID@").
@@ -571,7 +898,7 @@ class JsonReplica(JsonGetter):
 
     def __init__(self, in_json):
         """Creates a JSON form input JSON."""
-        self.json = munch.munchify(in_json)
+        self.json = lazy_munchify(in_json)
         super(self.__class__, self).__init__()
 
 class SQLiteReplica(sqlite3.Connection):
@@ -905,7 +1232,7 @@ class Portal(RESTEndpoint):
     @property
     def servers(self):
         servers_url = get_portal_base(self.url).split('/sharing')[0] + '/portaladmin/federation/servers'
-        serversResp = requests.get(servers_url, {TOKEN: self.token.token, F: JSON}, verify=False).json()
+        serversResp = SESSION_MANAGER.get(servers_url, {TOKEN: self.token.token, F: JSON}).json()
         return [ArcServer(s.get('url') + '/rest/services', token=self.token) for s in serversResp.get('servers', [])]
 
 
@@ -934,7 +1261,15 @@ class Portal(RESTEndpoint):
 
 
 class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
-    """Class to handle advanced layer properties."""
+    """Class to handle advanced layer properties.
+
+    Attributes:
+        cache_ttl: Number of seconds counts and extents are cached, 0 disables
+            the cache.
+        chunk_stats: ChunkStats of the last query fetched in chunks.
+    """
+    cache_ttl = 60
+    chunk_stats = None
 
     def _fix_fields(self, fields):
         """Fixes input fields, accepts esri field tokens too ("SHAPE@", "OID@"), internal
@@ -981,7 +1316,9 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
 
         # set fields to full field definition of the layer
         if isinstance(server_response, requests.Response):
-            server_response = munchify(server_response.json())
+            server_response = lazy_munchify(server_response.json())
+        elif type(server_response) is dict:
+            server_response = lazy_munchify(server_response)
         flds = self.fieldLookup
         if FIELDS in server_response:
             for i,fld in enumerate(server_response.fields):
@@ -1018,7 +1355,8 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
             where: Optional where clause. Defaults to '1=1'.
             add_params: Optional extra parameters to add to query string passed 
                 as dict. Defaults to {}.
-            f: Optional return format, default is JSON.  (html|json|kmz)
+            f: Optional return format, default is JSON.  (html|json|kmz|pbf)
+                "pbf" falls back to JSON when the layer does not support it.
             kwargs: Optional extra parameters to add to query string passed as 
                 key word arguments, will override add_params***.
 
@@ -1057,8 +1395,19 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
 
         elif self.type == TABLE:
             del params[RETURN_GEOMETRY]
+
+        # pbf is only returned for feature queries, fall back to JSON otherwise
+        if params[F] == PBF:
+            if not self.supports_pbf or any(params.get(k) in (TRUE, True) for k in (RETURN_IDS_ONLY, RETURN_COUNT_ONLY, RETURN_EXTENT_ONLY)):
+                params[F] = JSON
         return params
 
+    @property
+    def supports_pbf(self):
+        """True if the layer can return query results as protocol buffers (f=pbf)."""
+        formats = self.json.get(SUPPORTED_QUERY_FORMATS) or ''
+        return PBF in [fmt.strip().lower() for fmt in formats.split(',')]
+
     def iter_queries(self, where='1=1', add_params={}, max_recs=None, chunk_size=None, **kwargs):
         """Generator to form where clauses to query all records.  Will iterate 
                 through "chunks" of OID's until all records have been returned 
@@ -1083,19 +1432,29 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
 
         # get oids
         resp = self.query(where=where, add_params=add_params)
-        oids = sorted(resp.get(OBJECT_IDS, []))[:max_recs]
-        oid_name = resp.get(OID_FIELD_NAME, OBJECTID)
-        print('total records: {0}'.format(len(oids)))
 
         # set returnIdsOnly to False
         add_params[RETURN_IDS_ONLY] = FALSE
 
+        for where2 in self._iter_oid_wheres(resp, max_recs, chunk_size):
+            yield where2
+
+    def _iter_oid_wheres(self, resp, max_recs=None, chunk_size=None):
+        """Forms the OID range where clauses for each chunk from a 
+                returnIdsOnly response.
+
+        Args:
+            resp: Response from a query with returnIdsOnly=true.
+            max_recs: Optional maximum amount of records returned for all queries.
+            chunk_size: Optional size of chunks for each query.
+        """
+        oids = sorted(resp.get(OBJECT_IDS) or [])[:max_recs]
+        oid_name = resp.get(OID_FIELD_NAME, OBJECTID)
+        print('total records: {0}'.format(len(oids)))
+
         # iterate through groups to form queries
         # overwrite max_recs here with transfer limit from service
-        if chunk_size and chunk_size < self.json.get(MAX_RECORD_COUNT, 1000):
-            max_recs = chunk_size
-        else:
-            max_recs = self.json.get(MAX_RECORD_COUNT, 1000)
+        max_recs = self._get_chunk_size(chunk_size)
         for each in zip_longest(*(iter(oids),) * max_recs):
             theRange = list(filter(lambda x: x != None, each)) # do not want to remove OID "0"
             if theRange:
@@ -1103,8 +1462,202 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
                 del each
                 yield '{0} >= {1} and {0} <= {2}'.format(oid_name, _min, _max)
 
+    def _get_chunk_size(self, chunk_size=None):
+        """Returns the number of records to fetch per request, which can not 
+                be larger than the layer's maxRecordCount.
+        """
+        if chunk_size and chunk_size < self.json.get(MAX_RECORD_COUNT, 1000):
+            return chunk_size
+        return self.json.get(MAX_RECORD_COUNT, 1000)
+
+    def _get_pagination(self, pagination=None):
+        """Returns the pagination strategy for fetching all records.
+
+        Arg:
+            pagination: Optional strategy, "offset" pages through the results 
+                with resultOffset/resultRecordCount, "oid" queries ranges of 
+                OBJECTIDs.  Default is None to use "offset" if the layer 
+                supports pagination, otherwise "oid".
 
-    def query(self, where='1=1', fields='*', add_params={}, records=None, exceed_limit=False, fetch_in_chunks=False, f=DEFAULT_REQUEST_FORMAT, kmz='', **kwargs):
+        Raises:
+            ValueError: 'Invalid pagination "{}", must be "offset", "oid" or None'
+        """
+        if pagination in (PAGINATION_OFFSET, PAGINATION_OID):
+            return pagination
+        elif pagination is not None:
+            raise ValueError('Invalid pagination "{}", must be "{}", "{}" or None'.format(pagination, PAGINATION_OFFSET, PAGINATION_OID))
+        capabilities = self.json.get(ADVANCED_QUERY_CAPABILITIES) or {}
+        if capabilities.get(SUPPORTS_PAGINATION) and self.OIDFieldName:
+            return PAGINATION_OFFSET
+        return PAGINATION_OID
+
+    def _get_chunk_sizer(self, chunk_size=None):
+        """Returns the ChunkSizer for a query, its statistics are available in 
+                the chunk_stats property once the query has started.
+
+        Arg:
+            chunk_size: Optional number of records per request or a ChunkSizer
+                such as AdaptiveChunkSizer. Default is None to use maxRecordCount.
+        """
+        if isinstance(chunk_size, ChunkSizer):
+            sizer = chunk_size
+        else:
+            sizer = ChunkSizer(self._get_chunk_size(chunk_size))
+        sizer.bind(self.json.get(MAX_RECORD_COUNT, 1000))
+        self.chunk_stats = sizer.stats
+        return sizer
+
+    def _iter_oid_chunks(self, resp, where='1=1', max_recs=None, sizer=None):
+        """Groups the OIDs from a returnIdsOnly response into chunks that each
+                return close to the sizer's chunk size.
+
+        Args:
+            resp: Response from a query with returnIdsOnly=true.
+            where: Optional where clause for the query.
+            max_recs: Optional maximum amount of records returned for all queries.
+            sizer: Optional ChunkSizer, the size is read as each chunk is formed.
+        """
+        oids = sorted(resp.get(OBJECT_IDS) or [])[:max_recs]
+        oid_name = resp.get(OID_FIELD_NAME) or self.OIDFieldName or OBJECTID
+        print('total records: {0}'.format(len(oids)))
+
+        sizer = sizer or self._get_chunk_sizer()
+        user_where = where.replace('1=1', '') #remove default
+        i = 0
+        while i < len(oids):
+            size = sizer.size
+            yield OIDChunk(oids[i:i + size], oid_name, user_where)
+            i += size
+
+    def _iter_offset_chunks(self, count, params, max_recs=None, sizer=None):
+        """Forms the resultOffset/resultRecordCount pages of a query.
+
+        Args:
+            count: Number of records matching the query.
+            params: Validated query parameters.
+            max_recs: Optional maximum amount of records returned for all queries.
+            sizer: Optional ChunkSizer, the size is read as each page is formed.
+        """
+        total = min(count, max_recs) if max_recs else count
+        print('total records: {0}'.format(total))
+
+        # a stable sort order is required so pages do not overlap
+        order_by = params.get(ORDER_BY_FIELDS) or self.OIDFieldName
+        sizer = sizer or self._get_chunk_sizer()
+        offset = 0
+        while offset < total:
+            size = min(sizer.size, total - offset)
+            yield OffsetChunk(offset, size, order_by)
+            offset += size
+
+    def _iter_chunks(self, where, params, max_recs=None, sizer=None, pagination=None):
+        """Yields a QueryChunk for each request needed to fetch all records.
+
+        Args:
+            where: Where clause for the query.
+            params: Validated query parameters.
+            max_recs: Optional maximum amount of records returned for all queries.
+            sizer: Optional ChunkSizer for the size of each chunk.
+            pagination: Optional pagination strategy (offset|oid), see _get_pagination().
+        """
+        if self._get_pagination(pagination) == PAGINATION_OFFSET:
+            count_params = dict(params)
+            count_params.update({RETURN_COUNT_ONLY: TRUE, RETURN_GEOMETRY: FALSE, F: JSON})
+            count = self.request(self.url + '/query', count_params).get(COUNT) or 0
+            for page in self._iter_offset_chunks(count, params, max_recs, sizer):
+                yield page
+        else:
+            ids_params = dict(params)
+            ids_params.update({RETURN_IDS_ONLY: TRUE, RETURN_GEOMETRY: FALSE, F: JSON})
+            resp = self.request(self.url + '/query', ids_params)
+            for chunk in self._iter_oid_chunks(resp, where, max_recs, sizer):
+                yield chunk
+
+    def _fetch_chunk(self, query_url, params, sizer, chunk, retries=None):
+        """Fetches a chunk, any records left out because the server truncated 
+                the response are fetched with follow up requests.  If the request
+                fails with a transient error and the sizer allows retries, the 
+                chunk is split in half and each half is retried, other errors 
+                are raised right away.
+
+        Args:
+            query_url: Full url to the query endpoint.
+            params: Validated query parameters.
+            sizer: The ChunkSizer that records each response.
+            chunk: A QueryChunk.
+            retries: Optional number of retries left, defaults to sizer.max_retries.
+        """
+        chunk_params = dict(params)
+        chunk_params.update(chunk.params)
+        try:
+            raw = self.request(query_url, chunk_params, ret_json=False)
+            resp = handle_response(query_url, raw, as_munch=False)
+        except (RuntimeError, NameError, requests.exceptions.RequestException) as e:
+            if not _is_transient_error(e):
+                raise
+            sizer.record_error(chunk.size, e)
+            retries = sizer.max_retries if retries is None else retries
+            parts = chunk.split()
+            if retries < 1 or not parts:
+                raise
+            resp = self._fetch_chunk(query_url, params, sizer, parts[0], retries - 1)
+            for part in parts[1:]:
+                resp[FEATURES] += self._fetch_chunk(query_url, params, sizer, part, retries - 1)[FEATURES]
+            return resp
+
+        sizer.record(chunk.size, len(resp.get(FEATURES) or []), raw.elapsed.total_seconds(), len(raw.content))
+        remainder = chunk.remainder(resp, self.OIDFieldName)
+        for extra in remainder:
+            resp[FEATURES] += self._fetch_chunk(query_url, params, sizer, extra)[FEATURES]
+        if remainder:
+            resp.pop(EXCEEDED_TRANSFER_LIMIT, None)
+        return resp
+
+    def _stream_chunk(self, query_url, params, sizer, chunk, retries=None):
+        """Generator version of _fetch_chunk() that yields the features of a 
+                chunk as they are parsed from the response, only the OIDs are 
+                kept to find records left out of a truncated response.  A chunk 
+                is only split and retried if it fails with a transient error before 
+                any feature was read.
+
+        Args:
+            query_url: Full url to the query endpoint.
+            params: Validated query parameters.
+            sizer: The ChunkSizer that records each response.
+            chunk: A QueryChunk.
+            retries: Optional number of retries left, defaults to sizer.max_retries.
+        """
+        chunk_params = dict(params)
+        chunk_params.update(chunk.params)
+        oid_field = self.OIDFieldName
+        start = time.time()
+        stream, oids = None, []
+        try:
+            stream = self.stream_request(query_url, chunk_params)
+            for feature in stream:
+                oids.append(feature_oid(feature, oid_field))
+                yield feature
+        except (RuntimeError, NameError, requests.exceptions.RequestException) as e:
+            if (stream is not None and stream.count) or not _is_transient_error(e):
+                raise
+            sizer.record_error(chunk.size, e)
+            retries = sizer.max_retries if retries is None else retries
+            parts = chunk.split()
+            if retries < 1 or not parts:
+                raise
+            for part in parts:
+                for feature in self._stream_chunk(query_url, params, sizer, part, retries - 1):
+                    yield feature
+            return
+
+        sizer.record(chunk.size, stream.count, time.time() - start, stream.bytes)
+        summary = {FEATURES: [{ATTRIBUTES: {oid_field: oid}} for oid in oids],
+                   EXCEEDED_TRANSFER_LIMIT: stream.header.get(EXCEEDED_TRANSFER_LIMIT)}
+        for extra in chunk.remainder(summary, oid_field):
+            for feature in self._stream_chunk(query_url, params, sizer, extra):
+                yield feature
+
+    def query(self, where='1=1', fields='*', add_params={}, records=None, exceed_limit=False, fetch_in_chunks=False, f=DEFAULT_REQUEST_FORMAT, kmz='', max_workers=None, pagination=None, chunk_size=None, **kwargs):
         """Queries layer and gets response as JSON.
         
         Args:
@@ -1120,9 +1673,24 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
             fetch_in_chunks: Option to return a generator with a FeatureSet in 
                 chunks of each query group.  Use this to avoid memory errors when 
                 fetching many features. Defaults to False
-            f: Return format, default is JSON.  (html|json|kmz)
+            f: Return format, default is JSON.  (html|json|kmz|pbf)  "pbf" 
+                requests compact protocol buffer responses which are decoded 
+                into the same FeatureSet, it falls back to JSON when the layer 
+                does not list PBF in its supportedQueryFormats.
             kmz: Optional full path to output kmz file.  Only used if output 
                 format is "kmz". Defaults to ''.
+            max_workers: Optional number of concurrent requests to use when 
+                exceed_limit is True.  Features are always returned in the same 
+                order as a serial query. Default is None to fetch one chunk at a time.
+            pagination: Optional strategy used when exceed_limit is True. "offset"
+                pages through the results with resultOffset and resultRecordCount, 
+                "oid" fetches ranges of OBJECTIDs.  Default is None to use "offset" 
+                when the layer supports pagination, otherwise "oid".
+            chunk_size: Optional number of records per request when exceed_limit 
+                is True, or an AdaptiveChunkSizer to adjust the size to the 
+                observed response times and sizes.  Statistics for the query are 
+                available in the chunk_stats property.  Default is None to use 
+                the maxRecordCount.
             kwargs: Optional extra parameters to add to query string passed as key word arguments,
                 will override add_params***.
 
@@ -1158,10 +1726,8 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
             server_response = {}
             if exceed_limit:
 
-                for i, where2 in enumerate(self.iter_queries(where, params, max_recs=records)):
-                    sql = ' and '.join(filter(None, [where.replace('1=1', ''), where2])) #remove default
-                    params[WHERE] = sql
-                    resp = self.request(query_url, params)
+                chunks = self._iter_chunk_responses(query_url, where, params, records, max_workers, pagination, chunk_size)
+                for i, resp in enumerate(chunks):
                     if i < 1:
                         server_response = resp
                     else:
@@ -1175,7 +1741,32 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
 
             return self._format_server_response(server_response, records)
 
-    def query_in_chunks(self, where='1=1', fields='*', add_params={}, records=None, **kwargs):
+    def _iter_chunk_responses(self, query_url, where, params, records=None, max_workers=None, pagination=None, chunk_size=None, window=None,
+                              local_sr=None):
+        """Fetches every chunk from _iter_chunks() and yields the raw 
+                responses in chunk order, using up to max_workers concurrent requests.
+
+        Args:
+            query_url: Full url to the query endpoint.
+            where: Where clause for the query.
+            params: Validated query parameters, a copy is made for each chunk.
+            records: Optional maximum number of records to return.
+            max_workers: Optional number of concurrent requests.
+            pagination: Optional pagination strategy (offset|oid).
+            chunk_size: Optional number of records per request or a ChunkSizer.
+            window: Optional number of chunks to fetch ahead, see imap_ordered().
+            local_sr: Optional spatial reference to project the geometries of
+                each response to on the client, in the fetching thread.
+        """
+        sizer = self._get_chunk_sizer(chunk_size)
+        fetch_chunk = functools.partial(self._fetch_chunk, query_url, params, sizer)
+        if local_sr:
+            fetch_chunk = functools.partial(_project_response, fetch_chunk, local_sr)
+        chunks = self._iter_chunks(where, params, records, sizer, pagination)
+        return imap_ordered(fetch_chunk, chunks, max_workers, window)
+
+    def query_in_chunks(self, where='1=1', fields='*', add_params={}, records=None, max_workers=None, pagination=None, chunk_size=None, f=JSON,
+                        local_sr=None, **kwargs):
         """Queries a layer in chunks and returns a generator.
         
         Args:
@@ -1185,6 +1776,16 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
             records: Optional number of records to return.  Default is None to 
                 return all. Records within bounds of max record count unless 
                 exceed_limit is True.
+            max_workers: Optional number of concurrent requests.  Chunks are still 
+                yielded in order and only a small window of chunks is fetched 
+                ahead of the consumer. Default is None to fetch one chunk at a time.
+            pagination: Optional pagination strategy (offset|oid), see query().
+            chunk_size: Optional number of records per request or an 
+                AdaptiveChunkSizer, see query().
+            f: Optional return format (json|pbf), see query(). Default is JSON.
+            local_sr: Optional wkid to project the geometries to on the client
+                with restapi.reproject, instead of the server's outSR. 
+                Defaults to None.
             kwargs: Optional extra parameters to add to query string passed as key word arguments,
                 will override add_params***.
 
@@ -1195,12 +1796,344 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
 
         query_url = self.url + '/query'
 
-        params = self._validate_params(where, fields, add_params, **kwargs)
-        for where2 in self.iter_queries(where, params, max_recs=records):
-            sql = ' and '.join(filter(None, [where.replace('1=1', ''), where2])) #remove default
-            params[WHERE] = sql
-            # print('FIELDS: ', params.get('fields'))
-            yield self._format_server_response(self.request(query_url, params))
+        params = self._validate_params(where, fields, add_params, f, **kwargs)
+        for resp in self._iter_chunk_responses(query_url, where, params, records, max_workers, pagination, chunk_size,
+                                               local_sr=local_sr):
+            yield self._format_server_response(resp)
+
+    def iter_record_batches(self, where='1=1', fields='*', add_params={}, records=None, max_workers=None, pagination=None, chunk_size=None, f=JSON, **kwargs):
+        """Generator that yields each query chunk as an Arrow record batch, with
+                the geometry as WKB in a GeoParquet "geometry" column.  Every
+                batch has the schema of the first one.  Requires numpy and pyarrow.
+
+        Args:
+            where: Optional where clause. Defaults to '1=1'.
+            fields: Optional fields to return. Default is "*" to return all fields.
+            add_params: Optional extra parameters to add to query string passed as dict.
+            records: Optional number of records to return.  Default is None to 
+                return all.
+            max_workers: Optional number of concurrent requests, see query_in_chunks().
+            pagination: Optional pagination strategy (offset|oid), see query().
+            chunk_size: Optional number of records per request or an 
+                AdaptiveChunkSizer, see query().
+            f: Optional return format (json|pbf), see query(). Default is JSON.
+            kwargs: Optional extra parameters to add to query string passed as key word arguments,
+                will override add_params***.
+        """
+        schema = None
+        for fs in self.query_in_chunks(where, fields, add_params, records, max_workers, pagination, chunk_size, f, **kwargs):
+            # the layer fields have the coded value domains and exact types
+            cfs = ColumnarFeatureSet.from_feature_set(fs, self.fields)
+            if schema is None:
+                schema = arrow_schema(cfs.fields, cfs.geometryType, cfs.spatialReference, cfs.hasZ, cfs.hasM)
+            yield record_batch(cfs, schema)
+
+    def _export_chunks(self, chunks, open_writer, prepare, decode_workers=None, processes=False):
+        """Runs an export as three overlapping stages, see run_pipeline(): 
+                fetching the query chunks, converting them and writing them.
+                The statistics of each stage are kept in pipeline_stats.  The
+                export methods share these arguments:
+
+                max_workers: Optional number of concurrent requests, see 
+                    query_in_chunks().
+                decode_workers: Optional number of chunks converted at the 
+                    same time. Default is None to convert one chunk at a time.
+                processes: Optional boolean, True to convert the chunks in a 
+                    process pool instead of threads. Defaults to False.
+                exceed_limit: Optional boolean, False to export the single 
+                    request of query(), at most maxRecordCount records. 
+                    Defaults to True to export every chunk.
+                kwargs: Optional keyword arguments for query_in_chunks().
+
+        Args:
+            chunks: Iterator of the query chunks.
+            open_writer: Function of the first chunk that returns the writer,
+                called with None when the query returned no features so the
+                output is still created with the layer fields.
+            prepare: Function of the writer that returns the conversion and
+                write functions of the stages.  The conversion is a module
+                level function so it can be sent to a process pool.
+            decode_workers: See above.
+            processes: See above.
+
+        Returns:
+            The closed writer.
+        """
+        first = next(chunks, None)
+        with open_writer(first) as writer:
+            if first is not None:
+                decode, write = prepare(writer)
+                self.pipeline_stats = run_pipeline(itertools.chain([first], chunks), decode, write,
+                                                   decode_workers, processes)
+        return writer
+
+    def _export_source(self, where, fields, params, records, max_workers, exceed_limit=True, raw=False,
+                       local_sr=None, **kwargs):
+        """Returns the chunks of an export, see _export_chunks().  raw yields 
+                the response dicts instead of FeatureSets."""
+        if exceed_limit:
+            if raw:
+                return self._iter_raw_chunks(where, fields, params, records, max_workers, local_sr=local_sr, **kwargs)
+            return self.query_in_chunks(where, fields, params, records, max_workers, local_sr=local_sr, **kwargs)
+
+        # one request, like query()
+        limit = self.json.get(MAX_RECORD_COUNT, 1000)
+        fs = self.query(where, fields, params, min(records or limit, limit), **kwargs)
+        if local_sr:
+            fs = fs.project(local_sr)
+        return iter([fs.json if raw else fs])
+
+    def export_parquet(self, out_path, fields='*', where='1=1', records=None, params={}, compression='snappy',
+                       max_workers=None, decode_workers=None, processes=False, exceed_limit=True, **kwargs):
+        """Exports the layer to a GeoParquet file.  Requires numpy and pyarrow.
+
+        Args:
+            out_path: Full path to the output .parquet file.
+            fields: Optional list of fields. Defaults to '*'.
+            where: Optional where clause. Defaults to '1=1'.
+            records: Optional number of records to return. Default is None to 
+                return all.
+            params: Optional dictionary of parameters for query. Defaults to {}.
+            compression: Optional Parquet compression codec. Defaults to 'snappy'.
+            max_workers, decode_workers, processes, exceed_limit, kwargs: See 
+                _export_chunks().
+
+        Returns:
+            The path to the output file.
+        """
+        def open_writer(first):
+            writer = ParquetWriter(out_path, compression=compression)
+            if first is None:
+                # no features, still write the layer schema
+                writer.schema = arrow_schema(self.fields, getattr(self, GEOMETRY_TYPE, None), self.json.get(EXTENT, {}).get(SPATIAL_REFERENCE))
+            return writer
+
+        chunks = self._export_source(where, fields, params, records, max_workers, exceed_limit, **kwargs)
+        self._export_chunks(chunks, open_writer, lambda writer: (functools.partial(_record_batch, self.fields), writer.write),
+                            decode_workers, processes)
+        print('Created: "{0}"'.format(out_path))
+        return out_path
+
+    def export_shapefile(self, out_path, fields='*', where='1=1', records=None, params={},
+                         max_workers=None, decode_workers=None, processes=False, exceed_limit=True, **kwargs):
+        """Exports the layer to a shapefile without arcpy.  Every query chunk is
+                appended to the same shapefile as soon as it arrives, so memory 
+                use does not grow with the size of the layer.
+
+        Args:
+            out_path: Full path to the output shapefile.
+            fields: Optional list of fields. Defaults to '*'.
+            where: Optional where clause. Defaults to '1=1'.
+            records: Optional number of records to return. Default is None to 
+                return all.
+            params: Optional dictionary of parameters for query. Defaults to {}.
+            max_workers, decode_workers, processes, exceed_limit, kwargs: See 
+                _export_chunks().
+
+        Returns:
+            The path to the output shapefile.
+        """
+        def open_writer(first):
+            if first is None:
+                return ShapefileStreamWriter(out_path, self.fields, getattr(self, GEOMETRY_TYPE), self.getSR())
+            return ShapefileStreamWriter.from_feature_set(first, out_path)
+
+        chunks = self._export_source(where, fields, params, records, max_workers, exceed_limit, **kwargs)
+        return self._export_chunks(chunks, open_writer, _row_stages(_shapefile_rows), decode_workers, processes).path
+
+    def export_geopackage(self, out_path, fields='*', where='1=1', records=None, params={},
+                          max_workers=None, decode_workers=None, processes=False, exceed_limit=True, **kwargs):
+        """Exports the layer to a GeoPackage table without arcpy.  Every query 
+                chunk is inserted as soon as it arrives and the spatial index
+                is built after the load.
+
+        Args:
+            out_path: Full path to the output .gpkg file, or a table inside it 
+                such as "data.gpkg/parcels".
+            fields: Optional list of fields. Defaults to '*'.
+            where: Optional where clause. Defaults to '1=1'.
+            records: Optional number of records to return. Default is None to 
+                return all.
+            params: Optional dictionary of parameters for query. Defaults to {}.
+            max_workers, decode_workers, processes, exceed_limit, kwargs: See 
+                _export_chunks().
+
+        Returns:
+            The path to the output GeoPackage table.
+        """
+        def open_writer(first):
+            if first is None:
+                return GeoPackageWriter(out_path, self.fields, getattr(self, GEOMETRY_TYPE, None), self.getSR())
+            return GeoPackageWriter.from_feature_set(first, out_path)
+
+        chunks = self._export_source(where, fields, params, records, max_workers, exceed_limit, **kwargs)
+        self._export_chunks(chunks, open_writer, _row_stages(_geopackage_rows), decode_workers, processes)
+        return out_path
+
+    def export_flatgeobuf(self, out_path, fields='*', where='1=1', records=None, params={}, index_node_size=16,
+                          max_workers=None, decode_workers=None, processes=False, exceed_limit=True, **kwargs):
+        """Exports the layer to a FlatGeobuf file with a packed Hilbert R-tree
+                index.  Encoded features are spilled to a temporary file as the
+                chunks arrive and only their bounding boxes are kept in 
+                memory until the index is written.
+
+        Args:
+            out_path: Full path to the output .fgb file.
+            fields: Optional list of fields. Defaults to '*'.
+            where: Optional where clause. Defaults to '1=1'.
+            records: Optional number of records to return. Default is None to 
+                return all.
+            params: Optional dictionary of parameters for query. Defaults to {}.
+            index_node_size: Optional number of children of each index node, 
+                0 writes no spatial index. Defaults to 16.
+            max_workers, decode_workers, processes, exceed_limit, kwargs: See 
+                _export_chunks().
+
+        Returns:
+            The path to the output file.
+        """
+        def open_writer(first):
+            if first is None:
+                return FlatGeobufWriter(out_path, self.fields, getattr(self, GEOMETRY_TYPE, None), self.getSR(),
+                                        index_node_size=index_node_size)
+            return FlatGeobufWriter.from_feature_set(first, out_path, index_node_size=index_node_size)
+
+        chunks = self._export_source(where, fields, params, records, max_workers, exceed_limit, **kwargs)
+        self._export_chunks(chunks, open_writer, _row_stages(_flatgeobuf_features), decode_workers, processes)
+        return out_path
+
+    def _iter_raw_chunks(self, where='1=1', fields='*', add_params={}, records=None, max_workers=None,
+                         pagination=None, chunk_size=None, local_sr=None, **kwargs):
+        """Queries the layer in chunks and yields each JSON response as a
+                plain dict, without building a FeatureSet.  See query_in_chunks()
+                for the arguments.
+        """
+        query_url = self.url + '/query'
+        params = self._validate_params(where, fields, add_params, JSON, **kwargs)
+        return self._iter_chunk_responses(query_url, where, params, records, max_workers, pagination, chunk_size,
+                                          local_sr=local_sr)
+
+    def _export_text(self, writer_factory, prepare, out_path, fields, where, records, params,
+                     max_workers, decode_workers, processes, exceed_limit=True, **kwargs):
+        """Writes the raw chunk responses of a query with a line based writer
+                from textformats, see export_ndjson() and export_csv()."""
+        def open_writer(first):
+            # the fields and geometry type of the first response are needed for the header
+            first = first or {FIELDS: self.fields, GEOMETRY_TYPE: getattr(self, GEOMETRY_TYPE, None)}
+            lookup = self.fieldLookup
+            out_fields = [lookup.get(f.get(NAME)) or f for f in first.get(FIELDS) or self.fields]
+            return writer_factory(out_path, out_fields, first.get(GEOMETRY_TYPE), first.get(HAS_Z), first.get(HAS_M))
+
+        chunks = self._export_source(where, fields, params, records, max_workers, exceed_limit, raw=True, **kwargs)
+        self._export_chunks(chunks, open_writer, _row_stages(prepare), decode_workers, processes)
+        return out_path
+
+    def export_ndjson(self, out_path, fields='*', where='1=1', records=None, params={}, decode_domains=True,
+                      max_workers=None, decode_workers=None, processes=False, exceed_limit=True, **kwargs):
+        """Exports the layer to newline delimited GeoJSON, one Feature per line.
+                The raw query responses are converted and written as they
+                arrive, without building a FeatureSet.  Dates are written as
+                ISO 8601 UTC strings and a path ending with ".gz", ".bz2" or
+                ".xz" is compressed on the fly.
+
+        Args:
+            out_path: Full path to the output file, such as "parcels.geojsonl.gz".
+            fields: Optional list of fields. Defaults to '*'.
+            where: Optional where clause. Defaults to '1=1'.
+            records: Optional number of records to return. Default is None to
+                return all.
+            params: Optional dictionary of parameters for query. Defaults to {}.
+            decode_domains: Optional boolean, False to write the codes of coded
+                value domain fields instead of their names. Defaults to True.
+            max_workers, decode_workers, processes, exceed_limit, kwargs: See 
+                _export_chunks().
+
+        Returns:
+            The path to the output file.
+        """
+        def writer_factory(path, out_fields, geometryType, hasZ, hasM):
+            return NDJSONWriter(path, out_fields, geometryType, hasZ, self.fields, decode_domains)
+        return self._export_text(writer_factory, _ndjson_lines, out_path, fields, where, records, params,
+                                 max_workers, decode_workers, processes, exceed_limit, **kwargs)
+
+    def export_csv(self, out_path, fields='*', where='1=1', records=None, params={}, geometry='wkt', decode_domains=True,
+                   max_workers=None, decode_workers=None, processes=False, exceed_limit=True, **kwargs):
+        """Exports the layer to a CSV file with a header row.  The raw query
+                responses are converted and written as they arrive, without
+                building a FeatureSet.  Dates are written as ISO 8601 UTC strings
+                and a path ending with ".gz", ".bz2" or ".xz" is compressed on
+                the fly.
+
+        Args:
+            out_path: Full path to the output file, such as "parcels.csv".
+            fields: Optional list of fields. Defaults to '*'.
+            where: Optional where clause. Defaults to '1=1'.
+            records: Optional number of records to return. Default is None to
+                return all.
+            params: Optional dictionary of parameters for query. Defaults to {}.
+            geometry: Optional geometry columns, "wkt" for a WKT column, "xy"
+                for X and Y columns (point layers only) or None for none.
+                Defaults to "wkt".
+            decode_domains: Optional boolean, False to write the codes of coded
+                value domain fields instead of their names. Defaults to True.
+            max_workers, decode_workers, processes, exceed_limit, kwargs: See 
+                _export_chunks().
+
+        Returns:
+            The path to the output file.
+        """
+        def writer_factory(path, out_fields, geometryType, hasZ, hasM):
+            return CSVWriter(path, out_fields, geometryType, hasZ, hasM, geometry, self.fields, decode_domains)
+        return self._export_text(writer_factory, _csv_rows, out_path, fields, where, records, params,
+                                 max_workers, decode_workers, processes, exceed_limit, **kwargs)
+
+    def iter_features(self, where='1=1', fields='*', add_params={}, records=None, max_workers=None, prefetch=2, pagination=None, chunk_size=None, f=DEFAULT_REQUEST_FORMAT, stream=False, **kwargs):
+        """Generator that yields every feature of a query as a Feature, one at 
+                a time.  Unlike query(exceed_limit=True) the chunks are never 
+                combined, each chunk is released as soon as its features have 
+                been consumed, so memory use stays constant no matter how 
+                many features the layer has.
+
+        Args:
+            where: Optional where clause. Defaults to '1=1'.
+            fields: Optional fields to return. Default is "*" to return all fields.
+            add_params: Optional extra parameters to add to query string passed as dict.
+            records: Optional number of records to return.  Default is None to 
+                return all.
+            max_workers: Optional number of concurrent requests. Default is None.
+            prefetch: Optional number of chunks to fetch ahead of the consumer.  At 
+                most this many chunks (plus the one being consumed) are held in 
+                memory. Defaults to 2.
+            pagination: Optional pagination strategy (offset|oid), see query().
+            chunk_size: Optional number of records per request or an 
+                AdaptiveChunkSizer, see query().
+            f: Optional return format (json|geojson|pbf). Defaults to DEFAULT_REQUEST_FORMAT.
+            stream: Optional boolean to parse each chunk incrementally as it is 
+                read from the socket, so only about one feature is held in 
+                memory at a time.  Chunks are then fetched one at a time and 
+                max_workers and prefetch are ignored.  Not used for "pbf". 
+                Defaults to False.
+            kwargs: Optional extra parameters to add to query string passed as key word arguments,
+                will override add_params***.
+        """
+        query_url = self.url + '/query'
+        params = self._validate_params(where, fields, add_params, f, **kwargs)
+        if stream and params[F] != PBF:
+            sizer = self._get_chunk_sizer(chunk_size)
+            for chunk in self._iter_chunks(where, params, records, sizer, pagination):
+                for feature in self._stream_chunk(query_url, params, sizer, chunk):
+                    yield Feature(feature)
+            return
+
+        window = max(prefetch or 0, max_workers or 0) or None
+        for resp in self._iter_chunk_responses(query_url, where, params, records, max_workers, pagination, chunk_size, window):
+            features = resp.get(FEATURES) or []
+            del resp
+
+            # pop from the end so each feature is released once consumed
+            features.reverse()
+            while features:
+                yield Feature(features.pop())
 
 
     def query_related_records(self, objectIds, relationshipId, outFields='*', definitionExpression=None, returnGeometry=None, outSR=None, **kwargs):
@@ -1328,16 +2261,111 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
 
         return sorted(self.query(where=where, add_params=p)[OBJECT_IDS])[:max_recs]
 
-    def getCount(self, where='1=1', **kwargs):
+    def _query_cached(self, params, use_cache=True):
+        """Makes a query request, the response is cached for cache_ttl seconds.
+
+        Args:
+            params: Validated query parameters.
+            use_cache: Optional boolean, if False a cached response is ignored 
+                and replaced. Defaults to True.
+        """
+        key = json.dumps(params, sort_keys=True, default=str)
+        cached = self._cache_get(key) if use_cache else None
+        if cached is not None:
+            return cached
+        return self._cache_put(key, self.request(self.url + '/query', dict(params)))
+
+    def _cache_get(self, key):
+        """Returns a cached response that has not expired yet, or None."""
+        cached = self.__dict__.get('_query_cache', {}).get(key)
+        if cached and cached[0] > time.time():
+            return cached[1]
+
+    def _cache_put(self, key, resp):
+        """Caches a response for cache_ttl seconds and returns it."""
+        if self.cache_ttl:
+            cache = self.__dict__.setdefault('_query_cache', {})
+            now = time.time()
+
+            # drop expired entries so the cache can not grow unbounded
+            for k in [k for k, v in six.iteritems(cache) if v[0] <= now]:
+                cache.pop(k, None)
+            cache[key] = (now + self.cache_ttl, resp)
+        return resp
+
+    def clear_cache(self):
+        """Clears cached counts and extents."""
+        self.__dict__.get('_query_cache', {}).clear()
+
+    def _count_params(self, where='1=1', **kwargs):
+        """Returns the parameters for a returnCountOnly query."""
+        p = {RETURN_COUNT_ONLY: TRUE, RETURN_GEOMETRY: FALSE}
+        for k,v in six.iteritems(kwargs):
+            if k not in p:
+                p[k] = v
+        return self._validate_params(where, '', p, JSON)
+
+    def _extent_params(self, where='1=1', outSR=None, **kwargs):
+        """Returns the parameters for a returnExtentOnly query."""
+        p = {RETURN_EXTENT_ONLY: TRUE, RETURN_GEOMETRY: FALSE}
+        if outSR:
+            p[OUT_SR] = outSR
+        for k,v in six.iteritems(kwargs):
+            if k not in p:
+                p[k] = v
+        return self._validate_params(where, '', p, JSON)
+
+    def _format_extent(self, extent):
+        """Makes sure an extent returned by the server has a spatial reference."""
+        extent = munch.munchify(extent)
+        if not extent.get(SPATIAL_REFERENCE):
+            extent[SPATIAL_REFERENCE] = self.json.get(EXTENT, {}).get(SPATIAL_REFERENCE)
+        return extent
+
+    def getCount(self, where='1=1', use_cache=True, **kwargs):
         """Returns count of features, can use optional query and **kwargs to filter.
+                The count is computed by the server (returnCountOnly) and cached 
+                for cache_ttl seconds.
         
         Args:
             where: Optional where clause, defaults to '*'.
+            use_cache: Optional boolean, set to False to always ask the server.
+                Defaults to True.
             kwargs: Optional keyword arguments for query operation. 
         """
 
+        resp = self._query_cached(self._count_params(where, **kwargs), use_cache)
+        if COUNT in resp:
+            return resp[COUNT]
+
+        # server does not support returnCountOnly
         return len(self.getOIDs(where,  **kwargs))
 
+    def getExtent(self, where='1=1', outSR=None, use_cache=True, **kwargs):
+        """Returns the extent of features, can use optional query and **kwargs 
+                to filter.  The extent is computed by the server (returnExtentOnly) 
+                and cached for cache_ttl seconds.
+
+        Args:
+            where: Optional where clause, defaults to '1=1'.
+            outSR: Optional output spatial reference. Defaults to None.
+            use_cache: Optional boolean, set to False to always ask the server.
+                Defaults to True.
+            kwargs: Optional keyword arguments for query operation.
+
+        Returns:
+            An envelope json structure (extent).
+        """
+        resp = self._query_cached(self._extent_params(where, outSR, **kwargs), use_cache)
+        if resp.get(EXTENT):
+            return self._format_extent(resp[EXTENT])
+
+        # server does not support returnExtentOnly, compute it from the features
+        if outSR:
+            kwargs[OUT_SR] = outSR
+        fs = self.query(where, self.OIDFieldName or '*', exceed_limit=True, f=JSON, **kwargs)
+        return getFeatureExtent(fs)
+
     def attachments(self, oid, gdbVersion=''):
         """Queries attachments for an OBJECTDID.
         
@@ -1390,7 +2418,7 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
                     def blob(self):
                         """Returns a string of the chunks in the response."""
                         b = ''
-                        resp = requests.get(getattr(self, URL_WITH_TOKEN), stream=True, verify=False)
+                        resp = SESSION_MANAGER.get(getattr(self, URL_WITH_TOKEN), stream=True)
                         for chunk in resp.iter_content(1024 * 16):
                             b += chunk
                         return b
@@ -1415,7 +2443,7 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
                             ext = os.path.splitext(self.name)[-1]
                             out_file = os.path.join(out_path, name.split('.')[0] + ext)
 
-                        resp = requests.get(getattr(self, URL_WITH_TOKEN), stream=True, verify=False)
+                        resp = SESSION_MANAGER.get(getattr(self, URL_WITH_TOKEN), stream=True)
                         with open(out_file, 'wb') as f:
                             for chunk in resp.iter_content(1024 * 16):
                                 f.write(chunk)
@@ -1431,7 +2459,7 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
         else:
             raise NotImplementedError('Layer "{}" does not support attachments!'.format(self.name))
 
-    def cursor(self, fields='*', where='1=1', add_params={}, records=None, exceed_limit=False):
+    def cursor(self, fields='*', where='1=1', add_params={}, records=None, exceed_limit=False, f=DEFAULT_REQUEST_FORMAT, **kwargs):
         """Runs Cursor on layer, helper method that calls Cursor Object.
         
         Args:
@@ -1446,16 +2474,28 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
                 option may be time consuming because the ArcGIS REST API uses 
                 default maxRecordCount of 1000, so queries must be performed in 
                 chunks to get all records.
+            f: Optional return format (json|geojson|pbf), see query(). Defaults 
+                to DEFAULT_REQUEST_FORMAT.
+            kwargs: Optional keyword arguments passed to query(), such as 
+                max_workers or chunk_size.
         """
 
         cur_fields = self._fix_fields(fields)
 
-        fs = self.query(where, cur_fields, add_params, records, exceed_limit)
+        fs = self.query(where, cur_fields, add_params, records, exceed_limit, f=f, **kwargs)
         return Cursor(fs, fields)
 
     def export_layer(self, out_fc, fields='*', where='1=1', records=None, params={}, exceed_limit=False, sr=None,
                      include_domains=True, include_attachments=False, qualified_fieldnames=False, **kwargs):
         """Method to export a feature class or shapefile from a service layer.
+                A path ending with ".parquet" is exported to GeoParquet, see
+                export_parquet(), and a path ending with ".fgb" to FlatGeobuf,
+                see export_flatgeobuf().  Paths ending with ".geojsonl" or 
+                ".ndjson" are exported to newline delimited GeoJSON, see 
+                export_ndjson(), and paths ending with ".csv" to CSV, see 
+                export_csv(), both optionally followed by ".gz", ".bz2" or ".xz".
+                Without arcpy a path ending with ".gpkg" is exported to a 
+                GeoPackage, see export_geopackage().
         
         Args:
             out_fc: Full path to output feature class.
@@ -1492,6 +2532,27 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
             else:
                 params[OUT_SR] = sr
 
+            if os.path.splitext(out_fc)[1].lower() == FGB_EXTENSION:
+                return self.export_flatgeobuf(out_fc, fields, where, records, params, exceed_limit=exceed_limit, **kwargs)
+
+            text_ext = os.path.splitext(split_compression(out_fc)[0])[1].lower()
+            if text_ext in NDJSON_EXTENSIONS + (CSV_EXTENSION,):
+                if text_ext == CSV_EXTENSION:
+                    return self.export_csv(out_fc, fields, where, records, params, exceed_limit=exceed_limit, **kwargs)
+                return self.export_ndjson(out_fc, fields, where, records, params, exceed_limit=exceed_limit, **kwargs)
+
+            if os.path.splitext(out_fc)[1].lower() == PARQUET_EXTENSION:
+                return self.export_parquet(out_fc, fields, where, records, params, exceed_limit=exceed_limit, **kwargs)
+
+            if not has_arcpy:
+                if split_geopackage_path(out_fc)[0].lower().endswith(GPKG_EXTENSION):
+                    out_fc = self.export_geopackage(out_fc, fields, where, records, params, exceed_limit=exceed_limit, **kwargs)
+                else:
+                    out_fc = self.export_shapefile(out_fc, fields, where, records, params, exceed_limit=exceed_limit, **kwargs)
+                if exceed_limit:
+                    print('Fetched all records')
+                return out_fc
+
             if exceed_limit:
 
                 # download in chunks
@@ -1499,7 +2560,7 @@ class MapServiceLayer(RESTEndpoint, SpatialReferenceMixin, FieldsMixin):
                 orig = out_fc
                 doesExceed = False
                 if isShp:
-                    if self.query(returnCountOnly=True).count > self.maxRecordCount:
+                    if self.getCount(where, **params) > self.maxRecordCount:
                         doesExceed = True
                         out_fc = r'in_memory\restapi_chunk_{}'.format(os.path.splitext(os.path.basename(orig))[0])
                 for fs in self.query_in_chunks(where, fields, params, **kwargs):
@@ -2085,10 +3146,10 @@ class FeatureService(MapService):
         """
 
         if isinstance(rep_url, dict):
-            rep_url = st.get(URL_UPPER)
+            rep_url = rep_url.get(URL_UPPER)
 
         if rep_url.endswith('.geodatabase'):
-            resp = requests.get(rep_url, stream=True, verify=False)
+            resp = SESSION_MANAGER.get(rep_url, stream=True)
             fileName = rep_url.split('/')[-1]
             db = os.path.join(TEMP_DIR, fileName)
             with open(db, 'wb') as f:
@@ -2098,11 +3159,38 @@ class FeatureService(MapService):
             return SQLiteReplica(db)
 
         elif rep_url.endswith('.json'):
-            return JsonReplica(requests.get(self.url, verify=False).json())
+            return JsonReplica(SESSION_MANAGER.get(rep_url).json())
 
         return None
 
 
+    @staticmethod
+    def iterReplicaFeatures(rep_url, chunk_size=None):
+        """Generator that streams the features of a JSON replica as they are 
+                downloaded, without loading the whole replica into memory.
+
+        Args:
+            rep_url: url or JSON object that contains url to the ".json" replica
+                file on server, see fetchReplica().
+            chunk_size: Optional number of bytes read at a time. Defaults to 
+                JSON_STREAM_CHUNK_SIZE.
+
+        Raises:
+            ValueError: 'Replica "{}" is not a JSON replica!'
+
+        Yields:
+            A tuple of (layer id, feature as JSON).
+        """
+        if isinstance(rep_url, dict):
+            rep_url = rep_url.get(URL_UPPER)
+        if not rep_url.endswith('.json'):
+            raise ValueError('Replica "{}" is not a JSON replica!'.format(rep_url))
+
+        r = handle_response(rep_url, SESSION_MANAGER.get(rep_url, stream=True), ret_json=False)
+        stream = JSONStream(r.iter_content(chunk_size or JSON_STREAM_CHUNK_SIZE), FEATURES)
+        for feature in stream:
+            yield stream.context.get(ID), feature
+
     def replicaInfo(self, replicaID):
         """Gets replica information.
 
@@ -2220,6 +3308,8 @@ class FeatureLayer(MapServiceLayer):
         layer = self
         class UpdateCursor(Cursor):
             """Class that updates a cursor."""
+            # features are edited in place, so they are kept as JSON
+            compact = False
 
             def __init__(self,  feature_set, fieldOrder=[], auto_save=auto_save, useGlobalIds=useGlobalIds, **kwargs):
                 """Inits class with cursor parameters.
@@ -2729,7 +3819,7 @@ class FeatureLayer(MapServiceLayer):
                   F: JSON}
 
         # add features
-        return self.__edit_handler(self.request(add_url, params))
+        return self._edit_handler(self.request(add_url, params))
 
     def updateFeatures(self, features, gdbVersion='', rollbackOnFailure=True):
         """Updates features in feature service layer.
@@ -2760,7 +3850,7 @@ class FeatureLayer(MapServiceLayer):
                   F: JSON}
 
         # update features
-        return self.__edit_handler(self.request(update_url, params))
+        return self._edit_handler(self.request(update_url, params))
 
     def deleteFeatures(self, oids='', where='', geometry='', geometryType='',
                        spatialRel='', inSR='', gdbVersion='', rollbackOnFailure=True):
@@ -2802,7 +3892,7 @@ class FeatureLayer(MapServiceLayer):
                   F: JSON}
 
         # delete features
-        return self.__edit_handler(self.request(del_url, params))
+        return self._edit_handler(self.request(del_url, params))
 
     def applyEdits(self, adds=None, updates=None, deletes=None, attachments=None, gdbVersion=None, rollbackOnFailure=TRUE, useGlobalIds=False, **kwargs):
         """Applies edits on a feature service layer.
@@ -2870,6 +3960,11 @@ class FeatureLayer(MapServiceLayer):
         """
 
         edits_url = self.url + '/applyEdits'
+        params = self._edit_params(adds, updates, deletes, gdbVersion, rollbackOnFailure, useGlobalIds, **kwargs)
+        return self._edit_handler(self.request(edits_url, params))
+
+    def _edit_params(self, adds=None, updates=None, deletes=None, gdbVersion=None, rollbackOnFailure=TRUE, useGlobalIds=False, **kwargs):
+        """Encodes the parameters for an applyEdits request."""
         if isinstance(adds, FeatureSet):
             adds = json.dumps(adds.features, ensure_ascii=False, cls=RestapiEncoder)
         elif isinstance(adds, (list, tuple)):
@@ -2914,8 +4009,8 @@ class FeatureLayer(MapServiceLayer):
 ##                params[USE_GLOBALIDS] = TRUE
         # add other keyword arguments
         for k,v in six.iteritems(kwargs):
-            kwargs[k] = v
-        return self.__edit_handler(self.request(edits_url, params))
+            params[k] = v
+        return params
 
     def addAttachment(self, oid, attachment, content_type='', gdbVersion=''):
         """Adds an attachment to a feature service layer.
@@ -2946,7 +4041,7 @@ class FeatureLayer(MapServiceLayer):
                 params[TOKEN] = str(self.token)
             if gdbVersion:
                 params[GDB_VERSION] = gdbVersion
-            return self.__edit_handler(requests.post(att_url, params, files=files, cookies=self._cookie, verify=False).json(), oid)
+            return self._edit_handler(SESSION_MANAGER.post(att_url, params, files=files, cookies=self._cookie).json(), oid)
 
         else:
             raise NotImplementedError('FeatureLayer "{}" does not support attachments!'.format(self.name))
@@ -2982,7 +4077,7 @@ class FeatureLayer(MapServiceLayer):
                 params[GDB_VERSION] = gdbVersion
             for k,v in six.iteritems(kwargs):
                 params[k] = v
-            return self.__edit_handler(requests.post(att_url, params, cookies=self._cookie, verify=False).json(), oid)
+            return self._edit_handler(SESSION_MANAGER.post(att_url, params, cookies=self._cookie).json(), oid)
         else:
             raise NotImplementedError('FeatureLayer "{}" does not support attachments!'.format(self.name))
 
@@ -3024,7 +4119,7 @@ class FeatureLayer(MapServiceLayer):
                 params[TOKEN] = str(self.token)
             if gdbVersion:
                 params[GDB_VERSION] = gdbVersion
-            return self.__edit_handler(requests.post(att_url, params, files=files, cookies=self._cookie, verify=False).json(), oid)
+            return self._edit_handler(SESSION_MANAGER.post(att_url, params, files=files, cookies=self._cookie).json(), oid)
 
         else:
             raise NotImplementedError('FeatureLayer "{}" does not support attachments!'.format(self.name))
@@ -3057,7 +4152,7 @@ class FeatureLayer(MapServiceLayer):
         else:
             raise NotImplementedError('FeatureLayer "{}" does not support field calculations!'.format(self.name))
 
-    def __edit_handler(self, response, feature_id=None):
+    def _edit_handler(self, response, feature_id=None):
         """Handler for edit results.
 
         response: Response from edit operation.
@@ -3066,18 +4161,31 @@ class FeatureLayer(MapServiceLayer):
 
         e = EditResult(response, feature_id)
         self.editResults.append(e)
+        self.clear_cache()
         e.summary()
         return e
 
 class FeatureTable(FeatureLayer, MapServiceTable):
     pass
 
+class _LinearUnitNames(object):
+    """Sorted names of projections.linearUnits, the table is read on first 
+            access rather than at import."""
+
+    def __init__(self):
+        self._names = None
+
+    def __get__(self, obj, cls=None):
+        if self._names is None:
+            self._names = sorted(projections.linearUnits.keys())
+        return self._names
+
 class GeometryService(RESTEndpoint):
     """Class that handles the ArcGIS geometry service."""
-    linear_units = sorted(projections.linearUnits.keys())
+    linear_units = _LinearUnitNames()
     _default_url = 'https://utility.arcgisonline.com/ArcGIS/rest/services/Geometry/GeometryServer'
 
-    def __init__(self, url=None, usr=None, pw=None, token=None, proxy=None, referer=None):
+    def __init__(self, url=None, usr=None, pw=None, token=None, proxy=None, referer=None, local=False):
         """Inits class with login info for arcgis geometry service.
         
         Args:
@@ -3087,12 +4195,55 @@ class GeometryService(RESTEndpoint):
             token: Optional arg for token for service, Defaults to None.
             proxy: Optional arg for proxy for service. Defaults to None.
             referer: Optional arg for referer. Defaults to None.
+            local: Optional boolean, True to run buffer(), intersect(), union()
+                and project() with restapi.geometry_engine when it supports the
+                inputs.  The service is only contacted for the operations that
+                fall back to it. Defaults to False.
         """
         
         if not url:
             # use default arcgis online Geometry Service
             url = self._default_url
-        super(GeometryService, self).__init__(url, usr, pw, token, proxy, referer)
+        self.local = local
+        if local:
+            # the service description is not needed to run operations locally
+            self._prepare_endpoint(url, usr, pw, token, proxy, referer)
+        else:
+            super(GeometryService, self).__init__(url, usr, pw, token, proxy, referer)
+
+    def _run_local(self, operation, func, *args):
+        """Runs a geometry_engine operation when the service is local, returns 
+                None when it is not or the engine does not support the inputs.
+        """
+        if not self.local:
+            return None
+        try:
+            return func(*args)
+        except NotImplementedError as e:
+            print('running {} on the geometry service: {}'.format(operation, e))
+            return None
+
+    @staticmethod
+    def _local_buffer(geometries, distances, unit, inSR, outSR):
+        """Buffers geometries with the geometry engine, each distance in turn."""
+        if isinstance(distances, six.string_types):
+            distances = distances.split(',')
+        elif not isinstance(distances, (list, tuple)):
+            distances = [distances]
+        factor = 1.0
+        if unit:
+            sr_factor = geometry_engine.linear_unit_factor(inSR)
+            unit_factor = geometry_engine.LINEAR_UNITS.get(int(unit) if six.text_type(unit).isdigit() else unit) or \
+                geometry_engine.LINEAR_UNITS.get(GeometryService.getLinearUnitWKID(unit))
+            if not sr_factor or not unit_factor:
+                raise NotImplementedError('cannot convert {} to the units of {}'.format(unit, inSR))
+            factor = unit_factor / sr_factor
+        elif not geometry_engine.linear_unit_factor(inSR):
+            raise NotImplementedError('geodesic buffers are not supported')
+        buffers = [geometry_engine.buffer(g.json, float(d) * factor) for d in distances for g in geometries]
+        if outSR and get_wkid(outSR) != get_wkid(inSR):
+            buffers = [geometry_engine.project(b, inSR, outSR) for b in buffers]
+        return buffers
 
     @staticmethod
     def getLinearUnits():
@@ -3114,6 +4265,9 @@ class GeometryService(RESTEndpoint):
         if isinstance(unit_name, int) or six.text_type(unit_name).isdigit():
             return int(unit_name)
 
+        # an exact name is read through the index of the table
+        if unit_name in projections.linearUnits:
+            return int(projections.linearUnits[unit_name][WKID])
         for k,v in six.iteritems(projections.linearUnits):
             if k.lower() == unit_name.lower():
                 return int(v[WKID])
@@ -3164,6 +4318,9 @@ class GeometryService(RESTEndpoint):
 
         buff_url = self.url + '/buffer'
         geometries = self.validateGeometries(geometries)
+        buffers = self._run_local('buffer', self._local_buffer, geometries, distances, unit, inSR or geometries.getSR(), outSR)
+        if buffers is not None:
+            return GeometryCollection(buffers, spatialReference=outSR if outSR else inSR or geometries.getSR())
         params = {F: PJSON,
                   GEOMETRIES: geometries,
                   IN_SR: inSR or geometries.getSR(),
@@ -3201,6 +4358,10 @@ class GeometryService(RESTEndpoint):
         query_url = self.url + '/intersect'
         geometries = self.validateGeometries(geometries)
         sr = sr or geometries.getWKID() or NULL
+        clip = Geometry(geometry).json
+        result = self._run_local('intersect', lambda: [geometry_engine.intersect(g.json, clip) for g in geometries])
+        if result is not None:
+            return GeometryCollection(result, spatialReference=sr)
         params = {
             GEOMETRY: geometry,
             GEOMETRIES: geometries,
@@ -3221,6 +4382,9 @@ class GeometryService(RESTEndpoint):
         url = self.url + '/union'
         geometries = self.validateGeometries(geometries)
         sr = sr or geometries.getWKID() or NULL
+        result = self._run_local('union', geometry_engine.union, [g.json for g in geometries])
+        if result is not None:
+            return Geometry(result, spatialReference=sr)
         params = {
             GEOMETRY: geometries,
             GEOMETRIES: geometries,
@@ -3302,7 +4466,13 @@ class GeometryService(RESTEndpoint):
                 is transformed, default is False.
         """
 
-        params = {GEOMETRIES: self.validateGeometries(geometries),
+        geometries = self.validateGeometries(geometries)
+        if not transformation:
+            result = self._run_local('project', lambda: [geometry_engine.project(g.json, inSR, outSR) for g in geometries])
+            if result is not None:
+                return GeometryCollection(result, spatialReference=outSR)
+
+        params = {GEOMETRIES: geometries,
                   IN_SR: inSR,
                   OUT_SR: outSR,
                   TRANSFORMATION: transformation,
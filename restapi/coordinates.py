@@ -0,0 +1,177 @@
+"""Flat coordinate buffers for geometries.
+
+Esri JSON stores every vertex as a list of float objects, which costs about
+128 bytes per 2D vertex on CPython.  PackedCoordinates keeps the values of all
+vertices in one flat array('d') (or numpy float64 array) with the vertex
+offsets of the parts next to it, 16 bytes per 2D vertex:
+
+    packed = PackedCoordinates.from_parts(geometry['rings'])
+    packed.bbox          # computed on the buffer
+    packed.to_parts()    # the esri JSON rings again
+
+Geometry(..., packed=True) stores its coordinates this way and only builds
+the nested lists when its JSON is requested.  numpy is optional.
+"""
+from __future__ import print_function
+import array
+import itertools
+
+import six
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ['PackedCoordinates']
+
+NAN = float('nan')
+
+def _null_nan(values, dims):
+    """Replaces the NaN z and m values of a flat value list with None in place,
+            the null of esri JSON, and returns the list."""
+    for j in six.moves.range(2, dims):
+        for k in six.moves.range(j, len(values), dims):
+            if values[k] != values[k]:
+                values[k] = None
+    return values
+
+class VertexView(object):
+    """Read only sequence of the vertices of a PackedCoordinates, shared with
+            the buffer.  Each vertex is returned as a new list of its values,
+            missing z and m values as None, so shapefile.Shape can use it for
+            its points without copying the coordinates.
+    """
+    __slots__ = ('coords', 'dims', 'start', 'stop')
+
+    def __init__(self, coords, dims, start, stop):
+        self.coords = coords
+        self.dims = dims
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                raise ValueError('vertex views do not support steps')
+            return VertexView(self.coords, self.dims, self.start + start, self.start + max(start, stop))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('vertex index out of range')
+        d = self.dims
+        k = (self.start + i) * d
+        return _null_nan(self.coords[k:k + d].tolist(), d)
+
+    def __iter__(self):
+        d = self.dims
+        values = _null_nan(self.coords[self.start * d:self.stop * d].tolist(), d)
+        for k in six.moves.range(0, len(values), d):
+            yield values[k:k + d]
+
+    def __repr__(self):
+        return '<VertexView: {} vertices>'.format(len(self))
+
+class PackedCoordinates(object):
+    """The coordinates of a geometry in one flat buffer of doubles.
+
+    Attributes:
+        coords: Flat array('d') or numpy float64 array, the values of vertex i
+            are coords[i * dims:(i + 1) * dims].
+        part_offsets: Vertex offsets of the parts, the vertices of part i are
+            part_offsets[i]:part_offsets[i + 1].
+        dims: Number of values per vertex, x and y followed by z and m.
+    """
+
+    def __init__(self, coords, part_offsets, dims=2):
+        """Wraps existing buffers, see from_parts() to pack esri JSON parts.
+
+        Args:
+            coords: Flat array('d') or numpy float64 array of the vertex values.
+            part_offsets: Vertex offsets of the parts, starting with 0.
+            dims: Optional number of values per vertex. Defaults to 2.
+        """
+        self.coords = coords
+        self.part_offsets = part_offsets
+        self.dims = dims
+
+    @classmethod
+    def from_parts(cls, parts, dims=None, use_numpy=False):
+        """Packs lists of vertices, such as the rings of an esri JSON polygon.
+
+        Args:
+            parts: List of vertex lists.
+            dims: Optional number of values per vertex, missing values are
+                NaN and extra values are dropped.  Defaults to the length of
+                the first vertex.
+            use_numpy: Optional boolean, True to return numpy arrays, which
+                share the memory of the packed array('d'). Defaults to False.
+        """
+        if dims is None:
+            dims = next((len(pt) for part in parts for pt in part), 2)
+        coords = array.array('d')
+        offsets = [0]
+        for part in parts:
+            values = list(itertools.chain.from_iterable(part))
+            if len(values) != len(part) * dims or None in values:
+                # uneven vertices or null m values
+                values = [NAN if v is None else v for pt in part for v in (list(pt) + [NAN] * dims)[:dims]]
+            coords.extend(values)
+            offsets.append(offsets[-1] + len(part))
+        if use_numpy:
+            if np is None:
+                raise ImportError('numpy is required for numpy coordinate buffers')
+            return cls(np.frombuffer(coords, dtype='float64'), np.array(offsets, dtype='int64'), dims)
+        return cls(coords, array.array('l', offsets), dims)
+
+    @property
+    def count(self):
+        """The number of vertices."""
+        return len(self.coords) // self.dims
+
+    def __len__(self):
+        return len(self.part_offsets) - 1
+
+    def part(self, i):
+        """Returns a VertexView of the vertices of a part.
+
+        Arg:
+            i: The part index.
+        """
+        return VertexView(self.coords, self.dims, int(self.part_offsets[i]), int(self.part_offsets[i + 1]))
+
+    def vertices(self):
+        """Returns a VertexView of all vertices."""
+        return VertexView(self.coords, self.dims, 0, self.count)
+
+    def to_parts(self):
+        """Returns the parts as esri JSON vertex lists, missing z and m values
+                are None."""
+        d = self.dims
+        values = _null_nan(self.coords.tolist(), d)
+        offsets = self.part_offsets.tolist()
+        return [[values[k:k + d] for k in six.moves.range(start * d, stop * d, d)]
+                for start, stop in zip(offsets[:-1], offsets[1:])]
+
+    @property
+    def bbox(self):
+        """The (xmin, ymin, xmax, ymax) of the vertices, None when there are none."""
+        if not self.count:
+            return None
+        xs = self.coords[0::self.dims]
+        ys = self.coords[1::self.dims]
+        if np is not None and isinstance(xs, np.ndarray):
+            return float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())
+        return min(xs), min(ys), max(xs), max(ys)
+
+    @property
+    def nbytes(self):
+        """The memory used by the buffers in bytes."""
+        return len(self.coords) * self.coords.itemsize + len(self.part_offsets) * self.part_offsets.itemsize
+
+    def __repr__(self):
+        return '<PackedCoordinates: {} parts, {} vertices>'.format(len(self), self.count)
@@ -0,0 +1,580 @@
+"""Writes feature sets to FlatGeobuf files with a packed Hilbert R-tree.
+
+FlatGeobuf stores a header, an optional static spatial index and then one
+FlatBuffer per feature, so clients can range read only the features inside a
+bounding box.  The index needs the bounding box of every feature before any
+feature can be written and the features must follow the Hilbert order of the
+index.  FlatGeobufWriter therefore writes the encoded features to a temporary
+spill file as the chunks arrive and keeps only their bounding boxes and
+offsets in memory.  When it is closed the features are sorted, the index is
+built and the features are copied from the spill file in index order:
+
+    with FlatGeobufWriter('parcels.fgb', lyr.fields, lyr.geometryType, lyr.getSR()) as writer:
+        for fs in lyr.query_in_chunks(where='COUNTY = 27'):
+            writer.write(fs)
+
+The FlatBuffers are encoded here, no flatbuffers package is needed.  numpy is
+used to sort large indexes when it is installed.
+"""
+from __future__ import print_function
+import array
+import math
+import os
+import shutil
+import struct
+import tempfile
+from ._strings import *
+from .wkb import _group_rings, _list_signed_area, _list_contains
+from .rest_utils import mil_to_isoformat, raw_features, geojson_schema
+from .reproject import get_wkid
+from . import projections
+
+import six
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ['FlatGeobufWriter']
+
+MAGIC_BYTES = b'fgb\x03fgb\x00'
+DEFAULT_NODE_SIZE = 16
+HILBERT_MAX = (1 << 16) - 1
+
+# GeometryType of the FlatGeobuf schema, lines and polygons are always multi part
+FGB_POINT = 1
+FGB_POLYGON = 3
+FGB_MULTIPOINT = 4
+FGB_MULTILINESTRING = 5
+FGB_MULTIPOLYGON = 6
+
+FGB_GEOMETRY_TYPES = {
+    ESRI_POINT: FGB_POINT,
+    ESRI_MULTIPOINT: FGB_MULTIPOINT,
+    ESRI_POLYLINE: FGB_MULTILINESTRING,
+    ESRI_POLYGON: FGB_MULTIPOLYGON
+}
+
+# ColumnType of the FlatGeobuf schema and the struct format of its values,
+# None for values written as a length and bytes
+COLUMN_SHORT = 3
+COLUMN_INT = 5
+COLUMN_LONG = 7
+COLUMN_FLOAT = 9
+COLUMN_DOUBLE = 10
+COLUMN_STRING = 11
+COLUMN_DATETIME = 13
+COLUMN_BINARY = 14
+
+COLUMN_FORMATS = {
+    COLUMN_SHORT: '<h',
+    COLUMN_INT: '<i',
+    COLUMN_LONG: '<q',
+    COLUMN_FLOAT: '<f',
+    COLUMN_DOUBLE: '<d'
+}
+
+FGB_FIELD_TYPES = {
+    OID: COLUMN_LONG,
+    SHORT_FIELD: COLUMN_SHORT,
+    LONG_FIELD: COLUMN_INT,
+    BIG_INTEGER_FIELD: COLUMN_LONG,
+    FLOAT_FIELD: COLUMN_FLOAT,
+    DOUBLE_FIELD: COLUMN_DOUBLE,
+    DATE_FIELD: COLUMN_DATETIME,
+    BLOB_FIELD: COLUMN_BINARY,
+    RASTER_FIELD: COLUMN_BINARY
+}
+
+_INF = float('inf')
+_NAN = float('nan')
+_node = struct.Struct('<4dQ')
+_size = struct.Struct('<I')
+
+# inline sizes of the FlatBuffer field kinds, offsets take 4 bytes
+_SCALARS = {'bool': '<?', 'ubyte': '<B', 'ushort': '<H', 'int': '<i', 'ulong': '<Q'}
+
+class _FlatBuffer(object):
+    """Minimal FlatBuffer encoder.  The buffer is written front to back, each
+            table is preceded by its vtable and followed by the strings,
+            vectors and tables it refers to.
+
+    A table is a list of (field index, kind, value) tuples, fields with a None
+    value are left out.  Kinds are the keys of _SCALARS, 'string', 'bytes',
+    'doubles', 'uints', 'table' and 'tables'.
+    """
+
+    def __init__(self):
+        self.buf = bytearray(4)
+
+    def _pad(self, alignment, extra=0):
+        self.buf.extend(b'\0' * (-(len(self.buf) + extra) % alignment))
+
+    def finish(self, table):
+        """Returns the encoded buffer of a root table."""
+        struct.pack_into('<I', self.buf, 0, self.table(table))
+        self._pad(8)
+        return bytes(self.buf)
+
+    def table(self, fields):
+        fields = [f for f in fields if f[2] is not None]
+        sizes = [struct.calcsize(_SCALARS[kind]) if kind in _SCALARS else 4 for _, kind, _ in fields]
+
+        # the largest fields first keeps them aligned without padding
+        layout, offset = [], 4
+        for size, (index, kind, value) in sorted(zip(sizes, fields), key=lambda f: -f[0]):
+            offset += -offset % size
+            layout.append((index, offset, kind, value))
+            offset += size
+        count = max([f[0] for f in fields]) + 1 if fields else 0
+        vtable = [4 + 2 * count, offset] + [0] * count
+        for index, field_offset, _, _ in layout:
+            vtable[2 + index] = field_offset
+
+        buf = self.buf
+        self._pad(2)
+        vtable_pos = len(buf)
+        buf.extend(struct.pack('<{}H'.format(len(vtable)), *vtable))
+        self._pad(max(sizes + [4]))
+        pos = len(buf)
+        buf.extend(b'\0' * offset)
+        struct.pack_into('<i', buf, pos, pos - vtable_pos)
+        children = []
+        for index, field_offset, kind, value in layout:
+            if kind in _SCALARS:
+                struct.pack_into(_SCALARS[kind], buf, pos + field_offset, value)
+            else:
+                children.append((pos + field_offset, kind, value))
+        for field_pos, kind, value in children:
+            struct.pack_into('<I', buf, field_pos, self._child(kind, value) - field_pos)
+        return pos
+
+    def _child(self, kind, value):
+        buf = self.buf
+        if kind == 'table':
+            return self.table(value)
+        if kind == 'doubles':
+            self._pad(8, 4)
+            pos = len(buf)
+            buf.extend(_size.pack(len(value)))
+            buf.extend(struct.pack('<{}d'.format(len(value)), *value))
+            return pos
+        self._pad(4)
+        pos = len(buf)
+        if kind == 'string':
+            value = value.encode('utf-8')
+            buf.extend(_size.pack(len(value)) + value + b'\0')
+        elif kind == 'bytes':
+            buf.extend(_size.pack(len(value)) + value)
+        elif kind == 'uints':
+            buf.extend(struct.pack('<{}I'.format(len(value) + 1), len(value), *value))
+        elif kind == 'tables':
+            buf.extend(b'\0' * (4 + 4 * len(value)))
+            _size.pack_into(buf, pos, len(value))
+            for i, table in enumerate(value):
+                field_pos = pos + 4 + 4 * i
+                struct.pack_into('<I', buf, field_pos, self.table(table) - field_pos)
+        return pos
+
+def _hilbert(x, y):
+    """Hilbert curve index of 16 bit x and y values, works on python ints and
+            numpy uint32 arrays (see flatbush)."""
+    a = x ^ y
+    b = 0xFFFF ^ a
+    c = 0xFFFF ^ (x | y)
+    d = x & (y ^ 0xFFFF)
+
+    A = a | (b >> 1)
+    B = (a >> 1) ^ a
+    C = ((c >> 1) ^ (b & (d >> 1))) ^ c
+    D = ((a & (c >> 1)) ^ (d >> 1)) ^ d
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 2)) ^ (b & (b >> 2))
+    B = (a & (b >> 2)) ^ (b & ((a ^ b) >> 2))
+    C = C ^ ((a & (c >> 2)) ^ (b & (d >> 2)))
+    D = D ^ ((b & (c >> 2)) ^ ((a ^ b) & (d >> 2)))
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 4)) ^ (b & (b >> 4))
+    B = (a & (b >> 4)) ^ (b & ((a ^ b) >> 4))
+    C = C ^ ((a & (c >> 4)) ^ (b & (d >> 4)))
+    D = D ^ ((b & (c >> 4)) ^ ((a ^ b) & (d >> 4)))
+
+    a, b, c, d = A, B, C, D
+    C = C ^ ((a & (c >> 8)) ^ (b & (d >> 8)))
+    D = D ^ ((b & (c >> 8)) ^ ((a ^ b) & (d >> 8)))
+
+    a = C ^ (C >> 1)
+    b = D ^ (D >> 1)
+
+    i0 = x ^ y
+    i1 = b | (0xFFFF ^ (i0 | a))
+
+    i0 = (i0 | (i0 << 8)) & 0x00FF00FF
+    i0 = (i0 | (i0 << 4)) & 0x0F0F0F0F
+    i0 = (i0 | (i0 << 2)) & 0x33333333
+    i0 = (i0 | (i0 << 1)) & 0x55555555
+
+    i1 = (i1 | (i1 << 8)) & 0x00FF00FF
+    i1 = (i1 | (i1 << 4)) & 0x0F0F0F0F
+    i1 = (i1 | (i1 << 2)) & 0x33333333
+    i1 = (i1 | (i1 << 1)) & 0x55555555
+
+    return (i1 << 1) | i0
+
+def hilbert_order(minx, miny, maxx, maxy, extent):
+    """Returns the feature indexes sorted by the Hilbert value of the center of
+            their bounding boxes, highest first like the reference implementation.
+
+    Args:
+        minx, miny, maxx, maxy: Sequences of the bounding boxes, features
+            without geometry have infinite values.
+        extent: The (minx, miny, maxx, maxy) of all features.
+    """
+    ext_minx, ext_miny, ext_maxx, ext_maxy = extent
+    width, height = ext_maxx - ext_minx, ext_maxy - ext_miny
+    if np is not None:
+        bounds = [np.frombuffer(a, dtype='<f8') if isinstance(a, array.array) else np.asarray(a, dtype='f8') for a in (minx, miny, maxx, maxy)]
+        with np.errstate(invalid='ignore'):
+            cx = (bounds[0] + bounds[2]) / 2 - ext_minx
+            cy = (bounds[1] + bounds[3]) / 2 - ext_miny
+            x = np.floor(HILBERT_MAX * cx / width) if width else np.zeros(len(cx))
+            y = np.floor(HILBERT_MAX * cy / height) if height else np.zeros(len(cy))
+        x = np.nan_to_num(x, nan=0.0, posinf=0.0, neginf=0.0).astype('u4')
+        y = np.nan_to_num(y, nan=0.0, posinf=0.0, neginf=0.0).astype('u4')
+        values = _hilbert(x, y)
+        # stable sort on the negated values keeps ties in input order
+        return np.argsort(-values.astype('i8'), kind='stable').tolist()
+
+    values = []
+    for x0, y0, x1, y1 in zip(minx, miny, maxx, maxy):
+        if x0 == _INF:
+            values.append(0)
+            continue
+        x = int(math.floor(HILBERT_MAX * ((x0 + x1) / 2 - ext_minx) / width)) if width else 0
+        y = int(math.floor(HILBERT_MAX * ((y0 + y1) / 2 - ext_miny) / height)) if height else 0
+        values.append(_hilbert(x, y))
+    return sorted(range(len(values)), key=lambda i: -values[i])
+
+def level_bounds(num_items, node_size):
+    """Returns the (start, end) node indexes of each level of a packed R-tree,
+            leaves first.  The root is node 0."""
+    n = num_items
+    level_num_nodes = [n]
+    num_nodes = n
+    while True:
+        n = (n + node_size - 1) // node_size
+        num_nodes += n
+        level_num_nodes.append(n)
+        if n == 1:
+            break
+    bounds = []
+    for size in level_num_nodes:
+        num_nodes -= size
+        bounds.append((num_nodes, num_nodes + size))
+    return bounds
+
+def build_index(leaves, node_size):
+    """Returns the nodes of a packed R-tree.
+
+    Args:
+        leaves: List of (minx, miny, maxx, maxy, feature offset) in feature order.
+        node_size: Number of children of each node.
+
+    Returns:
+        List of (minx, miny, maxx, maxy, offset) nodes, the root first.
+    """
+    bounds = level_bounds(len(leaves), node_size)
+    nodes = [None] * bounds[0][1]
+    nodes[bounds[0][0]:] = leaves
+    for (pos, end), (new_pos, _) in zip(bounds[:-1], bounds[1:]):
+        while pos < end:
+            children = nodes[pos:min(pos + node_size, end)]
+            nodes[new_pos] = (min(n[0] for n in children), min(n[1] for n in children),
+                              max(n[2] for n in children), max(n[3] for n in children), pos)
+            pos += node_size
+            new_pos += 1
+    return nodes
+
+def _coordinate_values(coords, hasZ, hasM):
+    """Returns the flat xy, z and m values of a list of coordinates."""
+    xy = [v for pt in coords for v in (pt[0], pt[1])]
+    z = [pt[2] if len(pt) > 2 else _NAN for pt in coords] if hasZ else None
+    m_index = 3 if hasZ else 2
+    m = [pt[m_index] if len(pt) > m_index else _NAN for pt in coords] if hasM else None
+    return xy, z, m
+
+def _geometry_table(parts, hasZ, hasM, geometry_type=None):
+    """Returns the Geometry table of a list of coordinate lists, ends mark
+            where each part stops."""
+    coords = parts[0] if len(parts) == 1 else [pt for part in parts for pt in part]
+    xy, z, m = _coordinate_values(coords, hasZ, hasM)
+    ends = None
+    if len(parts) > 1:
+        ends, end = [], 0
+        for part in parts:
+            end += len(part)
+            ends.append(end)
+    return [(0, 'uints', ends), (1, 'doubles', xy), (2, 'doubles', z), (3, 'doubles', m), (6, 'ubyte', geometry_type)]
+
+def _geometry(geometry, geometryType, hasZ, hasM):
+    """Returns the Geometry table and bounding box of an esri JSON or GeoJSON
+            geometry, None for null and empty geometries."""
+    if not geometry:
+        return None
+    if TYPE in geometry:
+        coords = geometry.get(COORDINATES)
+        kind = geometry.get(TYPE)
+        if not coords:
+            return None
+        polygons = [coords] if kind == 'Polygon' else coords if kind == 'MultiPolygon' else None
+        lines = [coords] if kind == 'LineString' else coords if kind == 'MultiLineString' else None
+        points = [coords] if kind == 'Point' else coords if kind == 'MultiPoint' else None
+    else:
+        polygons = lines = points = None
+        if X in geometry:
+            if geometry[X] is None or geometry[X] == 'NaN':
+                return None
+            points = [[geometry[X], geometry[Y], geometry.get(Z, _NAN), geometry.get(M, _NAN)] if hasZ else
+                      [geometry[X], geometry[Y], geometry.get(M, _NAN)]]
+        elif geometry.get(POINTS):
+            points = geometry[POINTS]
+        elif geometry.get(PATHS):
+            lines = geometry[PATHS]
+        elif geometry.get(RINGS):
+            polygons = _group_rings(geometry[RINGS], _list_signed_area, _list_contains)
+        else:
+            return None
+
+    if polygons is not None:
+        coords = [pt for polygon in polygons for ring in polygon for pt in ring]
+        # a MultiPolygon always has its polygons as parts
+        table = [(7, 'tables', [_geometry_table(p, hasZ, hasM, FGB_POLYGON) for p in polygons])]
+    elif lines is not None:
+        coords = [pt for line in lines for pt in line]
+        table = _geometry_table(lines, hasZ, hasM)
+    else:
+        coords = points
+        table = _geometry_table([points], hasZ, hasM)
+    xs = [pt[0] for pt in coords]
+    ys = [pt[1] for pt in coords]
+    return table, (min(xs), min(ys), max(xs), max(ys))
+
+def _properties(columns, attributes):
+    """Encodes the attribute values of a feature, null values are left out."""
+    out = []
+    for i, (name, column_type, is_date) in enumerate(columns):
+        value = attributes.get(name)
+        if value is None:
+            continue
+        out.append(struct.pack('<H', i))
+        fmt = COLUMN_FORMATS.get(column_type)
+        if fmt:
+            out.append(struct.pack(fmt, value))
+            continue
+        if is_date:
+            value = mil_to_isoformat(value)
+        if not isinstance(value, six.binary_type):
+            value = six.text_type(value).encode('utf-8')
+        out.append(_size.pack(len(value)) + value)
+    return b''.join(out)
+
+def _flatgeobuf_features(columns, geometryType, hasZ, hasM, feature_set):
+    """Returns the (bounding box, size prefixed Feature buffer) of each feature."""
+    rows = []
+    for feat in raw_features(feature_set):
+        attributes = dict.get(feat, ATTRIBUTES) or dict.get(feat, PROPERTIES) or {}
+        geometry = _geometry(dict.get(feat, GEOMETRY), geometryType, hasZ, hasM) if geometryType else None
+        table, bbox = geometry if geometry else (None, None)
+        properties = _properties(columns, attributes)
+        buf = _FlatBuffer().finish([(0, 'table', table), (1, 'bytes', properties or None)])
+        rows.append((bbox, _size.pack(len(buf)) + buf))
+    return rows
+
+class FlatGeobufWriter(object):
+    """Writes feature sets to a FlatGeobuf file as they arrive.  Encoded
+            features are spilled to a temporary file and the file with its
+            spatial index is written when the writer is closed.
+
+    Attributes:
+        path: Path of the FlatGeobuf file.
+        columns: List of (field name, column type, is date) tuples.
+        index_node_size: Number of children of each index node, 0 writes no
+            index.
+        count: Number of features written.
+    """
+
+    def __init__(self, out_fgb, fields, geometryType=None, spatialReference=None, hasZ=False, hasM=False,
+                 index_node_size=DEFAULT_NODE_SIZE, name=None, spill_dir=None):
+        """Creates the writer.
+
+        Args:
+            out_fgb: Output .fgb file.
+            fields: The fields of the feature sets that will be written.
+            geometryType: Optional esri geometry type. Defaults to None.
+            spatialReference: Optional spatial reference JSON or wkid. Defaults to None.
+            hasZ: Optional boolean, True if the geometries have z values.
+            hasM: Optional boolean, True if the geometries have m values.
+            index_node_size: Optional number of children of each index node,
+                0 or None writes no spatial index. Defaults to 16.
+            name: Optional layer name. Defaults to the file name.
+            spill_dir: Optional folder for the temporary spill file. Defaults
+                to the folder of out_fgb.
+        """
+        self.path = out_fgb
+        self.name = name or os.path.splitext(os.path.basename(out_fgb))[0]
+        self.geometryType = geometryType if geometryType in FGB_GEOMETRY_TYPES else None
+        self.hasZ, self.hasM = bool(hasZ), bool(hasM)
+        self.wkid = get_wkid(spatialReference)
+        self.index_node_size = index_node_size or 0
+        self.count = 0
+
+        self.columns = []
+        self._column_tables = []
+        for fld in fields:
+            if not fld or fld.get(TYPE) == SHAPE:
+                continue
+            column_type = FGB_FIELD_TYPES.get(fld.get(TYPE), COLUMN_STRING)
+            self.columns.append((fld.get(NAME), column_type, fld.get(TYPE) == DATE_FIELD))
+            width = fld.get(LENGTH) if column_type == COLUMN_STRING else None
+            self._column_tables.append([(0, 'string', fld.get(NAME)), (1, 'ubyte', column_type),
+                                        (2, 'string', fld.get(ALIAS)), (4, 'int', width),
+                                        (9, 'bool', True if fld.get(TYPE) == OID else None)])
+
+        # bounding boxes and spill file offsets of the features
+        self._bounds = [array.array('d') for _ in range(4)]
+        # doubles hold byte offsets exactly up to 2 ** 53, Python 2 has no 'Q'
+        self._offsets = array.array('d')
+        self._spill = tempfile.TemporaryFile(dir=spill_dir or os.path.dirname(os.path.abspath(out_fgb)))
+
+    @classmethod
+    def from_feature_set(cls, feature_set, out_fgb, spatialReference=None, index_node_size=DEFAULT_NODE_SIZE):
+        """Creates a writer for the fields, geometry type and spatial reference
+                of a feature set.
+
+        Args:
+            feature_set: A FeatureSet or GeoJSONFeatureSet.
+            out_fgb: Output .fgb file.
+            spatialReference: Optional spatial reference, the spatial reference
+                of the feature set is used by default.
+            index_node_size: Optional number of children of each index node,
+                0 or None writes no spatial index. Defaults to 16.
+        """
+        json = feature_set.json
+        if json.get(TYPE) == 'FeatureCollection' and not json.get(FIELDS):
+            # GeoJSON has no schema, it is taken from the first feature
+            fields, geometryType = geojson_schema(json)
+            return cls(out_fgb, fields, geometryType, 4326, index_node_size=index_node_size)
+
+        # the features are not reprojected, the crs must match them
+        return cls(out_fgb, feature_set.fields, getattr(feature_set, GEOMETRY_TYPE, None),
+                   feature_set.getSR() or spatialReference, json.get(HAS_Z), json.get(HAS_M), index_node_size)
+
+    @property
+    def row_args(self):
+        """The arguments of the feature conversion before the feature set."""
+        return self.columns, self.geometryType, self.hasZ, self.hasM
+
+    def prepare(self, feature_set):
+        """Returns the encoded features, the part of write() that does not
+                touch the files so it can run in another thread or process.
+
+        Arg:
+            feature_set: A FeatureSet, GeoJSONFeatureSet or list of features.
+        """
+        return _flatgeobuf_features(*self.row_args + (feature_set,))
+
+    def write_rows(self, rows):
+        """Spills the features returned by prepare().
+
+        Arg:
+            rows: List of (bounding box, feature buffer) tuples.
+        """
+        minx, miny, maxx, maxy = self._bounds
+        offset = self._spill.tell()
+        for bbox, buf in rows:
+            if bbox is None:
+                bbox = (_INF, _INF, -_INF, -_INF)
+            minx.append(bbox[0])
+            miny.append(bbox[1])
+            maxx.append(bbox[2])
+            maxy.append(bbox[3])
+            self._offsets.append(offset)
+            offset += len(buf)
+        self._spill.write(b''.join(buf for _, buf in rows))
+        self.count += len(rows)
+
+    def write(self, feature_set):
+        """Appends the features of a feature set.
+
+        Arg:
+            feature_set: A FeatureSet, GeoJSONFeatureSet or list of features.
+        """
+        self.write_rows(self.prepare(feature_set))
+
+    @property
+    def extent(self):
+        """The (minx, miny, maxx, maxy) of the features written, None when no
+                feature has a geometry."""
+        minx, miny, maxx, maxy = self._bounds
+        if not minx or min(minx) == _INF:
+            return None
+        return min(minx), min(miny), max(maxx), max(maxy)
+
+    def _header(self, extent, index_node_size):
+        crs = None
+        if self.wkid:
+            wkt = projections.projections.get(str(self.wkid), '').replace("'", '"')
+            # esri well known ids start at 100000
+            crs = [(0, 'string', 'EPSG' if self.wkid < 100000 else 'ESRI'), (1, 'int', self.wkid), (4, 'string', wkt or None)]
+        header = [
+            (0, 'string', self.name),
+            (1, 'doubles', list(extent) if extent else None),
+            (2, 'ubyte', FGB_GEOMETRY_TYPES.get(self.geometryType, 0)),
+            (3, 'bool', self.hasZ or None),
+            (4, 'bool', self.hasM or None),
+            (7, 'tables', self._column_tables or None),
+            (8, 'ulong', self.count),
+            (9, 'ushort', index_node_size),
+            (10, 'table', crs)
+        ]
+        buf = _FlatBuffer().finish(header)
+        return _size.pack(len(buf)) + buf
+
+    def close(self):
+        """Builds the spatial index and writes the FlatGeobuf file."""
+        if self._spill is None:
+            return
+        spill, self._spill = self._spill, None
+        extent = self.extent
+        # an index needs features with a geometry
+        node_size = self.index_node_size if self.count and extent and self.geometryType else 0
+        ends = [int(o) for o in self._offsets] + [spill.tell()]
+        with open(self.path, 'wb') as f:
+            f.write(MAGIC_BYTES)
+            f.write(self._header(extent, node_size))
+            if not node_size:
+                spill.seek(0)
+                shutil.copyfileobj(spill, f)
+            else:
+                order = hilbert_order(*(self._bounds + [extent]))
+                minx, miny, maxx, maxy = self._bounds
+                leaves, offset = [], 0
+                for i in order:
+                    leaves.append((minx[i], miny[i], maxx[i], maxy[i], offset))
+                    offset += ends[i + 1] - ends[i]
+                f.write(b''.join(_node.pack(*node) for node in build_index(leaves, node_size)))
+                # features follow the order of the index
+                for i in order:
+                    spill.seek(ends[i])
+                    f.write(spill.read(ends[i + 1] - ends[i]))
+        spill.close()
+        print('Created: "{0}"'.format(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
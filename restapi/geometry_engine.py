@@ -0,0 +1,652 @@
+"""Local planar geometry operations on esri JSON geometries.
+
+GeometryService(local=True) runs buffer(), intersect(), union() and project()
+with these functions instead of posting the geometries to the service.  An
+operation that is not supported here raises NotImplementedError, and
+GeometryService then falls back to the service:
+
+    gs = GeometryService(local=True)
+    clipped = gs.intersect(parcels, county_boundary, 3857)
+
+project() runs the transformations of restapi.reproject.
+
+Polygons are overlaid by splitting the ring edges of all operands where they
+cross, keeping the pieces of each ring that are inside (intersection) or
+outside (union) the other operands, and linking the kept pieces back into
+rings.  Rings follow the esri orientation: outer rings are clockwise, so the
+interior is on the right of every edge.  The operands must be simple
+polygons, whose rings do not cross themselves.  Buffers are planar and built
+from circles and segment capsules with DEFAULT_SEGMENTS vertices per circle.
+numpy is used to test many points against a polygon when it is installed.
+"""
+from __future__ import print_function
+import math
+from ._strings import *
+from .wkb import _list_signed_area, _list_contains, _contains
+from .reproject import CoordinateSystem, get_transformer
+
+import six
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ['buffer', 'intersect', 'union', 'contains', 'points_in_polygon', 'project', 'linear_unit_factor']
+
+# vertices of a full buffer circle
+DEFAULT_SEGMENTS = 64
+
+# relative tolerance of the segment intersection parameters
+_EPS = 1e-12
+
+# rings with more vertices are tested with numpy when it is installed
+_NUMPY_MIN_VERTICES = 64
+
+# meters per linear unit, by esri unit constant and well known id
+LINEAR_UNITS = {
+    ESRI_METER: 1.0, 9001: 1.0,
+    ESRI_FOOT: 0.3048, 9002: 0.3048,
+    9003: 1200.0 / 3937.0,
+    ESRI_KILOMETER: 1000.0, 9036: 1000.0,
+    ESRI_MILE: 1609.344, 9093: 1609.344,
+    ESRI_NAUTICAL_MILE: 1852.0, 9030: 1852.0,
+    ESRI_US_NAUTICAL_MILE: 1853.248, 109012: 1853.248
+}
+
+UNION = 'union'
+INTERSECTION = 'intersection'
+
+def linear_unit_factor(sr):
+    """Returns the meters per unit of a projected spatial reference, None for
+            geographic and unknown spatial references.
+
+    Arg:
+        sr: A well known id or spatial reference dict.
+    """
+    try:
+        cs = CoordinateSystem.from_sr(sr)
+    except NotImplementedError:
+        return None
+    return None if cs.is_geographic else cs.unit
+
+def _kind(geometry):
+    """Returns the esri geometry type of esri JSON."""
+    if RINGS in geometry:
+        return ESRI_POLYGON
+    if PATHS in geometry:
+        return ESRI_POLYLINE
+    if POINTS in geometry:
+        return ESRI_MULTIPOINT
+    if X in geometry:
+        return ESRI_POINT
+    if XMIN in geometry:
+        return ESRI_ENVELOPE
+    raise NotImplementedError('unsupported geometry: {}'.format(list(geometry)))
+
+def _ring(coords):
+    """Returns a closed ring of (x, y) tuples without repeated vertices."""
+    ring = []
+    for pt in coords:
+        pt = (float(pt[0]), float(pt[1]))
+        if not ring or pt != ring[-1]:
+            ring.append(pt)
+    if ring and ring[0] != ring[-1]:
+        ring.append(ring[0])
+    return ring
+
+def _envelope_ring(xmin, ymin, xmax, ymax):
+    # clockwise
+    return [(xmin, ymin), (xmin, ymax), (xmax, ymax), (xmax, ymin), (xmin, ymin)]
+
+def _polygon_rings(geometry):
+    """Returns the closed, esri oriented rings of a polygon or envelope."""
+    kind = _kind(geometry)
+    if kind == ESRI_ENVELOPE:
+        if geometry.get(XMIN) in (None, 'NaN'):
+            return []
+        return [_envelope_ring(*(float(geometry[k]) for k in (XMIN, YMIN, XMAX, YMAX)))]
+    if kind != ESRI_POLYGON:
+        raise NotImplementedError('{} is not a polygon'.format(kind))
+    rings = [r for r in (_ring(ring) for ring in geometry[RINGS] or []) if len(r) >= 4]
+    oriented = []
+    for ring in rings:
+        # rings inside an odd number of other rings are holes
+        x, y = ring[0]
+        depth = sum(1 for other in rings if other is not ring and _list_contains(other, x, y))
+        clockwise = _list_signed_area(ring) < 0
+        oriented.append(ring if clockwise == (depth % 2 == 0) else ring[::-1])
+    return oriented
+
+def _bbox(parts):
+    xs = [pt[0] for part in parts for pt in part]
+    ys = [pt[1] for part in parts for pt in part]
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+class _Operand(object):
+    """The closed rings of a polygon operand, tested with the even-odd rule."""
+
+    def __init__(self, rings):
+        self.rings = rings
+        self.bbox = _bbox(rings)
+        self._arrays = None
+
+    def contains(self, x, y):
+        bbox = self.bbox
+        if bbox is None or x < bbox[0] or x > bbox[2] or y < bbox[1] or y > bbox[3]:
+            return False
+        if np is not None and self._arrays is None:
+            self._arrays = [np.array(r, dtype='float64') if len(r) >= _NUMPY_MIN_VERTICES else None
+                            for r in self.rings]
+        inside = False
+        for i, ring in enumerate(self.rings):
+            arr = self._arrays[i] if self._arrays else None
+            if _contains(arr, x, y) if arr is not None else _list_contains(ring, x, y):
+                inside = not inside
+        return inside
+
+class _GridIndex(object):
+    """Uniform grid of operand bounding boxes for point queries."""
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+        valid = [b for b in boxes if b]
+        self.cells = {}
+        if not valid:
+            return
+        xmin = min(b[0] for b in valid)
+        ymin = min(b[1] for b in valid)
+        xmax = max(b[2] for b in valid)
+        ymax = max(b[3] for b in valid)
+        n = max(1, int(math.sqrt(len(valid))))
+        self.origin = (xmin, ymin)
+        self.size = (max(xmax - xmin, 1e-300) / n, max(ymax - ymin, 1e-300) / n)
+        for i, b in enumerate(boxes):
+            if not b:
+                continue
+            for cx in range(self._cell(b[0], 0), self._cell(b[2], 0) + 1):
+                for cy in range(self._cell(b[1], 1), self._cell(b[3], 1) + 1):
+                    self.cells.setdefault((cx, cy), []).append(i)
+
+    def _cell(self, v, axis):
+        return int(math.floor((v - self.origin[axis]) / self.size[axis]))
+
+    def query(self, x, y):
+        if not self.cells:
+            return []
+        return self.cells.get((self._cell(x, 0), self._cell(y, 1)), [])
+
+def _segment_intersections(p, q, r, s):
+    """Returns (t, u, point) for each point where segment p-q meets segment
+            r-s, t and u are the positions along the segments.  Positions
+            within the tolerance of an end are snapped to that end, and the
+            point is then that exact vertex."""
+    dx1, dy1 = q[0] - p[0], q[1] - p[1]
+    dx2, dy2 = s[0] - r[0], s[1] - r[1]
+    len1 = dx1 * dx1 + dy1 * dy1
+    len2 = dx2 * dx2 + dy2 * dy2
+    if not len1 or not len2:
+        return []
+    ex, ey = r[0] - p[0], r[1] - p[1]
+    denom = dx1 * dy2 - dy1 * dx2
+    if abs(denom) <= _EPS * math.sqrt(len1 * len2):
+        # parallel, only collinear segments meet
+        if abs(ex * dy1 - ey * dx1) > _EPS * len1:
+            return []
+        out = []
+        for u, pt in ((0, r), (1, s)):
+            t = ((pt[0] - p[0]) * dx1 + (pt[1] - p[1]) * dy1) / len1
+            if -_EPS <= t <= 1 + _EPS:
+                out.append((0 if pt == p else 1 if pt == q else t, u, pt))
+        for t, pt in ((0, p), (1, q)):
+            u = ((pt[0] - r[0]) * dx2 + (pt[1] - r[1]) * dy2) / len2
+            if _EPS < u < 1 - _EPS:
+                out.append((t, u, pt))
+        return out
+    t = (ex * dy2 - ey * dx2) / denom
+    u = (ex * dy1 - ey * dx1) / denom
+    if t < -_EPS or t > 1 + _EPS or u < -_EPS or u > 1 + _EPS:
+        return []
+    if t <= _EPS:
+        t, pt = 0, p
+    elif t >= 1 - _EPS:
+        t, pt = 1, q
+    elif u <= _EPS:
+        pt = r
+    elif u >= 1 - _EPS:
+        pt = s
+    else:
+        pt = (p[0] + t * dx1, p[1] + t * dy1)
+    if u <= _EPS:
+        u = 0
+    elif u >= 1 - _EPS:
+        u = 1
+    return [(t, u, pt)]
+
+def _split(operands):
+    """Splits the edges of every part of every operand where they meet an edge
+            of another operand.
+
+    Arg:
+        operands: List of operands, each a list of parts (closed rings or
+            open paths) of (x, y) tuples.
+
+    Returns:
+        The split operands and the set of points where operands meet.
+    """
+    edges = []
+    for o, parts in enumerate(operands):
+        for k, part in enumerate(parts):
+            for e in six.moves.range(len(part) - 1):
+                (x0, y0), (x1, y1) = part[e], part[e + 1]
+                edges.append((min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1), o, k, e))
+    edges.sort()
+
+    splits = {}
+    nodes = set()
+    active = []
+    for edge in edges:
+        minx = edge[0]
+        active = [a for a in active if a[1] >= minx]
+        o, k, e = edge[4:]
+        p, q = operands[o][k][e], operands[o][k][e + 1]
+        for a in active:
+            if a[4] == o or a[3] < edge[2] or a[2] > edge[3]:
+                continue
+            ao, ak, ae = a[4:]
+            r, s = operands[ao][ak][ae], operands[ao][ak][ae + 1]
+            for t, u, pt in _segment_intersections(p, q, r, s):
+                nodes.add(pt)
+                if 0 < t < 1:
+                    splits.setdefault((o, k, e), []).append((t, pt))
+                if 0 < u < 1:
+                    splits.setdefault((ao, ak, ae), []).append((u, pt))
+        active.append(edge)
+
+    split_operands = []
+    for o, parts in enumerate(operands):
+        new_parts = []
+        for k, part in enumerate(parts):
+            vertices = [part[0]]
+            for e in six.moves.range(len(part) - 1):
+                for _, pt in sorted(splits.get((o, k, e), [])):
+                    if pt != vertices[-1]:
+                        vertices.append(pt)
+                if part[e + 1] != vertices[-1]:
+                    vertices.append(part[e + 1])
+            new_parts.append(vertices)
+        split_operands.append(new_parts)
+    return split_operands, nodes
+
+def _chains(part, nodes, closed=True):
+    """Splits a part into the runs of vertices between the nodes."""
+    n = len(part) - 1 if closed else len(part)
+    at = [i for i in six.moves.range(n) if part[i] in nodes]
+    if closed:
+        if not at:
+            return [part]
+        part = part[at[0]:-1] + part[:at[0] + 1]
+        at = [i - at[0] for i in at]
+    else:
+        at = [0] + [i for i in at if i] + ([] if at and at[-1] == n - 1 else [n - 1])
+    if at[-1] != len(part) - 1:
+        at.append(len(part) - 1)
+    return [part[i:j + 1] for i, j in zip(at[:-1], at[1:]) if j > i]
+
+def _edge_key(a, b):
+    return (a, b) if a < b else (b, a)
+
+def _side_points(a, b):
+    """Points just left and right of the middle of edge a-b."""
+    mx, my = (a[0] + b[0]) / 2.0, (a[1] + b[1]) / 2.0
+    nx, ny = (a[1] - b[1]) * 1e-6, (b[0] - a[0]) * 1e-6
+    return (mx + nx, my + ny), (mx - nx, my - ny)
+
+def _turn(d, o):
+    angle = math.atan2(d[0] * o[1] - d[1] * o[0], d[0] * o[0] + d[1] * o[1])
+    # a u-turn is the last choice
+    return math.pi if angle <= -math.pi + 1e-12 else angle
+
+def _assemble(edges):
+    """Links directed edges into closed rings, taking the rightmost turn where
+            rings touch so the interior stays on the right."""
+    outgoing = {}
+    for a, b in edges:
+        outgoing.setdefault(a, []).append(b)
+    rings = []
+    while outgoing:
+        start = next(iter(outgoing))
+        path, index = [start], {start: 0}
+        cur = start
+        while True:
+            nexts = outgoing.get(cur)
+            if not nexts:
+                if len(path) == 1:
+                    break
+                raise NotImplementedError('the overlay did not close, the input may not be simple polygons')
+            if len(nexts) == 1 or len(path) < 2:
+                b = nexts.pop(0)
+            else:
+                prev = path[-2]
+                d = (cur[0] - prev[0], cur[1] - prev[1])
+                b = min(nexts, key=lambda v: _turn(d, (v[0] - cur[0], v[1] - cur[1])))
+                nexts.remove(b)
+            if not nexts:
+                del outgoing[cur]
+            cur = b
+            if cur in index:
+                i = index[cur]
+                rings.append(path[i:] + [cur])
+                for v in path[i + 1:]:
+                    del index[v]
+                del path[i + 1:]
+            else:
+                index[cur] = len(path)
+                path.append(cur)
+    return rings
+
+def _esri_rings(rings):
+    """Drops degenerate rings and orders the rings so each outer ring is
+            followed by its holes, as esri JSON expects."""
+    rings = [r for r in rings if len(r) >= 4]
+    areas = [_list_signed_area(r) for r in rings]
+    scale = max([abs(a) for a in areas] or [0])
+    outers = [(a, r) for a, r in zip(areas, rings) if a < -1e-12 * scale]
+    holes = [r for a, r in zip(areas, rings) if a > 1e-12 * scale]
+    # the smallest outer ring that contains a hole owns it
+    outers.sort(key=lambda ar: -ar[0])
+    grouped = [[r] for _, r in outers]
+    for hole in holes:
+        x, y = _side_points(hole[0], hole[1])[1]
+        owner = next((g for g in grouped if _list_contains(g[0], x, y)), None)
+        if owner is not None:
+            owner.append(hole)
+    return [[list(pt) for pt in ring] for group in grouped for ring in group]
+
+def _overlay(operands, mode):
+    """Returns the rings of the union or intersection of polygon operands.
+
+    Args:
+        operands: List of operands, each a list of esri oriented closed rings.
+        mode: UNION or INTERSECTION.
+    """
+    operands = [rings for rings in operands if rings]
+    if mode == INTERSECTION and len(operands) < 2:
+        return []
+    tests = [_Operand(rings) for rings in operands]
+    grid = _GridIndex([t.bbox for t in tests])
+
+    def inside(x, y, exclude=None):
+        return [i for i in grid.query(x, y) if i != exclude and tests[i].contains(x, y)]
+
+    split_operands, nodes = _split(operands)
+    owners = {}
+    for o, rings in enumerate(split_operands):
+        for ring in rings:
+            for a, b in zip(ring[:-1], ring[1:]):
+                owners.setdefault(_edge_key(a, b), set()).add(o)
+
+    def keep_edge(o, a, b):
+        if len(owners[_edge_key(a, b)]) > 1:
+            # shared with another operand, test both sides of the edge
+            left, right = _side_points(a, b)
+            if mode == UNION:
+                return not inside(*left)
+            return len(inside(*right)) == len(operands) and len(inside(*left)) < len(operands)
+        mx, my = (a[0] + b[0]) / 2.0, (a[1] + b[1]) / 2.0
+        if mode == UNION:
+            return not inside(mx, my, o)
+        return len(inside(mx, my, o)) == len(operands) - 1
+
+    kept, seen = [], set()
+    for o, rings in enumerate(split_operands):
+        for ring in rings:
+            for chain in _chains(ring, nodes):
+                pairs = list(zip(chain[:-1], chain[1:]))
+                if not any(len(owners[_edge_key(a, b)]) > 1 for a, b in pairs):
+                    # the pieces between two nodes are all in or all out
+                    if keep_edge(o, *pairs[0]):
+                        kept.extend(pairs)
+                    continue
+                for a, b in pairs:
+                    if (a, b) not in seen and keep_edge(o, a, b):
+                        seen.add((a, b))
+                        kept.append((a, b))
+    return _esri_rings(_assemble(kept))
+
+def _clip_paths(paths, rings):
+    """Returns the parts of paths inside the polygon rings."""
+    operand = _Operand(rings)
+    parts = [p for p in ([(float(pt[0]), float(pt[1])) for pt in path] for path in paths) if len(p) > 1]
+    (split_paths, split_rings), nodes = _split([parts, rings])
+    boundary = set(_edge_key(a, b) for ring in split_rings for a, b in zip(ring[:-1], ring[1:]))
+    out = []
+    for path in split_paths:
+        current = None
+        for chain in _chains(path, nodes, closed=False):
+            a, b = chain[0], chain[1]
+            mx, my = (a[0] + b[0]) / 2.0, (a[1] + b[1]) / 2.0
+            if _edge_key(a, b) in boundary or operand.contains(mx, my):
+                if current is not None and current[-1] == chain[0]:
+                    current.extend(chain[1:])
+                else:
+                    current = list(chain)
+                    out.append(current)
+            else:
+                current = None
+    return [[list(pt) for pt in path] for path in out]
+
+def contains(polygon, x, y):
+    """Returns True when a point is inside a polygon.
+
+    Args:
+        polygon: An esri JSON polygon or envelope.
+        x: The x coordinate.
+        y: The y coordinate.
+    """
+    return _Operand(_polygon_rings(polygon)).contains(x, y)
+
+def points_in_polygon(points, polygon):
+    """Tests many points against a polygon with the even-odd rule.
+
+    Args:
+        points: List of [x, y] coordinates or an (n, 2) numpy array.
+        polygon: An esri JSON polygon or envelope.
+
+    Returns:
+        A list of booleans, a numpy boolean array when numpy is installed.
+    """
+    rings = _polygon_rings(polygon)
+    if np is None:
+        operand = _Operand(rings)
+        return [operand.contains(pt[0], pt[1]) for pt in points]
+    pts = np.asarray(points, dtype='float64').reshape(-1, 2)
+    xs, ys = pts[:, 0], pts[:, 1]
+    inside = np.zeros(len(pts), dtype=bool)
+    for ring in rings:
+        ring = np.array(ring, dtype='float64')
+        if len(ring) - 1 < len(pts):
+            # loop over the edges, each test covers all points
+            for (x0, y0), (x1, y1) in zip(ring[:-1], ring[1:]):
+                if y0 == y1:
+                    continue
+                crosses = (y0 > ys) != (y1 > ys)
+                xs_at = x0 + (ys - y0) * (x1 - x0) / (y1 - y0)
+                inside ^= crosses & (xs < xs_at)
+        else:
+            for i in six.moves.range(len(pts)):
+                if _contains(ring, xs[i], ys[i]):
+                    inside[i] = not inside[i]
+    return inside
+
+def _unit_circle(segments):
+    # clockwise from the positive x axis
+    return [(math.cos(-2 * math.pi * k / segments), math.sin(-2 * math.pi * k / segments))
+            for k in six.moves.range(segments)]
+
+def _circle(pt, radius, unit):
+    x, y = pt
+    ring = [(x + radius * c, y + radius * s) for c, s in unit]
+    return ring + ring[:1]
+
+def _convex_hull(points):
+    """Returns the clockwise closed convex hull of points (monotone chain)."""
+    points = sorted(set(points))
+    if len(points) < 3:
+        return points
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+    lower, upper = [], []
+    for pt in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], pt) <= 0:
+            lower.pop()
+        lower.append(pt)
+    for pt in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], pt) <= 0:
+            upper.pop()
+        upper.append(pt)
+    hull = lower[:-1] + upper[:-1]
+    return hull[::-1] + hull[-1:]
+
+def _capsules(part, radius, unit):
+    """The buffer circles of each vertex hulled pairwise along a part."""
+    circles = [_circle(pt, radius, unit)[:-1] for pt in part]
+    if len(part) == 1:
+        return [circles[0] + circles[0][:1]]
+    return [_convex_hull(a + b) for a, b in zip(circles[:-1], circles[1:])]
+
+def buffer(geometry, distance, segments=DEFAULT_SEGMENTS):
+    """Buffers a geometry on the plane.
+
+    Args:
+        geometry: An esri JSON point, multipoint, polyline, polygon or envelope.
+        distance: The buffer distance in the units of the coordinates.  Only
+            polygons can be buffered by a negative distance.
+        segments: Optional number of vertices of a full circle. Defaults to
+            DEFAULT_SEGMENTS.
+
+    Raises:
+        NotImplementedError: A negative buffer of a polygon.
+
+    Returns:
+        An esri JSON polygon.
+    """
+    kind = _kind(geometry)
+    distance = float(distance)
+    if kind in (ESRI_POLYGON, ESRI_ENVELOPE):
+        rings = _polygon_rings(geometry)
+        if distance < 0:
+            raise NotImplementedError('negative buffers are not supported')
+        if distance == 0 or not rings:
+            return {RINGS: _esri_rings(rings)}
+        unit = _unit_circle(segments)
+        operands = [rings] + [[c] for ring in rings for c in _capsules(ring, distance, unit)]
+        return {RINGS: _overlay(operands, UNION)}
+    if distance <= 0:
+        return {RINGS: []}
+    unit = _unit_circle(segments)
+    if kind == ESRI_POINT:
+        if geometry.get(X) in (None, 'NaN'):
+            return {RINGS: []}
+        parts = [[(float(geometry[X]), float(geometry[Y]))]]
+    elif kind == ESRI_MULTIPOINT:
+        parts = [[(float(pt[0]), float(pt[1]))] for pt in geometry[POINTS] or []]
+    else:
+        parts = [[(float(pt[0]), float(pt[1])) for pt in path] for path in geometry[PATHS] or []]
+    operands = [[c] for part in parts if part for c in _capsules(part, distance, unit)]
+    if len(operands) == 1:
+        return {RINGS: _esri_rings(operands[0])}
+    return {RINGS: _overlay(operands, UNION)}
+
+def intersect(geometry, clip):
+    """Intersects a geometry with a polygon or envelope.
+
+    Args:
+        geometry: An esri JSON geometry.
+        clip: An esri JSON polygon or envelope.
+
+    Raises:
+        NotImplementedError: The clip geometry is not a polygon or envelope.
+
+    Returns:
+        The part of the geometry inside the clip geometry, as the same type.
+    """
+    clip_rings = _polygon_rings(clip)
+    kind = _kind(geometry)
+    clip_box = _bbox(clip_rings)
+    if kind == ESRI_POINT:
+        if geometry.get(X) in (None, 'NaN') or not _Operand(clip_rings).contains(geometry[X], geometry[Y]):
+            return {X: None, Y: None}
+        return {X: geometry[X], Y: geometry[Y]}
+    if kind == ESRI_MULTIPOINT:
+        points = geometry[POINTS] or []
+        inside = points_in_polygon([pt[:2] for pt in points], clip) if points else []
+        return {POINTS: [pt for pt, keep in zip(points, inside) if keep]}
+    if kind == ESRI_POLYLINE:
+        box = _bbox(geometry[PATHS] or [])
+        if not box or not clip_box or box[0] > clip_box[2] or box[2] < clip_box[0] or box[1] > clip_box[3] or box[3] < clip_box[1]:
+            return {PATHS: []}
+        return {PATHS: _clip_paths(geometry[PATHS], clip_rings)}
+    rings = _polygon_rings(geometry)
+    box = _bbox(rings)
+    if not box or not clip_box or box[0] > clip_box[2] or box[2] < clip_box[0] or box[1] > clip_box[3] or box[3] < clip_box[1]:
+        return {RINGS: []}
+    if kind == ESRI_ENVELOPE and _kind(clip) == ESRI_ENVELOPE:
+        return {XMIN: max(box[0], clip_box[0]), YMIN: max(box[1], clip_box[1]),
+                XMAX: min(box[2], clip_box[2]), YMAX: min(box[3], clip_box[3])}
+    if _kind(clip) == ESRI_ENVELOPE and clip_box[0] <= box[0] and clip_box[1] <= box[1] and \
+            box[2] <= clip_box[2] and box[3] <= clip_box[3]:
+        # inside the envelope, nothing to clip
+        return {RINGS: _esri_rings(rings)}
+    return {RINGS: _overlay([rings, clip_rings], INTERSECTION)}
+
+def union(geometries):
+    """Unions polygons and envelopes, or points and multipoints.
+
+    Arg:
+        geometries: List of esri JSON geometries of the same dimension.
+
+    Raises:
+        NotImplementedError: Polylines or mixed dimensions.
+
+    Returns:
+        An esri JSON polygon or multipoint.
+    """
+    kinds = set(_kind(g) for g in geometries)
+    if kinds <= set([ESRI_POINT, ESRI_MULTIPOINT]):
+        points, seen = [], set()
+        for g in geometries:
+            for pt in (g[POINTS] or []) if POINTS in g else [[g[X], g[Y]]] if g.get(X) not in (None, 'NaN') else []:
+                key = tuple(pt)
+                if key not in seen:
+                    seen.add(key)
+                    points.append(list(pt))
+        return {POINTS: points}
+    if kinds <= set([ESRI_POLYGON, ESRI_ENVELOPE]):
+        operands = [_polygon_rings(g) for g in geometries]
+        if len(operands) == 1:
+            return {RINGS: _esri_rings(operands[0])}
+        return {RINGS: _overlay(operands, UNION)}
+    raise NotImplementedError('union of {} is not supported'.format(', '.join(sorted(kinds))))
+
+def project(geometry, inSR, outSR):
+    """Projects a geometry with restapi.reproject.
+
+    Args:
+        geometry: An esri JSON geometry.
+        inSR: The input well known id or spatial reference dict.
+        outSR: The output well known id or spatial reference dict.
+
+    Raises:
+        NotImplementedError: A spatial reference that reproject does not support.
+
+    Returns:
+        The projected esri JSON geometry.
+    """
+    transformer = get_transformer(inSR, outSR)
+    out = transformer.transform_geometry(geometry)
+    out[SPATIAL_REFERENCE] = transformer.spatialReference
+    return out
@@ -0,0 +1,452 @@
+"""Writes feature sets to an OGC GeoPackage with the standard library sqlite3.
+
+Features are inserted with one prepared statement per chunk inside large
+transactions, the geometries are stored as GeoPackage binary (a small header
+with the envelope followed by ISO WKB).  The R-tree spatial index is built
+once after the load instead of being updated for every insert.  Chunks can be
+written as they arrive, such as the feature sets of query_in_chunks():
+
+    with GeoPackageWriter('parcels.gpkg', lyr.fields, lyr.geometryType, lyr.getSR()) as writer:
+        for fs in lyr.query_in_chunks(where='COUNTY = 27'):
+            writer.write(fs)
+"""
+from __future__ import print_function
+import os
+import sqlite3
+import struct
+from ._strings import *
+from .wkb import JSONWKBEncoder, WKB_NAMES, WKB_TYPES
+from .rest_utils import mil_to_isoformat, raw_features, geojson_schema
+from .reproject import get_wkid
+from . import projections
+
+import six
+
+__all__ = ['GeoPackageWriter', 'split_geopackage_path']
+
+GPKG_APPLICATION_ID = 0x47504B47
+GPKG_USER_VERSION = 10300
+GEOMETRY_COLUMN = 'geom'
+
+# rows inserted before each commit
+COMMIT_ROWS = 100000
+
+# GeoPackage column types of esri field types, text fields get their length
+GPKG_FIELD_TYPES = {
+    OID: 'INTEGER',
+    SHORT_FIELD: 'SMALLINT',
+    LONG_FIELD: 'MEDIUMINT',
+    BIG_INTEGER_FIELD: 'INTEGER',
+    FLOAT_FIELD: 'FLOAT',
+    DOUBLE_FIELD: 'DOUBLE',
+    DATE_FIELD: 'DATETIME',
+    GUID_FIELD: 'TEXT(38)',
+    GLOBALID: 'TEXT(38)',
+    BLOB_FIELD: 'BLOB',
+    RASTER_FIELD: 'BLOB'
+}
+
+_gpkg_header = struct.Struct('<2sBBi').pack
+_envelope = struct.Struct('<4d')
+_point_xy = struct.Struct('<2d')
+
+_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (
+        srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL,
+        organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS gpkg_contents (
+        table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+        description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+        min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER,
+        CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id))''',
+    '''CREATE TABLE IF NOT EXISTS gpkg_geometry_columns (
+        table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL,
+        srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+        CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+        CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+        CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id))''',
+    '''CREATE TABLE IF NOT EXISTS gpkg_extensions (
+        table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL, definition TEXT NOT NULL,
+        scope TEXT NOT NULL, CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name))'''
+]
+
+# the spatial reference systems every GeoPackage has
+_DEFAULT_SRS = [
+    ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', 'undefined cartesian coordinate reference system'),
+    ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', 'undefined geographic coordinate reference system'),
+    ('WGS 84 geodetic', 4326, 'EPSG', 4326, projections.projections.get('4326', 'undefined'),
+     'longitude/latitude coordinates in decimal degrees on the WGS 84 spheroid')
+]
+
+# keeps the R-tree in sync when the table is edited later, see the GeoPackage spec
+_RTREE_TRIGGERS = '''
+CREATE TRIGGER "{rtree}_insert" AFTER INSERT ON "{table}"
+WHEN (new."{geom}" NOT NULL AND NOT ST_IsEmpty(NEW."{geom}"))
+BEGIN
+  INSERT OR REPLACE INTO "{rtree}" VALUES (NEW."{fid}",
+    ST_MinX(NEW."{geom}"), ST_MaxX(NEW."{geom}"), ST_MinY(NEW."{geom}"), ST_MaxY(NEW."{geom}"));
+END;
+CREATE TRIGGER "{rtree}_update1" AFTER UPDATE OF "{geom}" ON "{table}"
+WHEN OLD."{fid}" = NEW."{fid}" AND (NEW."{geom}" NOTNULL AND NOT ST_IsEmpty(NEW."{geom}"))
+BEGIN
+  INSERT OR REPLACE INTO "{rtree}" VALUES (NEW."{fid}",
+    ST_MinX(NEW."{geom}"), ST_MaxX(NEW."{geom}"), ST_MinY(NEW."{geom}"), ST_MaxY(NEW."{geom}"));
+END;
+CREATE TRIGGER "{rtree}_update2" AFTER UPDATE OF "{geom}" ON "{table}"
+WHEN OLD."{fid}" = NEW."{fid}" AND (NEW."{geom}" ISNULL OR ST_IsEmpty(NEW."{geom}"))
+BEGIN
+  DELETE FROM "{rtree}" WHERE id = OLD."{fid}";
+END;
+CREATE TRIGGER "{rtree}_update3" AFTER UPDATE ON "{table}"
+WHEN OLD."{fid}" != NEW."{fid}" AND (NEW."{geom}" NOTNULL AND NOT ST_IsEmpty(NEW."{geom}"))
+BEGIN
+  DELETE FROM "{rtree}" WHERE id = OLD."{fid}";
+  INSERT OR REPLACE INTO "{rtree}" VALUES (NEW."{fid}",
+    ST_MinX(NEW."{geom}"), ST_MaxX(NEW."{geom}"), ST_MinY(NEW."{geom}"), ST_MaxY(NEW."{geom}"));
+END;
+CREATE TRIGGER "{rtree}_update4" AFTER UPDATE ON "{table}"
+WHEN OLD."{fid}" != NEW."{fid}" AND (NEW."{geom}" ISNULL OR ST_IsEmpty(NEW."{geom}"))
+BEGIN
+  DELETE FROM "{rtree}" WHERE id IN (OLD."{fid}", NEW."{fid}");
+END;
+CREATE TRIGGER "{rtree}_delete" AFTER DELETE ON "{table}"
+WHEN old."{geom}" NOT NULL
+BEGIN
+  DELETE FROM "{rtree}" WHERE id = OLD."{fid}";
+END;
+'''
+
+def split_geopackage_path(path):
+    """Splits an output path into the GeoPackage file and the table name,
+            "data.gpkg/parcels" writes the parcels table and "parcels.gpkg"
+            writes a table named after the file.
+
+    Returns:
+        A tuple of the GeoPackage path and table name.
+    """
+    head, tail = os.path.split(path)
+    if head.lower().endswith(GPKG_EXTENSION):
+        return head, tail
+    return path, os.path.splitext(tail)[0]
+
+def blob_envelope(blob):
+    """Returns the (minx, maxx, miny, maxy) of GeoPackage binary, None for
+            empty geometries."""
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    flags = six.indexbytes(blob, 3)
+    if flags & 0x10:
+        return None
+    if flags & 0x0E:
+        return _envelope.unpack_from(blob, 8)
+    # points are written without an envelope
+    x, y = _point_xy.unpack_from(blob, 13)
+    return x, x, y, y
+
+def _envelope_value(index):
+    def func(blob):
+        envelope = blob_envelope(blob)
+        return envelope[index] if envelope else None
+    return func
+
+def _is_empty(blob):
+    return blob_envelope(blob) is None
+
+def register_functions(connection):
+    """Adds the ST_ functions used by the R-tree triggers to a connection."""
+    for i, name in enumerate(['ST_MinX', 'ST_MaxX', 'ST_MinY', 'ST_MaxY']):
+        connection.create_function(name, 1, _envelope_value(i))
+    connection.create_function('ST_IsEmpty', 1, _is_empty)
+
+class GeometryBlobEncoder(object):
+    """Converts esri JSON and GeoJSON geometries to GeoPackage binary.
+
+    Attributes:
+        srs_id: Spatial reference id written to the header.
+        encoder: The JSONWKBEncoder for the geometry type.
+    """
+
+    def __init__(self, srs_id, geometryType, hasZ=False, hasM=False):
+        self.srs_id = srs_id
+        self.encoder = JSONWKBEncoder(geometryType, hasZ, hasM, multi=True)
+        self.is_point = geometryType == ESRI_POINT
+
+    def __call__(self, geometry):
+        if not geometry:
+            return None
+        if TYPE in geometry:
+            wkb = self.encoder.encode_geojson(geometry)
+            coords = geometry.get(COORDINATES)
+            if wkb is not None and not self.is_point:
+                # nesting depth of the coordinates differs by GeoJSON type
+                while isinstance(coords[0][0], (list, tuple)):
+                    coords = [pt for part in coords for pt in part]
+        else:
+            parts = self.encoder.parts(geometry)
+            wkb = self.encoder.encode(parts) if parts else None
+            coords = parts[0] if len(parts) == 1 else [pt for part in parts for pt in part]
+        if wkb is None:
+            return None
+        if self.is_point:
+            return _gpkg_header(b'GP', 0, 0x01, self.srs_id) + wkb
+        xs = [pt[0] for pt in coords]
+        ys = [pt[1] for pt in coords]
+        return _gpkg_header(b'GP', 0, 0x03, self.srs_id) + _envelope.pack(min(xs), max(xs), min(ys), max(ys)) + wkb
+
+def _geopackage_rows(field_names, date_fields, encode, feature_set):
+    """Returns the row of each feature for a GeoPackage table."""
+    rows = []
+    for feat in raw_features(feature_set):
+        attributes = dict.get(feat, ATTRIBUTES) or dict.get(feat, PROPERTIES) or {}
+        row = [mil_to_isoformat(attributes.get(f)) if f in date_fields else attributes.get(f) for f in field_names]
+        if encode is not None:
+            row.append(encode(dict.get(feat, GEOMETRY)))
+        rows.append(row)
+    return rows
+
+class GeoPackageWriter(object):
+    """Writes feature sets to a GeoPackage table as they arrive.  Rows are
+            inserted in large transactions and the spatial index is built
+            when the writer is closed.  An existing table with the same name
+            is replaced, other tables in the GeoPackage are kept.
+
+    Attributes:
+        path: Path of the GeoPackage.
+        table_name: Name of the table.
+        srs_id: Spatial reference id of the geometries.
+        field_map: List of (field name, column name) tuples.
+        count: Number of features written.
+    """
+
+    def __init__(self, out_gpkg, fields, geometryType=None, spatialReference=None, table_name=None, hasZ=False, hasM=False):
+        """Creates the GeoPackage table.
+
+        Args:
+            out_gpkg: Output GeoPackage, "data.gpkg/parcels" writes the parcels
+                table.
+            fields: The fields of the feature sets that will be written.
+            geometryType: Optional esri geometry type, a table without geometry
+                is written when not set. Defaults to None.
+            spatialReference: Optional spatial reference JSON or wkid. Defaults to None.
+            table_name: Optional table name. Defaults to the name in out_gpkg.
+            hasZ: Optional boolean, True if the geometries have z values.
+            hasM: Optional boolean, True if the geometries have m values.
+        """
+        self.path, name = split_geopackage_path(out_gpkg)
+        self.table_name = table_name or name
+        self.geometryType = geometryType if geometryType in WKB_TYPES else None
+        self.hasZ, self.hasM = bool(hasZ), bool(hasM)
+        self.srs_id = get_wkid(spatialReference) or -1
+        self.count = 0
+        self._extent = None
+        self._pending = 0
+
+        self.fid_column = None
+        self.field_map = []
+        columns = []
+        names = set([GEOMETRY_COLUMN])
+        for fld in fields:
+            if not fld or fld.get(TYPE) == SHAPE:
+                continue
+            column = fld.get(NAME).split('.')[-1]
+            while column.lower() in names:
+                column += '_1'
+            names.add(column.lower())
+            if fld.get(TYPE) == OID and self.fid_column is None:
+                self.fid_column = column
+                columns.insert(0, '"{}" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL'.format(column))
+            else:
+                field_type = GPKG_FIELD_TYPES.get(fld.get(TYPE))
+                if field_type is None:
+                    field_type = 'TEXT({})'.format(fld[LENGTH]) if fld.get(LENGTH) else 'TEXT'
+                columns.append('"{}" {}'.format(column, field_type))
+            self.field_map.append((fld.get(NAME), column))
+        if self.fid_column is None:
+            self.fid_column = 'fid'
+            columns.insert(0, '"fid" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL')
+        if self.geometryType:
+            columns.append('"{}" {}'.format(GEOMETRY_COLUMN, self.geometry_type_name))
+        self.date_fields = set(f.get(NAME) for f in fields if f and f.get(TYPE) == DATE_FIELD)
+
+        self._connection = sqlite3.connect(self.path, isolation_level=None)
+        register_functions(self._connection)
+        self._create(columns)
+        columns = self.columns
+        self._fid_index = columns.index(self.fid_column) if self.fid_column in columns else None
+        if self._fid_index is None:
+            columns.insert(0, self.fid_column)
+        self._insert = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+            self.table_name, ', '.join('"{}"'.format(c) for c in columns), ', '.join('?' * len(columns)))
+
+    @classmethod
+    def from_feature_set(cls, feature_set, out_gpkg, spatialReference=None, table_name=None):
+        """Creates a writer for the fields and geometry type of a feature set.
+
+        Args:
+            feature_set: A FeatureSet or GeoJSONFeatureSet.
+            out_gpkg: Output GeoPackage.
+            spatialReference: Optional spatial reference, the spatial reference
+                of the feature set is used by default.
+            table_name: Optional table name. Defaults to the name in out_gpkg.
+        """
+        json = feature_set.json
+        if json.get(TYPE) == 'FeatureCollection' and not json.get(FIELDS):
+            # GeoJSON has no schema, it is taken from the first feature
+            fields, geometryType = geojson_schema(json)
+            return cls(out_gpkg, fields, geometryType, 4326, table_name)
+
+        # the features are not reprojected, the srs must match them
+        return cls(out_gpkg, feature_set.fields, getattr(feature_set, GEOMETRY_TYPE, None),
+                   feature_set.getSR() or spatialReference, table_name, json.get(HAS_Z), json.get(HAS_M))
+
+    @property
+    def columns(self):
+        """The names of the inserted columns, in row order."""
+        return [c for _, c in self.field_map] + ([GEOMETRY_COLUMN] if self.geometryType else [])
+
+    @property
+    def geometry_type_name(self):
+        """The GeoPackage geometry type, lines and polygons are always multi
+                part so single and multi part features share one type."""
+        return WKB_NAMES[WKB_TYPES[self.geometryType][1]].upper()
+
+    @property
+    def rtree_name(self):
+        return 'rtree_{}_{}'.format(self.table_name, GEOMETRY_COLUMN)
+
+    def _create(self, columns):
+        cursor = self._connection.cursor()
+        cursor.execute('PRAGMA application_id = {}'.format(GPKG_APPLICATION_ID))
+        cursor.execute('PRAGMA user_version = {}'.format(GPKG_USER_VERSION))
+        # a new file is written, durability only matters once it is complete
+        cursor.execute('PRAGMA synchronous = OFF')
+        cursor.execute('PRAGMA journal_mode = MEMORY')
+        cursor.execute('BEGIN')
+        for sql in _TABLES:
+            cursor.execute(sql)
+        cursor.executemany('INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)', _DEFAULT_SRS)
+        if self.geometryType and self.srs_id > 0:
+            wkt = projections.projections.get(str(self.srs_id), '').replace("'", '"')
+            name = wkt.split('"')[1] if '"' in wkt else str(self.srs_id)
+            # esri well known ids start at 100000
+            organization = 'EPSG' if self.srs_id < 100000 else 'ESRI'
+            cursor.execute('INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)',
+                           (name, self.srs_id, organization, self.srs_id, wkt or 'undefined', None))
+
+        # replace an existing table
+        for table in ('gpkg_extensions', 'gpkg_geometry_columns', 'gpkg_contents'):
+            cursor.execute('DELETE FROM {} WHERE table_name = ?'.format(table), (self.table_name,))
+        cursor.execute('DROP TABLE IF EXISTS "{}"'.format(self.rtree_name))
+        cursor.execute('DROP TABLE IF EXISTS "{}"'.format(self.table_name))
+
+        cursor.execute('CREATE TABLE "{}" ({})'.format(self.table_name, ', '.join(columns)))
+        cursor.execute('INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) VALUES (?, ?, ?, ?)',
+                       (self.table_name, 'features' if self.geometryType else 'attributes', self.table_name,
+                        self.srs_id if self.geometryType else None))
+        if self.geometryType:
+            cursor.execute('INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, ?, ?)',
+                           (self.table_name, GEOMETRY_COLUMN, self.geometry_type_name, self.srs_id, int(self.hasZ), int(self.hasM)))
+            cursor.execute('CREATE TEMP TABLE rtree_load (id INTEGER, minx DOUBLE, maxx DOUBLE, miny DOUBLE, maxy DOUBLE)')
+
+    def prepare(self, feature_set):
+        """Returns the row of each feature, the part of write() that does not
+                touch the GeoPackage so it can run in another thread or process.
+
+        Arg:
+            feature_set: A FeatureSet, GeoJSONFeatureSet or list of features.
+        """
+        return _geopackage_rows(*self.row_args + (feature_set,))
+
+    @property
+    def row_args(self):
+        """The arguments of the row conversion before the feature set."""
+        encode = GeometryBlobEncoder(self.srs_id, self.geometryType, self.hasZ, self.hasM) if self.geometryType else None
+        return [f for f, _ in self.field_map], self.date_fields, encode
+
+    def write_rows(self, rows):
+        """Inserts the rows returned by prepare().
+
+        Arg:
+            rows: List of rows.
+        """
+        if not rows:
+            return
+        if self._fid_index is None:
+            # the ids are set here so the index rows can refer to them
+            for fid, row in enumerate(rows, self.count + 1):
+                row.insert(0, fid)
+        cursor = self._connection.cursor()
+        cursor.executemany(self._insert, rows)
+        if self.geometryType:
+            fid_index = self._fid_index or 0
+            index_rows = []
+            for row in rows:
+                envelope = blob_envelope(row[-1])
+                if envelope is not None:
+                    self._expand(envelope)
+                    index_rows.append((row[fid_index],) + envelope)
+            # the R-tree is built from these after the load
+            cursor.executemany('INSERT INTO temp.rtree_load VALUES (?, ?, ?, ?, ?)', index_rows)
+        self.count += len(rows)
+        self._pending += len(rows)
+        if self._pending >= COMMIT_ROWS:
+            self._connection.execute('COMMIT')
+            self._connection.execute('BEGIN')
+            self._pending = 0
+
+    def _expand(self, envelope):
+        minx, maxx, miny, maxy = envelope
+        if self._extent is None:
+            self._extent = [minx, maxx, miny, maxy]
+        else:
+            ext = self._extent
+            if minx < ext[0]: ext[0] = minx
+            if maxx > ext[1]: ext[1] = maxx
+            if miny < ext[2]: ext[2] = miny
+            if maxy > ext[3]: ext[3] = maxy
+
+    def write(self, feature_set):
+        """Appends the features of a feature set.
+
+        Arg:
+            feature_set: A FeatureSet, GeoJSONFeatureSet or list of features.
+        """
+        self.write_rows(self.prepare(feature_set))
+
+    def _create_index(self):
+        """Builds the R-tree from the loaded rows and adds the triggers."""
+        names = dict(rtree=self.rtree_name, table=self.table_name, geom=GEOMETRY_COLUMN, fid=self.fid_column)
+        cursor = self._connection.cursor()
+        cursor.execute('CREATE VIRTUAL TABLE "{rtree}" USING rtree(id, minx, maxx, miny, maxy)'.format(**names))
+        cursor.execute('INSERT INTO "{rtree}" SELECT * FROM temp.rtree_load'.format(**names))
+        cursor.execute('DROP TABLE temp.rtree_load')
+        # executescript() would commit, run the triggers one at a time
+        for trigger in _RTREE_TRIGGERS.format(**names).split('END;')[:-1]:
+            cursor.execute(trigger + 'END;')
+        cursor.execute('INSERT INTO gpkg_extensions VALUES (?, ?, ?, ?, ?)',
+                       (self.table_name, GEOMETRY_COLUMN, 'gpkg_rtree_index',
+                        'http://www.geopackage.org/spec120/#extension_rtree', 'write-only'))
+
+    def close(self):
+        """Builds the spatial index, updates the extent and commits."""
+        if self._connection is None:
+            return
+        if self.geometryType:
+            self._create_index()
+            if self._extent is not None:
+                minx, maxx, miny, maxy = self._extent
+                self._connection.execute('UPDATE gpkg_contents SET min_x = ?, min_y = ?, max_x = ?, max_y = ? WHERE table_name = ?',
+                                         (minx, miny, maxx, maxy, self.table_name))
+        self._connection.execute("UPDATE gpkg_contents SET last_change = strftime('%Y-%m-%dT%H:%M:%fZ','now') WHERE table_name = ?",
+                                 (self.table_name,))
+        self._connection.execute('COMMIT')
+        self._connection.close()
+        self._connection = None
+        print('Created: "{0}"'.format(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -12,9 +12,10 @@ from .rest_utils import *
 shapefile =  shp_helper.shapefile
 
 from . import projections
+from .coordinates import PackedCoordinates
+from .reproject import get_transformer
 
 import six
-from six.moves import urllib
 
 # field types for shapefile module
 SHP_FTYPES = munch.munchify({
@@ -30,6 +31,14 @@ SHP_FTYPES = munch.munchify({
           GLOBALID: 'C'
           })
 
+# shapefile shape types of the esri geometry types, Z or M is appended
+SHP_SHAPE_TYPES = {
+    ESRI_POINT: 'POINT',
+    ESRI_MULTIPOINT: 'MULTIPOINT',
+    ESRI_POLYLINE: 'POLYLINE',
+    ESRI_POLYGON: 'POLYGON'
+}
+
 def project(SHAPEFILE, wkid):
     """Creates .prj for shapefile.
 
@@ -75,8 +84,10 @@ def exportReplica(replica, out_folder):
         att_dict = {}
         for attInfo in layer.attachments:
             out_file = assign_unique_name(os.path.join(att_loc, attInfo[NAME]))
+            resp = SESSION_MANAGER.get(attInfo['url'], stream=True)
             with open(out_file, 'wb') as f:
-                f.write(urllib.request.urlopen(attInfo['url']).read())
+                for chunk in resp.iter_content(1024 * 16):
+                    f.write(chunk)
             att_dict[attInfo['parentGlobalId']] = out_file.strip()
 
         if layer.features:
@@ -183,6 +194,43 @@ def partHandler(shape):
         raise IOError('Not a valid shapefile.Shape() input!')
     return parts
 
+def _coordinate_bbox(parts):
+    """Returns the (xmin, ymin, xmax, ymax) of lists of coordinates in a single
+            pass, None when there are no coordinates.
+
+    Arg:
+        parts: List of coordinate lists, such as the rings of a polygon.
+    """
+    xmin = ymin = float('inf')
+    xmax = ymax = float('-inf')
+    for part in parts:
+        for pt in part:
+            x = pt[0]
+            y = pt[1]
+            if x < xmin:
+                xmin = x
+            if x > xmax:
+                xmax = x
+            if y < ymin:
+                ymin = y
+            if y > ymax:
+                ymax = y
+    if xmin > xmax:
+        return None
+    return xmin, ymin, xmax, ymax
+
+def _geojson_parts(geometry):
+    """Returns the coordinate lists of a GeoJSON geometry."""
+    coords = dict.get(geometry, COORDINATES) or []
+    kind = dict.get(geometry, TYPE)
+    if kind == 'Point':
+        return [[coords]] if coords else []
+    if kind in ('LineString', 'MultiPoint'):
+        return [coords]
+    if kind == 'MultiPolygon':
+        return [ring for polygon in coords for ring in polygon]
+    return coords
+
 def find_ws_type(path):
     """Returns a workspace for shapefile.
     
@@ -198,7 +246,14 @@ def find_ws_type(path):
         return(os.path.dirname(path), 'FileSystem')
 
 class Geometry(BaseGeometry):
-    """Class to handle restapi.Geometry."""
+    """Class to handle restapi.Geometry.
+
+    Attributes:
+        packed: The PackedCoordinates of a geometry created with packed=True,
+            otherwise None.
+    """
+    _bbox = None
+    packed = None
 
     def __init__(self, geometry, **kwargs):
         """Converts geometry input to restapi.Geometry object.
@@ -206,10 +261,23 @@ class Geometry(BaseGeometry):
         Arg:
             geometry: Input geometry.  Can be arcpy.Geometry(), shapefile/feature
                 class, or JSON.
+            packed: Optional keyword argument to keep the coordinates of 
+                multipoints, polylines and polygons in a flat buffer instead
+                of nested lists, see PackedCoordinates.  True packs them in an
+                array('d') and "numpy" in a numpy array.  The JSON is then 
+                built each time it is requested. Defaults to False.
         """
 
-        self._inputGeometry = geometry
+        packed = kwargs.pop('packed', False)
+        # a packed geometry must not keep the nested lists of its input alive
+        self._inputGeometry = geometry if not packed else None
         if isinstance(geometry, self.__class__):
+            if geometry.packed is not None and packed:
+                # the buffers are immutable in practice, share them
+                self._json = geometry._json
+                self.packed, self._packed_key = geometry.packed, geometry._packed_key
+                self.geometryType = geometry.geometryType
+                return
             geometry = geometry.json
         spatialReference = None
         self.geometryType = None
@@ -269,7 +337,7 @@ class Geometry(BaseGeometry):
             # first check for geojson
             if COORDINATES in geometry:
                 self.geometryType = geometry.get(TYPE)
-                self.json = munch.munchify(geometry)
+                self.json = lazy_munchify(geometry)
                 return
                 
             if FEATURES in geometry:
@@ -301,6 +369,9 @@ class Geometry(BaseGeometry):
                     self.geometryType = ESRI_ENVELOPE
                 else:
                     raise IOError('Not a valid JSON object!')
+                for k in (HAS_Z, HAS_M):
+                    if k in geometry:
+                        self.json[k] = geometry[k]
             if not self.geometryType and GEOMETRY_TYPE in geometry:
                 self.geometryType = geometry[GEOMETRY_TYPE]
         if not SPATIAL_REFERENCE in self.json and spatialReference is not None:
@@ -316,7 +387,42 @@ class Geometry(BaseGeometry):
                 self.geometryType = ESRI_POINT
             else:
                 self.geometryType = NULL_GEOMETRY
-        self.json = munch.munchify(self.json)
+        self.json = lazy_munchify(self.json)
+        if packed and self.geometryType in (ESRI_MULTIPOINT, ESRI_POLYLINE, ESRI_POLYGON):
+            self._pack(packed == 'numpy')
+
+    def _pack(self, use_numpy=False):
+        """Moves the coordinates from the JSON to a PackedCoordinates."""
+        key = JSON_CODE[self.geometryType]
+        parts = dict.get(self._json, key)
+        if parts is None:
+            return
+        if key == POINTS:
+            parts = [parts]
+        dims = None
+        if self._json.get(HAS_Z) or self._json.get(HAS_M):
+            dims = 2 + bool(self._json.get(HAS_Z)) + bool(self._json.get(HAS_M))
+        self.packed = PackedCoordinates.from_parts(parts, dims, use_numpy)
+        self._packed_key = key
+        # the json is a copy of the input, dropping the lists frees them
+        dict.pop(self._json, key)
+
+    @property
+    def json(self):
+        """The geometry as esri JSON, for packed geometries it is built from 
+                the coordinate buffer on each access."""
+        if self.packed is None:
+            return self._json
+        json = LazyMunch(self._json)
+        parts = self.packed.to_parts()
+        json[self._packed_key] = parts[0] if self._packed_key == POINTS else parts
+        return json
+
+    @json.setter
+    def json(self, value):
+        self._json = value
+        self.packed = None
+        self._bbox = None
 
     @property
     def spatialReference(self):
@@ -325,23 +431,40 @@ class Geometry(BaseGeometry):
     @spatialReference.setter
     def spatialReference(self, wkid):
         if isinstance(wkid, int):
-            self.json[SPATIAL_REFERENCE] = {WKID: wkid}
+            self._json[SPATIAL_REFERENCE] = {WKID: wkid}
         elif isinstance(wkid, dict):
-            self.json[SPATIAL_REFERENCE] = wkid
+            self._json[SPATIAL_REFERENCE] = wkid
+
+    @property
+    def bbox(self):
+        """The numeric (xmin, ymin, xmax, ymax) of the geometry, None for empty 
+                geometries.  It is computed on first access and cached, the 
+                string and JSON envelopes are derived from it.
+        """
+        if self._bbox is None:
+            geometry = self._json
+            if self.packed is not None:
+                bbox = self.packed.bbox
+            elif COORDINATES in geometry:
+                bbox = _coordinate_bbox(_geojson_parts(geometry))
+            elif self.geometryType == ESRI_POINT:
+                x, y = dict.get(geometry, X), dict.get(geometry, Y)
+                bbox = (x, y, x, y) if x is not None and x != 'NaN' else None
+            elif self.geometryType == ESRI_ENVELOPE:
+                bbox = tuple(dict.get(geometry, k) for k in (XMIN, YMIN, XMAX, YMAX))
+            elif self.geometryType == ESRI_MULTIPOINT:
+                bbox = _coordinate_bbox([dict.get(geometry, POINTS) or []])
+            else:
+                bbox = _coordinate_bbox(dict.get(geometry, JSON_CODE.get(self.geometryType)) or [])
+            # empty geometries are cached too
+            self._bbox = bbox or ()
+        return self._bbox or None
 
     def envelope(self):
-        """Returns an envelope from shape."""
-        if self.geometryType != ESRI_POINT:
-            coords = []
-            for i in self.json[JSON_CODE[self.geometryType]]:
-                coords.extend(i)
-            XMin = min(g[0] for g in coords)
-            YMin = min(g[1] for g in coords)
-            XMax = max(g[0] for g in coords)
-            YMax = max(g[1] for g in coords)
-            return ','.join(map(str, [XMin, YMin, XMax, YMax]))
-        else:
-            return '{0},{1},{0},{1}'.format(self.json[X], self.json[Y])
+        """Returns an envelope from shape as a comma separated string, None for
+                empty geometries."""
+        bbox = self.bbox
+        return ','.join(map(str, bbox)) if bbox else None
 
     def envelopeAsJSON(self, roundCoordinates=False):
         """Returns an envelope geometry object as JSON.
@@ -353,10 +476,9 @@ class Geometry(BaseGeometry):
 
         if self.geometryType != ESRI_ENVELOPE:
             flds = [XMIN, YMIN, XMAX, YMAX]
-            if roundCoordinates:
-                coords = map(int, [float(i) for i in self.envelope().split(',')])
-            else:
-                coords = self.envelope().split(',')
+            coords = self.bbox or (None,) * 4
+            if roundCoordinates and self.bbox:
+                coords = map(int, coords)
             d = dict(zip(flds, coords))
         else:
             d = self.json
@@ -364,34 +486,59 @@ class Geometry(BaseGeometry):
             d[SPATIAL_REFERENCE] = self.json[SPATIAL_REFERENCE]
         return d
 
+    def project(self, outSR):
+        """Returns the geometry projected to another spatial reference on the
+                client, see restapi.reproject.  The coordinate buffer of a 
+                packed geometry is projected as a whole and stays packed.
+
+        Arg:
+            outSR: The output well known id or spatial reference dict.
+
+        Raises:
+            NotImplementedError: The transformation is not supported locally,
+                use GeometryService.project() instead.
+        """
+        transformer = get_transformer(self._json.get(SPATIAL_REFERENCE) or self.getSR(), outSR)
+        if self.packed is not None:
+            geometry = Geometry(self, packed=True)
+            geometry._json = LazyMunch(self._json)
+            geometry.packed = PackedCoordinates(transformer.transform_coords(self.packed.coords, self.packed.dims),
+                                                self.packed.part_offsets, self.packed.dims)
+        else:
+            geometry = Geometry(transformer.transform_geometry(self.json))
+        geometry.spatialReference = transformer.spatialReference
+        return geometry
+
     def asShape(self):
-        """Returns geometry as shapefile.Shape() object."""
-        return shapefile.Shape._from_geojson(self.json)
-#         shp = shapefile.Shape(shp_helper.shp_dict[self.geometryType.split('Geometry')[1].upper()])
-#         if self.geometryType != ESRI_POINT:
-#             shp.points = self.json[JSON_CODE[self.geometryType]]
-#         else:
-#             shp.points = [[self.json[X], self.json[Y]]]
-
-#         # check if multipart, will need to fix if it is
-#         if any(isinstance(i, list) for i in shp.points):
-#             coords = []
-#             part_indices = [0] + [len(i) for i in iter(shp.points)][:-1]
-# ##            for i in shp.points:
-# ##                coords.extend(i)
-# ##            shp.points = coords
-#             shp.parts = shapefile._Array('i', part_indices)
-#         else:
-#             shp.parts = shapefile._Array('i', [0])
-
-#         if shp.shapeType not in (0,1,8,18,28,31):
-#             XMin = min(coords[0] for coords in shp.points)
-#             YMin = min(coords[1] for coords in shp.points)
-#             XMax = max(coords[0] for coords in shp.points)
-#             YMax = max(coords[1] for coords in shp.points)
-#             shp.bbox = shapefile._Array('d', [XMin, YMin, XMax, YMax])
-
-        return shp
+        """Returns geometry as shapefile.Shape() object.  The points of a packed
+                geometry are a view of its coordinate buffer, not a copy."""
+        json = self._json
+        if COORDINATES in json:
+            return shapefile.Shape._from_geojson(json)
+        if self.geometryType not in SHP_SHAPE_TYPES:
+            return shapefile.Shape(shapefile.NULL)
+        shapeType = SHP_SHAPE_TYPES[self.geometryType]
+        if json.get(HAS_Z):
+            shapeType += 'Z'
+        elif json.get(HAS_M):
+            shapeType += 'M'
+        shape = shapefile.Shape(shp_helper.shp_dict[shapeType])
+        if self.geometryType == ESRI_POINT:
+            shape.points = [[json[k] for k in (X, Y, Z, M) if k in json]]
+        elif self.packed is not None:
+            shape.points = self.packed.vertices()
+            shape.parts = self.packed.part_offsets[:-1].tolist()
+        else:
+            parts = dict.get(json, JSON_CODE[self.geometryType]) or []
+            if self.geometryType == ESRI_MULTIPOINT:
+                parts = [parts]
+            # the vertex lists are shared with the JSON
+            shape.points = [pt for part in parts for pt in part]
+            start = 0
+            for part in parts:
+                shape.parts.append(start)
+                start += len(part)
+        return shape
 
     def __str__(self):
         """Dumps JSON to string."""
@@ -402,31 +549,39 @@ class Geometry(BaseGeometry):
         return '<restapi.Geometry: {}>'.format(self.geometryType)
 
 
-class GeometryCollection(object):
+class GeometryCollection(BaseGeometryCollection):
     """Represents an array of restapi.Geometry objects."""
     geometries = []
-    JSON = {GEOMETRIES: []}
     geometryType = None
 
-    def __init__(self, geometries, use_envelopes=False):
+    def __init__(self, geometries, use_envelopes=False, packed=False, spatialReference=None):
         """Represents an array of restapi.Geometry objects.
         
         Args:
             geometries: A single geometry or a list of geometries.  Valid inputs
                 are a shapefile|feature class|Layer, geometry as JSON, or a 
-                restapi.Geometry or restapi.FeatureSet.
+                restapi.Geometry, restapi.GeometryCollection or restapi.FeatureSet.
             use_envelopes: Optional boolean, if set to true, will use the bounding 
                 box of each geometry passed in for the JSON attribute. 
                 Default is False.
+            packed: Optional, True or "numpy" to keep the coordinates of the
+                geometries created from JSON or shapefiles in flat buffers, 
+                see Geometry(). Defaults to False.
+            spatialReference: Optional wkid or spatial reference dict for the 
+                geometries that do not have one. Defaults to None.
         
         Raises:
             ValueError: 'Inputs are not valid ESRI JSON Geometries!!!'
         """
 
+        # it is already a GeometryCollection
+        if isinstance(geometries, GeometryCollection):
+            self.geometries = list(geometries.geometries)
+
         # it is a shapefile
-        if os.path.exists(geometries) and geometries.endswith('.shp'):
+        elif isinstance(geometries, six.string_types) and geometries.endswith('.shp') and os.path.exists(geometries):
             r = shapefile.Reader(geometries)
-            self.geometries = [Geometry(s) for s in r.shapes]
+            self.geometries = [Geometry(s, packed=packed) for s in r.shapes()]
 
         # it is already a list
         elif isinstance(geometries, list):
@@ -440,42 +595,67 @@ class GeometryCollection(object):
 
                 # this *should* be JSON, right???
                 try:
-                    self.geometries = [Geometry(g) for g in geometries]
+                    self.geometries = [Geometry(g, packed=packed) for g in geometries]
                 except ValueError:
                     raise ValueError('Inputs are not valid ESRI JSON Geometries!!!')
 
         # it is a FeatureSet
         elif isinstance(geometries, FeatureSet):
             fs = geometries
-            self.geometries = [Geometry(f.geometry, spatialReference=fs.getWKID(), geometryType=fs.geometryType) for f in fs.features]
+            self.geometries = [Geometry(f.geometry, spatialReference=fs.getWKID(), geometryType=fs.geometryType, packed=packed) for f in fs.features]
 
         # it is a JSON struture of geometries already
         elif isinstance(geometries, dict) and GEOMETRIES in geometries:
 
             # it is already a GeometryCollection in ESRI JSON format?
-            self.geometries = [Geometry(g) for g in geometries[GEOMETRIES]]
+            self.geometries = [Geometry(g, packed=packed) for g in geometries[GEOMETRIES]]
 
         # it is a single Geometry object
         elif isinstance(geometries, Geometry):
-            self.geometries.append(geometries)
+            self.geometries = [geometries]
 
         # it is a single geometry as JSON
         elif isinstance(geometries, (dict, six.string_types)):
 
             # this *should* be JSON, right???
             try:
-                self.geometries.append(Geometry(geometries))
+                self.geometries = [Geometry(geometries, packed=packed)]
             except ValueError:
                 raise ValueError('Inputs are not valid ESRI JSON Geometries!!!')
 
         else:
             raise ValueError('Inputs are not valid ESRI JSON Geometries!!!')
 
+        self.use_envelopes = use_envelopes
+        if isinstance(spatialReference, six.string_types) and spatialReference.isdigit():
+            spatialReference = int(spatialReference)
+        if spatialReference:
+            for g in self.geometries:
+                if not g.getSR():
+                    g.spatialReference = spatialReference
         if self.geometries:
-            self.JSON[GEOMETRIES] = [g.envelopeAsJSON() if use_envelopes else g.JSON for g in self.geometries]
-            self.JSON[GEOMETRY_TYPE] = self.geometries[0].geometryType if not use_envelopes else ESRI_ENVELOPE
             self.geometryType = self.geometries[0].geometryType
 
+    @property
+    def json(self):
+        return self.JSON
+
+    @property
+    def _spatialReference(self):
+        """Gets the spatial reference dict of the first geometry."""
+        if not self.geometries:
+            return munch.munchify({})
+        return self.geometries[0]._spatialReference
+
+    @property
+    def JSON(self):
+        """The geometries as esri JSON, built on access so packed geometries
+                stay packed."""
+        if not self.geometries:
+            return {GEOMETRIES: []}
+        return {GEOMETRIES: [g.envelopeAsJSON() if self.use_envelopes else g.json for g in self.geometries],
+                GEOMETRY_TYPE: self.geometries[0].geometryType if not self.use_envelopes else ESRI_ENVELOPE}
+
     @property
     def count(self):
         return len(self)
@@ -0,0 +1,208 @@
+"""Writes query results to Apache Arrow record batches and GeoParquet files.
+
+Each query chunk is converted to a ColumnarFeatureSet and then to an Arrow
+record batch, the typed numpy columns are handed to Arrow as is.  Geometries
+are written as WKB to a "geometry" column described by GeoParquet metadata,
+so the files can be read by GeoPandas, DuckDB and other GeoParquet readers.
+Batches are written as they arrive, the whole result is never held in memory:
+
+    with ParquetWriter('parcels.parquet') as writer:
+        for batch in layer.iter_record_batches(where='COUNTY = 27'):
+            writer.write(batch)
+
+Requires numpy and pyarrow.
+"""
+from __future__ import print_function
+import json
+from ._strings import *
+from .columnar import ColumnarFeatureSet
+from .wkb import WKBEncoder, geometry_type_names
+from .reproject import get_wkid
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    has_pyarrow = True
+except ImportError:
+    has_pyarrow = False
+
+__all__ = ['ParquetWriter', 'write_parquet', 'arrow_schema', 'record_batch', 'conform_batch', 'has_pyarrow']
+
+GEOMETRY_COLUMN = 'geometry'
+GEOPARQUET_VERSION = '1.0.0'
+
+# wkids that do not need a crs in the GeoParquet metadata, the default is OGC:CRS84
+DEFAULT_CRS_WKIDS = (4326,)
+
+def _arrow_type(field_type):
+    """Returns the Arrow type of an esri field type."""
+    return {
+        OID: pa.int64(),
+        SHORT_FIELD: pa.int16(),
+        LONG_FIELD: pa.int32(),
+        BIG_INTEGER_FIELD: pa.int64(),
+        FLOAT_FIELD: pa.float32(),
+        DOUBLE_FIELD: pa.float64(),
+        DATE_FIELD: pa.timestamp('ms', tz='UTC')
+    }.get(field_type, pa.string())
+
+def _crs(wkid):
+    """Returns the GeoParquet crs of a well known id as a PROJJSON id, or None
+            when the crs is unknown."""
+    if not wkid:
+        return None
+    # esri well known ids start at 100000
+    return {'id': {'authority': 'EPSG' if wkid < 100000 else 'ESRI', 'code': wkid}}
+
+def arrow_schema(fields, geometryType=None, spatialReference=None, hasZ=False, hasM=False):
+    """Returns the Arrow schema for a set of fields.
+
+    Args:
+        fields: List of esri fields, the Shape field is skipped.
+        geometryType: Optional esri geometry type, a WKB geometry column is
+            added when set. Defaults to None.
+        spatialReference: Optional spatial reference JSON for the GeoParquet
+            metadata. Defaults to None.
+        hasZ: Optional boolean, True if the geometries have z values.
+        hasM: Optional boolean, True if the geometries have m values.
+
+    Raises:
+        ImportError: 'pyarrow is required to write Arrow and Parquet data'
+    """
+    if not has_pyarrow:
+        raise ImportError('pyarrow is required to write Arrow and Parquet data')
+    schema_fields = [pa.field(f.get(NAME), _arrow_type(f.get(TYPE))) for f in fields if f and f.get(TYPE) != SHAPE]
+    metadata = None
+    if geometryType:
+        schema_fields.append(pa.field(GEOMETRY_COLUMN, pa.binary()))
+        column = {'encoding': 'WKB', 'geometry_types': geometry_type_names(geometryType, hasZ, hasM)}
+        wkid = get_wkid(spatialReference)
+        if wkid not in DEFAULT_CRS_WKIDS:
+            column['crs'] = _crs(wkid)
+        geo = {'version': GEOPARQUET_VERSION, 'primary_column': GEOMETRY_COLUMN, 'columns': {GEOMETRY_COLUMN: column}}
+        metadata = {b'geo': json.dumps(geo).encode('utf-8')}
+    return pa.schema(schema_fields, metadata=metadata)
+
+def record_batch(cfs, schema=None):
+    """Converts a ColumnarFeatureSet to an Arrow record batch.
+
+    Args:
+        cfs: A ColumnarFeatureSet, or a FeatureSet which is converted first.
+        schema: Optional schema from arrow_schema(), keeps the batches of
+            several chunks the same.  Fields missing from cfs are null.
+            Defaults to the schema of cfs.
+
+    Returns:
+        A pyarrow.RecordBatch.
+    """
+    if not isinstance(cfs, ColumnarFeatureSet):
+        cfs = ColumnarFeatureSet.from_feature_set(cfs)
+    if schema is None:
+        schema = arrow_schema(cfs.fields, cfs.geometryType, cfs.spatialReference, cfs.hasZ, cfs.hasM)
+    arrays = []
+    for field in schema:
+        if field.name == GEOMETRY_COLUMN and GEOMETRY_COLUMN not in cfs:
+            encoder = WKBEncoder(cfs.geometryType, cfs.hasZ, cfs.hasM)
+            arrays.append(pa.array(list(encoder.iter_wkb(cfs)), type=field.type))
+        elif field.name in cfs:
+            arrays.append(pa.array(cfs.values(field.name), type=field.type, mask=cfs.isnull(field.name)))
+        else:
+            arrays.append(pa.nulls(len(cfs), type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def conform_batch(batch, schema):
+    """Returns a record batch with the columns of a schema, such as a batch
+            converted on its own with the schema of the first batch written.
+            Columns are cast to the schema types and missing columns are null.
+    """
+    names = batch.schema.names
+    arrays = []
+    for field in schema:
+        if field.name in names:
+            column = batch.column(names.index(field.name))
+            arrays.append(column if column.type == field.type else column.cast(field.type))
+        else:
+            arrays.append(pa.nulls(batch.num_rows, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+class ParquetWriter(object):
+    """Writes record batches to a Parquet file as they arrive, each batch is
+            written as its own row group.
+
+    Attributes:
+        path: The output file.
+        schema: The schema of the file, taken from the first batch when not
+            given.
+        count: Number of rows written.
+    """
+
+    def __init__(self, path, schema=None, compression='snappy'):
+        """Creates a Parquet writer, the file is opened on the first write.
+
+        Args:
+            path: The output file.
+            schema: Optional Arrow schema. Defaults to the schema of the first batch.
+            compression: Optional compression codec. Defaults to 'snappy'.
+        """
+        if not has_pyarrow:
+            raise ImportError('pyarrow is required to write Arrow and Parquet data')
+        self.path = path
+        self.schema = schema
+        self.compression = compression
+        self.count = 0
+        self._writer = None
+
+    def _open(self):
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+
+    def write(self, batch):
+        """Writes a record batch, ColumnarFeatureSet or FeatureSet.
+
+        Arg:
+            batch: The data to write.
+        """
+        if not isinstance(batch, pa.RecordBatch):
+            batch = record_batch(batch, self.schema)
+        if self.schema is None:
+            self.schema = batch.schema
+        elif not batch.schema.equals(self.schema):
+            batch = conform_batch(batch, self.schema)
+        self._open()
+        self._writer.write_batch(batch)
+        self.count += batch.num_rows
+
+    def close(self):
+        """Closes the file, an empty file is written if nothing was written
+                but the schema is known."""
+        if self._writer is None and self.schema is not None:
+            self._open()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+def write_parquet(path, batches, schema=None, compression='snappy'):
+    """Writes record batches, ColumnarFeatureSets or FeatureSets to a Parquet
+            file one at a time.
+
+    Args:
+        path: The output file.
+        batches: Iterable of the data to write, such as
+            MapServiceLayer.iter_record_batches().
+        schema: Optional Arrow schema. Defaults to the schema of the first batch.
+        compression: Optional compression codec. Defaults to 'snappy'.
+
+    Returns:
+        The path to the output file.
+    """
+    with ParquetWriter(path, schema, compression) as writer:
+        for batch in batches:
+            writer.write(batch)
+    print('Created: "{0}"'.format(path))
+    return path
@@ -0,0 +1,352 @@
+"""Decoder for query results in the esri protocol buffer format (f=pbf).
+
+ArcGIS Server 10.7+ and ArcGIS Online can return feature queries as a
+FeatureCollectionPBuffer message, which is several times smaller than JSON
+because attribute names are only sent once and geometries are quantized to
+integers and delta encoded.  This is a small pure python reader for that
+message, the result has exactly the same structure as a JSON query response
+so it can be used to build a FeatureSet or Cursor:
+
+    features = decode_feature_collection(response.content)[FEATURES]
+
+Only the parts of the message returned by feature queries are decoded, ids
+only and extent only queries are always made as JSON by restapi.
+"""
+import struct
+from ._strings import *
+
+import six
+
+# enums from FeatureCollection.proto, proto3 does not encode the first
+# value of an enum so it is the default for missing fields
+GEOMETRY_TYPES = {
+    0: ESRI_POINT,
+    1: ESRI_MULTIPOINT,
+    2: ESRI_POLYLINE,
+    3: ESRI_POLYGON,
+    4: 'esriGeometryMultiPatch'
+}
+
+FIELD_TYPES = {
+    0: SHORT_FIELD,
+    1: LONG_FIELD,
+    2: FLOAT_FIELD,
+    3: DOUBLE_FIELD,
+    4: TEXT_FIELD,
+    5: DATE_FIELD,
+    6: OID,
+    7: SHAPE,
+    8: BLOB_FIELD,
+    9: RASTER_FIELD,
+    10: GUID_FIELD,
+    11: GLOBALID,
+    12: 'esriFieldTypeXML'
+}
+
+# wire types
+VARINT, FIXED64, LENGTH_DELIMITED, FIXED32 = 0, 1, 2, 5
+
+# quantizeOriginPostion of a Transform
+UPPER_LEFT = 0
+
+_float = struct.Struct('<f').unpack_from
+_double = struct.Struct('<d').unpack_from
+
+def _read_varint(buf, pos):
+    """Returns the varint starting at pos and the position after it."""
+    result = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+def _zigzag(n):
+    """Decodes a zigzag encoded sint32/sint64."""
+    return (n >> 1) ^ -(n & 1)
+
+def _int64(n):
+    """Converts an unsigned varint to a two's complement int64."""
+    return n - (1 << 64) if n >= (1 << 63) else n
+
+def _iter_fields(buf, pos, end):
+    """Generator for the (field number, wire type, value) of each field in a
+            message.  Varints are returned as int, length delimited fields as
+            a (start, end) tuple and fixed size fields as their offset.
+
+    Raises:
+        ValueError: 'Unsupported wire type {}'
+    """
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        wire_type = key & 7
+        if wire_type == VARINT:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == LENGTH_DELIMITED:
+            size, pos = _read_varint(buf, pos)
+            value = (pos, pos + size)
+            pos += size
+        elif wire_type == FIXED64:
+            value = pos
+            pos += 8
+        elif wire_type == FIXED32:
+            value = pos
+            pos += 4
+        else:
+            raise ValueError('Unsupported wire type {}'.format(wire_type))
+        yield key >> 3, wire_type, value
+
+def _string(buf, span):
+    return bytes(buf[span[0]:span[1]]).decode('utf-8')
+
+def _packed_varints(buf, span, values=None):
+    """Decodes a packed repeated varint field."""
+    values = [] if values is None else values
+    pos, end = span
+    append = values.append
+    while pos < end:
+        b = buf[pos]
+        if b < 0x80:
+            # most coordinate deltas fit in a single byte
+            append(b)
+            pos += 1
+        else:
+            value, pos = _read_varint(buf, pos)
+            append(value)
+    return values
+
+def _repeated_varints(buf, wire_type, value, values):
+    """Adds a repeated varint field that may or may not be packed."""
+    if wire_type == LENGTH_DELIMITED:
+        _packed_varints(buf, value, values)
+    else:
+        values.append(value)
+
+def _decode_value(buf, span):
+    """Decodes a Value message, which holds a single attribute."""
+    for number, wire_type, value in _iter_fields(buf, span[0], span[1]):
+        if number == 1:
+            return _string(buf, value)
+        elif number == 2:
+            return _float(buf, value)[0]
+        elif number == 3:
+            return _double(buf, value)[0]
+        elif number in (4, 8):
+            return _zigzag(value)
+        elif number in (5, 7):
+            return value
+        elif number == 6:
+            return _int64(value)
+        elif number == 9:
+            return bool(value)
+
+def _decode_spatial_reference(buf, span):
+    sr = {}
+    for number, wire_type, value in _iter_fields(buf, span[0], span[1]):
+        if number == 1:
+            sr[WKID] = value
+        elif number == 2:
+            sr[LATEST_WKID] = value
+        elif number == 3:
+            sr['vcsWkid'] = value
+        elif number == 4:
+            sr['latestVcsWkid'] = value
+        elif number == 5:
+            sr[WKT] = _string(buf, value)
+    return sr
+
+def _decode_field(buf, span):
+    field = {TYPE: FIELD_TYPES[0]}
+    for number, wire_type, value in _iter_fields(buf, span[0], span[1]):
+        if number == 1:
+            field[NAME] = _string(buf, value)
+        elif number == 2:
+            field[TYPE] = FIELD_TYPES.get(value)
+        elif number == 3:
+            field[ALIAS] = _string(buf, value)
+        elif number == 5:
+            field['domain'] = _string(buf, value)
+        elif number == 6:
+            field['defaultValue'] = _string(buf, value)
+    return field
+
+def _decode_doubles(buf, span, default):
+    """Decodes a Scale or Translate message, fields 1 to 4 are x, y, m and z."""
+    values = [default] * 4
+    for number, wire_type, value in _iter_fields(buf, span[0], span[1]):
+        if number <= 4 and wire_type == FIXED64:
+            values[number - 1] = _double(buf, value)[0]
+    return values
+
+class Transform(object):
+    """Converts quantized integer coordinates back to map coordinates.
+
+    Attributes:
+        upper_left: True if y values increase downward from the origin.
+        scale: (x, y, m, z) scale factors.
+        translate: (x, y, m, z) translations.
+    """
+    def __init__(self, buf=None, span=None):
+        self.upper_left = False
+        self.scale = [1.0, 1.0, 1.0, 1.0]
+        self.translate = [0.0, 0.0, 0.0, 0.0]
+        if buf is None:
+            return
+
+        # proto3 omits the default, which is upperLeft
+        self.upper_left = True
+        for number, wire_type, value in _iter_fields(buf, span[0], span[1]):
+            if number == 1:
+                self.upper_left = value == UPPER_LEFT
+            elif number == 2:
+                self.scale = _decode_doubles(buf, value, 1.0)
+            elif number == 3:
+                self.translate = _decode_doubles(buf, value, 0.0)
+
+    def coordinates(self, coords, has_z=False, has_m=False):
+        """Returns the list of [x, y(, z)(, m)] coordinates from the raw
+                delta encoded integer coordinates.
+        """
+        sx, sy, sm, sz = self.scale
+        tx, ty, tm, tz = self.translate
+        stride = 2 + has_z + has_m
+        points = []
+        append = points.append
+        x = y = z = m = 0
+        if stride == 2:
+            ysign = -sy if self.upper_left else sy
+            for i in six.moves.range(0, len(coords) - 1, 2):
+                x += _zigzag(coords[i])
+                y += _zigzag(coords[i + 1])
+                append([x * sx + tx, y * ysign + ty])
+            return points
+
+        for i in six.moves.range(0, len(coords) - stride + 1, stride):
+            x += _zigzag(coords[i])
+            y += _zigzag(coords[i + 1])
+            pt = [x * sx + tx, ty - y * sy if self.upper_left else y * sy + ty]
+            j = i + 2
+            if has_z:
+                z += _zigzag(coords[j])
+                pt.append(z * sz + tz)
+                j += 1
+            if has_m:
+                m += _zigzag(coords[j])
+                pt.append(m * sm + tm)
+            append(pt)
+        return points
+
+def _decode_geometry(buf, span, geometry_type, transform, has_z, has_m):
+    """Decodes a Geometry message into esri JSON geometry."""
+    lengths, coords = [], []
+    for number, wire_type, value in _iter_fields(buf, span[0], span[1]):
+        if number == 2:
+            _repeated_varints(buf, wire_type, value, lengths)
+        elif number == 3:
+            _repeated_varints(buf, wire_type, value, coords)
+
+    points = transform.coordinates(coords, has_z, has_m)
+    if geometry_type == ESRI_POINT:
+        if not points:
+            return None
+        pt = points[0]
+        geometry = {X: pt[0], Y: pt[1]}
+        if has_z:
+            geometry['z'] = pt[2]
+        if has_m:
+            geometry['m'] = pt[-1]
+        return geometry
+    elif geometry_type == ESRI_MULTIPOINT:
+        return {POINTS: points}
+
+    parts, start = [], 0
+    for length in lengths or [len(points)]:
+        parts.append(points[start:start + length])
+        start += length
+    if geometry_type == ESRI_POLYGON:
+        return {RINGS: parts}
+    return {PATHS: parts}
+
+def _decode_feature(buf, span, field_names, geometry_type, transform, has_z, has_m):
+    attributes, geometry = [], None
+    for number, wire_type, value in _iter_fields(buf, span[0], span[1]):
+        if number == 1:
+            attributes.append(_decode_value(buf, value))
+        elif number == 2:
+            geometry = _decode_geometry(buf, value, geometry_type, transform, has_z, has_m)
+    feature = {ATTRIBUTES: dict(zip(field_names, attributes))}
+    if geometry is not None:
+        feature[GEOMETRY] = geometry
+    return feature
+
+def _decode_feature_result(buf, span):
+    """Decodes a FeatureResult message into a JSON style query response."""
+    resp = {}
+    fields, features = [], []
+    transform = None
+    has_z = has_m = False
+    geometry_type = GEOMETRY_TYPES[0]
+    for number, wire_type, value in _iter_fields(buf, span[0], span[1]):
+        if number == 1:
+            resp[OID_FIELD_NAME] = _string(buf, value)
+        elif number == 3:
+            resp[GLOBALID_FIELD_NAME] = _string(buf, value)
+        elif number == 7:
+            geometry_type = GEOMETRY_TYPES.get(value)
+        elif number == 8:
+            resp[SPATIAL_REFERENCE] = _decode_spatial_reference(buf, value)
+        elif number == 9:
+            if value:
+                resp[EXCEEDED_TRANSFER_LIMIT] = True
+        elif number == 10:
+            has_z = bool(value)
+        elif number == 11:
+            has_m = bool(value)
+        elif number == 12:
+            transform = Transform(buf, value)
+        elif number == 13:
+            fields.append(_decode_field(buf, value))
+        elif number == 15:
+            # features come last, decoded below once the transform is known
+            features.append(value)
+
+    if geometry_type:
+        resp[GEOMETRY_TYPE] = geometry_type
+    if has_z:
+        resp['hasZ'] = True
+    if has_m:
+        resp['hasM'] = True
+    resp[FIELDS] = fields
+    field_names = [f.get(NAME) for f in fields]
+    transform = transform or Transform()
+    resp[FEATURES] = [_decode_feature(buf, f, field_names, geometry_type, transform, has_z, has_m) for f in features]
+    return resp
+
+def decode_feature_collection(data):
+    """Decodes a FeatureCollectionPBuffer message.
+
+    Args:
+        data: The raw response content of a query made with f=pbf.
+
+    Returns:
+        The query response as a dict, with the same structure as the JSON
+            response (objectIdFieldName, geometryType, spatialReference,
+            fields and features, or count for count only queries).
+
+    Raises:
+        ValueError: 'Invalid pbf response, no query result found'
+    """
+    buf = bytearray(data)
+    for number, wire_type, value in _iter_fields(buf, 0, len(buf)):
+        if number == 2 and wire_type == LENGTH_DELIMITED:
+            for n, wt, v in _iter_fields(buf, value[0], value[1]):
+                if n == 1:
+                    return _decode_feature_result(buf, v)
+                elif n == 2:
+                    for cn, cwt, count in _iter_fields(buf, v[0], v[1]):
+                        if cn == 1:
+                            return {COUNT: count}
+                    return {COUNT: 0}
+    raise ValueError('Invalid pbf response, no query result found')
@@ -0,0 +1,272 @@
+"""Runs an export as overlapping fetch, decode and write stages.
+
+Each stage runs in its own thread and hands its results to the next stage
+through a bounded queue, so the network, the conversion of features and the
+disk are busy at the same time while only a few chunks are held in memory:
+
+    fetch (I/O threads) -> queue -> decode (threads or processes) -> queue -> write
+
+The order of the items is kept.  Decoding can use a process pool for CPU
+bound conversions, the decode function and the items must then be picklable.
+Every stage records how long it was busy and how long it waited on the others,
+see PipelineStats.bottleneck.
+"""
+from __future__ import print_function
+import collections
+import threading
+import time
+import sys
+
+import six
+from six.moves import queue
+
+try:
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = ProcessPoolExecutor = None
+
+__all__ = ['run_pipeline', 'PipelineStats', 'StageStats']
+
+# sentinel put on a queue after the last item
+_DONE = object()
+
+class _Failure(object):
+    """Passes an exception raised in a stage on to the writer thread."""
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+class StageStats(object):
+    """Statistics of one pipeline stage.
+
+    Attributes:
+        name: Name of the stage.
+        items: Number of items the stage produced.
+        seconds: Time spent doing work.
+        waiting: Time spent waiting for input or for room in the next queue.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.seconds = 0.0
+        self.waiting = 0.0
+
+    @property
+    def throughput(self):
+        """Items per second of work, the rate the stage could reach if it
+                never had to wait."""
+        return self.items / self.seconds if self.seconds else None
+
+    def asJSON(self):
+        """Returns the statistics as JSON."""
+        return {'name': self.name, 'items': self.items, 'seconds': self.seconds,
+                'waiting': self.waiting, 'throughput': self.throughput}
+
+    def __repr__(self):
+        rate = '{:.1f}/s'.format(self.throughput) if self.throughput else 'n/a'
+        return '<StageStats {}: {} items, {:.2f}s busy, {:.2f}s waiting, {}>'.format(
+            self.name, self.items, self.seconds, self.waiting, rate)
+
+class PipelineStats(object):
+    """Statistics of a pipeline run.
+
+    Attributes:
+        fetch: StageStats of the fetch stage.
+        decode: StageStats of the decode stage.
+        write: StageStats of the write stage.
+        seconds: Total run time.
+    """
+    def __init__(self):
+        self.fetch = StageStats('fetch')
+        self.decode = StageStats('decode')
+        self.write = StageStats('write')
+        self.seconds = 0.0
+
+    @property
+    def stages(self):
+        return [self.fetch, self.decode, self.write]
+
+    @property
+    def bottleneck(self):
+        """Returns the name of the stage that was busy the longest."""
+        return max(self.stages, key=lambda s: s.seconds).name
+
+    def asJSON(self):
+        """Returns the statistics as JSON."""
+        return {'stages': [s.asJSON() for s in self.stages], 'seconds': self.seconds, 'bottleneck': self.bottleneck}
+
+    def __repr__(self):
+        return '<PipelineStats: {} in {:.2f}s, bottleneck: {}>'.format(
+            ', '.join('{} {:.2f}s'.format(s.name, s.seconds) for s in self.stages), self.seconds, self.bottleneck)
+
+def _timed(func, item):
+    """Calls func in a worker and returns the result with the time it took,
+            module level so it can be sent to a process pool."""
+    start = time.time()
+    return func(item), time.time() - start
+
+class _Stage(threading.Thread):
+    """Thread that runs one stage and puts its results on a queue."""
+
+    def __init__(self, stats, output, stop):
+        super(_Stage, self).__init__()
+        self.daemon = True
+        self.stats = stats
+        self.output = output
+        self.stop = stop
+
+    def put(self, item):
+        """Puts an item on the output queue, gives up when the pipeline stops.
+
+        Returns:
+            False if the pipeline was stopped.
+        """
+        start = time.time()
+        try:
+            while not self.stop.is_set():
+                try:
+                    self.output.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            self.stats.waiting += time.time() - start
+
+    def run(self):
+        try:
+            self.work()
+        except Exception:
+            self.put(_Failure(sys.exc_info()))
+        else:
+            self.put(_DONE)
+
+class _FetchStage(_Stage):
+
+    def __init__(self, source, stats, output, stop):
+        super(_FetchStage, self).__init__(stats, output, stop)
+        self.source = source
+
+    def work(self):
+        items = iter(self.source)
+        try:
+            while True:
+                start = time.time()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    self.stats.seconds += time.time() - start
+                self.stats.items += 1
+                if not self.put(item):
+                    return
+        finally:
+            close = getattr(items, 'close', None)
+            if close:
+                close()
+
+class _DecodeStage(_Stage):
+
+    def __init__(self, decode, workers, processes, stats, input, output, stop):
+        super(_DecodeStage, self).__init__(stats, output, stop)
+        self.decode = decode
+        self.workers = workers
+        self.processes = processes
+        self.input = input
+
+    def get(self):
+        start = time.time()
+        try:
+            while not self.stop.is_set():
+                try:
+                    return self.input.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return _DONE
+        finally:
+            self.stats.waiting += time.time() - start
+
+    def work(self):
+        pool = None
+        if self.workers and self.workers > 1 and ThreadPoolExecutor is not None:
+            pool = (ProcessPoolExecutor if self.processes else ThreadPoolExecutor)(max_workers=self.workers)
+        pending = collections.deque()
+        try:
+            while True:
+                item = self.get()
+                if isinstance(item, _Failure):
+                    self.put(item)
+                    return
+                if item is not _DONE:
+                    if pool is None:
+                        pending.append(_timed(self.decode, item))
+                    else:
+                        pending.append(pool.submit(_timed, self.decode, item))
+                # keep the order, only a window of items is decoded at once
+                while pending and (item is _DONE or len(pending) >= (self.workers or 1)):
+                    result = pending.popleft()
+                    if pool is not None:
+                        wait = time.time()
+                        result = result.result()
+                        self.stats.waiting += time.time() - wait
+                    value, seconds = result
+                    self.stats.seconds += seconds
+                    self.stats.items += 1
+                    if not self.put(value):
+                        return
+                if item is _DONE:
+                    return
+        finally:
+            for future in pending:
+                if pool is not None:
+                    future.cancel()
+            if pool is not None:
+                pool.shutdown(wait=True)
+
+def run_pipeline(source, decode, write, decode_workers=None, processes=False, queue_size=2):
+    """Runs fetch, decode and write as overlapping stages.
+
+    Args:
+        source: Iterable that fetches the items, such as a generator of chunk
+            responses.  It is consumed in its own thread.
+        decode: Function that converts an item for the writer.
+        write: Function called with each decoded item, in the order of the
+            source, from the calling thread.
+        decode_workers: Optional number of items decoded at the same time.
+            Defaults to None to decode one item at a time.
+        processes: Optional boolean, True to decode in a process pool instead
+            of threads, decode and the items must be picklable.  Defaults to False.
+        queue_size: Optional number of items each queue holds before the stage
+            feeding it waits. Defaults to 2.
+
+    Returns:
+        PipelineStats for the run.
+    """
+    stats = PipelineStats()
+    stop = threading.Event()
+    fetched = queue.Queue(maxsize=queue_size)
+    decoded = queue.Queue(maxsize=queue_size)
+    stages = [_FetchStage(source, stats.fetch, fetched, stop),
+              _DecodeStage(decode, decode_workers, processes, stats.decode, fetched, decoded, stop)]
+    start = time.time()
+    for stage in stages:
+        stage.start()
+    try:
+        while True:
+            wait = time.time()
+            item = decoded.get()
+            stats.write.waiting += time.time() - wait
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                six.reraise(*item.exc_info)
+            wait = time.time()
+            write(item)
+            stats.write.seconds += time.time() - wait
+            stats.write.items += 1
+    finally:
+        stop.set()
+        for stage in stages:
+            stage.join()
+        stats.seconds = time.time() - start
+    return stats
@@ -1,13 +1,207 @@
+"""Spatial reference tables, loaded lazily from the JSON files in bin.
+
+Each table is a read only mapping that is not read at import.  A lookup by
+key reads one record: the .idx file next to each JSON file holds the sorted
+md5 prefixes of the keys with the byte range of each "key": value member, so
+a lookup binary searches the memory mapped index and decodes only that
+member.  Iterating a table, or a table whose index is missing or stale,
+loads the whole JSON file once.  Run build_indexes() after editing the JSON
+files.
+
+    projections.projections['4326']     # WKT by wkid
+    projections.wkt[wkt]                # wkid by WKT
+    projections.names['WGS_1984_Web_Mercator_Auxiliary_Sphere']
+"""
 import os
 import json
+import mmap
+import struct
+import hashlib
+import threading
 from munch import munchify
 
+import six
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 json_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'bin')
 
 __all__ = ('projections', 'names', 'wkt', 'linearUnits')
 
-projections = munchify(json.loads(open(os.path.join(json_dir, 'projections.json')).read()))
-names = munchify(json.loads(open(os.path.join(json_dir, 'projection_names.json')).read()))
-wkt = munchify(json.loads(open(os.path.join(json_dir, 'projection_strings.json')).read()))
-gtfs = munchify(json.loads(open(os.path.join(json_dir, 'gtf.json')).read()))
-linearUnits = munchify(json.loads(open(os.path.join(json_dir, 'linearUnits.json')).read()))
+# magic, version, number of records, size of the JSON file
+_HEADER = struct.Struct('>4sHIQ')
+# md5 prefix of the key, offset and length of the member in the JSON file
+_RECORD = struct.Struct('>8sII')
+_MAGIC = b'RPIX'
+_VERSION = 1
+
+_MISSING = object()
+
+def _digest(key):
+    return hashlib.md5(key.encode('utf-8')).digest()[:8]
+
+def _members(data):
+    """Yields the key, start and end byte offsets of each member of a JSON
+            object."""
+    text = data.decode('utf-8')
+    if len(text) != len(data):
+        raise ValueError('the tables are expected to be ASCII JSON')
+    decoder = json.JSONDecoder()
+    ws = ' \t\r\n'
+    pos = text.index('{') + 1
+    while True:
+        while text[pos] in ws:
+            pos += 1
+        if text[pos] == '}':
+            return
+        start = pos
+        key, pos = decoder.raw_decode(text, pos)
+        while text[pos] in ws + ':':
+            pos += 1
+        _, pos = decoder.raw_decode(text, pos)
+        yield key, start, pos
+        while text[pos] in ws + ',':
+            pos += 1
+
+def build_index(name):
+    """Writes the .idx file of a JSON table in bin.
+
+    Arg:
+        name: The table file name without extension, such as "projections".
+
+    Returns:
+        The path to the index.
+    """
+    path = os.path.join(json_dir, name + '.json')
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = sorted((_digest(key), start, end - start) for key, start, end in _members(data))
+    out = os.path.join(json_dir, name + '.idx')
+    with open(out, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(records), len(data)))
+        for record in records:
+            f.write(_RECORD.pack(*record))
+    return out
+
+class LazyTable(Mapping):
+    """Read only mapping of a JSON table in bin, loaded on first use.  Items
+            can also be read as attributes, like a Munch, and integer keys
+            are looked up as strings.
+    """
+
+    def __init__(self, name):
+        """Creates the table without reading it.
+
+        Arg:
+            name: The table file name without extension.
+        """
+        self.name = name
+        self.path = os.path.join(json_dir, name + '.json')
+        self._data = None
+        self._index = None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Returns the whole table, read on first use."""
+        if self._data is None:
+            with open(self.path, 'r') as f:
+                self._data = munchify(json.load(f))
+        return self._data
+
+    def _open_index(self):
+        """Returns the memory mapped index, False if it is missing or stale."""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = False
+                    try:
+                        with open(os.path.join(json_dir, self.name + '.idx'), 'rb') as f:
+                            index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        magic, version, count, size = _HEADER.unpack_from(index, 0)
+                        if magic == _MAGIC and version == _VERSION and size == os.path.getsize(self.path) and \
+                                len(index) == _HEADER.size + count * _RECORD.size:
+                            self._index, self._count = index, count
+                    except (IOError, OSError, ValueError, struct.error):
+                        pass
+        return self._index
+
+    def _lookup(self, key):
+        if isinstance(key, six.integer_types):
+            key = str(key)
+        if not isinstance(key, six.string_types):
+            return _MISSING
+        if self._data is not None:
+            return self._data.get(key, _MISSING)
+        if key in self._cache:
+            return self._cache[key]
+        index = self._open_index()
+        if not index:
+            return self._load().get(key, _MISSING)
+
+        # leftmost record with the digest
+        digest = _digest(key)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _RECORD.unpack_from(index, _HEADER.size + mid * _RECORD.size)[0] < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        value = _MISSING
+        with open(self.path, 'rb') as f:
+            for i in six.moves.range(lo, self._count):
+                prefix, offset, length = _RECORD.unpack_from(index, _HEADER.size + i * _RECORD.size)
+                if prefix != digest:
+                    break
+                f.seek(offset)
+                member = json.loads('{' + f.read(length).decode('utf-8') + '}')
+                if key in member:
+                    value = member[key]
+                    value = munchify(value) if isinstance(value, dict) else value
+                    break
+        self._cache[key] = value
+        return value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _MISSING
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        value = self._lookup(name)
+        if value is _MISSING:
+            raise AttributeError(name)
+        return value
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        if self._data is None and self._open_index():
+            return self._count
+        return len(self._load())
+
+    def __repr__(self):
+        return '<LazyTable: {}>'.format(self.name)
+
+TABLES = ('projections', 'projection_names', 'projection_strings', 'gtf', 'linearUnits')
+
+def build_indexes():
+    """Rebuilds the index files of all tables, returns their paths."""
+    return [build_index(name) for name in TABLES]
+
+projections = LazyTable('projections')
+names = LazyTable('projection_names')
+wkt = LazyTable('projection_strings')
+gtfs = LazyTable('gtf')
+linearUnits = LazyTable('linearUnits')
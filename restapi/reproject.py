@@ -0,0 +1,573 @@
+"""Local coordinate transformations from the WKT of restapi.projections.
+
+Transformer projects coordinates between two spatial references without a
+geometry service.  The coordinate systems are read from the esri WKT strings
+bundled with restapi.projections, and these projections are supported:
+
+    Geographic coordinate systems
+    Mercator_Auxiliary_Sphere (Web Mercator) and Mercator
+    Transverse_Mercator and Gauss_Kruger, such as UTM zones and state planes
+    Lambert_Conformal_Conic, such as state planes
+
+    t = Transformer(4326, 2264)
+    xs, ys = t.transform(lons, lats)        # numpy arrays or lists
+    geometry = t.transform_geometry(geometry) # esri JSON
+
+The formulas run on whole numpy arrays when numpy is installed, and on one
+vertex at a time otherwise.  Like GeometryService.project() without a
+transformation, no datum transformation is applied, the geographic
+coordinates of the input are used as they are on the output datum.
+Unsupported spatial references raise NotImplementedError.
+"""
+from __future__ import print_function
+import array
+import math
+import re
+from ._strings import *
+from . import projections
+
+import six
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ['CoordinateSystem', 'Transformer', 'get_transformer', 'get_wkid']
+
+WEB_MERCATOR_WKIDS = (3857, 102100, 102113, 900913)
+
+_MAX_MERCATOR_LATITUDE = math.radians(85.0511287798066)
+
+# iterations of the latitude series, they converge to 1e-15 in 4 or 5
+_ITERATIONS = 6
+
+_wkt_token = re.compile(r"\s*(?:([A-Za-z_][A-Za-z0-9_]*)\s*\[|('[^']*'|\"[^\"]*\")|([^,\[\]\s]+)|(\])|(,))")
+
+def get_wkid(sr):
+    """Returns the well known id of a spatial reference, None when unknown.
+
+    Arg:
+        sr: A well known id, a digit string or a spatial reference dict, a
+            WKT string has no well known id.
+    """
+    if isinstance(sr, dict):
+        sr = sr.get(LATEST_WKID) or sr.get(WKID)
+    if isinstance(sr, six.string_types) and sr.isdigit():
+        sr = int(sr)
+    return sr if isinstance(sr, six.integer_types) else None
+
+def parse_wkt(wkt):
+    """Parses WKT into nested [keyword, value, ...] lists, quoted values are
+            strings and the others floats.
+
+    Arg:
+        wkt: The WKT, an esri ";" coordinate grid suffix is ignored.
+    """
+    wkt = wkt.split(';')[0]
+    stack, pos = [[]], 0
+    while pos < len(wkt):
+        match = _wkt_token.match(wkt, pos)
+        if not match:
+            raise ValueError('invalid WKT at: "{}"'.format(wkt[pos:pos + 20]))
+        pos = match.end()
+        keyword, quoted, value, close, _ = match.groups()
+        if keyword:
+            node = [keyword.upper()]
+            stack[-1].append(node)
+            stack.append(node)
+        elif quoted:
+            stack[-1].append(quoted[1:-1])
+        elif value:
+            stack[-1].append(float(value))
+        elif close:
+            stack.pop()
+    if len(stack) != 1 or not stack[0]:
+        raise ValueError('invalid WKT: "{}"'.format(wkt))
+    return stack[0][0]
+
+def _child(node, keyword):
+    return next((c for c in node[1:] if isinstance(c, list) and c[0] == keyword), None)
+
+class _Ops(object):
+    """The math functions used by the projection formulas."""
+
+    def __init__(self, **funcs):
+        self.__dict__.update(funcs)
+
+_MATH = _Ops(sin=math.sin, cos=math.cos, tan=math.tan, sinh=math.sinh, cosh=math.cosh, sqrt=math.sqrt,
+             exp=math.exp, log=math.log, atan=math.atan, atan2=math.atan2, asinh=math.asinh,
+             atanh=math.atanh, hypot=math.hypot, clip=lambda v, lo, hi: min(max(v, lo), hi))
+if np is not None:
+    _NUMPY = _Ops(sin=np.sin, cos=np.cos, tan=np.tan, sinh=np.sinh, cosh=np.cosh, sqrt=np.sqrt,
+                  exp=np.exp, log=np.log, atan=np.arctan, atan2=np.arctan2, asinh=np.arcsinh,
+                  atanh=np.arctanh, hypot=np.hypot, clip=np.clip)
+
+def _tsfn(phi, e, m):
+    """Snyder's t function of the isometric latitude."""
+    sinphi = e * m.sin(phi)
+    return m.tan(math.pi / 4 - phi / 2) / ((1 - sinphi) / (1 + sinphi)) ** (e / 2)
+
+def _phi_from_ts(ts, e, m):
+    """Inverse of _tsfn() by fixed point iteration."""
+    phi = math.pi / 2 - 2 * m.atan(ts)
+    for _ in range(_ITERATIONS):
+        sinphi = e * m.sin(phi)
+        phi = math.pi / 2 - 2 * m.atan(ts * ((1 - sinphi) / (1 + sinphi)) ** (e / 2))
+    return phi
+
+class _Projection(object):
+    """Base of the projection formulas, coordinates in meters and radians."""
+
+    def __init__(self, a, f, params):
+        self.a = a
+        self.f = f
+        self.e2 = f * (2 - f)
+        self.e = math.sqrt(self.e2)
+        self.lam0 = math.radians(params.get('central_meridian', params.get('longitude_of_origin', 0.0)))
+        self.k0 = params.get('scale_factor', 1.0)
+
+class _WebMercator(_Projection):
+    """Mercator on the sphere with the semi-major axis of the datum."""
+
+    def forward(self, lam, phi, m):
+        phi = m.clip(phi, -_MAX_MERCATOR_LATITUDE, _MAX_MERCATOR_LATITUDE)
+        return self.a * (lam - self.lam0), self.a * m.log(m.tan(math.pi / 4 + phi / 2))
+
+    def inverse(self, x, y, m):
+        return x / self.a + self.lam0, 2 * m.atan(m.exp(y / self.a)) - math.pi / 2
+
+class _Mercator(_Projection):
+    """Ellipsoidal Mercator, true to scale on the standard parallel."""
+
+    def __init__(self, a, f, params):
+        super(_Mercator, self).__init__(a, f, params)
+        phi1 = math.radians(params.get('standard_parallel_1', 0.0))
+        self.k0 = math.cos(phi1) / math.sqrt(1 - self.e2 * math.sin(phi1) ** 2)
+
+    def forward(self, lam, phi, m):
+        phi = m.clip(phi, -_MAX_MERCATOR_LATITUDE, _MAX_MERCATOR_LATITUDE)
+        ak = self.a * self.k0
+        return ak * (lam - self.lam0), -ak * m.log(_tsfn(phi, self.e, m))
+
+    def inverse(self, x, y, m):
+        ak = self.a * self.k0
+        return x / ak + self.lam0, _phi_from_ts(m.exp(-y / ak), self.e, m)
+
+class _TransverseMercator(_Projection):
+    """Transverse Mercator with the 6th order Kruger series (Karney 2011),
+            accurate to a few nanometers within 4000 km of the central meridian.
+    """
+
+    def __init__(self, a, f, params):
+        super(_TransverseMercator, self).__init__(a, f, params)
+        n = f / (2 - f)
+        n2, n3, n4, n5, n6 = n ** 2, n ** 3, n ** 4, n ** 5, n ** 6
+        self.A = a / (1 + n) * (1 + n2 / 4 + n4 / 64 + n6 / 256)
+        self.alpha = (n / 2 - 2 * n2 / 3 + 5 * n3 / 16 + 41 * n4 / 180 - 127 * n5 / 288 + 7891 * n6 / 37800,
+                      13 * n2 / 48 - 3 * n3 / 5 + 557 * n4 / 1440 + 281 * n5 / 630 - 1983433 * n6 / 1935360,
+                      61 * n3 / 240 - 103 * n4 / 140 + 15061 * n5 / 26880 + 167603 * n6 / 181440,
+                      49561 * n4 / 161280 - 179 * n5 / 168 + 6601661 * n6 / 7257600,
+                      34729 * n5 / 80640 - 3418889 * n6 / 1995840,
+                      212378941 * n6 / 319334400)
+        self.beta = (n / 2 - 2 * n2 / 3 + 37 * n3 / 96 - n4 / 360 - 81 * n5 / 512 + 96199 * n6 / 604800,
+                     n2 / 48 + n3 / 15 - 437 * n4 / 1440 + 46 * n5 / 105 - 1118711 * n6 / 3870720,
+                     17 * n3 / 480 - 37 * n4 / 840 - 209 * n5 / 4480 + 5569 * n6 / 90720,
+                     4397 * n4 / 161280 - 11 * n5 / 504 - 830251 * n6 / 7257600,
+                     4583 * n5 / 161280 - 108847 * n6 / 3991680,
+                     20648693 * n6 / 638668800)
+        # northing of the latitude of origin on the central meridian
+        phi0 = math.radians(params.get('latitude_of_origin', 0.0))
+        self.y0 = self._forward(0.0, phi0, _MATH)[1]
+
+    def _conformal_tan(self, tau, m):
+        sigma = m.sinh(self.e * m.atanh(self.e * tau / m.sqrt(1 + tau * tau)))
+        return tau * m.sqrt(1 + sigma * sigma) - sigma * m.sqrt(1 + tau * tau)
+
+    def _forward(self, lam, phi, m):
+        taup = self._conformal_tan(m.tan(phi), m)
+        coslam = m.cos(lam)
+        xip = m.atan2(taup, coslam)
+        etap = m.asinh(m.sin(lam) / m.sqrt(taup * taup + coslam * coslam))
+        xi, eta = xip, etap
+        for j, alpha in enumerate(self.alpha, 1):
+            xi = xi + alpha * m.sin(2 * j * xip) * m.cosh(2 * j * etap)
+            eta = eta + alpha * m.cos(2 * j * xip) * m.sinh(2 * j * etap)
+        kA = self.k0 * self.A
+        return kA * eta, kA * xi
+
+    def forward(self, lam, phi, m):
+        x, y = self._forward(lam - self.lam0, phi, m)
+        return x, y - self.y0
+
+    def inverse(self, x, y, m):
+        kA = self.k0 * self.A
+        xi, eta = (y + self.y0) / kA, x / kA
+        xip, etap = xi, eta
+        for j, beta in enumerate(self.beta, 1):
+            xip = xip - beta * m.sin(2 * j * xi) * m.cosh(2 * j * eta)
+            etap = etap - beta * m.cos(2 * j * xi) * m.sinh(2 * j * eta)
+        sinhetap, cosxip = m.sinh(etap), m.cos(xip)
+        taup = m.sin(xip) / m.sqrt(sinhetap * sinhetap + cosxip * cosxip)
+        # Newton's method for the geodetic latitude
+        tau, e2 = taup, self.e2
+        for _ in range(_ITERATIONS):
+            taui = self._conformal_tan(tau, m)
+            tau = tau + (taup - taui) / m.sqrt(1 + taui * taui) * \
+                (1 + (1 - e2) * tau * tau) / ((1 - e2) * m.sqrt(1 + tau * tau))
+        return m.atan2(sinhetap, cosxip) + self.lam0, m.atan(tau)
+
+class _LambertConformalConic(_Projection):
+    """Lambert Conformal Conic with one or two standard parallels (Snyder)."""
+
+    def __init__(self, a, f, params):
+        super(_LambertConformalConic, self).__init__(a, f, params)
+        phi0 = math.radians(params.get('latitude_of_origin', 0.0))
+        phi1 = math.radians(params.get('standard_parallel_1', params.get('latitude_of_origin', 0.0)))
+        phi2 = math.radians(params.get('standard_parallel_2', math.degrees(phi1)))
+        e = self.e
+
+        def msfn(phi):
+            return math.cos(phi) / math.sqrt(1 - self.e2 * math.sin(phi) ** 2)
+        m1, t1 = msfn(phi1), _tsfn(phi1, e, _MATH)
+        if abs(phi1 - phi2) > 1e-10:
+            self.n = (math.log(m1) - math.log(msfn(phi2))) / (math.log(t1) - math.log(_tsfn(phi2, e, _MATH)))
+        else:
+            self.n = math.sin(phi1)
+        self.aF = self.a * self.k0 * m1 / (self.n * t1 ** self.n)
+        self.rho0 = self.aF * _tsfn(phi0, e, _MATH) ** self.n
+
+    def forward(self, lam, phi, m):
+        rho = self.aF * _tsfn(phi, self.e, m) ** self.n
+        theta = self.n * (lam - self.lam0)
+        return rho * m.sin(theta), self.rho0 - rho * m.cos(theta)
+
+    def inverse(self, x, y, m):
+        sign = 1.0 if self.n > 0 else -1.0
+        dy = self.rho0 - y
+        rho = sign * m.hypot(x, dy)
+        theta = m.atan2(sign * x, sign * dy)
+        ts = (rho / self.aF) ** (1 / self.n)
+        return theta / self.n + self.lam0, _phi_from_ts(ts, self.e, m)
+
+PROJECTIONS = {
+    'mercator_auxiliary_sphere': _WebMercator,
+    'mercator': _Mercator,
+    'transverse_mercator': _TransverseMercator,
+    'gauss_kruger': _TransverseMercator,
+    'lambert_conformal_conic': _LambertConformalConic
+}
+
+class CoordinateSystem(object):
+    """A geographic or projected coordinate system parsed from esri WKT.
+
+    Attributes:
+        wkt: The WKT.
+        name: The name of the coordinate system.
+        datum: The name of the datum.
+        projection: The projection formulas, None for geographic coordinate systems.
+        unit: Meters per linear unit for projected, radians per angular unit
+            for geographic coordinate systems.
+    """
+
+    def __init__(self, wkt):
+        """Parses esri WKT.
+
+        Arg:
+            wkt: The WKT of a geographic or projected coordinate system.
+
+        Raises:
+            NotImplementedError: The projection is not supported.
+        """
+        self.wkt = wkt
+        root = parse_wkt(wkt)
+        geogcs = root if root[0] == 'GEOGCS' else _child(root, 'GEOGCS')
+        if geogcs is None or root[0] not in ('GEOGCS', 'PROJCS'):
+            raise NotImplementedError('unsupported coordinate system: {}'.format(root[0]))
+        self.name = root[1]
+        datum = _child(geogcs, 'DATUM')
+        spheroid = _child(datum, 'SPHEROID')
+        self.datum = datum[1]
+        a, inv_f = spheroid[2], spheroid[3]
+        f = 1.0 / inv_f if inv_f else 0.0
+        primem = _child(geogcs, 'PRIMEM')
+        self.prime_meridian = math.radians(primem[2]) if primem else 0.0
+        self.angular_unit = _child(geogcs, 'UNIT')[2]
+        if root[0] == 'GEOGCS':
+            self.projection = None
+            self.unit = self.angular_unit
+            return
+        name = _child(root, 'PROJECTION')[1]
+        params = {p[1].lower(): p[2] for p in root[1:] if isinstance(p, list) and p[0] == 'PARAMETER'}
+        if name.lower() not in PROJECTIONS:
+            raise NotImplementedError('the {} projection is not supported'.format(name))
+        self.projection = PROJECTIONS[name.lower()](a, f, params)
+        self.false_easting = params.get('false_easting', 0.0)
+        self.false_northing = params.get('false_northing', 0.0)
+        self.unit = _child(root, 'UNIT')[2]
+
+    @classmethod
+    def from_sr(cls, sr):
+        """Returns the coordinate system of a spatial reference.
+
+        Arg:
+            sr: A well known id, or spatial reference dict with a wkid or wkt.
+
+        Raises:
+            NotImplementedError: The spatial reference is not in
+                restapi.projections or not supported.
+        """
+        wkid = get_wkid(sr)
+        if wkid is None and isinstance(sr, dict) and sr.get(WKT):
+            return cls(sr[WKT])
+        if wkid in WEB_MERCATOR_WKIDS:
+            wkid = 3857
+        wkt = projections.projections.get(str(wkid)) if wkid else None
+        if not wkt:
+            raise NotImplementedError('unknown spatial reference: {}'.format(sr))
+        return cls(wkt)
+
+    @property
+    def is_geographic(self):
+        return self.projection is None
+
+    def to_geographic(self, x, y, m):
+        """Returns the longitudes and latitudes in radians."""
+        if self.projection is None:
+            return x * self.unit + self.prime_meridian, y * self.unit
+        x = (x - self.false_easting) * self.unit
+        y = (y - self.false_northing) * self.unit
+        lam, phi = self.projection.inverse(x, y, m)
+        return lam + self.prime_meridian, phi
+
+    def from_geographic(self, lam, phi, m):
+        """Returns the coordinates of longitudes and latitudes in radians."""
+        lam = lam - self.prime_meridian
+        if self.projection is None:
+            return lam / self.unit, phi / self.unit
+        x, y = self.projection.forward(lam, phi, m)
+        return x / self.unit + self.false_easting, y / self.unit + self.false_northing
+
+    def __repr__(self):
+        return '<CoordinateSystem: {}>'.format(self.name)
+
+class Transformer(object):
+    """Projects coordinates between two spatial references."""
+
+    def __init__(self, inSR, outSR):
+        """Creates the transformation.
+
+        Args:
+            inSR: The input well known id, or spatial reference dict.
+            outSR: The output well known id, or spatial reference dict.
+
+        Raises:
+            NotImplementedError: One of the spatial references is not supported.
+        """
+        self.inSR = inSR
+        self.outSR = outSR
+        in_wkid, out_wkid = get_wkid(inSR), get_wkid(outSR)
+        self.identity = in_wkid is not None and (in_wkid == out_wkid or
+            (in_wkid in WEB_MERCATOR_WKIDS and out_wkid in WEB_MERCATOR_WKIDS))
+        if not self.identity:
+            self.source = CoordinateSystem.from_sr(inSR)
+            self.target = CoordinateSystem.from_sr(outSR)
+        self.spatialReference = {WKID: out_wkid} if out_wkid else outSR
+
+    def _transform(self, x, y, m):
+        lam, phi = self.source.to_geographic(x, y, m)
+        return self.target.from_geographic(lam, phi, m)
+
+    def transform(self, xs, ys):
+        """Projects coordinates.
+
+        Args:
+            xs: The x coordinates, a numpy array or a sequence.
+            ys: The y coordinates, a numpy array or a sequence.
+
+        Returns:
+            The projected (xs, ys), numpy float64 arrays when numpy is
+            installed, otherwise lists.
+        """
+        if np is not None:
+            xs, ys = np.asarray(xs, dtype='float64'), np.asarray(ys, dtype='float64')
+            if self.identity:
+                return xs.copy(), ys.copy()
+            with np.errstate(all='ignore'):
+                return self._transform(xs, ys, _NUMPY)
+        if self.identity:
+            return list(xs), list(ys)
+        out = [self._transform(float(x), float(y), _MATH) for x, y in zip(xs, ys)]
+        return [p[0] for p in out], [p[1] for p in out]
+
+    def transform_coords(self, coords, dims=2):
+        """Projects interleaved coordinates, such as the buffer of a
+                PackedCoordinates or the coords of a ColumnarFeatureSet.
+
+        Args:
+            coords: Flat array('d') or numpy array of x, y, ... values, or a
+                numpy array of shape (vertices, dims).
+            dims: Optional number of values per vertex of a flat buffer.
+                Defaults to 2.
+
+        Returns:
+            A projected copy of the same type and shape, z and m values are kept.
+        """
+        if np is not None and isinstance(coords, np.ndarray) and coords.ndim == 2:
+            out = coords.astype('float64', copy=True)
+            out[:, 0], out[:, 1] = self.transform(out[:, 0], out[:, 1])
+            return out
+        if np is not None:
+            out = np.array(coords, dtype='float64')
+            out[0::dims], out[1::dims] = self.transform(out[0::dims], out[1::dims])
+            return array.array('d', out.tobytes()) if isinstance(coords, array.array) else out
+        out = array.array('d', coords)
+        xs, ys = self.transform(out[0::dims], out[1::dims])
+        out[0::dims], out[1::dims] = array.array('d', xs), array.array('d', ys)
+        return out
+
+    def transform_geometry(self, geometry):
+        """Returns a projected copy of an esri JSON geometry.
+
+        Arg:
+            geometry: An esri JSON point, multipoint, polyline, polygon or envelope.
+        """
+        return self.transform_geometries([geometry])[0]
+
+    def transform_geometries(self, geometries):
+        """Returns projected copies of esri JSON geometries, all vertices are
+                projected at once.
+
+        Arg:
+            geometries: List of esri JSON geometries, None is kept as None.
+        """
+        xs, ys = [], []
+        for g in geometries:
+            if not g:
+                continue
+            if X in g:
+                if g[X] not in (None, 'NaN'):
+                    xs.append(g[X])
+                    ys.append(g[Y])
+            elif XMIN in g:
+                if g[XMIN] not in (None, 'NaN'):
+                    xs.extend((g[XMIN], g[XMAX]))
+                    ys.extend((g[YMIN], g[YMAX]))
+            else:
+                key = POINTS if POINTS in g else RINGS if RINGS in g else PATHS
+                parts = [g[key] or []] if key == POINTS else g.get(key) or []
+                for part in parts:
+                    xs.extend(pt[0] for pt in part)
+                    ys.extend(pt[1] for pt in part)
+        if np is not None:
+            xs, ys = self.transform(xs, ys)
+            xs, ys = xs.tolist(), ys.tolist()
+        else:
+            xs, ys = self.transform(xs, ys)
+
+        out, i = [], 0
+        for g in geometries:
+            if not g:
+                out.append(g)
+                continue
+            new = {k: v for k, v in six.iteritems(g) if k != SPATIAL_REFERENCE}
+            if X in g:
+                if g[X] not in (None, 'NaN'):
+                    new[X], new[Y] = xs[i], ys[i]
+                    i += 1
+            elif XMIN in g:
+                if g[XMIN] not in (None, 'NaN'):
+                    new[XMIN], new[XMAX] = min(xs[i], xs[i + 1]), max(xs[i], xs[i + 1])
+                    new[YMIN], new[YMAX] = min(ys[i], ys[i + 1]), max(ys[i], ys[i + 1])
+                    i += 2
+            else:
+                key = POINTS if POINTS in g else RINGS if RINGS in g else PATHS
+                parts = []
+                for part in ([g[key] or []] if key == POINTS else g.get(key) or []):
+                    new_part = []
+                    for pt in part:
+                        new_part.append([xs[i], ys[i]] + list(pt[2:]))
+                        i += 1
+                    parts.append(new_part)
+                new[key] = parts[0] if key == POINTS else parts
+            if SPATIAL_REFERENCE in g:
+                new[SPATIAL_REFERENCE] = self.spatialReference
+            out.append(new)
+        return out
+
+    def transform_features(self, features):
+        """Projects the geometries of esri JSON features in place.
+
+        Arg:
+            features: List of esri JSON feature dicts.
+        """
+        geometries = self.transform_geometries([ft.get(GEOMETRY) for ft in features])
+        for ft, g in zip(features, geometries):
+            if g:
+                ft[GEOMETRY] = g
+        return features
+
+    def transform_geojson(self, geometries):
+        """Returns projected copies of GeoJSON geometries, all positions are
+                projected at once.
+
+        Arg:
+            geometries: List of GeoJSON geometries of any type, including
+                GeometryCollection, None is kept as None.
+        """
+        xs, ys = [], []
+
+        def collect(coords):
+            if coords and isinstance(coords[0], (list, tuple)):
+                for c in coords:
+                    collect(c)
+            elif coords:
+                xs.append(coords[0])
+                ys.append(coords[1])
+
+        def walk(g, func):
+            if not g:
+                return g
+            new = dict(g)
+            if GEOMETRIES in g:
+                new[GEOMETRIES] = [walk(sub, func) for sub in g[GEOMETRIES] or []]
+            elif COORDINATES in g:
+                new[COORDINATES] = func(g[COORDINATES])
+            return new
+
+        for g in geometries:
+            walk(g, collect)
+        xs, ys = self.transform(xs, ys)
+        if np is not None:
+            xs, ys = xs.tolist(), ys.tolist()
+
+        position = iter(six.moves.range(len(xs)))
+        def rebuild(coords):
+            if coords and isinstance(coords[0], (list, tuple)):
+                return [rebuild(c) for c in coords]
+            elif coords:
+                i = next(position)
+                return [xs[i], ys[i]] + list(coords[2:])
+            return coords
+
+        return [walk(g, rebuild) for g in geometries]
+
+    def __repr__(self):
+        return '<Transformer: {} to {}>'.format(get_wkid(self.inSR) or self.inSR, get_wkid(self.outSR) or self.outSR)
+
+_transformers = {}
+
+def get_transformer(inSR, outSR):
+    """Returns a cached Transformer for two spatial references.
+
+    Args:
+        inSR: The input well known id, or spatial reference dict.
+        outSR: The output well known id, or spatial reference dict.
+
+    Raises:
+        NotImplementedError: One of the spatial references is not supported.
+    """
+    key = (get_wkid(inSR) or repr(inSR), get_wkid(outSR) or repr(outSR))
+    if key not in _transformers:
+        _transformers[key] = Transformer(inSR, outSR)
+    return _transformers[key]
@@ -10,21 +10,32 @@ import warnings
 import tempfile
 import time
 import codecs
+import re
 import json
 import copy
 import os
 import sys
+import threading
 import munch
 from collections import namedtuple, OrderedDict
 from ._strings import *
 from urllib3.exceptions import InsecureRequestWarning, InsecurePlatformWarning, SNIMissingWarning
 from urllib3 import disable_warnings
+from urllib3.util.retry import Retry
 from . import projections
 from . import enums
+from .reproject import get_transformer
+from . import pbf
 
 import six
 from six.moves import urllib
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # python 2 without the "futures" backport, fall back to serial requests
+    ThreadPoolExecutor = None
+
 # disable ssl warnings
 for warning in [SNIMissingWarning, InsecurePlatformWarning, InsecureRequestWarning]:
     disable_warnings(warning)
@@ -59,6 +70,76 @@ def munch_repr(self):
 # override repr(Munch)
 munch.Munch.__repr__ = munch_repr
 
+class LazyMunch(munch.Munch):
+    """Munch that only wraps nested dicts and lists when they are accessed.
+            munch.munchify() walks and copies a whole response up front, which
+            for feature sets means every coordinate of every feature.  Wrapped
+            values are stored back, so repeated access costs the same as a 
+            regular Munch, and lists of numbers (coordinates) are never copied.
+    """
+    def __getitem__(self, k):
+        value = dict.__getitem__(self, k)
+        wrapped = lazy_munchify(value)
+        if wrapped is not value:
+            dict.__setitem__(self, k, wrapped)
+        return wrapped
+
+    def values(self):
+        return [self[k] for k in self]
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+    if six.PY2:
+        def itervalues(self):
+            for k in self:
+                yield self[k]
+
+        def iteritems(self):
+            for k in self:
+                yield k, self[k]
+
+class LazyList(list):
+    """List that wraps its dict items in a LazyMunch when they are accessed."""
+    def __getitem__(self, i):
+        value = list.__getitem__(self, i)
+        if isinstance(i, slice):
+            return LazyList(value)
+        wrapped = lazy_munchify(value)
+        if wrapped is not value:
+            list.__setitem__(self, i, wrapped)
+        return wrapped
+
+    if six.PY2:
+        def __getslice__(self, i, j):
+            return LazyList(list.__getslice__(self, i, j))
+
+    def __iter__(self):
+        for i in six.moves.range(len(self)):
+            yield self[i]
+
+    def pop(self, i=-1):
+        return lazy_munchify(list.pop(self, i))
+
+def lazy_munchify(obj):
+    """Drop in replacement for munch.munchify() that wraps JSON for attribute
+            access without copying it, see LazyMunch.
+
+    Arg:
+        obj: JSON object, dicts and lists of dicts are wrapped, anything else 
+            is returned as is.
+    """
+    if isinstance(obj, dict):
+        return obj if isinstance(obj, LazyMunch) else LazyMunch(obj)
+    elif isinstance(obj, list) and not isinstance(obj, LazyList):
+        # only lists that contain dicts need wrapping, check the first leaf
+        first = obj
+        while isinstance(first, list) and first:
+            first = first[0]
+        if isinstance(first, dict):
+            return LazyList(obj)
+    return obj
+
 class IdentityManager(object):
     """Identity Manager for secured services.  This will allow the user to only have
             to sign in once (until the token expires) when accessing a services 
@@ -119,6 +200,163 @@ class IdentityManager(object):
 # initialize Identity Manager
 ID_MANAGER = IdentityManager()
 
+class SessionManager(object):
+    """Keeps a pooled keep-alive requests.Session() per host so repeated calls
+            to the same ArcGIS Server reuse open TCP/TLS connections instead
+            of performing a new handshake for every request.
+
+    Attributes:
+        pool_connections: Number of connection pools to cache per session.
+        pool_maxsize: Maximum number of connections kept alive per host, this
+            should be at least as large as the number of threads making
+            concurrent requests against a single server.
+        timeout: Default timeout (seconds) for all requests, can be a single
+            value or a (connect, read) tuple.  None waits forever.
+        max_retries: Number of retries for failed connections and 502/503/504
+            responses.  POST requests are retried on those responses only for
+            the READ_ONLY_OPERATIONS, such as query, other POST requests only
+            when the connection could not be established, so edits are never
+            submitted twice.
+        backoff_factor: Backoff factor applied between retries.
+        verify: Verify SSL certificates, defaults to False.
+    """
+    pool_connections = 10
+    pool_maxsize = 16
+    timeout = None
+    max_retries = 3
+    backoff_factor = 0.3
+    verify = False
+
+    def __init__(self, **kwargs):
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.configure(**kwargs)
+
+    def configure(self, pool_connections=None, pool_maxsize=None, timeout=False, max_retries=None, backoff_factor=None, verify=None):
+        """Changes the transport settings, any open sessions are closed so the
+                new settings are applied on the next request.
+
+        Args:
+            pool_connections: Optional number of connection pools to cache.
+            pool_maxsize: Optional maximum number of connections to keep alive per host.
+            timeout: Optional default timeout in seconds (None for no timeout).
+            max_retries: Optional number of retries for failed connections.
+            backoff_factor: Optional backoff factor between retries.
+            verify: Optional boolean to verify SSL certificates.
+        """
+        for name, value in six.iteritems({'pool_connections': pool_connections,
+                                          'pool_maxsize': pool_maxsize,
+                                          'max_retries': max_retries,
+                                          'backoff_factor': backoff_factor,
+                                          'verify': verify}):
+            if value is not None:
+                setattr(self, name, value)
+
+        # None is a valid timeout
+        if timeout is not False:
+            self.timeout = timeout
+        self.close()
+
+    def _make_session(self, retry_post=False):
+        """Creates a new session with a pooled adapter mounted for http and https.
+
+        Arg:
+            retry_post: Optional boolean, True to retry POST requests on 
+                502/503/504 responses too. Defaults to False.
+        """
+        session = requests.Session()
+        session.headers['User-Agent'] = USER_AGENT
+        session.verify = self.verify
+
+        # do not let server cookies leak between requests, credentials are always passed explicitly
+        session.cookies.set_policy(six.moves.http_cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        # urllib3 before 1.26 names allowed_methods method_whitelist
+        methods_arg = 'allowed_methods' if hasattr(Retry, 'DEFAULT_ALLOWED_METHODS') else 'method_whitelist'
+        methods = getattr(Retry, 'DEFAULT_ALLOWED_METHODS', None) or Retry.DEFAULT_METHOD_WHITELIST
+        if retry_post:
+            methods = frozenset(methods) | frozenset(['POST'])
+        retries = Retry(total=self.max_retries,
+                        connect=self.max_retries,
+                        read=0,
+                        status=self.max_retries,
+                        backoff_factor=self.backoff_factor,
+                        status_forcelist=(502, 503, 504),
+                        raise_on_status=False,
+                        **{methods_arg: methods})
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_connections,
+                                                pool_maxsize=self.pool_maxsize,
+                                                max_retries=retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get_session(self, url, retry_post=False):
+        """Returns the shared session for the host of a url.
+
+        Args:
+            url: Full url to resource.
+            retry_post: Optional boolean, True for the session that retries 
+                POST requests on 502/503/504 responses. Defaults to False.
+        """
+        parsed = parse_url(url)
+        key = ('{}://{}'.format(parsed.scheme, parsed.netloc).lower(), retry_post)
+        session = self._sessions.get(key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is None:
+                    session = self._make_session(retry_post)
+                    self._sessions[key] = session
+        return session
+
+    def request(self, method, url, params=None, **kwargs):
+        """Makes a request through the pooled session for the url's host.
+
+        Args:
+            method: HTTP method (GET|POST).
+            url: Full url to resource.
+            params: Optional parameters, sent in the body for POST requests and
+                in the query string for GET requests.
+            kwargs: Optional keyword arguments passed to requests.Session.request().
+        """
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = self.timeout
+        if 'verify' not in kwargs:
+            kwargs['verify'] = self.verify
+        retry_post = False
+        if method.upper() == 'POST':
+            kwargs['data'] = params
+            retry_post = parse_url(url).path.rstrip('/').split('/')[-1] in READ_ONLY_OPERATIONS
+        else:
+            kwargs['params'] = params
+        return self.get_session(url, retry_post).request(method.upper(), url, **kwargs)
+
+    def get(self, url, params=None, **kwargs):
+        """Makes a GET request through a pooled session."""
+        return self.request('GET', url, params, **kwargs)
+
+    def post(self, url, params=None, **kwargs):
+        """Makes a POST request through a pooled session."""
+        return self.request('POST', url, params, **kwargs)
+
+    def close(self):
+        """Closes all open sessions."""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+# initialize Session Manager
+SESSION_MANAGER = SessionManager()
+
+def configure_sessions(**kwargs):
+    """Configures the shared HTTP transport used for all requests.  See
+            SessionManager.configure() for valid keyword arguments, for example:
+
+        restapi.configure_sessions(pool_maxsize=32, timeout=(10, 300), max_retries=5)
+    """
+    SESSION_MANAGER.configure(**kwargs)
+
 # temp dir for json outputs
 TEMP_DIR = tempfile.gettempdir()
 if not os.access(TEMP_DIR, os.W_OK| os.X_OK):
@@ -174,6 +412,310 @@ def iter_chunks(iterable, n):
     for group in six.moves.zip_longest(*args, fillvalue=None):
         yield filter(None, group)
 
+def imap_ordered(func, iterable, max_workers=None, window=None):
+    """Calls a function for every item in an iterable using a pool of threads
+            and yields the results in the same order as the input.  Only a
+            bounded window of calls (2 * max_workers) is in flight at any time,
+            so results can be consumed as a stream without queueing every
+            request up front.
+
+    Args:
+        func: Function to call with each item.
+        iterable: A valid iterable.
+        max_workers: Optional number of threads.  When None or 1, items are
+            processed serially in the calling thread. Defaults to None.
+        window: Optional maximum number of calls that are running or waiting
+            to be consumed, defaults to 2 * max_workers.  When given, a single
+            worker also runs ahead of the consumer.
+    """
+    max_workers = max_workers or (1 if window else None)
+    if not max_workers or (max_workers < 2 and not window) or ThreadPoolExecutor is None:
+        for item in iterable:
+            yield func(item)
+        return
+
+    window = max(window or max_workers * 2, 1)
+    pending = collections.deque()
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for item in iterable:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # generator was closed early or a request failed, do not start anything new
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+
+def feature_oid(feature, oid_field):
+    """Returns the OBJECTID of an esri JSON or GeoJSON feature.
+
+    Args:
+        feature: Feature as JSON.
+        oid_field: Name of the OID field.
+    """
+    attributes = feature.get(ATTRIBUTES) or feature.get(PROPERTIES) or {}
+    oid = attributes.get(oid_field)
+    return feature.get('id') if oid is None else oid
+
+class QueryChunk(object):
+    """A planned request for part of the records of a query.
+
+    Attributes:
+        params: Parameters that override the query parameters for this chunk.
+        size: Number of records this chunk is expected to return.
+    """
+    def __init__(self, params, size):
+        self.params = params
+        self.size = size
+
+    def remainder(self, response, oid_field):
+        """Returns a list of chunks needed to fetch records the server left out
+                of a truncated response.
+
+        Args:
+            response: Response to this chunk's request.
+            oid_field: Name of the OID field.
+        """
+        return []
+
+    def split(self):
+        """Returns this chunk split in two halves, or an empty list if it 
+                can not be split any further.
+        """
+        return []
+
+    def __repr__(self):
+        return '<{}: {} records>'.format(self.__class__.__name__, self.size)
+
+class OffsetChunk(QueryChunk):
+    """A page of results fetched with resultOffset and resultRecordCount."""
+    def __init__(self, offset, count, order_by):
+        self.offset = offset
+        self.order_by = order_by
+        super(OffsetChunk, self).__init__({RESULT_OFFSET: offset,
+                                           RESULT_RECORD_COUNT: count,
+                                           ORDER_BY_FIELDS: order_by}, count)
+
+    def remainder(self, response, oid_field):
+        returned = len(response.get(FEATURES) or [])
+        if not response.get(EXCEEDED_TRANSFER_LIMIT) or returned >= self.size:
+            return []
+        if returned:
+            return [OffsetChunk(self.offset + returned, self.size - returned, self.order_by)]
+        # nothing came back, split the page to get under the server's limit
+        return self.split()
+
+    def split(self):
+        if self.size < 2:
+            return []
+        half = self.size // 2
+        return [OffsetChunk(self.offset, half, self.order_by),
+                OffsetChunk(self.offset + half, self.size - half, self.order_by)]
+
+class OIDChunk(QueryChunk):
+    """A group of known OBJECTIDs.  Dense groups are requested with a tight OID
+            range, sparse groups with an explicit objectIds list so the server 
+            does not have to scan large gaps.
+    """
+    # maximum ratio of the OID range span to the number of OIDs for a range query
+    max_span_ratio = 2
+
+    def __init__(self, oids, oid_field, where=''):
+        self.oids = oids
+        self.oid_field = oid_field
+        self.where = where
+        _min, _max = oids[0], oids[-1]
+        if _max - _min + 1 <= len(oids) * self.max_span_ratio:
+            oid_where = '{0} >= {1} and {0} <= {2}'.format(oid_field, _min, _max)
+            params = {WHERE: ' and '.join(filter(None, [where, oid_where]))}
+        else:
+            params = {WHERE: where or '1=1', OBJECT_IDS: ','.join(map(str, oids))}
+        super(OIDChunk, self).__init__(params, len(oids))
+
+    def remainder(self, response, oid_field):
+        if not response.get(EXCEEDED_TRANSFER_LIMIT):
+            return []
+        returned = set(feature_oid(f, oid_field) for f in response.get(FEATURES) or [])
+        missing = [oid for oid in self.oids if oid not in returned]
+        if not missing:
+            return []
+        if len(missing) < len(self.oids):
+            return [OIDChunk(missing, self.oid_field, self.where)]
+        # nothing came back, split the group to get under the server's limit
+        return self.split()
+
+    def split(self):
+        if len(self.oids) < 2:
+            return []
+        half = len(self.oids) // 2
+        return [OIDChunk(self.oids[:half], self.oid_field, self.where),
+                OIDChunk(self.oids[half:], self.oid_field, self.where)]
+
+class ChunkStats(object):
+    """Statistics collected while fetching a query in chunks.
+
+    Attributes:
+        requests: Number of chunk requests that succeeded.
+        features: Number of features returned.
+        bytes: Size of all responses in bytes.
+        seconds: Total time spent waiting for responses.
+        errors: Number of failed chunk requests.
+        size: Chunk size used for the next request.
+        history: List of (old_size, new_size, reason) tuples for every change 
+            in chunk size.
+    """
+    def __init__(self, size):
+        self.requests = 0
+        self.features = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.size = size
+        self.history = []
+
+    def asJSON(self):
+        """Returns the statistics as JSON."""
+        return {k: getattr(self, k) for k in ('requests', 'features', 'bytes', 'seconds', 'errors', 'size', 'history')}
+
+    def __repr__(self):
+        return '<ChunkStats: {} requests, {} features, {} bytes in {:.2f}s, {} errors, size: {}>'.format(
+            self.requests, self.features, self.bytes, self.seconds, self.errors, self.size)
+
+class ChunkSizer(object):
+    """Provides a fixed number of records for each chunk of a query and keeps
+            statistics about the responses.
+
+    Attributes:
+        max_retries: Number of times a failed chunk is split and retried before 
+            the error is raised, a fixed size never retries.
+        stats: ChunkStats for the query.
+    """
+    max_retries = 0
+
+    def __init__(self, size):
+        self.stats = ChunkStats(size)
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        """Number of records to request for the next chunk."""
+        return self.stats.size
+
+    def bind(self, max_size):
+        """Limits the chunk size to the layer's maxRecordCount.
+
+        Arg:
+            max_size: Maximum number of records the server returns per request.
+        """
+        self.stats.size = min(self.stats.size, max_size)
+        return self
+
+    def record(self, size, features, seconds, nbytes):
+        """Records a successful response.
+
+        Args:
+            size: Number of records requested.
+            features: Number of features returned.
+            seconds: Time spent waiting for the response.
+            nbytes: Size of the response in bytes.
+        """
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.features += features
+            self.stats.seconds += seconds
+            self.stats.bytes += nbytes
+            self._adjust(size, features, seconds, nbytes)
+
+    def record_error(self, size, error):
+        """Records a failed request.
+
+        Args:
+            size: Number of records requested.
+            error: The exception that was raised.
+        """
+        with self._lock:
+            self.stats.errors += 1
+            self._adjust_for_error(size, error)
+
+    def _resize(self, new_size, reason):
+        if new_size != self.stats.size:
+            self.stats.history.append((self.stats.size, new_size, reason))
+            self.stats.size = new_size
+
+    def _adjust(self, size, features, seconds, nbytes):
+        pass
+
+    def _adjust_for_error(self, size, error):
+        pass
+
+class AdaptiveChunkSizer(ChunkSizer):
+    """Grows or shrinks the chunk size so each request takes about 
+            target_seconds and stays below max_bytes.  The size never changes
+            by more than a factor of 2 per response and is halved when a 
+            request fails, in which case the failed chunk is split and retried.
+
+    Example:
+        sizer = restapi.AdaptiveChunkSizer(target_seconds=10, max_bytes=20 * 1024 ** 2)
+        fs = lyr.query(exceed_limit=True, chunk_size=sizer, max_workers=4)
+        print(sizer.stats)
+
+    Attributes:
+        target_seconds: Target response time for each chunk.
+        max_bytes: Optional maximum response size in bytes for each chunk.
+        min_size: Smallest chunk size.
+        max_size: Largest chunk size, also limited by the layer's maxRecordCount.
+    """
+    max_retries = 3
+
+    def __init__(self, initial_size=None, target_seconds=5.0, max_bytes=None, min_size=10, max_size=None, max_retries=None):
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.min_size = min_size
+        self.max_size = max_size
+        self._initial_size = initial_size
+        # smallest size that failed and largest size that succeeded since
+        self._failed_size = None
+        self._ok_size = 0
+        if max_retries is not None:
+            self.max_retries = max_retries
+        super(AdaptiveChunkSizer, self).__init__(initial_size or max_size or 1000)
+
+    def bind(self, max_size):
+        self.max_size = min(self.max_size or max_size, max_size)
+        if self._initial_size is None and not self.stats.requests:
+            # start conservatively and grow, heavy layers may time out at maxRecordCount
+            self.stats.size = max(self.min_size, self.max_size // 4)
+        self.stats.size = max(min(self.stats.size, self.max_size), min(self.min_size, self.max_size))
+        return self
+
+    def _adjust(self, size, features, seconds, nbytes):
+        if not features:
+            return
+        desired = self.target_seconds * features / max(seconds, 1e-3)
+        reason = 'response took {:.2f}s'.format(seconds)
+        if self.max_bytes:
+            by_bytes = self.max_bytes * features / float(max(nbytes, 1))
+            if by_bytes < desired:
+                desired, reason = by_bytes, 'response was {} bytes'.format(nbytes)
+        new_size = int(min(max(desired, size / 2.0), size * 2.0))
+        if self._failed_size:
+            if size < self._failed_size:
+                self._ok_size = max(self._ok_size, size)
+            # do not grow back into sizes that failed, bisect towards them instead
+            new_size = min(new_size, max((self._ok_size + self._failed_size) // 2, self._ok_size))
+        new_size = min(max(self.min_size, new_size), self.max_size or new_size)
+        self._resize(new_size, reason)
+
+    def _adjust_for_error(self, size, error):
+        self._failed_size = min(self._failed_size or size, size)
+        self._ok_size = min(self._ok_size, self._failed_size - 1)
+        # concurrent failures of chunks with the same size only back off once
+        self._resize(max(self.min_size, min(self.stats.size, size // 2)), 'request failed: {}'.format(error.__class__.__name__))
+
 def tmp_json_file():
     """Returns a valid path for a temporary json file"""
     global TEMP_DIR
@@ -204,6 +746,37 @@ def do_post(service, params={F: JSON}, ret_json=True, token='', cookies=None, pr
         The post request.
     """
 
+    service, params, cookies, proxy = prepare_post(service, params, token, cookies, proxy, **kwargs)
+    stream = params.get(F) == 'image'
+
+    if proxy:
+        r = do_proxy_request(proxy, service, params, referer)
+        ID_MANAGER.proxies[service.split('/rest')[0].lower() + '/rest/services'] = proxy
+    else:
+        r = SESSION_MANAGER.post(service, params, headers={'User-Agent': USER_AGENT}, cookies=cookies, stream=stream)
+
+    return handle_response(service, r, ret_json)
+
+def prepare_post(service, params={F: JSON}, token='', cookies=None, proxy=None, **kwargs):
+    """Resolves credentials, proxies and parameter encoding for a request 
+            before it is sent.  This is shared by do_post() and the asyncio
+            client so both send exactly the same request.
+
+    Args:
+        service: Full path to REST endpoint of service.
+        params: Optional parameters for posting a request. Defaults to {F: JSON}.
+        token: Optional token to handle security (only required if security is enabled).
+            Defaults to ''.
+        cookies: Optional arg for cookie object {'agstoken': 'your_token'}.
+            Defaults to None.
+        proxy: Option to use proxy page to handle security, need to provide
+            full path to proxy url. Defaults to None.
+        kwargs: Optional extra parameters merged into params.
+
+    Returns:
+        A tuple of (service, params, cookies, proxy).
+    """
+
     global PROTOCOL
     if PROTOCOL != '':
         service = '{}://{}'.format(PROTOCOL, service.split('://')[-1])
@@ -255,29 +828,232 @@ def do_post(service, params={F: JSON}, ret_json=True, token='', cookies=None, pr
         
         # TODO: make sure token is in ID Manager registry
 
-    stream = params.get(F) == 'image'
+    return service, params, cookies, proxy
 
-    if proxy:
-        r = do_proxy_request(proxy, service, params, referer)
-        ID_MANAGER.proxies[service.split('/rest')[0].lower() + '/rest/services'] = proxy
-    else:
-        r = requests.post(service, params, headers={'User-Agent': USER_AGENT}, cookies=cookies, verify=False, stream=stream)
+def handle_response(service, r, ret_json=True, as_munch=True):
+    """Validates a response and optionally returns it as JSON.
+
+    Args:
+        service: Full path to REST endpoint of service.
+        r: The response object.
+        ret_json: Optional boolean that returns the response as JSON if True.  
+            Protocol buffer responses (f=pbf) are decoded to the same structure
+            as JSON. Default is True.
+        as_munch: Optional boolean to return the JSON as a munch.Munch, if 
+            False plain dicts are returned. Default is True.
+
+    Raises:
+        NameError: '"{0}" service not found!\n{1}'
+    """
 
     # make sure return
     if r.status_code != 200:
         raise NameError('"{0}" service not found!\n{1}'.format(service, r.raise_for_status()))
     else:
         if ret_json:# is True and params.get(F) in (JSON, PJSON):
+            if PBF_CONTENT_TYPE in (r.headers.get('Content-Type') or ''):
+                _json = pbf.decode_feature_collection(r.content)
+                return lazy_munchify(_json) if as_munch else _json
             try:
                 _json = r.json()
             except:
                 return r
             RequestError(_json)
-            return munch.munchify(_json)
+            return lazy_munchify(_json) if as_munch else _json
         else:
             return r
 
 
+class JSONStream(object):
+    """Incremental JSON parser that yields the items of an array as they are
+            read from a response, without holding the whole body in memory.
+            Every array with the given key is streamed (i.e. "features" of a
+            query, or "features" of each layer in a replica), everything else
+            is collected in the header, where streamed arrays are left empty:
+
+                stream = JSONStream(r.iter_content(JSON_STREAM_CHUNK_SIZE), FEATURES)
+                for feature in stream:
+                    print(feature['attributes'])
+                print(stream.header['exceededTransferLimit'])
+
+    Attributes:
+        key: Key of the arrays that are streamed.
+        header: The response without the streamed items, it is complete once
+            the stream has been consumed.
+        context: The dict that contains the array currently being streamed,
+            for example the layer of a replica.
+        count: Number of items yielded so far.
+        bytes: Number of bytes read so far.
+    """
+    _whitespace = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, chunks, key=FEATURES):
+        """Inits the stream.
+
+        Args:
+            chunks: Iterable of bytes, such as requests.Response.iter_content().
+            key: Optional key of the arrays to stream. Defaults to "features".
+        """
+        self.key = key
+        self.header = None
+        self.context = None
+        self.count = 0
+        self.bytes = 0
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._text = u''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Reads the next chunk into the buffer, returns False at the end of the stream."""
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            chunk = b''
+        self.bytes += len(chunk)
+
+        # drop everything that has already been parsed
+        self._text = self._text[self._pos:] + self._text_decoder.decode(chunk, final=self._eof)
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """Skips whitespace and returns the next character, or None at the end."""
+        while True:
+            self._pos = self._whitespace.match(self._text, self._pos).end()
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if not self._fill():
+                return None
+
+    def _expect(self, chars):
+        """Consumes the next character, which must be one of chars.
+
+        Raises:
+            ValueError: 'Invalid JSON, expected "{}" at position {} but found "{}"'
+        """
+        c = self._peek()
+        if c is None or c not in chars:
+            raise ValueError('Invalid JSON, expected "{}" at position {} but found "{}"'.format(
+                chars, self.bytes - len(self._text) + self._pos, c))
+        self._pos += 1
+        return c
+
+    def _decode(self):
+        """Decodes the complete value at the current position."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._text, self._pos)
+            except ValueError:
+                # the value is incomplete, read more unless the stream has ended
+                if not self._fill():
+                    raise
+                continue
+
+            # a number may continue in the next chunk
+            if end == len(self._text) and self._text[self._pos] not in '{["' and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def __iter__(self):
+        """Generator for the items of the streamed arrays.
+
+        Raises:
+            RuntimeError: If the response is an esri error response.
+        """
+        # each frame is [container, current key, streaming, has items]
+        stack = []
+        while True:
+            frame = stack[-1] if stack else None
+            c = self._peek()
+            if frame is not None and frame[2]:
+                item = self._decode()
+                self.count += 1
+                yield item
+                del item
+            elif c in ('{', '['):
+                self._pos += 1
+                container = {} if c == '{' else []
+                streaming = c == '[' and frame is not None and frame[1] == self.key
+                self._attach(frame, container)
+                if streaming:
+                    self.context = frame[0]
+                stack.append([container, None, streaming, False])
+            else:
+                self._attach(frame, self._decode())
+
+            # close finished containers and move on to the next value
+            while stack:
+                frame = stack[-1]
+                if self._peek() in ('}', ']'):
+                    self._expect('}]')
+                    stack.pop()
+                    if frame[2]:
+                        self.context = None
+                    continue
+                if frame[3]:
+                    self._expect(',')
+                frame[3] = True
+                if isinstance(frame[0], dict):
+                    frame[1] = self._decode()
+                    self._expect(':')
+                break
+            else:
+                break
+
+        RequestError(self.header)
+
+    def _attach(self, frame, value):
+        """Adds a parsed value to its parent container."""
+        if frame is None:
+            self.header = value
+        elif isinstance(frame[0], dict):
+            frame[0][frame[1]] = value
+        else:
+            frame[0].append(value)
+
+    def __repr__(self):
+        return '<JSONStream: "{}" ({} items)>'.format(self.key, self.count)
+
+def stream_post(service, params={F: JSON}, key=FEATURES, token='', cookies=None, proxy=None, referer=None, chunk_size=None, **kwargs):
+    """Post request whose JSON response is parsed incrementally, the items of
+            every array named key are yielded as they arrive instead of 
+            loading the whole response, see JSONStream.
+
+    Args:
+        service: Full path to REST endpoint of service.
+        params: Optional parameters for posting a request. Defaults to {F: JSON}.
+        key: Optional key of the arrays to stream. Defaults to "features".
+        token: Optional token to handle security (only required if security is enabled).
+            Defaults to ''.
+        cookies: Optional arg for cookie object {'agstoken': 'your_token'}.
+            Defaults to None.
+        proxy: Option to use proxy page to handle security, need to provide
+            full path to proxy url. Defaults to None.
+        referer: Optional referer, defaults to None.
+        chunk_size: Optional number of bytes read from the socket at a time.
+            Defaults to JSON_STREAM_CHUNK_SIZE.
+
+    Raises:
+        NameError: '"{0}" service not found!\\n{1}'
+
+    Returns:
+        A JSONStream.
+    """
+    service, params, cookies, proxy = prepare_post(service, params, token, cookies, proxy, **kwargs)
+    if proxy:
+        r = do_proxy_request(proxy, service, params, referer, ret_json=False)
+    else:
+        r = SESSION_MANAGER.post(service, params, headers={'User-Agent': USER_AGENT}, cookies=cookies, stream=True)
+    r = handle_response(service, r, ret_json=False)
+    return JSONStream(r.iter_content(chunk_size or JSON_STREAM_CHUNK_SIZE), key)
+
 def do_proxy_request(proxy, url, params={}, referer=None, ret_json=True):
     """Makes request against ArcGIS service through a proxy.  This is designed for a
             proxy page that stores access credentials in the configuration to 
@@ -308,7 +1084,7 @@ def do_proxy_request(proxy, url, params={}, referer=None, ret_json=True):
     if referer:
         headers[enums.headers.referer] = referer
     #return requests.post('{}?{}?f={}&{}'.format(proxy, url, frmat, p).rstrip('&'), verify=False, headers=headers)
-    return requests.post('{}?{}?f={}'.format(proxy, url, frmat).rstrip('&'), params, verify=False, headers=headers)
+    return SESSION_MANAGER.post('{}?{}?f={}'.format(proxy, url, frmat).rstrip('&'), params, headers=headers)
 
 def guess_proxy_url(domain):
     """Grade school level hack to see if there is a standard esri proxy available 
@@ -327,7 +1103,7 @@ def guess_proxy_url(domain):
     types = ['.ashx', '.jsp', '.php']
     for ptype in types:
         proxy_url = '/'.join([domain, 'proxy' + ptype])
-        r = requests.get(proxy_url)
+        r = SESSION_MANAGER.get(proxy_url, verify=True)
         # should produce an error in JSON if using esri proxy out of the box
         try:
             if r.status_code == 400 or 'error' in r.json():
@@ -338,7 +1114,7 @@ def guess_proxy_url(domain):
     # try again looking to see if it is in a folder called "proxy"
     for ptype in types:
         proxy_url = '/'.join([domain, enums.misc.proxy, enums.misc.proxy + ptype])
-        r = requests.get(proxy_url)
+        r = SESSION_MANAGER.get(proxy_url, verify=True)
         try:
             if r.status_code == 400 or r.content:
                 return r.url
@@ -385,6 +1161,39 @@ def guess_wkid(wkt):
         return projections.names[name]
     return 0
 
+def raw_features(feature_set):
+    """Iterates the feature dicts of a feature set without wrapping them in a
+            LazyMunch, the row conversions of the exports run in a process
+            pool and on large chunks so they read the raw dicts.
+
+    Arg:
+        feature_set: A FeatureSet, GeoJSONFeatureSet, response dict or list
+            of features.
+    """
+    features = feature_set
+    if isinstance(feature_set, dict) or hasattr(feature_set, 'json'):
+        features = dict.get(getattr(feature_set, 'json', feature_set), FEATURES) or []
+    for feat in list.__iter__(features) if isinstance(features, list) else features:
+        yield feat.json if isinstance(feat, Feature) else feat
+
+def geojson_schema(geojson):
+    """Returns the esri fields and geometry type of a GeoJSON feature 
+            collection, taken from the first feature.
+
+    Arg:
+        geojson: The GeoJSON feature collection dict.
+    """
+    features = dict.get(geojson, FEATURES) or [{}]
+    feature = features[0]
+    fields = []
+    for name, value in six.iteritems(dict.get(feature, PROPERTIES) or {}):
+        if isinstance(value, bool) or not isinstance(value, six.integer_types + (float,)):
+            field_type = TEXT_FIELD
+        else:
+            field_type = DOUBLE_FIELD if isinstance(value, float) else BIG_INTEGER_FIELD
+        fields.append({NAME: name, TYPE: field_type})
+    geometry = dict.get(feature, GEOMETRY) or {}
+    return fields, GEOJSON_GEOMETRY_TYPES.get(geometry.get(TYPE))
 
 def assign_unique_name(fl):
     """Assigns a unique file name.
@@ -433,6 +1242,26 @@ def mil_to_date(mil):
             print(mil)
             raise e
 
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def mil_to_isoformat(mil):
+    """Converts milliseconds to an ISO 8601 UTC string such as 
+            "2017-07-14T02:40:00.001Z".  Faster than mil_to_date() because it
+            skips the round trip through local time, and keeps the milliseconds.
+
+    Arg:
+        mil: Time in milliseconds, datetime objects are formatted as is and
+            other values are returned unchanged.
+
+    Returns:
+        The date string.
+    """
+    if isinstance(mil, six.integer_types + (float,)):
+        mil = EPOCH + datetime.timedelta(milliseconds=mil)
+    if isinstance(mil, datetime.datetime):
+        return mil.strftime('%Y-%m-%dT%H:%M:%S.') + '{:03d}Z'.format(mil.microsecond // 1000)
+    return mil
+
 def date_to_mil(date=None):
     """Converts datetime.datetime() object to milliseconds.
     
@@ -674,6 +1503,7 @@ class NameEncoder(json.JSONEncoder):
 
 class JsonGetter(object):
     """Overrides getters to also check its json property."""
+    __slots__ = ()
     json = {}
 
     def get(self, name, default=None):
@@ -726,7 +1556,7 @@ class JsonGetter(object):
             return object.__getattribute__(self, name)
         except AttributeError:
             # it is in the json definition, abstract it to the class level
-            if name in self.json:
+            if name != JSON and name in self.json:
                 return self.json[name]
             else:
                 raise AttributeError(name)
@@ -762,7 +1592,16 @@ class RESTEndpoint(JsonGetter):
             proxy: Option to use proxy page to handle security, need to provide
                 full path to proxy url.
         """
-        
+
+        params = self._prepare_endpoint(url, usr, pw, token, proxy, referer, **kwargs)
+        self._load_response(do_post(self.url, params, ret_json=False, token=self.token, cookies=self._cookie, proxy=self._proxy, referer=self._referer))
+
+    def _prepare_endpoint(self, url, usr='', pw='', token='', proxy=None, referer=None, **kwargs):
+        """Validates the url and resolves credentials for the endpoint.
+
+        Returns:
+            The parameters for the request that fetches the endpoint's JSON.
+        """
         if PROTOCOL:
             self.url = PROTOCOL + '://' + url.split('://')[-1].rstrip('/') if not url.startswith(PROTOCOL) else url.rstrip('/')
         else:
@@ -822,10 +1661,18 @@ class RESTEndpoint(JsonGetter):
         if isinstance(self.token, Token):
             if self.token.get(IS_AGOL) or self.token.get(IS_PORTAL):
                 params[TOKEN] = str(self.token)
-        self.raw_response = do_post(self.url, params, ret_json=False, token=self.token, cookies=self._cookie, proxy=self._proxy, referer=self._referer)
+        return params
+
+    def _load_response(self, raw_response):
+        """Sets the JSON properties from the endpoint's response.
+
+        Arg:
+            raw_response: The response from the endpoint.
+        """
+        self.raw_response = raw_response
         self.elapsed = self.raw_response.elapsed
         self.response = self.raw_response.json()
-        self.json = munch.munchify(self.response)
+        self.json = lazy_munchify(self.response)
         RequestError(self.json)
 
     def compatible_with_version(self, version):
@@ -855,8 +1702,8 @@ class RESTEndpoint(JsonGetter):
         except AttributeError:
             return False
 
-    def request(self, *args, **kwargs):
-        """Wrapper for request to automatically pass in credentials."""
+    def _add_credentials(self, kwargs):
+        """Fills in the endpoint's credentials for a request."""
         for key, value in six.iteritems({'token': 'token',
             'cookies': '_cookie',
             'proxy': '_proxy',
@@ -864,11 +1711,19 @@ class RESTEndpoint(JsonGetter):
         }):
             if key not in kwargs:
                 kwargs[key] = getattr(self, value)
+        return kwargs
 
+    def request(self, *args, **kwargs):
+        """Wrapper for request to automatically pass in credentials."""
+        self._add_credentials(kwargs)
         if 'ret_json' not in kwargs:
             kwargs['ret_json'] = True
         return do_post(*args, **kwargs)
 
+    def stream_request(self, *args, **kwargs):
+        """Wrapper for stream_post() to automatically pass in credentials."""
+        return stream_post(*args, **self._add_credentials(kwargs))
+
     def refresh(self):
         """Refreshes the service."""
         self.__init__(self.url, token=self.token)
@@ -1088,7 +1943,7 @@ class FeatureSet(FeatureSetBase):
         if isinstance(in_json, self.__class__):
             self.json = in_json.json
         elif isinstance(in_json, dict):
-            self.json = munch.munchify(in_json)
+            self.json = lazy_munchify(in_json)
         if not all(map(lambda k: k in self.json.keys(), [FIELDS, FEATURES])):
             print(self.json.keys())
             raise ValueError('Not a valid Feature Set!')
@@ -1114,6 +1969,35 @@ class FeatureSet(FeatureSetBase):
                     nextOID += 1
             self.features.extend(otherCopy.features)
 
+    def to_columns(self, fields=None):
+        """Returns the feature set as a ColumnarFeatureSet, which stores each
+                field as a typed numpy array.  Requires numpy.
+
+        Arg:
+            fields: Optional list of fields with more details than the fields of
+                the feature set, usually the fields of the layer, which have
+                the coded value domains.  Defaults to None.
+        """
+        from .columnar import ColumnarFeatureSet
+        return ColumnarFeatureSet.from_feature_set(self, fields)
+
+    def project(self, outSR):
+        """Returns a copy of the feature set with the geometries projected to 
+                another spatial reference on the client, all vertices are 
+                projected at once.  See restapi.reproject.
+
+        Arg:
+            outSR: The output well known id or spatial reference dict.
+
+        Raises:
+            NotImplementedError: The transformation is not supported locally.
+        """
+        transformer = get_transformer(dict.get(self.json, SPATIAL_REFERENCE) or self.getSR(), outSR)
+        fsd = {k: v for k, v in six.iteritems(self.json) if k != FEATURES}
+        fsd[FEATURES] = transformer.transform_features([dict(ft) for ft in dict.get(self.json, FEATURES)])
+        fsd[SPATIAL_REFERENCE] = transformer.spatialReference
+        return FeatureSet(fsd)
+
     def getEmptyCopy(self):
         """Gets an empty copy of a feature set."""
         fsd = munch.Munch()
@@ -1146,7 +2030,7 @@ class GeoJSONFeatureSet(FeatureSetBase):
         if isinstance(in_json, self.__class__):
             self.json = in_json.json
         elif isinstance(in_json, dict):
-            self.json = munch.munchify(in_json)
+            self.json = lazy_munchify(in_json)
 
 
     def extend(other):
@@ -1171,6 +2055,35 @@ class GeoJSONFeatureSet(FeatureSetBase):
                     nextOID += 1
             self.features.extend(otherCopy.features)
 
+    def project(self, outSR):
+        """Returns a copy of the feature set with the geometries projected to
+                another spatial reference on the client, all positions are
+                projected at once.  The coordinates are read as WGS 1984
+                (RFC 7946) unless the legacy "crs" member names an EPSG code,
+                which is written on the output when it is not WGS 1984.
+
+        Arg:
+            outSR: The output well known id or spatial reference dict.
+
+        Raises:
+            NotImplementedError: The transformation is not supported locally.
+        """
+        inSR = 4326
+        code = str(self._find_wkid({CRS: dict.get(self.json, CRS)}) or '')
+        if code.isdigit():
+            inSR = int(code)
+        transformer = get_transformer(inSR, outSR)
+        features = [dict(ft) for ft in dict.get(self.json, FEATURES) or []]
+        geometries = transformer.transform_geojson([ft.get(GEOMETRY) for ft in features])
+        for ft, g in zip(features, geometries):
+            ft[GEOMETRY] = g
+        fsd = {k: v for k, v in six.iteritems(self.json) if k not in (FEATURES, CRS)}
+        fsd[FEATURES] = features
+        wkid = self._find_wkid(transformer.spatialReference)
+        if wkid not in (4326, None):
+            fsd[CRS] = {TYPE: NAME, PROPERTIES: {NAME: 'EPSG:{}'.format(wkid)}}
+        return GeoJSONFeatureSet(fsd)
+
     def getEmptyCopy(self):
         """Gets an empty copy of a feature set."""
         fsd = munch.Munch()
@@ -1183,6 +2096,8 @@ class GeoJSONFeatureSet(FeatureSetBase):
 
 class Feature(JsonGetter):
     """Class that represents a single feature."""
+    __slots__ = ('json', '_propsGetter')
+
     def __init__(self, feature):
         """Inits the class with a feature.
 
@@ -1190,9 +2105,12 @@ class Feature(JsonGetter):
             feature: Input json for feature.
         """
         
-        self.json = munch.munchify(feature)
+        self.json = lazy_munchify(feature)
         self._propsGetter = ATTRIBUTES if ATTRIBUTES in self.json else PROPERTIES
-        self._type = GEOJSON if self._propsGetter == PROPERTIES else ESRI_JSON_FORMAT
+
+    @property
+    def _type(self):
+        return GEOJSON if self._propsGetter == PROPERTIES else ESRI_JSON_FORMAT
 
     def get(self, field, default=None):
         """Returns/gets an attribute from the feature.
@@ -1226,7 +2144,7 @@ class RelatedRecords(JsonGetter, SpatialReferenceMixin):
             in_json: json response for query related records operation.
         """
         
-        self.json = munch.munchify(in_json)
+        self.json = lazy_munchify(in_json)
         self.geometryType = self.json.get(enums.geometry.type)
         self.spatialReference = self.json.get(SPATIAL_REFERENCE)
 
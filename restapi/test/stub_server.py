@@ -0,0 +1,270 @@
+#-------------------------------------------------------------------------------
+# Name:        stub_server
+# Purpose:     minimal local ArcGIS REST server for offline tests.  Serves a
+#              single feature service with one point layer and supports the
+#              query operations used by restapi (where, objectIds, returnIdsOnly,
+#              returnCountOnly, returnExtentOnly, resultOffset/resultRecordCount)
+#              as well as applyEdits.  Feature queries can be returned as pbf.
+#-------------------------------------------------------------------------------
+import json
+import re
+import struct
+import threading
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import urlparse, parse_qs
+
+SERVICE_PATH = '/arcgis/rest/services/Test/FeatureServer'
+
+FIELDS = [
+    {'name': 'OBJECTID', 'type': 'esriFieldTypeOID', 'alias': 'OBJECTID'},
+    {'name': 'NAME', 'type': 'esriFieldTypeString', 'alias': 'NAME', 'length': 50},
+    {'name': 'VAL', 'type': 'esriFieldTypeDouble', 'alias': 'VAL'},
+    {'name': 'DT', 'type': 'esriFieldTypeDate', 'alias': 'DT'}
+]
+
+OPERATORS = {
+    '>=': lambda a, b: a >= b,
+    '<=': lambda a, b: a <= b,
+    '=': lambda a, b: a == b,
+    '>': lambda a, b: a > b,
+    '<': lambda a, b: a < b
+}
+
+# FeatureCollection.proto field types of FIELDS
+PBF_FIELD_TYPES = {'esriFieldTypeOID': 6, 'esriFieldTypeString': 4, 'esriFieldTypeDouble': 3, 'esriFieldTypeDate': 5}
+
+# quantization used for pbf geometries, origin is the upper left corner
+PBF_SCALE = 0.25
+PBF_TRANSLATE = (-10.0, 5000.0)
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        b, n = n & 0x7f, n >> 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+def _field(number, wire_type, data):
+    if wire_type == 2:
+        data = _varint(len(data)) + data
+    return _varint(number << 3 | wire_type) + data
+
+def _value(v):
+    if isinstance(v, float):
+        return _field(3, 1, struct.pack('<d', v))
+    elif isinstance(v, int) and v > 2 ** 31:
+        return _field(6, 0, _varint(v))
+    elif isinstance(v, int):
+        return _field(4, 0, _varint(_zigzag(v)))
+    return _field(1, 2, v.encode('utf-8'))
+
+def encode_pbf(response):
+    """Encodes a point feature query response as a FeatureCollectionPBuffer.
+            Default values (point geometry type, upper left origin) are
+            omitted like a proto3 serializer does.
+    """
+    transform = _field(2, 2, _field(1, 1, struct.pack('<d', PBF_SCALE)) + _field(2, 1, struct.pack('<d', PBF_SCALE)))
+    transform += _field(3, 2, _field(1, 1, struct.pack('<d', PBF_TRANSLATE[0])) + _field(2, 1, struct.pack('<d', PBF_TRANSLATE[1])))
+    result = _field(1, 2, response['objectIdFieldName'].encode('utf-8'))
+    result += _field(8, 2, _field(1, 0, _varint(4326)) + _field(2, 0, _varint(4326)))
+    if response.get('exceededTransferLimit'):
+        result += _field(9, 0, _varint(1))
+    result += _field(12, 2, transform)
+    for fld in response['fields']:
+        result += _field(13, 2, _field(1, 2, fld['name'].encode('utf-8')) + _field(2, 0, _varint(PBF_FIELD_TYPES[fld['type']])))
+    for ft in response['features']:
+        values = b''.join(_field(1, 2, _value(ft['attributes'][fld['name']])) for fld in response['fields'])
+        x = int(round((ft['geometry']['x'] - PBF_TRANSLATE[0]) / PBF_SCALE))
+        y = int(round((PBF_TRANSLATE[1] - ft['geometry']['y']) / PBF_SCALE))
+        coords = _varint(_zigzag(x)) + _varint(_zigzag(y))
+        result += _field(15, 2, values + _field(2, 2, _field(3, 2, coords)))
+    return _field(1, 2, b'2.0') + _field(2, 2, _field(1, 2, result))
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class StubArcGISServer(object):
+    """Serves a point layer with the given object ids on localhost.
+
+    Attributes:
+        url: Url to the ArcGIS Server services directory.
+        layer_url: Url to the point layer.
+        requests: List of (path, params) tuples for every request received.
+        connections: Number of TCP connections opened by clients.
+        unavailable: Number of the next requests answered with 503 Service
+            Unavailable, like an overloaded server.
+    """
+
+    def __init__(self, oids=range(1, 101), max_record_count=100, supports_pagination=True, transfer_limit=None, error_above=None, error_code=500, pbf=True):
+        self.oids = list(oids)
+        self.max_record_count = max_record_count
+        # the number of records actually returned, can be lower than the advertised maxRecordCount
+        self.transfer_limit = transfer_limit or max_record_count
+        # simulate a server that fails on queries returning more than this many features
+        self.error_above = error_above
+        self.error_code = error_code
+        self.supports_pagination = supports_pagination
+        self.pbf = pbf
+        self.requests = []
+        self.connections = 0
+        self.unavailable = 0
+        self.features = {}
+        for oid in self.oids:
+            self.features[oid] = {
+                'attributes': {'OBJECTID': oid, 'NAME': 'feature {}'.format(oid), 'VAL': oid * 1.5, 'DT': 1500000000000 + oid},
+                'geometry': {'x': float(oid), 'y': float(oid) * 2}
+            }
+        self._httpd = None
+
+    def layer_json(self):
+        return {
+            'currentVersion': 10.81,
+            'id': 0,
+            'name': 'Points',
+            'type': 'Feature Layer',
+            'geometryType': 'esriGeometryPoint',
+            'objectIdField': 'OBJECTID',
+            'maxRecordCount': self.max_record_count,
+            'supportedQueryFormats': 'JSON, geoJSON, PBF' if self.pbf else 'JSON, geoJSON',
+            'advancedQueryCapabilities': {'supportsPagination': self.supports_pagination},
+            'extent': {'xmin': 0, 'ymin': 0, 'xmax': 1, 'ymax': 1, 'spatialReference': {'wkid': 4326}},
+            'hasAttachments': False,
+            'fields': FIELDS
+        }
+
+    def _matches(self, where, oid):
+        attributes = self.features[oid]['attributes']
+        for clause in re.split(r'\s+and\s+', where.strip(), flags=re.I):
+            clause = clause.strip()
+            if not clause or clause == '1=1':
+                continue
+            field, op, value = re.match(r'(\w+)\s*(>=|<=|=|>|<)\s*(\S+)', clause).groups()
+            if not OPERATORS[op](attributes[field], float(value)):
+                return False
+        return True
+
+    def query(self, params):
+        selected = [oid for oid in self.oids if self._matches(params.get('where', '1=1'), oid)]
+        if params.get('objectIds'):
+            ids = set(int(i) for i in params['objectIds'].split(','))
+            selected = [oid for oid in selected if oid in ids]
+
+        if params.get('returnCountOnly') == 'true':
+            return {'count': len(selected)}
+        if params.get('returnIdsOnly') == 'true':
+            return {'objectIdFieldName': 'OBJECTID', 'objectIds': selected}
+        if params.get('returnExtentOnly') == 'true':
+            xs = [self.features[oid]['geometry']['x'] for oid in selected]
+            ys = [self.features[oid]['geometry']['y'] for oid in selected]
+            return {'extent': {'xmin': min(xs), 'ymin': min(ys), 'xmax': max(xs), 'ymax': max(ys),
+                               'spatialReference': {'wkid': 4326}}}
+
+        if 'resultOffset' in params:
+            offset = int(params['resultOffset'])
+            count = min(int(params.get('resultRecordCount', self.max_record_count)), self.transfer_limit)
+            exceeded = len(selected) > offset + count
+            selected = selected[offset:offset + count]
+        else:
+            exceeded = len(selected) > self.transfer_limit
+            selected = selected[:self.transfer_limit]
+
+        if self.error_above and len(selected) > self.error_above:
+            return {'error': {'code': self.error_code, 'message': 'Error performing query operation', 'details': []}}
+
+        response = {
+            'objectIdFieldName': 'OBJECTID',
+            'geometryType': 'esriGeometryPoint',
+            'spatialReference': {'wkid': 4326, 'latestWkid': 4326},
+            'fields': FIELDS,
+            'features': [self.features[oid] for oid in selected]
+        }
+        if exceeded:
+            response['exceededTransferLimit'] = True
+        return response
+
+    def respond(self, path, params):
+        self.requests.append((path, params))
+        path = path.rstrip('/')
+        if path.endswith('/query'):
+            return self.query(params)
+        elif path.endswith('/applyEdits'):
+            adds = json.loads(params.get('adds') or '[]')
+            return {'addResults': [{'objectId': max(self.oids) + i + 1, 'success': True} for i in range(len(adds))],
+                    'updateResults': [], 'deleteResults': []}
+        elif path.endswith(SERVICE_PATH + '/0'):
+            return self.layer_json()
+        elif path.endswith(SERVICE_PATH):
+            return {'currentVersion': 10.81, 'layers': [{'id': 0, 'name': 'Points'}], 'tables': []}
+        elif path.endswith('/rest/services'):
+            return {'currentVersion': 10.81, 'folders': [], 'services': [{'name': 'Test', 'type': 'FeatureServer'}]}
+        return {'error': {'code': 404, 'message': 'Not Found', 'details': []}}
+
+    def start(self):
+        """Starts serving in a background thread and returns the layer url."""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                stub.connections += 1
+                BaseHTTPRequestHandler.setup(self)
+
+            def _handle(self, body):
+                parsed = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                params.update({k: v[0] for k, v in parse_qs(body).items()})
+                if stub.unavailable:
+                    stub.unavailable -= 1
+                    stub.requests.append((parsed.path, params))
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                response = stub.respond(parsed.path, params)
+                if params.get('f') == 'pbf' and 'features' in response:
+                    data, content_type = encode_pbf(response), 'application/x-protobuf'
+                else:
+                    data, content_type = json.dumps(response).encode('utf-8'), 'application/json'
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle('')
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self._handle(self.rfile.read(length).decode('utf-8'))
+
+        self._httpd = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=self._httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.layer_url
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/arcgis/rest/services'.format(self._httpd.server_address[1])
+
+    @property
+    def layer_url(self):
+        return self.url + '/Test/FeatureServer/0'
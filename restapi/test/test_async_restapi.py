@@ -0,0 +1,71 @@
+#-------------------------------------------------------------------------------
+# Name:        test_async_restapi
+# Purpose:     tests the asyncio client against a local stub server.
+#-------------------------------------------------------------------------------
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import restapi as r
+from stub_server import StubArcGISServer
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.run_until_complete(r.ASYNC_SESSION_MANAGER.close())
+        loop.close()
+
+class TestAsyncRestapi(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubArcGISServer(oids=range(1, 451), max_record_count=100)
+        cls.stub.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+
+    def test_ArcServer(self):
+        async def main():
+            ags = await r.AsyncArcServer.create(self.stub.url)
+            return await ags.list_services()
+        self.assertEqual(run(main()), [self.stub.url + '/Test/FeatureServer'])
+
+    def test_query_exceed_limit(self):
+        async def main():
+            lyr = await r.AsyncMapServiceLayer.create(self.stub.layer_url)
+            return await lyr.query(exceed_limit=True, max_workers=4)
+        fs = run(main())
+        self.assertEqual(fs.count, 450)
+        self.assertEqual([f.attributes.OBJECTID for f in fs.features], list(range(1, 451)))
+
+    def test_query_in_chunks(self):
+        async def main():
+            lyr = await r.AsyncMapServiceLayer.create(self.stub.layer_url)
+            return [fs.count async for fs in lyr.query_in_chunks(where='OBJECTID > 50', max_workers=3)]
+        self.assertEqual(run(main()), [100, 100, 100, 100])
+
+    def test_fan_out(self):
+        async def main():
+            lyr = await r.AsyncMapServiceLayer.create(self.stub.layer_url)
+            return await asyncio.gather(*[lyr.getCount('OBJECTID <= {}'.format(i)) for i in range(1, 21)])
+        self.assertEqual(run(main()), list(range(1, 21)))
+
+    def test_applyEdits(self):
+        async def main():
+            lyr = await r.AsyncFeatureLayer.create(self.stub.layer_url)
+            return await lyr.applyEdits(adds=[{'attributes': {'NAME': 'new'}, 'geometry': {'x': 1, 'y': 2}}])
+        result = run(main())
+        self.assertEqual(len(result.addResults), 1)
+
+    def test_create_required(self):
+        with self.assertRaises(TypeError):
+            r.AsyncMapServiceLayer(self.stub.layer_url)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#-------------------------------------------------------------------------------
+# Name:        test_columnar
+# Purpose:     tests storing query results as typed columns.
+#-------------------------------------------------------------------------------
+import datetime
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import restapi as r
+
+FIELDS = [
+    {'name': 'OBJECTID', 'type': 'esriFieldTypeOID'},
+    {'name': 'NAME', 'type': 'esriFieldTypeString'},
+    {'name': 'VAL', 'type': 'esriFieldTypeDouble'},
+    {'name': 'CNT', 'type': 'esriFieldTypeInteger'},
+    {'name': 'DT', 'type': 'esriFieldTypeDate'},
+    {'name': 'KIND', 'type': 'esriFieldTypeSmallInteger', 'domain': {'type': 'codedValue', 'name': 'Kinds',
+        'codedValues': [{'name': 'Road', 'code': 1}, {'name': 'Rail', 'code': 2}]}}
+]
+
+def feature_set():
+    features = []
+    for i in range(1, 7):
+        ft = {'attributes': {'OBJECTID': i, 'NAME': 'f{}'.format(i), 'VAL': i * 1.5, 'CNT': None if i == 3 else i,
+                             'DT': 1500000000000 + i, 'KIND': None if i == 6 else i % 2 + 1}}
+        if i != 4:
+            ft['geometry'] = {'paths': [[[i, 0], [i, 1]], [[i, 2], [i, 3], [i, 4]]]}
+        features.append(ft)
+    return {'geometryType': 'esriGeometryPolyline', 'spatialReference': {'wkid': 3857},
+            'fields': [dict(f, domain=None) for f in FIELDS], 'features': features}
+
+@unittest.skipUnless(r.has_numpy, 'numpy is not installed')
+class TestColumnarFeatureSet(unittest.TestCase):
+
+    def setUp(self):
+        self.raw = feature_set()
+        self.cfs = r.FeatureSet(self.raw).to_columns(FIELDS)
+
+    def test_columns(self):
+        cfs = self.cfs
+        self.assertEqual(len(cfs), 6)
+        self.assertEqual(str(cfs.columns['OBJECTID'].dtype), 'int64')
+        self.assertEqual(str(cfs.columns['CNT'].dtype), 'int32')
+        self.assertEqual(cfs['DT'][0].item(), datetime.datetime(2017, 7, 14, 2, 40, 0, 1000))
+        self.assertEqual(cfs.isnull('CNT').tolist(), [False, False, True, False, False, False])
+        self.assertEqual(cfs['KIND'].tolist(), [2, 1, 2, 1, 2, None])
+        self.assertEqual(cfs.labels('KIND').tolist(), ['Rail', 'Road', 'Rail', 'Road', 'Rail', None])
+        self.assertEqual(cfs.coords.shape, (25, 2))
+        self.assertEqual(cfs.has_geometry.tolist(), [True, True, True, False, True, True])
+
+        # round trip back to the same features
+        self.assertEqual(list(cfs.iter_features()), self.raw['features'])
+        self.assertEqual(cfs.to_feature_set().count, 6)
+
+    def test_filter_select(self):
+        cfs = self.cfs.filter(self.cfs['VAL'] > 4)
+        self.assertEqual(cfs['OBJECTID'].tolist(), [3, 4, 5, 6])
+        self.assertEqual(list(cfs.iter_features()), self.raw['features'][2:])
+        self.assertEqual(cfs.isnull('CNT').tolist(), [True, False, False, False])
+
+        sub = self.cfs.select(['NAME'], geometry=False)
+        self.assertIs(sub.columns['NAME'], self.cfs.columns['NAME'])
+        self.assertEqual(list(sub.iter_features())[0], {'attributes': {'NAME': 'f1'}})
+
+    def test_aggregate(self):
+        cfs = self.cfs
+        self.assertEqual(cfs.aggregate('VAL'), 31.5)
+        self.assertEqual(cfs.aggregate('CNT', 'count'), 5)
+        self.assertEqual(cfs.aggregate('CNT', 'max'), 6)
+        self.assertEqual(cfs.aggregate('VAL', 'sum', by='KIND'), {1: 9.0, 2: 13.5, None: 9.0})
+        self.assertEqual(cfs.aggregate('CNT', 'min', by='KIND'), {1: 2, 2: 1, None: 6})
+        self.assertEqual(cfs.aggregate('CNT', 'mean', by='NAME')['f3'], None)
+        self.assertRaises(ValueError, cfs.aggregate, 'VAL', 'median')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#-------------------------------------------------------------------------------
+# Name:        test_flatgeobuf
+# Purpose:     tests exporting layers to FlatGeobuf against a local stub server.
+#-------------------------------------------------------------------------------
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import restapi as r
+from restapi import flatgeobuf
+from stub_server import StubArcGISServer
+
+class TestFlatGeobuf(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubArcGISServer(oids=range(1, 251), max_record_count=100)
+        cls.stub.start()
+        cls.lyr = r.FeatureLayer(cls.stub.layer_url)
+        cls.tmp = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        shutil.rmtree(cls.tmp)
+
+    def test_export_layer(self):
+        out = self.lyr.export_layer(os.path.join(self.tmp, 'points.fgb'), exceed_limit=True)
+        with open(out, 'rb') as f:
+            data = f.read()
+        self.assertEqual(data[:8], flatgeobuf.MAGIC_BYTES)
+        header_size = struct.unpack_from('<I', data, 8)[0]
+        index_start = 12 + header_size
+
+        # 250 leaves, 16 nodes above them and the root
+        bounds = flatgeobuf.level_bounds(250, 16)
+        self.assertEqual(bounds, [(17, 267), (1, 17), (0, 1)])
+        nodes = [struct.unpack_from('<4dQ', data, index_start + 40 * i) for i in range(267)]
+        self.assertEqual(nodes[0][:4], (1.0, 2.0, 250.0, 500.0))
+
+        # the leaves point at the features, which follow in the same order
+        features_start = index_start + 40 * 267
+        offset = 0
+        points = []
+        for minx, miny, maxx, maxy, leaf_offset in nodes[17:]:
+            self.assertEqual(leaf_offset, offset)
+            offset += 4 + struct.unpack_from('<I', data, features_start + offset)[0]
+            points.append((minx, miny))
+        self.assertEqual(features_start + offset, len(data))
+        self.assertEqual(sorted(points), [(float(i), 2.0 * i) for i in range(1, 251)])
+
+    def test_no_index(self):
+        fs = r.FeatureSet({'geometryType': 'esriGeometryPolyline', 'spatialReference': {'wkid': 3857},
+            'fields': [{'name': 'ID', 'type': 'esriFieldTypeInteger'}], 'features': [
+                {'attributes': {'ID': i}, 'geometry': {'paths': [[[i, 0], [i, 1]]]}} for i in range(3)]})
+        out = r.common_types.exportFeatureSet_os(fs, os.path.join(self.tmp, 'lines.fgb'), index_node_size=0)
+        with open(out, 'rb') as f:
+            data = f.read()
+        # the features follow the header in the order they were written
+        offset = 12 + struct.unpack_from('<I', data, 8)[0]
+        sizes = []
+        while offset < len(data):
+            size = struct.unpack_from('<I', data, offset)[0]
+            sizes.append(size)
+            offset += 4 + size
+        self.assertEqual(len(sizes), 3)
+        self.assertEqual(offset, len(data))
+
+if __name__ == '__main__':
+    unittest.main()
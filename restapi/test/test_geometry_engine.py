@@ -0,0 +1,64 @@
+#-------------------------------------------------------------------------------
+# Name:        test_geometry_engine
+# Purpose:     tests the local geometry engine behind GeometryService(local=True),
+#              no geometry service is contacted.
+#-------------------------------------------------------------------------------
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import restapi as r
+from restapi import geometry_engine
+from restapi.wkb import _list_signed_area
+
+def area(polygon):
+    return -sum(_list_signed_area([tuple(pt) for pt in ring]) for ring in polygon[r.RINGS])
+
+def square(x, y, size):
+    return {'rings': [[[x, y], [x, y + size], [x + size, y + size], [x + size, y], [x, y]]],
+            'spatialReference': {'wkid': 3857}}
+
+class TestGeometryEngine(unittest.TestCase):
+
+    def test_overlay(self):
+        a, b = square(0, 0, 10), square(5, 5, 10)
+        self.assertAlmostEqual(area(geometry_engine.union([a, b])), 175)
+        self.assertAlmostEqual(area(geometry_engine.intersect(a, b)), 25)
+
+        # parcels sharing edges merge into one ring around a hole
+        parcels = [square(i, j, 1) for i in range(5) for j in range(5) if (i, j) != (2, 2)]
+        merged = geometry_engine.union(parcels)
+        self.assertEqual(len(merged[r.RINGS]), 2)
+        self.assertAlmostEqual(area(merged), 24)
+
+        line = geometry_engine.intersect({'paths': [[[-5, 5], [15, 5]]]}, a)
+        self.assertEqual(line, {'paths': [[[0.0, 5.0], [10.0, 5.0]]]})
+        self.assertEqual(list(geometry_engine.points_in_polygon([[1, 1], [11, 1]], a)), [True, False])
+
+        # polygon with a hole clipped by an envelope
+        holed = {'rings': a['rings'] + [[[2, 2], [4, 2], [4, 4], [2, 4], [2, 2]]]}
+        clipped = geometry_engine.intersect(holed, {'xmin': 1, 'ymin': 1, 'xmax': 3, 'ymax': 3})
+        self.assertAlmostEqual(area(clipped), 3)
+
+    def test_local_geometry_service(self):
+        gs = r.GeometryService(local=True)
+        circle = gs.buffer({'x': 0, 'y': 0, 'spatialReference': {'wkid': 3857}}, 1, r.ESRI_KILOMETER)
+        self.assertEqual(circle.getWKID(), 3857)
+        self.assertAlmostEqual(area(circle.json), math.pi * 1000 ** 2, delta=0.01 * math.pi * 1000 ** 2)
+
+        buffers = gs.buffer({'paths': [[[0, 0], [10, 0]]], 'spatialReference': {'wkid': 3857}}, [1, 2])
+        self.assertEqual(len(buffers), 2)
+        self.assertAlmostEqual(area(buffers[1].json), 40 + 4 * math.pi, delta=0.1)
+
+        clipped = gs.intersect([square(0, 0, 10), square(20, 0, 10)], square(5, 5, 10), 3857)
+        self.assertEqual([round(area(g.json)) for g in clipped], [25, 0])
+        self.assertAlmostEqual(area(gs.union([square(0, 0, 10), square(10, 0, 10)]).json), 200)
+
+        point = gs.project({'x': -90, 'y': 45}, 4326, 3857)
+        self.assertAlmostEqual(point.json[r.X], -10018754.17139462, 4)
+        self.assertAlmostEqual(point.json[r.Y], 5621521.486192066, 4)
+
+if __name__ == '__main__':
+    unittest.main()
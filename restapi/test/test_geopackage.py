@@ -0,0 +1,80 @@
+#-------------------------------------------------------------------------------
+# Name:        test_geopackage
+# Purpose:     tests exporting layers to GeoPackage against a local stub server.
+#-------------------------------------------------------------------------------
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import restapi as r
+from restapi import geopackage
+from stub_server import StubArcGISServer
+
+class TestGeoPackage(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubArcGISServer(oids=range(1, 251), max_record_count=100)
+        cls.stub.start()
+        cls.lyr = r.FeatureLayer(cls.stub.layer_url)
+        cls.tmp = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        shutil.rmtree(cls.tmp)
+
+    def test_export_layer(self):
+        out = os.path.join(self.tmp, 'points.gpkg')
+        self.lyr.export_geopackage(out)
+        con = sqlite3.connect(out)
+        self.assertEqual(con.execute('PRAGMA application_id').fetchone()[0], geopackage.GPKG_APPLICATION_ID)
+        self.assertEqual(con.execute('SELECT "OBJECTID", "NAME", "DT" FROM points WHERE "OBJECTID" = 3').fetchone(),
+                         (3, 'feature 3', '2017-07-14T02:40:00.003Z'))
+        self.assertEqual(con.execute('SELECT count(*) FROM points').fetchone()[0], 250)
+        self.assertEqual(con.execute('SELECT geometry_type_name, srs_id FROM gpkg_geometry_columns').fetchone(), ('POINT', 4326))
+        self.assertEqual(con.execute('SELECT min_x, min_y, max_x, max_y FROM gpkg_contents').fetchone(), (1.0, 2.0, 250.0, 500.0))
+
+        # the spatial index is built after the load
+        self.assertEqual(con.execute('SELECT id FROM rtree_points_geom WHERE minx <= 3.5 AND maxx >= 2.5').fetchall(), [(3,)])
+        con.close()
+
+        # a second table in the same GeoPackage, a table with the same name is replaced
+        self.lyr.export_geopackage(os.path.join(out, 'first'), where='OBJECTID < 11')
+        self.lyr.export_geopackage(os.path.join(out, 'first'), where='OBJECTID < 6')
+        con = sqlite3.connect(out)
+        self.assertEqual(con.execute('SELECT count(*) FROM first').fetchone()[0], 5)
+        self.assertEqual(sorted(con.execute('SELECT table_name FROM gpkg_contents').fetchall()), [('first',), ('points',)])
+        con.close()
+
+    def test_polygons(self):
+        outer = [[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]]
+        hole = [[2, 2], [4, 2], [4, 4], [2, 4], [2, 2]]
+        fs = r.FeatureSet({'geometryType': 'esriGeometryPolygon', 'spatialReference': {'wkid': 3857},
+            'fields': [{'name': 'ID', 'type': 'esriFieldTypeInteger'}], 'features': [
+                {'attributes': {'ID': 1}, 'geometry': {'rings': [outer, hole]}},
+                {'attributes': {'ID': 2}, 'geometry': None}]})
+        out = r.common_types.exportFeatureSet_os(fs, os.path.join(self.tmp, 'polygons.gpkg'))
+        con = sqlite3.connect(out)
+        (blob,), (empty,) = con.execute('SELECT geom FROM polygons ORDER BY fid').fetchall()
+        self.assertIsNone(empty)
+        self.assertEqual(struct.unpack_from('<2sBBi4d', blob), (b'GP', 0, 3, 3857, 0.0, 10.0, 0.0, 10.0))
+        # a single polygon with its hole in a MultiPolygon
+        self.assertEqual(struct.unpack_from('<BIIBII', blob, 40), (1, 6, 1, 1, 3, 2))
+        self.assertEqual(con.execute('SELECT geometry_type_name FROM gpkg_geometry_columns').fetchone(), ('MULTIPOLYGON',))
+
+        # GeoJSON has no fields, they are taken from the first feature
+        gj = r.rest_utils.GeoJSONFeatureSet({'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {'ID': 1, 'NAME': 'a'},
+             'geometry': {'type': 'Polygon', 'coordinates': [outer]}}]})
+        r.common_types.exportFeatureSet_os(gj, os.path.join(out, 'geojson'))
+        self.assertEqual(con.execute('SELECT "ID", "NAME" FROM geojson').fetchall(), [(1, 'a')])
+        con.close()
+
+if __name__ == '__main__':
+    unittest.main()
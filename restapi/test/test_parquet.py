@@ -0,0 +1,88 @@
+#-------------------------------------------------------------------------------
+# Name:        test_parquet
+# Purpose:     tests exporting layers to GeoParquet against a local stub server.
+#-------------------------------------------------------------------------------
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import restapi as r
+from restapi import wkb
+from stub_server import StubArcGISServer
+
+if r.has_pyarrow:
+    import pyarrow.parquet as pq
+
+@unittest.skipUnless(r.has_numpy and r.has_pyarrow, 'numpy and pyarrow are not installed')
+class TestParquet(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubArcGISServer(oids=range(1, 251), max_record_count=100)
+        cls.stub.start()
+        cls.lyr = r.FeatureLayer(cls.stub.layer_url)
+        cls.tmp = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        shutil.rmtree(cls.tmp)
+
+    def test_export_layer(self):
+        out = self.lyr.export_layer(os.path.join(self.tmp, 'points.parquet'), exceed_limit=True)
+        pf = pq.ParquetFile(out)
+        self.assertEqual(pf.metadata.num_rows, 250)
+        self.assertEqual(pf.metadata.num_row_groups, 3)
+        table = pf.read()
+        self.assertEqual(table.column_names, ['OBJECTID', 'NAME', 'VAL', 'DT', 'geometry'])
+        self.assertEqual(str(table.schema.field('DT').type), 'timestamp[ms, tz=UTC]')
+        self.assertEqual(table.column('OBJECTID').to_pylist(), list(range(1, 251)))
+        self.assertEqual(table.column('geometry')[2].as_py(), struct.pack('<BIdd', 1, 1, 3.0, 6.0))
+
+        geo = json.loads(table.schema.metadata[b'geo'])
+        self.assertEqual(geo['primary_column'], 'geometry')
+        self.assertEqual(geo['columns']['geometry']['geometry_types'], ['Point'])
+        self.assertNotIn('crs', geo['columns']['geometry'])
+
+        # no features still writes the schema
+        empty = self.lyr.export_layer(os.path.join(self.tmp, 'empty.parquet'), where='OBJECTID > 1000')
+        self.assertEqual(pq.read_table(empty).column_names, table.column_names)
+
+    def test_pipeline_stats(self):
+        # chunks are converted in a process pool and written in order
+        out = self.lyr.export_parquet(os.path.join(self.tmp, 'pipeline.parquet'), max_workers=2,
+                                      decode_workers=2, processes=True)
+        self.assertEqual(pq.read_table(out).column('OBJECTID').to_pylist(), list(range(1, 251)))
+        stats = self.lyr.pipeline_stats
+        self.assertEqual([s.name for s in stats.stages], ['fetch', 'decode', 'write'])
+        self.assertEqual([s.items for s in stats.stages], [3, 3, 3])
+        self.assertIn(stats.bottleneck, ('fetch', 'decode', 'write'))
+
+    def test_pipeline_error(self):
+        def source():
+            yield 1
+            raise ValueError('fetch failed')
+        written = []
+        with self.assertRaises(ValueError):
+            r.run_pipeline(source(), lambda i: i * 2, written.append)
+        self.assertEqual(written, [2])
+
+    def test_polygon_wkb(self):
+        outer = [[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]]
+        hole = [[2, 2], [4, 2], [4, 4], [2, 4], [2, 2]]
+        other = [[20, 0], [20, 1], [21, 1], [20, 0]]
+        fs = {'geometryType': 'esriGeometryPolygon', 'fields': [], 'features': [
+            {'attributes': {}, 'geometry': {'rings': [outer, hole]}},
+            {'attributes': {}, 'geometry': {'rings': [outer, other, hole]}}]}
+        single, multi = list(wkb.iter_wkb(r.FeatureSet(fs).to_columns()))
+        self.assertEqual(struct.unpack_from('<BII', single), (1, 3, 2))
+        # the hole belongs to the first polygon even though it follows the second
+        self.assertEqual(struct.unpack_from('<BIIBII', multi), (1, 6, 2, 1, 3, 2))
+
+if __name__ == '__main__':
+    unittest.main()
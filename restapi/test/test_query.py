@@ -0,0 +1,295 @@
+#-------------------------------------------------------------------------------
+# Name:        test_query
+# Purpose:     tests fetching all records from a layer against a local stub server.
+#-------------------------------------------------------------------------------
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import restapi as r
+from stub_server import StubArcGISServer
+
+class TestQueryAllRecords(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubArcGISServer(oids=range(1, 451), max_record_count=100)
+        cls.stub.start()
+        cls.lyr = r.FeatureLayer(cls.stub.layer_url)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+
+    def oids(self, fs):
+        return [f.attributes.OBJECTID for f in fs.features]
+
+    def test_pagination_detected(self):
+        self.assertEqual(self.lyr._get_pagination(), r.PAGINATION_OFFSET)
+        self.assertEqual(self.lyr._get_pagination(r.PAGINATION_OID), r.PAGINATION_OID)
+        self.assertRaises(ValueError, self.lyr._get_pagination, 'pages')
+
+    def test_sessions(self):
+        # requests to the same host share a keep-alive connection
+        connections = self.stub.connections
+        for oid in (401, 402, 403):
+            self.assertEqual(self.lyr.getCount('OBJECTID > {}'.format(oid)), 450 - oid)
+        self.assertLessEqual(self.stub.connections - connections, 1)
+
+        # a query is retried when the server is unavailable, edits are not
+        del self.stub.requests[:]
+        self.stub.unavailable = 1
+        self.assertEqual(self.lyr.getCount('OBJECTID > 404'), 46)
+        self.assertEqual(len(self.stub.requests), 2)
+        del self.stub.requests[:]
+        self.stub.unavailable = 1
+        resp = r.SESSION_MANAGER.post(self.lyr.url + '/applyEdits', {'f': 'json', 'adds': '[]'})
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_exceed_limit(self):
+        for pagination in (r.PAGINATION_OFFSET, r.PAGINATION_OID):
+            for max_workers in (None, 4):
+                fs = self.lyr.query(exceed_limit=True, f=r.JSON, pagination=pagination, max_workers=max_workers)
+                self.assertEqual(self.oids(fs), list(range(1, 451)))
+
+    def test_offset_pages(self):
+        del self.stub.requests[:]
+        fs = self.lyr.query(where='OBJECTID > 25', exceed_limit=True, f=r.JSON, records=230, pagination=r.PAGINATION_OFFSET)
+        self.assertEqual(self.oids(fs), list(range(26, 256)))
+        params = [p for path, p in self.stub.requests if path.endswith('/query')]
+        self.assertEqual(params[0]['returnCountOnly'], 'true')
+        self.assertFalse(any(p.get('returnIdsOnly') == 'true' for p in params))
+        self.assertEqual([p['resultOffset'] for p in params[1:]], ['0', '100', '200'])
+
+    def test_query_in_chunks(self):
+        counts = [fs.count for fs in self.lyr.query_in_chunks(f=r.JSON, max_workers=2)]
+        self.assertEqual(counts, [100, 100, 100, 100, 50])
+
+    def test_iter_features(self):
+        features = self.lyr.iter_features(where='OBJECTID > 10', f=r.JSON, max_workers=2)
+        self.assertEqual([ft.get('OBJECTID') for ft in features], list(range(11, 451)))
+
+    def test_iter_features_prefetch(self):
+        del self.stub.requests[:]
+        features = self.lyr.iter_features(f=r.JSON, prefetch=1, pagination=r.PAGINATION_OFFSET)
+        self.assertEqual(next(features).get('OBJECTID'), 1)
+        time.sleep(0.2)
+        # count request, the chunk being consumed and at most one chunk ahead
+        self.assertLessEqual(len(self.stub.requests), 3)
+        self.assertEqual(len(list(features)), 449)
+
+    def test_iter_features_stream(self):
+        features = self.lyr.iter_features(where='OBJECTID > 10', f=r.JSON, stream=True, pagination=r.PAGINATION_OID)
+        self.assertEqual([ft.get('OBJECTID') for ft in features], list(range(11, 451)))
+
+    def test_count_and_extent(self):
+        del self.stub.requests[:]
+        self.assertEqual(self.lyr.getCount('OBJECTID > 400'), 50)
+        self.assertEqual(self.lyr.getCount('OBJECTID > 400'), 50)
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(self.stub.requests[0][1]['returnCountOnly'], 'true')
+        self.assertEqual(self.lyr.getCount('OBJECTID > 400', use_cache=False), 50)
+        self.assertEqual(len(self.stub.requests), 2)
+
+        extent = self.lyr.getExtent('OBJECTID <= 10')
+        self.assertEqual([extent.xmin, extent.ymin, extent.xmax, extent.ymax], [1, 2, 10, 20])
+        self.assertEqual(extent.spatialReference.wkid, 4326)
+
+    def test_geometry_envelope(self):
+        geom = r.Geometry({'rings': [[[0, 0], [0, 10], [12.5, 10], [0, 0]], [[-3, 1], [-1, 1], [-3, 2], [-3, 1]]],
+                           'spatialReference': {'wkid': 3857}})
+        self.assertEqual(geom.bbox, (-3, 0, 12.5, 10))
+        self.assertIs(geom.bbox, geom.bbox)
+        self.assertEqual(geom.envelope(), '-3,0,12.5,10')
+        self.assertEqual(geom.envelopeAsJSON(), {'xmin': -3, 'ymin': 0, 'xmax': 12.5, 'ymax': 10,
+                                                 'spatialReference': {'wkid': 3857}})
+        self.assertIsNone(r.Geometry({'paths': []}).bbox)
+
+        # the extent of the layer features, compared as numbers
+        extent = r.getFeatureExtent(self.lyr.query(where='OBJECTID >= 5 AND OBJECTID <= 12'))
+        self.assertEqual([extent.xmin, extent.ymin, extent.xmax, extent.ymax], [5, 10, 12, 24])
+
+    def test_packed_geometry(self):
+        outer = [[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]]
+        hole = [[2, 2], [4, 2], [4, 4], [2, 4], [2, 2]]
+        geom = r.Geometry({'rings': [outer, hole], 'spatialReference': {'wkid': 3857}}, packed=True)
+        self.assertEqual(geom.packed.nbytes, 10 * 16 + 3 * geom.packed.part_offsets.itemsize)
+        self.assertEqual(geom.json['rings'], [outer, hole])
+        self.assertEqual(geom.getWKID(), 3857)
+        self.assertEqual(geom.bbox, (0, 0, 10, 10))
+
+        # the shape reads its points from the same buffer
+        shape = geom.asShape()
+        self.assertEqual((shape.shapeType, shape.parts, len(shape.points)), (5, [0, 5], 10))
+        self.assertIs(shape.points.coords, geom.packed.coords)
+        self.assertEqual(list(shape.points[5:7]), hole[:2])
+
+        gc = r.GeometryCollection([{'paths': [[[0, 0, 1], [1, 1, None]]], 'hasZ': True, 'hasM': True}], packed=True)
+        self.assertEqual(gc[0].packed.dims, 4)
+        self.assertEqual(gc[0].asShape().shapeType, 13)
+        self.assertEqual(gc.JSON['geometries'][0]['paths'], [[[0, 0, 1, None], [1, 1, None, None]]])
+        self.assertEqual(gc[0].asShape().points[1], [1, 1, None, None])
+
+    def test_pbf(self):
+        del self.stub.requests[:]
+        expected = self.lyr.query(where='OBJECTID > 390', exceed_limit=True, f=r.JSON)
+        fs = self.lyr.query(where='OBJECTID > 390', exceed_limit=True, f=r.PBF, max_workers=2)
+        self.assertEqual(fs.json.features, expected.json.features)
+        self.assertEqual(fs.fields, expected.fields)
+        self.assertEqual(fs.spatialReference, expected.spatialReference)
+        self.assertIn('pbf', [p['f'] for path, p in self.stub.requests])
+
+        cursor = self.lyr.cursor(['OBJECTID', 'NAME'], 'OBJECTID <= 3', f=r.PBF)
+        self.assertEqual(list(cursor), [(1, 'feature 1'), (2, 'feature 2'), (3, 'feature 3')])
+
+    def test_compact_cursor(self):
+        cursor = self.lyr.cursor(['OID@', 'NAME', 'DT'], 'OBJECTID <= 20', f=r.JSON)
+        row = cursor.getRow(0)
+        self.assertIs(type(row), r.CursorRow)
+        self.assertFalse(hasattr(row, '__dict__'))
+        self.assertEqual(row.coordinates, (1.0, 2.0))
+        self.assertEqual(row.values, (1, 'feature 1', r.mil_to_date(1500000000001)))
+        self.assertEqual(list(r.Cursor(cursor, ['VAL', 'MISSING']))[:2], [(1.5, None), (3.0, None)])
+        self.assertEqual(len(cursor.features), 20)
+        self.assertEqual(cursor.features[19].attributes.NAME, 'feature 20')
+        self.assertEqual(row.asJSON(), {'attributes': {'OBJECTID': 1, 'NAME': 'feature 1', 'VAL': 1.5, 'DT': 1500000000001},
+                                      'geometry': {'x': 1.0, 'y': 2.0}})
+
+    @unittest.skipIf(r.has_arcpy, 'shapefiles are written by arcpy')
+    def test_export_shapefile(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            out = self.lyr.export_layer(os.path.join(tmp, 'points.shp'), exceed_limit=True)
+            reader = r.shapefile.Reader(out)
+            self.assertEqual(len(reader), 450)
+            self.assertEqual([f[0] for f in reader.fields[1:]], ['NAME', 'VAL', 'DT'])
+            self.assertEqual([list(pt) for pt in reader.shape(449).points], [[450.0, 900.0]])
+            reader.close()
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'points.prj')))
+        finally:
+            shutil.rmtree(tmp)
+
+class TestChunkPlanning(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = None
+
+    def tearDown(self):
+        if self.stub:
+            self.stub.stop()
+
+    def layer(self, **kwargs):
+        self.stub = StubArcGISServer(**kwargs)
+        self.stub.start()
+        return r.FeatureLayer(self.stub.layer_url)
+
+    def query_params(self):
+        return [p for path, p in self.stub.requests if path.endswith('/query')]
+
+    def test_sparse_oids(self):
+        oids = list(range(1, 101)) + list(range(10000, 1000000, 5000))
+        lyr = self.layer(oids=oids, max_record_count=50)
+        fs = lyr.query(exceed_limit=True, f=r.JSON, pagination=r.PAGINATION_OID)
+        self.assertEqual([f.attributes.OBJECTID for f in fs.features], oids)
+        chunks = self.query_params()[1:]
+        self.assertEqual(len(chunks), 6)
+        self.assertNotIn('objectIds', chunks[0])
+        self.assertEqual(len(chunks[-1]['objectIds'].split(',')), 48)
+
+    def test_truncated_chunks(self):
+        for pagination in (r.PAGINATION_OFFSET, r.PAGINATION_OID):
+            lyr = self.layer(oids=range(1, 301), max_record_count=100, transfer_limit=40)
+            fs = lyr.query(exceed_limit=True, f=r.JSON, pagination=pagination, max_workers=2)
+            self.assertEqual([f.attributes.OBJECTID for f in fs.features], list(range(1, 301)))
+            self.assertFalse(fs.json.get(r.EXCEEDED_TRANSFER_LIMIT))
+            self.stub.stop()
+
+    def test_adaptive_chunk_size(self):
+        for pagination in (r.PAGINATION_OFFSET, r.PAGINATION_OID):
+            lyr = self.layer(oids=range(1, 501), max_record_count=200, error_above=60)
+            sizer = r.AdaptiveChunkSizer(initial_size=200, target_seconds=60, min_size=5)
+            fs = lyr.query(exceed_limit=True, f=r.JSON, pagination=pagination, chunk_size=sizer)
+            self.assertEqual([f.attributes.OBJECTID for f in fs.features], list(range(1, 501)))
+            self.assertIs(lyr.chunk_stats, sizer.stats)
+            self.assertTrue(sizer.stats.errors)
+            self.assertEqual(sizer.stats.features, 500)
+            self.assertTrue(sizer.stats.history)
+            self.stub.stop()
+
+    def test_fixed_chunk_size_errors(self):
+        lyr = self.layer(oids=range(1, 101), max_record_count=100, error_above=60)
+        self.assertRaises(RuntimeError, lyr.query, exceed_limit=True, f=r.JSON)
+        fs = lyr.query(exceed_limit=True, f=r.JSON, chunk_size=50)
+        self.assertEqual([f.attributes.OBJECTID for f in fs.features], list(range(1, 101)))
+        self.assertEqual(lyr.chunk_stats.requests, 2)
+        self.stub.stop()
+
+        # client errors are raised without splitting the chunk
+        lyr = self.layer(oids=range(1, 101), max_record_count=100, error_above=60, error_code=400)
+        sizer = r.AdaptiveChunkSizer(initial_size=100, min_size=5)
+        self.assertRaises(RuntimeError, lyr.query, exceed_limit=True, f=r.JSON, chunk_size=sizer)
+        self.assertEqual(len(self.query_params()), 2)
+        self.assertFalse(sizer.stats.errors)
+
+    def test_pbf_fallback(self):
+        lyr = self.layer(oids=range(1, 11), pbf=False)
+        fs = lyr.query(f=r.PBF)
+        self.assertEqual(fs.count, 10)
+        self.assertEqual(self.query_params()[0]['f'], r.JSON)
+
+    def test_stream_truncated_chunks(self):
+        lyr = self.layer(oids=range(1, 301), max_record_count=100, transfer_limit=40, error_above=30)
+        sizer = r.AdaptiveChunkSizer(initial_size=100, min_size=5)
+        features = lyr.iter_features(f=r.JSON, stream=True, chunk_size=sizer)
+        self.assertEqual([ft.get('OBJECTID') for ft in features], list(range(1, 301)))
+        self.assertEqual(sizer.stats.features, 300)
+
+    def test_json_stream(self):
+        doc = {'objectIdFieldName': 'OID', 'fields': [{'name': 'OID'}], 'exceededTransferLimit': True,
+               'layers': [{'id': 0, 'features': [{'attributes': {'OID': i, 'NAME': u'caf\xe9 {}'.format(i)}, 'geometry': {'x': -1.5e3, 'y': i}} for i in range(3)]},
+                          {'id': 3, 'features': []}, {'id': 4, 'features': [{'attributes': {'OID': 10}}]}]}
+        data = json.dumps(doc, ensure_ascii=False).encode('utf-8')
+        for size in (1, 2, 7, len(data)):
+            stream = r.JSONStream((data[i:i + size] for i in range(0, len(data), size)), r.FEATURES)
+            items = [(stream.context['id'], ft) for ft in stream]
+            self.assertEqual(items, [(0, ft) for ft in doc['layers'][0]['features']] + [(4, doc['layers'][2]['features'][0])])
+            self.assertEqual(stream.header['fields'], doc['fields'])
+            self.assertEqual([lyr['features'] for lyr in stream.header['layers']], [[], [], []])
+            self.assertEqual(stream.bytes, len(data))
+        self.assertEqual(list(r.JSONStream([b'[1, 2', b'3, 4]'], r.FEATURES)), [])
+        self.assertRaises(RuntimeError, list, r.JSONStream([b'{"error": {"code": 400}}']))
+        self.assertRaises(ValueError, list, r.JSONStream([b'{"features": [1, 2']))
+
+    def test_oid_chunk(self):
+        dense = r.OIDChunk([5, 6, 8, 9], 'OID', 'A = 1')
+        self.assertEqual(dense.params, {r.WHERE: 'A = 1 and OID >= 5 and OID <= 9'})
+        sparse = r.OIDChunk([5, 60, 800], 'OID')
+        self.assertEqual(sparse.params, {r.WHERE: '1=1', r.OBJECT_IDS: '5,60,800'})
+        response = {r.EXCEEDED_TRANSFER_LIMIT: True, r.FEATURES: [{r.ATTRIBUTES: {'OID': 5}}]}
+        self.assertEqual(sparse.remainder(response, 'OID')[0].oids, [60, 800])
+
+class TestLazyMunch(unittest.TestCase):
+
+    def test_lazy_munchify(self):
+        rings = [[[0, 0], [1, 0], [1, 1], [0, 0]]]
+        raw = {'fields': [{'name': 'A'}], 'features': [{'attributes': {'A': 1}, 'geometry': {'rings': rings}}]}
+        fs = r.FeatureSet(raw)
+        self.assertIsInstance(fs.json, r.LazyMunch)
+        self.assertIs(type(dict.__getitem__(fs.json, 'features')[0]), dict)
+        self.assertEqual([ft.attributes.A for ft in fs.features], [1])
+        self.assertIsInstance(dict.__getitem__(fs.json, 'features')[0], r.LazyMunch)
+
+        # coordinates are never copied and the input is not modified
+        self.assertIs(fs.features[0].geometry.rings, rings)
+        self.assertIs(type(raw['features'][0]), dict)
+        self.assertEqual(json.loads(fs.dumps()), raw)
+        self.assertEqual(r.Feature(fs.features[0]).json, raw['features'][0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#-------------------------------------------------------------------------------
+# Name:        test_reproject
+# Purpose:     tests local coordinate transformations against reference
+#              values, and projecting query chunks from a local stub server.
+#-------------------------------------------------------------------------------
+import csv
+import io
+import math
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import restapi as r
+from restapi import reproject, projections
+from stub_server import StubArcGISServer
+
+class TestReproject(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubArcGISServer(oids=range(1, 251), max_record_count=100)
+        cls.stub.start()
+        cls.lyr = r.FeatureLayer(cls.stub.layer_url)
+        cls.tmp = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        shutil.rmtree(cls.tmp)
+
+    def test_transformer(self):
+        # 45N on the central meridian of UTM zone 15N
+        xs, ys = r.Transformer(4326, 32615).transform([-93.0], [45.0])
+        self.assertAlmostEqual(xs[0], 500000.0, 6)
+        self.assertAlmostEqual(ys[0], 4982950.4002, 3)
+
+        # British National Grid, the values of PROJ
+        xs, ys = r.Transformer(4277, 27700).transform([0.5], [50.5])
+        self.assertAlmostEqual(xs[0], 577274.9838, 3)
+        self.assertAlmostEqual(ys[0], 69740.4923, 3)
+
+        # state plane Lambert Conformal Conic in US feet round trips
+        t = reproject.get_transformer(4269, 2264)
+        self.assertIs(t, reproject.get_transformer(4269, 2264))
+        xs, ys = t.transform([-79.0, -77.5], [33.75, 35.2])
+        self.assertAlmostEqual(xs[0], 2000000.002616666, 6)
+        self.assertAlmostEqual(ys[0], 0.0, 6)
+        lons, lats = reproject.Transformer(2264, 4269).transform(xs, ys)
+        self.assertAlmostEqual(lons[1], -77.5, 10)
+        self.assertAlmostEqual(lats[1], 35.2, 10)
+
+        polygon = r.Geometry({'rings': [[[-80, 35], [-79, 35], [-79, 36], [-80, 35]]],
+                              'spatialReference': {'wkid': 4269}}, packed=True)
+        projected = polygon.project(2264)
+        self.assertEqual(projected.getWKID(), 2264)
+        self.assertIsNotNone(projected.packed)
+        self.assertAlmostEqual(projected.json['rings'][0][1][0], 2000000.002616666, 6)
+
+        with self.assertRaises(NotImplementedError):
+            r.Transformer(4326, 3031)
+
+    def test_geojson(self):
+        fs = r.GeoJSONFeatureSet({'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {'OID': 1}, 'geometry': {'type': 'Point', 'coordinates': [3, 6]}},
+            {'type': 'Feature', 'properties': {'OID': 2}, 'geometry': None},
+            {'type': 'Feature', 'properties': {'OID': 3}, 'geometry': {'type': 'MultiPolygon',
+                'coordinates': [[[[0, 0], [0, 1, 7], [1, 1], [0, 0]]]]}}]})
+        projected = fs.project(3857)
+        self.assertIsInstance(projected, r.GeoJSONFeatureSet)
+        self.assertEqual(projected.json['crs']['properties']['name'], 'EPSG:3857')
+        point = projected.json['features'][0]['geometry']['coordinates']
+        self.assertAlmostEqual(point[0], 6378137 * math.radians(3), 6)
+        self.assertAlmostEqual(point[1], 6378137 * math.log(math.tan(math.pi / 4 + math.radians(6) / 2)), 6)
+        self.assertIsNone(projected.json['features'][1]['geometry'])
+        ring = projected.json['features'][2]['geometry']['coordinates'][0][0]
+        self.assertEqual(ring[1][2], 7)
+        self.assertAlmostEqual(ring[2][0], 6378137 * math.radians(1), 6)
+        self.assertEqual(fs.json['features'][0]['geometry']['coordinates'], [3, 6])
+
+        # the legacy crs member is read back
+        back = projected.project(4326)
+        self.assertNotIn('crs', back.json)
+        self.assertAlmostEqual(back.json['features'][0]['geometry']['coordinates'][1], 6, 9)
+
+    def test_projection_tables(self):
+        table = projections.LazyTable('projections')
+        self.assertTrue(table._open_index())
+        self.assertTrue(table[4326].startswith("GEOGCS['GCS_WGS_1984'"))
+        self.assertIsNone(table._data)
+        self.assertNotIn('1', table)
+        self.assertEqual(projections.names[table['2264'].split("'")[1]], '102719')
+        self.assertEqual(projections.wkt[table['2264']], '102719')
+        self.assertEqual(projections.linearUnits.Foot.wkid, '9002')
+        self.assertEqual(r.GeometryService.getLinearUnitWKID('Foot'), 9002)
+        self.assertIn('Foot', r.GeometryService.linear_units)
+        self.assertEqual(len(table), 4352)
+        self.assertEqual(len(list(table)), 4352)
+
+    def test_local_sr(self):
+        out = self.lyr.export_csv(os.path.join(self.tmp, 'points.csv'), where='OBJECTID < 40',
+                                  geometry='xy', local_sr=3857)
+        with io.open(out, encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(len(rows), 40)
+        x, y = float(rows[3][-2]), float(rows[3][-1])
+        self.assertAlmostEqual(x, 6378137 * math.radians(3), 6)
+        self.assertAlmostEqual(y, 6378137 * math.log(math.tan(math.pi / 4 + math.radians(6) / 2)), 6)
+
+        fs = next(self.lyr.query_in_chunks(where='OBJECTID < 40', local_sr=32631))
+        self.assertEqual(fs.getWKID(), 32631)
+        self.assertAlmostEqual(fs.features[0].geometry.x, 277539.3634, 3)
+        self.assertAlmostEqual(fs.features[0].geometry.y, 221196.5388, 3)
+
+if __name__ == '__main__':
+    unittest.main()
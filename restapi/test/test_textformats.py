@@ -0,0 +1,83 @@
+#-------------------------------------------------------------------------------
+# Name:        test_textformats
+# Purpose:     tests exporting layers to newline delimited GeoJSON and CSV
+#              against a local stub server.
+#-------------------------------------------------------------------------------
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import restapi as r
+from restapi import textformats
+from stub_server import StubArcGISServer
+
+class TestTextFormats(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubArcGISServer(oids=range(1, 251), max_record_count=100)
+        cls.stub.start()
+        cls.lyr = r.FeatureLayer(cls.stub.layer_url)
+        cls.tmp = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        shutil.rmtree(cls.tmp)
+
+    def test_export_layer(self):
+        out = self.lyr.export_layer(os.path.join(self.tmp, 'points.geojsonl.gz'), exceed_limit=True)
+        with gzip.open(out, 'rt') as f:
+            features = [json.loads(line) for line in f]
+        self.assertEqual(len(features), 250)
+        self.assertEqual(features[2], {'type': 'Feature', 'id': 3,
+            'geometry': {'type': 'Point', 'coordinates': [3.0, 6.0]},
+            'properties': {'OBJECTID': 3, 'NAME': 'feature 3', 'VAL': 4.5, 'DT': '2017-07-14T02:40:00.003Z'}})
+
+        # without exceed_limit a single query request, like query()
+        del self.stub.requests[:]
+        out = self.lyr.export_layer(os.path.join(self.tmp, 'points.csv'), where='OBJECTID < 6')
+        self.assertEqual(len([path for path, _ in self.stub.requests if path.endswith('/query')]), 1)
+        with io.open(out, encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['OBJECTID', 'NAME', 'VAL', 'DT', 'WKT'])
+        self.assertEqual(rows[3], ['3', 'feature 3', '4.5', '2017-07-14T02:40:00.003Z', 'POINT (3.0 6.0)'])
+        self.assertEqual(len(rows), 6)
+
+        out = self.lyr.export_layer(os.path.join(self.tmp, 'capped.csv'))
+        with io.open(out, encoding='utf-8', newline='') as f:
+            self.assertEqual(len(list(csv.reader(f))), 101)
+
+    def test_polygons_and_domains(self):
+        outer = [[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]]
+        hole = [[2, 2], [4, 2], [4, 4], [2, 4], [2, 2]]
+        fields = [{'name': 'KIND', 'type': 'esriFieldTypeInteger', 'domain': {'type': 'codedValue',
+            'name': 'kinds', 'codedValues': [{'code': 1, 'name': 'Park'}]}}]
+        fs = r.FeatureSet({'geometryType': 'esriGeometryPolygon', 'spatialReference': {'wkid': 3857},
+            'fields': fields, 'features': [{'attributes': {'KIND': 1}, 'geometry': {'rings': [outer, hole]}},
+                                           {'attributes': {'KIND': 2}, 'geometry': None}]})
+        out = os.path.join(self.tmp, 'polygons.csv')
+        with textformats.CSVWriter(out, fields, fs.geometryType) as writer:
+            writer.write(fs)
+        with io.open(out, encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[1], ['Park', 'POLYGON ((0 0, 0 10, 10 10, 10 0, 0 0), (2 2, 4 2, 4 4, 2 4, 2 2))'])
+        self.assertEqual(rows[2], ['2', ''])
+
+        # GeoJSON outer rings are counterclockwise
+        geometry = textformats.esri_to_geojson({'rings': [outer, hole]})
+        self.assertEqual(geometry['type'], 'Polygon')
+        self.assertEqual(geometry['coordinates'][0], outer[::-1])
+
+        with self.assertRaises(ValueError):
+            textformats.CSVWriter(out, fields, fs.geometryType, geometry='xy')
+
+if __name__ == '__main__':
+    unittest.main()
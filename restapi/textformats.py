@@ -0,0 +1,374 @@
+"""Writes query chunks to newline delimited GeoJSON and CSV files.
+
+Both formats are written one line per feature, so the raw JSON responses of a
+query can be converted and written as they arrive without building a
+FeatureSet, and memory use does not grow with the number of features:
+
+    with NDJSONWriter('parcels.geojsonl.gz', lyr.fields, lyr.geometryType) as writer:
+        for fs in lyr.query_in_chunks(where='COUNTY = 27'):
+            writer.write(fs)
+
+Dates are written as ISO 8601 UTC strings and the codes of coded value domain
+fields are replaced with their names.  A path ending with ".gz", ".bz2" or ".xz"
+is compressed on the fly, ".zst" needs the compression.zstd module of Python
+3.14 or later.
+"""
+from __future__ import print_function
+import bz2
+import csv
+import gzip
+import io
+import json
+import os
+from ._strings import *
+from .wkb import NAN, _group_rings, _list_signed_area, _list_contains
+from .rest_utils import mil_to_isoformat, raw_features
+
+import six
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+__all__ = ['NDJSONWriter', 'CSVWriter', 'esri_to_geojson', 'esri_to_wkt']
+
+# binary openers of the compressed file extensions, Python 2 has no bz2.open()
+COMPRESSION_OPENERS = {'.gz': gzip.open, '.bz2': getattr(bz2, 'open', bz2.BZ2File)}
+if lzma is not None:
+    COMPRESSION_OPENERS.update({'.xz': lzma.open, '.lzma': lzma.open})
+if zstd is not None:
+    COMPRESSION_OPENERS['.zst'] = zstd.open
+
+# geometry columns of a CSV file
+CSV_GEOMETRY_COLUMNS = {'wkt': ['WKT'], 'xy': ['X', 'Y'], None: []}
+
+_WKT_DIMENSIONS = {(False, False): '', (True, False): ' Z', (False, True): ' M', (True, True): ' ZM'}
+
+def split_compression(path):
+    """Returns the path without its compression extension and the opener of
+            the compression, None when the path is not compressed.
+
+    Arg:
+        path: A file path.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in COMPRESSION_OPENERS:
+        return path[:-len(ext)], COMPRESSION_OPENERS[ext]
+    return path, None
+
+class _UTF8Writer(object):
+    """Python 2 text stream over a binary file, unicode is written as UTF-8 
+            and byte strings, such as the rows of the csv module, as they are."""
+
+    def __init__(self, f):
+        self._file = f
+
+    def write(self, data):
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+def open_text(path):
+    """Opens a UTF-8 text file for writing, compressed by its extension.
+
+    Arg:
+        path: Output file path.
+    """
+    opener = split_compression(path)[1] or io.open
+    f = opener(path, 'wb')
+    if six.PY2:
+        return _UTF8Writer(f)
+    return io.TextIOWrapper(f, encoding='utf-8', newline='')
+
+def text_columns(fields, domain_fields=None, decode_domains=True):
+    """Returns a (field name, is date, coded value names or None) tuple for
+            each field.
+
+    Args:
+        fields: The fields that are written.
+        domain_fields: Optional fields with the domains, usually the layer
+            fields because query responses leave the domains out.  Defaults
+            to fields.
+        decode_domains: Optional boolean, False to write the codes of coded
+            value domain fields. Defaults to True.
+    """
+    domains = {}
+    for f in domain_fields or fields:
+        domain = f.get(DOMAIN) or {}
+        if decode_domains and domain.get(TYPE) == CODED_VALUE_DOMAIN and domain.get(CODED_VALUES):
+            domains[f.get(NAME)] = {cv.get(CODE): cv.get(NAME) for cv in domain[CODED_VALUES]}
+    return [(f.get(NAME), f.get(TYPE) == DATE_FIELD, domains.get(f.get(NAME)))
+            for f in fields if f.get(TYPE) != SHAPE]
+
+def _value(value, is_date, names):
+    if value is None:
+        return None
+    if names is not None:
+        return names.get(value, value)
+    if is_date:
+        return mil_to_isoformat(value)
+    return value
+
+def _point(geometry, hasZ):
+    if hasZ:
+        return [geometry[X], geometry[Y], geometry.get(Z)]
+    return [geometry[X], geometry[Y]]
+
+def esri_to_geojson(geometry, hasZ=False):
+    """Converts an esri JSON geometry to a GeoJSON geometry.  Polygon rings are
+            grouped into polygons and wound counterclockwise as RFC 7946
+            recommends, m values are left out.
+
+    Args:
+        geometry: An esri JSON geometry dict.
+        hasZ: Optional boolean, True to keep z values. Defaults to False.
+
+    Returns:
+        A GeoJSON geometry dict, None for null and empty geometries.
+    """
+    if not geometry:
+        return None
+    dims = 3 if hasZ else 2
+    if X in geometry:
+        if geometry[X] is None or geometry[X] == 'NaN':
+            return None
+        return {TYPE: 'Point', COORDINATES: _point(geometry, hasZ)}
+    if geometry.get(POINTS):
+        return {TYPE: 'MultiPoint', COORDINATES: [pt[:dims] for pt in geometry[POINTS]]}
+    if geometry.get(PATHS):
+        lines = [[pt[:dims] for pt in path] for path in geometry[PATHS]]
+        if len(lines) == 1:
+            return {TYPE: 'LineString', COORDINATES: lines[0]}
+        return {TYPE: 'MultiLineString', COORDINATES: lines}
+    if geometry.get(RINGS):
+        # esri outer rings are clockwise, GeoJSON outer rings counterclockwise
+        polygons = [[[pt[:dims] for pt in reversed(ring)] for ring in polygon]
+                    for polygon in _group_rings(geometry[RINGS], _list_signed_area, _list_contains)]
+        if len(polygons) == 1:
+            return {TYPE: 'Polygon', COORDINATES: polygons[0]}
+        return {TYPE: 'MultiPolygon', COORDINATES: polygons}
+    return None
+
+def _wkt_coords(coords, dims):
+    """Formats coordinates, missing z and m values are NaN."""
+    return ', '.join(' '.join(repr(v) for v in (list(pt) + [NAN] * dims)[:dims]) for pt in coords)
+
+def esri_to_wkt(geometry, hasZ=False, hasM=False):
+    """Converts an esri JSON geometry to well known text.
+
+    Args:
+        geometry: An esri JSON geometry dict.
+        hasZ: Optional boolean, True to write z values. Defaults to False.
+        hasM: Optional boolean, True to write m values. Defaults to False.
+
+    Returns:
+        The WKT string, None for null and empty geometries.
+    """
+    if not geometry:
+        return None
+    tag = _WKT_DIMENSIONS[(bool(hasZ), bool(hasM))]
+    dims = 2 + bool(hasZ) + bool(hasM)
+    if X in geometry:
+        if geometry[X] is None or geometry[X] == 'NaN':
+            return None
+        pt = [geometry[X], geometry[Y]] + ([geometry.get(Z, NAN)] if hasZ else []) + ([geometry.get(M, NAN)] if hasM else [])
+        return 'POINT{} ({})'.format(tag, _wkt_coords([pt], dims))
+    if geometry.get(POINTS):
+        return 'MULTIPOINT{} ({})'.format(tag, ', '.join('({})'.format(_wkt_coords([pt], dims)) for pt in geometry[POINTS]))
+    if geometry.get(PATHS):
+        lines = ['({})'.format(_wkt_coords(path, dims)) for path in geometry[PATHS]]
+        if len(lines) == 1:
+            return 'LINESTRING{} {}'.format(tag, lines[0])
+        return 'MULTILINESTRING{} ({})'.format(tag, ', '.join(lines))
+    if geometry.get(RINGS):
+        # WKT has no preferred winding, the esri rings are kept as they are
+        polygons = ['({})'.format(', '.join('({})'.format(_wkt_coords(ring, dims)) for ring in polygon))
+                    for polygon in _group_rings(geometry[RINGS], _list_signed_area, _list_contains)]
+        if len(polygons) == 1:
+            return 'POLYGON{} {}'.format(tag, polygons[0])
+        return 'MULTIPOLYGON{} ({})'.format(tag, ', '.join(polygons))
+    return None
+
+def _ndjson_lines(columns, oid_field, hasZ, feature_set):
+    """Returns the GeoJSON Feature lines of a chunk as one string."""
+    lines = []
+    for feat in raw_features(feature_set):
+        attributes = dict.get(feat, ATTRIBUTES) or {}
+        feature = {TYPE: 'Feature'}
+        if oid_field:
+            feature['id'] = attributes.get(oid_field)
+        feature[GEOMETRY] = esri_to_geojson(dict.get(feat, GEOMETRY), hasZ)
+        feature[PROPERTIES] = {name: _value(attributes.get(name), is_date, names) for name, is_date, names in columns}
+        lines.append(json.dumps(feature, separators=(',', ':'), ensure_ascii=False))
+    lines.append('')
+    return '\n'.join(lines) if len(lines) > 1 else ''
+
+def _csv_rows(columns, geometry, hasZ, hasM, feature_set):
+    """Returns the CSV rows of a chunk."""
+    rows = []
+    for feat in raw_features(feature_set):
+        attributes = dict.get(feat, ATTRIBUTES) or {}
+        row = [_value(attributes.get(name), is_date, names) for name, is_date, names in columns]
+        if geometry == 'wkt':
+            row.append(esri_to_wkt(dict.get(feat, GEOMETRY), hasZ, hasM))
+        elif geometry == 'xy':
+            geom = dict.get(feat, GEOMETRY) or {}
+            row.extend([geom.get(X), geom.get(Y)])
+        rows.append(row)
+    return rows
+
+class _TextWriter(object):
+    """Base class of the line based writers, subclasses set row_args and
+            write_rows().
+
+    Attributes:
+        path: Path of the output file.
+        columns: List of (field name, is date, coded value names) tuples.
+        count: Number of features written.
+    """
+    _prepare = None
+
+    def __init__(self, path, fields, domain_fields=None, decode_domains=True):
+        self.path = path
+        self.columns = text_columns(fields, domain_fields, decode_domains)
+        self.count = 0
+        self._file = open_text(path)
+
+    def prepare(self, feature_set):
+        """Returns the converted features, the part of write() that does not
+                touch the file so it can run in another thread or process.
+
+        Arg:
+            feature_set: A FeatureSet, query response dict or list of features.
+        """
+        return type(self)._prepare(*self.row_args + (feature_set,))
+
+    def write(self, feature_set):
+        """Appends the features of a feature set.
+
+        Arg:
+            feature_set: A FeatureSet, query response dict or list of features.
+        """
+        self.write_rows(self.prepare(feature_set))
+
+    def close(self):
+        """Closes the file, which flushes the compressor."""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        print('Created: "{0}"'.format(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+class NDJSONWriter(_TextWriter):
+    """Writes features as newline delimited GeoJSON, one Feature per line."""
+    _prepare = staticmethod(_ndjson_lines)
+
+    def __init__(self, path, fields, geometryType=None, hasZ=False, domain_fields=None, decode_domains=True):
+        """Creates the writer.
+
+        Args:
+            path: Output file, compressed when it ends with a compression extension.
+            fields: The fields of the feature sets that will be written.
+            geometryType: Optional esri geometry type, None writes null geometries.
+            hasZ: Optional boolean, True to write z values. Defaults to False.
+            domain_fields: Optional fields with the coded value domains, see
+                text_columns(). Defaults to fields.
+            decode_domains: Optional boolean, False to write the codes of coded
+                value domain fields. Defaults to True.
+        """
+        super(NDJSONWriter, self).__init__(path, fields, domain_fields, decode_domains)
+        self.geometryType = geometryType
+        self.hasZ = bool(hasZ)
+        self.oid_field = next((f.get(NAME) for f in fields if f.get(TYPE) == OID), None)
+
+    @property
+    def row_args(self):
+        """The arguments of the feature conversion before the feature set."""
+        return self.columns, self.oid_field, self.hasZ and bool(self.geometryType)
+
+    def write_rows(self, rows):
+        """Writes the lines returned by prepare().
+
+        Arg:
+            rows: The Feature lines as one string.
+        """
+        self._file.write(rows)
+        self.count += rows.count('\n')
+
+class CSVWriter(_TextWriter):
+    """Writes features as CSV rows, with a header row of the field names."""
+    _prepare = staticmethod(_csv_rows)
+
+    def __init__(self, path, fields, geometryType=None, hasZ=False, hasM=False, geometry='wkt',
+                 domain_fields=None, decode_domains=True, delimiter=','):
+        """Creates the writer and writes the header row.
+
+        Args:
+            path: Output file, compressed when it ends with a compression extension.
+            fields: The fields of the feature sets that will be written.
+            geometryType: Optional esri geometry type, None writes no geometry column.
+            hasZ: Optional boolean, True to write z values. Defaults to False.
+            hasM: Optional boolean, True to write m values. Defaults to False.
+            geometry: Optional geometry columns, "wkt" for a WKT column, "xy"
+                for X and Y columns (points only) or None for none. Defaults
+                to "wkt".
+            domain_fields: Optional fields with the coded value domains, see
+                text_columns(). Defaults to fields.
+            decode_domains: Optional boolean, False to write the codes of coded
+                value domain fields. Defaults to True.
+            delimiter: Optional field delimiter. Defaults to ",".
+
+        Raises:
+            ValueError: The geometry option is unknown or "xy" is used for
+                geometries that are not points.
+        """
+        if geometry not in CSV_GEOMETRY_COLUMNS:
+            raise ValueError('geometry must be one of "wkt", "xy" or None, not "{}"'.format(geometry))
+        if geometry == 'xy' and geometryType and geometryType != ESRI_POINT:
+            raise ValueError('x/y columns need point geometries, use "wkt" for {}'.format(geometryType))
+        super(CSVWriter, self).__init__(path, fields, domain_fields, decode_domains)
+        self.geometryType = geometryType
+        self.hasZ = bool(hasZ)
+        self.hasM = bool(hasM)
+        self.geometry = geometry if geometryType else None
+        self._writer = csv.writer(self._file, delimiter=str(delimiter))
+        self._writer.writerow(self._encode([name for name, _, _ in self.columns] + CSV_GEOMETRY_COLUMNS[self.geometry]))
+
+    @staticmethod
+    def _encode(row):
+        """Returns the row for the csv module, which only writes byte strings
+                on Python 2."""
+        if six.PY2:
+            return [v.encode('utf-8') if isinstance(v, six.text_type) else v for v in row]
+        return row
+
+    @property
+    def row_args(self):
+        """The arguments of the feature conversion before the feature set."""
+        return self.columns, self.geometry, self.hasZ, self.hasM
+
+    def write_rows(self, rows):
+        """Writes the rows returned by prepare().
+
+        Arg:
+            rows: List of row value lists.
+        """
+        if six.PY2:
+            rows = [self._encode(row) for row in rows]
+        self._writer.writerows(rows)
+        self.count += len(rows)
@@ -0,0 +1,267 @@
+"""Encodes the geometries of a ColumnarFeatureSet as ISO well known binary.
+
+The coordinates are written straight from the flat coordinate buffer, one
+bytes copy per ring or path, so there is no per vertex python work.  Esri
+polygons can have several outer rings, each outer ring and the holes inside
+it become one polygon of a MultiPolygon.
+
+WKBEncoder requires numpy, JSONWKBEncoder encodes esri JSON and GeoJSON
+geometries without it.
+"""
+import itertools
+import struct
+from ._strings import *
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_MULTIPOINT = 4
+WKB_MULTILINESTRING = 5
+WKB_MULTIPOLYGON = 6
+
+# names used by GeoParquet and GeoPackage
+WKB_NAMES = {
+    WKB_POINT: 'Point',
+    WKB_LINESTRING: 'LineString',
+    WKB_POLYGON: 'Polygon',
+    WKB_MULTIPOINT: 'MultiPoint',
+    WKB_MULTILINESTRING: 'MultiLineString',
+    WKB_MULTIPOLYGON: 'MultiPolygon'
+}
+
+# the single and multi part WKB types of each esri geometry type
+WKB_TYPES = {
+    ESRI_POINT: (WKB_POINT, WKB_POINT),
+    ESRI_MULTIPOINT: (WKB_MULTIPOINT, WKB_MULTIPOINT),
+    ESRI_POLYLINE: (WKB_LINESTRING, WKB_MULTILINESTRING),
+    ESRI_POLYGON: (WKB_POLYGON, WKB_MULTIPOLYGON)
+}
+
+_header = struct.Struct('<BI').pack
+_count = struct.Struct('<I').pack
+
+NAN = float('nan')
+
+def geometry_type_names(geometryType, hasZ=False, hasM=False):
+    """Returns the names of the WKB types written for an esri geometry type,
+            with a " Z", " M" or " ZM" suffix for 3D and measured geometries.
+    """
+    suffix = ' ' + ('Z' if hasZ else '') + ('M' if hasM else '') if hasZ or hasM else ''
+    return sorted(set(WKB_NAMES[t] + suffix for t in WKB_TYPES.get(geometryType, ())))
+
+def _signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return float((x[:-1] * y[1:] - x[1:] * y[:-1]).sum()) / 2.0
+
+def _contains(ring, x, y):
+    """Even-odd test of a point against a ring."""
+    x0, y0 = ring[:-1, 0], ring[:-1, 1]
+    x1, y1 = ring[1:, 0], ring[1:, 1]
+    crosses = (y0 > y) != (y1 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xs = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return bool(np.count_nonzero(crosses & (x < xs)) % 2)
+
+def _list_signed_area(ring):
+    """_signed_area() of a list of coordinates."""
+    area = 0.0
+    x0, y0 = ring[0][0], ring[0][1]
+    for pt in ring:
+        x1, y1 = pt[0], pt[1]
+        area += x0 * y1 - x1 * y0
+        x0, y0 = x1, y1
+    return area / 2.0
+
+def _list_contains(ring, x, y):
+    """_contains() of a list of coordinates."""
+    inside = False
+    x0, y0 = ring[0][0], ring[0][1]
+    for pt in ring:
+        x1, y1 = pt[0], pt[1]
+        if (y0 > y) != (y1 > y) and x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+            inside = not inside
+        x0, y0 = x1, y1
+    return inside
+
+def _group_rings(rings, signed_area=_signed_area, contains=_contains):
+    """Groups esri rings into polygons, outer rings are clockwise and holes
+            are added to the outer ring that contains them."""
+    polygons = []
+    for ring in rings:
+        if not polygons or len(ring) < 4 or signed_area(ring) <= 0:
+            polygons.append([ring])
+            continue
+        x, y = ring[0][0], ring[0][1]
+        for polygon in reversed(polygons):
+            if contains(polygon[0], x, y):
+                polygon.append(ring)
+                break
+        else:
+            polygons[-1].append(ring)
+    return polygons
+
+class WKBEncoder(object):
+    """Writes the geometries of a ColumnarFeatureSet as WKB.
+
+    Attributes:
+        geometryType: The esri geometry type.
+        type_flag: Added to the WKB type codes, 1000 for Z, 2000 for M and
+            3000 for ZM.
+        multi: True to write lines and polygons as multi part types even when 
+            they have a single part.
+    """
+
+    def __init__(self, geometryType, hasZ=False, hasM=False, multi=False):
+        self.geometryType = geometryType
+        self.type_flag = (1000 if hasZ else 0) + (2000 if hasM else 0)
+        self.single, self.multi_type = WKB_TYPES.get(geometryType, (None, None))
+        self.multi = multi
+
+    def _point(self, pt):
+        return pt.tobytes()
+
+    def _coords(self, coords):
+        return coords.tobytes()
+
+    def _group_rings(self, rings):
+        return _group_rings(rings)
+
+    def _points(self, coords):
+        return _count(len(coords)) + self._coords(coords)
+
+    def _polygon(self, rings):
+        return _header(1, WKB_POLYGON + self.type_flag) + _count(len(rings)) + b''.join(self._points(r) for r in rings)
+
+    def _lines(self, parts):
+        flag = self.type_flag
+        if len(parts) == 1 and not self.multi:
+            return _header(1, WKB_LINESTRING + flag) + self._points(parts[0])
+        return _header(1, WKB_MULTILINESTRING + flag) + _count(len(parts)) + \
+            b''.join(_header(1, WKB_LINESTRING + flag) + self._points(p) for p in parts)
+
+    def _polygons(self, polygons):
+        if len(polygons) == 1 and not self.multi:
+            return self._polygon(polygons[0])
+        return _header(1, WKB_MULTIPOLYGON + self.type_flag) + _count(len(polygons)) + \
+            b''.join(self._polygon(p) for p in polygons)
+
+    def _multipoint(self, points):
+        flag = self.type_flag
+        return _header(1, WKB_MULTIPOINT + flag) + _count(len(points)) + \
+            b''.join(_header(1, WKB_POINT + flag) + self._point(pt) for pt in points)
+
+    def encode(self, parts):
+        """Returns the WKB of one geometry.
+
+        Arg:
+            parts: List of float64 coordinate arrays, one for each part.
+        """
+        if self.single == WKB_POINT:
+            return _header(1, WKB_POINT + self.type_flag) + self._point(parts[0][0])
+        elif self.single == WKB_MULTIPOINT:
+            return self._multipoint([pt for part in parts for pt in part])
+        elif self.single == WKB_LINESTRING:
+            return self._lines(parts)
+        elif self.single == WKB_POLYGON:
+            return self._polygons(self._group_rings(parts))
+        raise ValueError('Unsupported geometry type "{}"'.format(self.geometryType))
+
+    def iter_wkb(self, cfs):
+        """Generator for the WKB of each feature of a ColumnarFeatureSet, None
+                for null geometries."""
+        coords = np.ascontiguousarray(cfs.coords, dtype='<f8')
+        part_offsets = cfs.part_offsets.tolist()
+        geometry_offsets = cfs.geometry_offsets.tolist()
+        for start, end in zip(geometry_offsets[:-1], geometry_offsets[1:]):
+            if start == end:
+                yield None
+            else:
+                yield self.encode([coords[part_offsets[i]:part_offsets[i + 1]] for i in range(start, end)])
+
+class JSONWKBEncoder(WKBEncoder):
+    """Writes esri JSON and GeoJSON geometries as WKB, does not need numpy.
+            Coordinates without z or m values get NaN.
+
+    Attributes:
+        dims: Number of values of each coordinate.
+    """
+
+    def __init__(self, geometryType, hasZ=False, hasM=False, multi=False):
+        super(JSONWKBEncoder, self).__init__(geometryType, hasZ, hasM, multi)
+        self.hasZ = hasZ
+        self.hasM = hasM
+        self.dims = 2 + bool(hasZ) + bool(hasM)
+        self._format = '<{}d'.format(self.dims)
+
+    def _point(self, pt):
+        if len(pt) != self.dims:
+            pt = (list(pt) + [NAN] * self.dims)[:self.dims]
+        return struct.pack(self._format, *pt)
+
+    def _coords(self, coords):
+        dims = self.dims
+        if all(len(pt) == dims for pt in coords):
+            return struct.pack('<{}d'.format(len(coords) * dims), *itertools.chain.from_iterable(coords))
+        return b''.join(self._point(pt) for pt in coords)
+
+    def _group_rings(self, rings):
+        return _group_rings(rings, _list_signed_area, _list_contains)
+
+    def parts(self, geometry):
+        """Returns the coordinate lists of an esri JSON geometry, an empty list
+                for empty geometries."""
+        if X in geometry:
+            if geometry[X] is None or geometry[X] == 'NaN':
+                return []
+            pt = [geometry[X], geometry[Y]]
+            if self.hasZ:
+                pt.append(geometry.get(Z, NAN))
+            if self.hasM:
+                pt.append(geometry.get(M, NAN))
+            return [[pt]]
+        if POINTS in geometry:
+            return [geometry[POINTS]] if geometry[POINTS] else []
+        return geometry.get(RINGS) or geometry.get(PATHS) or []
+
+    def encode_json(self, geometry):
+        """Returns the WKB of an esri JSON or GeoJSON geometry, None for null 
+                and empty geometries."""
+        if not geometry:
+            return None
+        if TYPE in geometry:
+            return self.encode_geojson(geometry)
+        parts = self.parts(geometry)
+        return self.encode(parts) if parts else None
+
+    def encode_geojson(self, geometry):
+        """Returns the WKB of a GeoJSON geometry, None for empty geometries."""
+        geometry_type, coords = geometry.get(TYPE), geometry.get(COORDINATES)
+        if not coords:
+            return None
+        if geometry_type == 'Point':
+            return _header(1, WKB_POINT + self.type_flag) + self._point(coords)
+        elif geometry_type == 'MultiPoint':
+            return self._multipoint(coords)
+        elif geometry_type == 'LineString':
+            return self._lines([coords])
+        elif geometry_type == 'MultiLineString':
+            return self._lines(coords)
+        elif geometry_type == 'Polygon':
+            return self._polygons([coords])
+        elif geometry_type == 'MultiPolygon':
+            return self._polygons(coords)
+        raise ValueError('Unsupported geometry type "{}"'.format(geometry_type))
+
+def iter_wkb(cfs):
+    """Generator for the WKB of each feature of a ColumnarFeatureSet, None for
+            null geometries.
+
+    Arg:
+        cfs: A ColumnarFeatureSet.
+    """
+    return WKBEncoder(cfs.geometryType, cfs.hasZ, cfs.hasM).iter_wkb(cfs)
@@ -22,6 +22,7 @@ setup(name=name,
                                 'admin/samples/*.py',
                                 'projections/bin/*']},
       install_requires=['munch', 'requests'],
+      extras_require={'async': ['aiohttp'], 'columnar': ['numpy'], 'parquet': ['numpy', 'pyarrow']},
       long_description=long_description,
       long_description_content_type='text/markdown',
       classifiers=[